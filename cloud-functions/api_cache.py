@@ -0,0 +1,619 @@
+"""
+API Cache - Two-tier cache for library API reads
+Keeps decoded responses in process (L1) in front of an optional tier shared by every instance (L2).
+
+L1 is an LRU of frozen values (see utils.freeze), so hits hand out the same
+read-only objects with no copying or decoding. L2 is pluggable, chosen by
+LIBRARY_CACHE_L2:
+
+    sqlite:///var/cache/library.db          one file shared by processes on a host (or a shared volume)
+    memcached://10.0.0.5:11211,10.0.0.6:11211
+    redis://10.0.0.7:6379,10.0.0.8:6379
+
+Network backends shard keys over their servers with a consistent hash ring,
+so adding or removing a server only remaps that server's share of the keys.
+L2 values are compact JSON (codec.dumps), zlib-compressed from
+LIBRARY_CACHE_COMPRESS_MIN_BYTES up, behind a small header carrying the
+absolute expiry and the time the value was stored, so an instance filling its
+L1 from L2 keeps the original deadline (and can tell which pushed changes,
+see cache_events.py, the value predates). L2 failures are counted and
+treated as misses; a server that fails is skipped for LIBRARY_CACHE_L2_RETRY
+seconds.
+
+L1 entries carry tags (e.g. the books a search result contains) so a change
+to one book can find every cached value it appears in.
+
+benchmarks/cache_server.py is a local stand-in speaking both network
+protocols.
+"""
+
+import os
+import time
+import zlib
+import bisect
+import struct
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Callable, Iterable, List, Mapping, Optional, Sequence, Set, Tuple
+
+import codec
+import metrics
+from utils import freeze, thaw
+
+logger = logging.getLogger(__name__)
+
+# Format version of the L2 envelope; part of every L2 key
+FORMAT_VERSION = 2
+# flags (bit 0: zlib), absolute expiry, time stored (epoch seconds)
+_HEADER = struct.Struct('>Bdd')
+_COMPRESSED = 1
+# memcached treats larger expiry values as absolute timestamps
+_MEMCACHED_MAX_RELATIVE = 30 * 24 * 3600
+
+
+class CacheBackendError(Exception):
+    """A shared cache backend could not serve an operation."""
+
+
+class _ReplyError(CacheBackendError):
+    """The server answered with an error; the connection itself is still usable."""
+
+
+def cache_key(endpoint: str, params: Optional[Mapping[str, Any]] = None) -> str:
+    """Canonical cache key of an API read (parameters in sorted order)."""
+    if not params:
+        return endpoint
+    return endpoint + '?' + '&'.join(f"{name}={params[name]}" for name in sorted(params))
+
+
+def parse_ttls(raw: str, known: Iterable[str], setting: str) -> Dict[str, float]:
+    """
+    Parse 'name=seconds,name=seconds' TTL overrides.
+
+    Args:
+        raw: Setting value
+        known: Names that may be overridden (others are skipped with a warning)
+        setting: Setting name, for log messages
+
+    Returns:
+        Seconds by name
+    """
+    known = set(known)
+    ttls = {}
+    for entry in raw.split(','):
+        if not entry.strip():
+            continue
+        name, _, seconds = entry.partition('=')
+        name = name.strip()
+        try:
+            if name not in known:
+                raise ValueError(f"unknown name (one of {', '.join(sorted(known))})")
+            ttls[name] = float(seconds)
+        except ValueError as e:
+            logger.warning(f"Ignoring {setting} entry '{entry.strip()}': {str(e)}")
+    return ttls
+
+
+def encode_value(value: Any, expires_at: float, stored_at: float, compress_min_bytes: int) -> bytes:
+    """L2 envelope of a value: header, then compact JSON (zlib-compressed when large)."""
+    payload = codec.dumps(value)
+    flags = 0
+    if compress_min_bytes and len(payload) >= compress_min_bytes:
+        compressed = zlib.compress(payload, 6)
+        if len(compressed) < len(payload):
+            payload, flags = compressed, _COMPRESSED
+    return _HEADER.pack(flags, expires_at, stored_at) + payload
+
+
+def decode_value(data: bytes) -> Tuple[Any, float, float]:
+    """(value, absolute expiry, time stored) from an L2 envelope (raises ValueError if malformed)."""
+    if len(data) < _HEADER.size:
+        raise ValueError('truncated cache entry')
+    flags, expires_at, stored_at = _HEADER.unpack_from(data)
+    payload = data[_HEADER.size:]
+    if flags & _COMPRESSED:
+        payload = zlib.decompress(payload)
+    return codec.loads(payload), expires_at, stored_at
+
+
+def _blake2b(data: bytes, digest_size: int):
+    # Imported here: hashlib loads OpenSSL, and only instances with an L2 hash keys
+    import hashlib
+    return hashlib.blake2b(data, digest_size=digest_size)
+
+
+def _hash64(text: str) -> int:
+    return int.from_bytes(_blake2b(text.encode('utf-8'), 8).digest(), 'big')
+
+
+class HashRing:
+    """
+    Consistent hash ring mapping keys to nodes.
+
+    Each node owns `replicas` points on a 64-bit ring; a key belongs to the
+    first point at or after its hash, so the load evens out across nodes and
+    removing one only moves the keys it owned.
+    """
+
+    def __init__(self, nodes: Sequence[str], replicas: int = 160):
+        if not nodes:
+            raise ValueError('a hash ring needs at least one node')
+        points = sorted((_hash64(f"{node}#{index}"), node) for node in nodes for index in range(replicas))
+        self.nodes = tuple(nodes)
+        self._hashes = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    def node(self, key: str) -> str:
+        """Node a key belongs to."""
+        index = bisect.bisect_left(self._hashes, _hash64(key))
+        return self._owners[index if index < len(self._owners) else 0]
+
+
+class SqliteBackend:
+    """L2 in a SQLite file (WAL mode; one connection per thread)."""
+
+    name = 'sqlite'
+    # Sets between sweeps of expired rows
+    PURGE_EVERY = 500
+
+    def __init__(self, path: str, timeout: float = 1.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._sets = 0
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # Imported here: only instances with a SQLite L2 need it
+            import sqlite3
+            try:
+                connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+                connection.execute('PRAGMA journal_mode=WAL')
+                connection.execute('PRAGMA synchronous=NORMAL')
+                connection.execute(
+                    'CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)')
+            except sqlite3.Error as e:
+                raise CacheBackendError(f"{self.path}: {str(e)}") from e
+            self._local.connection = connection
+        return connection
+
+    def _execute(self, sql: str, args: Tuple) -> List[Tuple]:
+        import sqlite3
+        try:
+            return self._connection().execute(sql, args).fetchall()
+        except sqlite3.Error as e:
+            raise CacheBackendError(f"{self.path}: {str(e)}") from e
+
+    def get(self, key: str) -> Optional[bytes]:
+        rows = self._execute('SELECT value FROM cache WHERE key = ? AND expires_at > ?', (key, time.time()))
+        return bytes(rows[0][0]) if rows else None
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        now = time.time()
+        self._execute('INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)', (key, value, now + ttl))
+        self._sets += 1
+        if self._sets % self.PURGE_EVERY == 0:
+            self._execute('DELETE FROM cache WHERE expires_at <= ?', (now,))
+
+    def delete(self, key: str) -> None:
+        self._execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def incr(self, key: str) -> int:
+        """Atomically increment a counter (created at 1; counters do not expire)."""
+        rows = self._execute(
+            "INSERT INTO cache (key, value, expires_at) VALUES (?, CAST('1' AS BLOB), ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = CAST(CAST(CAST(CAST(value AS TEXT) AS INTEGER) + 1 AS TEXT) AS BLOB) "
+            "RETURNING CAST(value AS INTEGER)", (key, float('inf')))
+        return int(rows[0][0])
+
+
+class _Server:
+    """One cache server: a lazily opened socket used under a lock."""
+
+    def __init__(self, address: str, timeout: float, retry_after: float):
+        host, _, port = address.rpartition(':')
+        self.address = address
+        self.host, self.port = host or '127.0.0.1', int(port)
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.down_until = 0.0
+        self._socket = None
+        self._reader = None
+        self._lock = threading.Lock()
+
+    def _close(self) -> None:
+        if self._socket is not None:
+            try:
+                self._socket.close()
+            except OSError:
+                pass
+        self._socket = self._reader = None
+
+    def call(self, payload: bytes, read_reply: Callable) -> Any:
+        """Send a request and parse its reply (raises CacheBackendError)."""
+        with self._lock:
+            if self.down_until and time.monotonic() < self.down_until:
+                raise CacheBackendError(f"{self.address} is marked down")
+            try:
+                if self._socket is None:
+                    # Imported here: only instances with a network L2 need it
+                    import socket
+                    self._socket = socket.create_connection((self.host, self.port), timeout=self.timeout)
+                    self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                    self._reader = self._socket.makefile('rb')
+                self._socket.sendall(payload)
+                reply = read_reply(self._reader)
+                self.down_until = 0.0
+                return reply
+            except _ReplyError:
+                raise
+            except (OSError, ValueError) as e:
+                # Timeouts and garbled replies leave the stream in an unknown state
+                self._close()
+                self.down_until = time.monotonic() + self.retry_after
+                raise CacheBackendError(f"{self.address}: {str(e) or type(e).__name__}") from e
+
+    def close(self) -> None:
+        with self._lock:
+            self._close()
+
+
+class _ShardedBackend:
+    """Base for network backends: a hash ring over per-server connections."""
+
+    name = ''
+
+    def __init__(self, addresses: Sequence[str], timeout: float = 0.05, retry_after: float = 10.0):
+        self._servers = {address: _Server(address, timeout, retry_after) for address in addresses}
+        self.ring = HashRing(list(self._servers))
+
+    def server(self, key: str) -> _Server:
+        return self._servers[self.ring.node(key)]
+
+    def close(self) -> None:
+        for server in self._servers.values():
+            server.close()
+
+
+def _read_line(reader) -> bytes:
+    line = reader.readline()
+    if not line.endswith(b'\r\n'):
+        raise ValueError('connection closed mid-reply')
+    return line[:-2]
+
+
+class MemcachedBackend(_ShardedBackend):
+    """L2 on memcached servers (text protocol: get, set, delete)."""
+
+    name = 'memcached'
+
+    @staticmethod
+    def _check(line: bytes) -> bytes:
+        if line.startswith((b'SERVER_ERROR', b'CLIENT_ERROR')) or line == b'ERROR':
+            raise _ReplyError(line.decode('utf-8', 'replace'))
+        return line
+
+    def get(self, key: str) -> Optional[bytes]:
+        def read(reader):
+            line = self._check(_read_line(reader))
+            if line == b'END':
+                return None
+            parts = line.split()
+            if len(parts) < 4 or parts[0] != b'VALUE':
+                raise ValueError(f"unexpected reply {line[:40]!r}")
+            data = reader.read(int(parts[3]) + 2)
+            if _read_line(reader) != b'END':
+                raise ValueError('missing END')
+            return data[:-2]
+        return self.server(key).call(b'get ' + key.encode('utf-8') + b'\r\n', read)
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        expiry = max(1, int(-(-ttl // 1)))
+        if expiry > _MEMCACHED_MAX_RELATIVE:
+            expiry = int(time.time() + ttl)
+        header = b'set %s 0 %d %d\r\n' % (key.encode('utf-8'), expiry, len(value))
+        self.server(key).call(header + value + b'\r\n', lambda reader: self._check(_read_line(reader)))
+
+    def delete(self, key: str) -> None:
+        self.server(key).call(b'delete ' + key.encode('utf-8') + b'\r\n', lambda reader: self._check(_read_line(reader)))
+
+    def incr(self, key: str) -> int:
+        """Atomically increment a counter (created at 1; counters do not expire)."""
+        server, encoded = self.server(key), key.encode('utf-8')
+        read = lambda reader: self._check(_read_line(reader))
+        for _ in range(3):
+            reply = server.call(b'incr %s 1\r\n' % encoded, read)
+            if reply != b'NOT_FOUND':
+                return int(reply)
+            # add fails if another instance created the counter meanwhile; increment that one
+            if server.call(b'add %s 0 0 1\r\n1\r\n' % encoded, read) == b'STORED':
+                return 1
+        raise CacheBackendError(f"could not increment {key}")
+
+
+def _resp_command(*args: bytes) -> bytes:
+    parts = [b'*%d\r\n' % len(args)]
+    for arg in args:
+        parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+    return b''.join(parts)
+
+
+def _read_resp(reader) -> Any:
+    line = _read_line(reader)
+    kind, rest = line[:1], line[1:]
+    if kind == b'-':
+        raise _ReplyError(rest.decode('utf-8', 'replace'))
+    if kind in (b'+', b':'):
+        return rest
+    if kind == b'$':
+        size = int(rest)
+        if size < 0:
+            return None
+        return reader.read(size + 2)[:-2]
+    raise ValueError(f"unexpected reply {line[:40]!r}")
+
+
+class RedisBackend(_ShardedBackend):
+    """L2 on Redis servers (RESP: GET, SET with PX, DEL)."""
+
+    name = 'redis'
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.server(key).call(_resp_command(b'GET', key.encode('utf-8')), _read_resp)
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        millis = b'%d' % max(1, int(ttl * 1000))
+        self.server(key).call(_resp_command(b'SET', key.encode('utf-8'), value, b'PX', millis), _read_resp)
+
+    def delete(self, key: str) -> None:
+        self.server(key).call(_resp_command(b'DEL', key.encode('utf-8')), _read_resp)
+
+    def incr(self, key: str) -> int:
+        """Atomically increment a counter (created at 1; counters do not expire)."""
+        return int(self.server(key).call(_resp_command(b'INCR', key.encode('utf-8')), _read_resp))
+
+
+def backend_from_url(url: str, timeout: float = 0.05, retry_after: float = 10.0):
+    """
+    Build an L2 backend from a LIBRARY_CACHE_L2 value.
+
+    Returns:
+        The backend, or None when url is empty or not understood
+    """
+    url = url.strip()
+    if not url:
+        return None
+    scheme, _, rest = url.partition('://')
+    if scheme == 'sqlite' and rest:
+        # sqlite:///abs/path and sqlite://relative/path
+        return SqliteBackend(rest, timeout=max(timeout, 0.5))
+    addresses = [address.strip() for address in rest.split(',') if address.strip()]
+    if scheme in ('memcached', 'redis') and addresses:
+        backend = MemcachedBackend if scheme == 'memcached' else RedisBackend
+        return backend(addresses, timeout=timeout, retry_after=retry_after)
+    logger.error(f"Unsupported LIBRARY_CACHE_L2 '{url}' (use sqlite://, memcached:// or redis://)")
+    return None
+
+
+class TieredCache:
+    """
+    In-process LRU (L1) in front of an optional shared backend (L2).
+
+    Values are frozen on the way in and handed out read-only. Two hooks can
+    be set after construction: tagger(key, value) returns the tags of a
+    value (stored with its L1 entry), and on_load(key, value, stored_at)
+    may rewrite a (writable) value read from L2 before it is frozen.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        l2=None,
+        namespace: str = 'library',
+        compress_min_bytes: int = 1024
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries: L1 entries kept before the least recently used is evicted
+            l2: Shared backend (see backend_from_url), or None for L1 only
+            namespace: Prefix of L2 keys (instances sharing an L2 must agree)
+            compress_min_bytes: Compress L2 values at least this large (0: never)
+        """
+        self.max_entries = max_entries
+        self.l2 = l2
+        self.namespace = namespace
+        self.compress_min_bytes = compress_min_bytes
+        self.tagger: Optional[Callable[[str, Any], Iterable[str]]] = None
+        self.on_load: Optional[Callable[[str, Any, float], Any]] = None
+        # key -> (expires_at, value, stored_at, tags)
+        self._entries: 'OrderedDict[str, Tuple[float, Any, float, Tuple[str, ...]]]' = OrderedDict()
+        self._tagged: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> 'TieredCache':
+        """Build the cache from LIBRARY_CACHE_* settings."""
+        l2 = backend_from_url(
+            os.environ.get('LIBRARY_CACHE_L2', ''),
+            timeout=float(os.environ.get('LIBRARY_CACHE_L2_TIMEOUT', '0.05')),
+            retry_after=float(os.environ.get('LIBRARY_CACHE_L2_RETRY', '10'))
+        )
+        return cls(
+            max_entries=int(os.environ.get('LIBRARY_CACHE_SIZE', '1024')),
+            l2=l2,
+            namespace=os.environ.get('LIBRARY_CACHE_NAMESPACE', 'library'),
+            compress_min_bytes=int(os.environ.get('LIBRARY_CACHE_COMPRESS_MIN_BYTES', '1024'))
+        )
+
+    def l2_key(self, key: str) -> str:
+        """Backend key of a cache key (hashed: fixed length, no spaces)."""
+        digest = _blake2b(key.encode('utf-8'), 16).hexdigest()
+        return f"{self.namespace}:v{FORMAT_VERSION}:{digest}"
+
+    def _tags(self, key: str, value: Any) -> Tuple[str, ...]:
+        return tuple(self.tagger(key, value)) if self.tagger is not None else ()
+
+    def _untag(self, key: str, tags: Tuple[str, ...]) -> None:
+        for tag in tags:
+            keys = self._tagged.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tagged[tag]
+
+    def _remember(self, key: str, expires_at: float, value: Any, stored_at: float) -> None:
+        tags = self._tags(key, value)
+        with self._lock:
+            previous = self._entries.get(key)
+            if previous is not None:
+                self._untag(key, previous[3])
+            self._entries[key] = (expires_at, value, stored_at, tags)
+            self._entries.move_to_end(key)
+            for tag in tags:
+                self._tagged.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                evicted, entry = self._entries.popitem(last=False)
+                self._untag(evicted, entry[3])
+
+    def _forget(self, key: str, entry=None) -> None:
+        """Drop an L1 entry (only if it is still `entry`, when given)."""
+        with self._lock:
+            current = self._entries.get(key)
+            if current is not None and (entry is None or current is entry):
+                del self._entries[key]
+                self._untag(key, current[3])
+
+    def _l2_failed(self, operation: str, error: CacheBackendError) -> None:
+        metrics.cache_backend_errors.inc(self.l2.name, operation)
+        logger.warning(f"Shared cache {operation} failed: {str(error)}")
+
+    def _l2_set(self, key: str, value: Any, expires_at: float, stored_at: float) -> None:
+        try:
+            data = encode_value(value, expires_at, stored_at, self.compress_min_bytes)
+            self.l2.set(self.l2_key(key), data, expires_at - time.time())
+        except CacheBackendError as e:
+            self._l2_failed('set', e)
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Cached value for a key, from L1 or else L2.
+
+        Returns:
+            The frozen value, or None on a miss
+        """
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    def get_entry(self, key: str) -> Optional[Tuple[Any, float]]:
+        """
+        Cached value for a key with the time it was stored (see get).
+
+        Returns:
+            (frozen value, stored_at as a time.time() value), or None on a miss
+        """
+        entry = self._entries.get(key)
+        now = time.time()
+        if entry is not None:
+            if entry[0] > now:
+                with self._lock:
+                    if key in self._entries:
+                        self._entries.move_to_end(key)
+                metrics.cache_hit('library_l1')
+                return entry[1], entry[2]
+            self._forget(key, entry)
+        metrics.cache_miss('library_l1')
+        if self.l2 is None:
+            return None
+
+        try:
+            data = self.l2.get(self.l2_key(key))
+        except CacheBackendError as e:
+            self._l2_failed('get', e)
+            return None
+        if data is not None:
+            try:
+                value, expires_at, stored_at = decode_value(data)
+            except (ValueError, zlib.error) as e:
+                logger.warning(f"Discarding unreadable shared cache entry for '{key}': {str(e)}")
+                value, expires_at, stored_at = None, 0.0, 0.0
+            if expires_at <= now:
+                value = None
+            elif self.on_load is not None:
+                value = self.on_load(key, value, stored_at)
+            if value is not None:
+                metrics.cache_hit('library_l2')
+                value = freeze(value)
+                self._remember(key, expires_at, value, stored_at)
+                return value, stored_at
+        metrics.cache_miss('library_l2')
+        return None
+
+    def set(self, key: str, value: Any, ttl: float) -> Any:
+        """
+        Store a value in both tiers.
+
+        Returns:
+            The frozen value (hand this out instead of the original)
+        """
+        value = freeze(value)
+        now = time.time()
+        expires_at = now + ttl
+        self._remember(key, expires_at, value, now)
+        if self.l2 is not None:
+            self._l2_set(key, value, expires_at, now)
+        return value
+
+    def update(self, key: str, change: Callable[[Any], Any]) -> bool:
+        """
+        Rewrite a cached value in both tiers, keeping its expiry.
+
+        Args:
+            key: Cache key (looked up in L1, then L2)
+            change: Called with a writable copy of the value; returns the new
+                value, or None to drop the key
+
+        Returns:
+            False if the key was not cached
+        """
+        if self.get(key) is None:
+            return False
+        entry = self._entries.get(key)
+        if entry is None:
+            return False
+        expires_at, value, stored_at, _ = entry
+        value = change(thaw(value))
+        if value is None:
+            self.delete(key)
+            return True
+        value = freeze(value)
+        self._remember(key, expires_at, value, stored_at)
+        if self.l2 is not None:
+            self._l2_set(key, value, expires_at, stored_at)
+        return True
+
+    def tagged(self, tag: str) -> List[str]:
+        """Keys of the L1 entries carrying a tag."""
+        with self._lock:
+            return list(self._tagged.get(tag, ()))
+
+    def delete(self, key: str) -> None:
+        """Drop a key from both tiers."""
+        self._forget(key)
+        if self.l2 is not None:
+            try:
+                self.l2.delete(self.l2_key(key))
+            except CacheBackendError as e:
+                self._l2_failed('delete', e)
+
+    def clear_local(self) -> None:
+        """Drop every L1 entry (L2 keeps its entries until they expire)."""
+        with self._lock:
+            self._entries.clear()
+            self._tagged.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,250 @@
+"""
+Cache events checks and benchmark.
+Pushes signed change batches through main.handle_cache_events and checks that:
+
+    - unsigned, badly signed, expired and malformed batches are rejected
+    - redelivered events and older versions are skipped (per book field)
+    - an availability change shows in book detail and search replies without a backend call
+    - an added event shows in the upcoming events, a title change in the recommendation title index
+    - with a shared SQLite tier, a sibling instance picks the change up from the change log,
+      and values it loads from L2 that predate the change are patched on the way in
+    - a turn reads at most LIBRARY_CACHE_SYNC_BATCH log entries; warm-up reads the whole backlog
+
+It also reports the cost of applying an event and of an idle sync.
+Exits non-zero if a check fails.
+
+Usage:
+    python benchmarks/bench_cache_events.py
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import tempfile
+import argparse
+import statistics
+from typing import Dict, Any, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+SECRET = 'bench-secret'
+os.environ.setdefault('USE_MOCK_DATA', 'true')
+os.environ['LIBRARY_CACHE'] = 'true'
+os.environ['LIBRARY_CACHE_L2'] = ''
+os.environ['RESPONSE_CACHE'] = 'true'
+os.environ['CACHE_EVENTS_SECRET'] = SECRET
+
+import main
+import codec
+import library_service
+from cache_events import CacheEvents, MAX_BACKLOG, sign
+from response_cache import ResponseCache
+from recommendations import RecommendationTable
+from replay import ReplayRequest
+
+FAILURES: List[str] = []
+
+
+def check(condition: bool, message: str) -> None:
+    print(f"  {'ok  ' if condition else 'FAIL'} {message}")
+    if not condition:
+        FAILURES.append(message)
+
+
+class EventRequest:
+    """Stand-in for the Flask request handed to handle_cache_events."""
+
+    def __init__(self, body: bytes, headers: Dict[str, str]):
+        self._data = body
+        self.headers = headers
+
+    def get_data(self, **kwargs):
+        return self._data
+
+
+def signed(events: List[Dict[str, Any]], secret: str = SECRET, sent_at: float = None):
+    body = json.dumps({'events': events}).encode('utf-8')
+    timestamp = str(int(time.time() if sent_at is None else sent_at))
+    return body, {'X-Signature': sign(secret, body, timestamp), 'X-Signature-Timestamp': timestamp}
+
+
+def push(events: List[Dict[str, Any]], **kwargs):
+    body, status, _ = main.handle_cache_events(EventRequest(*signed(events, **kwargs)))
+    return status, codec.loads(body)
+
+
+def turn(tag: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
+    body = {
+        'fulfillmentInfo': {'tag': tag},
+        'sessionInfo': {'session': 'projects/p/locations/l/agents/a/sessions/bench', 'parameters': parameters},
+        'pageInfo': {'currentPage': {'displayName': 'Page'}, 'currentFlow': {'displayName': 'Flow'}}
+    }
+    return codec.reply_json(main.handle_webhook(ReplayRequest(body)))
+
+
+def count_calls(service) -> Dict[str, int]:
+    calls = {'count': 0}
+    original = service._call_api
+
+    def counted(endpoint, method='GET', data=None):
+        calls['count'] += 1
+        return original(endpoint, method, data)
+
+    service._call_api = counted
+    return calls
+
+
+def check_auth() -> None:
+    print("\nauthentication")
+    body, headers = signed([])
+    check(main.handle_cache_events(EventRequest(body, {}))[1] == 401, 'unsigned batch rejected (401)')
+    check(push([], secret='wrong')[0] == 401, 'wrong secret rejected (401)')
+    check(push([], sent_at=time.time() - 3600)[0] == 401, 'hour-old timestamp rejected (401)')
+    tampered = body.replace(b'[]', b'[{}]')
+    check(main.handle_cache_events(EventRequest(tampered, headers))[1] == 401, 'modified body rejected (401)')
+    junk = b'not json'
+    timestamp = str(int(time.time()))
+    request = EventRequest(junk, {'X-Signature': sign(SECRET, junk, timestamp), 'X-Signature-Timestamp': timestamp})
+    check(main.handle_cache_events(request)[1] == 400, 'signed but malformed batch rejected (400)')
+    unconfigured = CacheEvents(main.library_service, main.response_cache, main.recommendation_table, secret='')
+    check(unconfigured.handle(body, headers)[0] == 503, 'endpoint disabled without a secret (503)')
+
+
+def check_in_place() -> None:
+    print("\nin-place updates")
+    calls = count_calls(main.library_service)
+    # The detail card shows what get_book_details returns; search replies carry their results
+    turn('get-book-details', {'selected_item_id': '1'})
+    details = lambda: main.library_service.get_book_details('1')
+    search = lambda: turn('book-search', {'book_title': 'The Great Gatsby'})['sessionInfo']['parameters']['search_results'][0]
+    check(details()['availability'] == 'Available' and search()['availability'] == 'Available', 'book 1 starts Available')
+    before = calls['count']
+
+    status, counts = push([{'id': 'a-1', 'type': 'book.availability_changed', 'book_id': '1',
+                            'availability': 'Checked Out', 'version': 10}])
+    check(status == 200 and counts['applied'] == 1, f"availability change applied ({counts})")
+    check(details()['availability'] == 'Checked Out', 'book details show the new availability')
+    check(search()['availability'] == 'Checked Out', 'search reply shows the new availability')
+    check(calls['count'] == before, f"without a backend call ({calls['count'] - before} calls)")
+
+    status, counts = push([{'id': 'a-1', 'type': 'book.availability_changed', 'book_id': '1',
+                            'availability': 'Checked Out', 'version': 10}])
+    check(counts == {'applied': 0, 'duplicate': 1, 'stale': 0, 'invalid': 0}, f"redelivered event skipped ({counts})")
+    status, counts = push([{'id': 'a-0', 'type': 'book.availability_changed', 'book_id': '1',
+                            'availability': 'Available', 'version': 9}])
+    check(counts['stale'] == 1 and details()['availability'] == 'Checked Out', 'older version skipped, newer value kept')
+    status, counts = push([{'id': 'u-9', 'type': 'book.updated', 'book_id': '1', 'version': 9,
+                            'changes': {'title': 'The Great Gatsby (Centenary Edition)'}}])
+    check(counts['applied'] == 1 and details()['title'].endswith('(Centenary Edition)')
+          and details()['availability'] == 'Checked Out',
+          'older version of another field still applies')
+    check(main.recommendation_table.resolve_book_id(title='the great gatsby (centenary edition)') == '1',
+          'recommendation title index updated')
+    status, counts = push([{'id': 'bad', 'type': 'book.renamed', 'book_id': '1'}, {'type': 'event.added'}])
+    check(counts['invalid'] == 2, f"unknown and incomplete events counted invalid ({counts})")
+
+    events = main.library_service.get_upcoming_events()
+    before = calls['count']
+    push([{'id': 'ev-add-1', 'type': 'event.added', 'event': {'id': 'evt-new', 'title': 'Poetry Night', 'date': '2030-01-01'}}])
+    titles = [event['title'] for event in main.library_service.get_upcoming_events()]
+    check(titles == [event['title'] for event in events] + ['Poetry Night'] and calls['count'] == before,
+          'added event listed without a backend call')
+
+    before = calls['count']
+    push([{'id': 'u-10', 'type': 'book.updated', 'book_id': '1', 'version': 11}])
+    check(details()['availability'] == 'Available' and calls['count'] == before + 1,
+          'book.updated without changes refetches the book')
+
+
+def instance(l2_url: str):
+    """(LibraryService, CacheEvents) of a new instance sharing an L2."""
+    os.environ['LIBRARY_CACHE_L2'] = l2_url
+    service = library_service.LibraryService()
+    events = CacheEvents(service, ResponseCache(enabled=True), RecommendationTable.from_file(),
+                         secret=SECRET, sync_interval=0)
+    return service, events
+
+
+def check_siblings() -> None:
+    print("\nsibling instances (shared SQLite tier)")
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite://{os.path.join(tmp, 'l2.db')}"
+        (_, a), (service_b, b), (service_w, writer) = instance(url), instance(url), instance(url)
+        # B holds book 2 in L1; only the writer holds a search showing it (B would load it from L2)
+        service_b.get_book_details('2')
+        service_w.search_books(title='Mockingbird')
+        search_key = library_service.cache_key('books/search', {'title': 'Mockingbird'})
+        b_details = lambda: b.cache.get('books/2')['book']['availability']
+
+        status, counts = a.handle(*signed([{'id': 's-1', 'type': 'book.availability_changed', 'book_id': '2',
+                                            'availability': 'Checked Out', 'version': 1}]))
+        check(status == 200 and counts['applied'] == 1, 'instance A applies and publishes the change')
+        check(b_details() == 'Available', 'B still holds the old value before it syncs')
+        applied = b.sync()
+        check(applied == 1 and b_details() == 'Checked Out', f"B applies it from the change log ({applied} event)")
+        check(b.sync() == 0, 'a second sync applies nothing')
+        _, fresh = instance(url)
+        check(fresh.cache.get('books/2')['book']['availability'] == 'Checked Out', "A's write-through reached L2")
+        loaded = b.cache.get(search_key)
+        check(loaded is not None and loaded['books'][0]['availability'] == 'Checked Out',
+              'a search stored in L2 before the change is patched when B loads it')
+        check(writer.sync() == 1 and writer.cache.get(search_key)['books'][0]['availability'] == 'Checked Out',
+              "the writer's own L1 copy is patched by its sync")
+        _, late = instance(url)
+        check(late.sync(force=True, limit=MAX_BACKLOG) == 1, 'a starting instance replays the retained log in warm-up')
+
+        for i in range(40):
+            a.handle(*signed([{'id': f"b-{i}", 'type': 'book.availability_changed', 'book_id': '3',
+                               'availability': 'Checked Out', 'version': 1 + i}]))
+        _, cold = instance(url)
+        reads = []
+        original_get = cold.log.get
+        entry_prefix = f"{cold._log_prefix}:"
+        cold.log.get = lambda key: reads.append(key.startswith(entry_prefix) and not key.endswith(':seq')) or original_get(key)
+        last = int(a.log.get(f"{a._log_prefix}:seq"))
+        # Only a read cut short by the batch limit lets the next turn read before the interval
+        cold.sync_interval = 3600
+        per_turn = []
+        while cold._cursor != last and len(per_turn) < 100:
+            reads.clear()
+            cold.sync()
+            per_turn.append(sum(reads))
+        check(max(per_turn) <= cold.sync_batch,
+              f"a turn reads at most {cold.sync_batch} log entries ({max(per_turn)}), the backlog carries over")
+        check(cold._cursor == last and cold.sync() == 0, f"the backlog is caught up over {len(per_turn)} turns")
+        cold.log.get = original_get
+        _, warmed = instance(url)
+        check(warmed.sync(force=True, limit=MAX_BACKLOG) == 41 and warmed.sync() == 0, 'warm-up catches up in one read')
+
+        timings = []
+        for i in range(200):
+            start = time.perf_counter()
+            a.apply([{'id': f"t-{i}", 'type': 'book.availability_changed', 'book_id': '2',
+                      'availability': 'Available' if i % 2 else 'Checked Out', 'version': 2 + i}], time.time())
+            timings.append(time.perf_counter() - start)
+        idle = []
+        for _ in range(200):
+            start = time.perf_counter()
+            b.sync(force=True)
+            idle.append(time.perf_counter() - start)
+        print(f"  apply one event (L1 + SQLite write-through): {statistics.median(timings) * 1e6:.0f} us; "
+              f"sync with nothing new: {statistics.median(idle) * 1e6:.0f} us")
+
+
+def main_cli():
+    argparse.ArgumentParser(description='Check and benchmark push invalidation of the catalog caches.').parse_args()
+    logging.disable(logging.ERROR)
+    check_auth()
+    check_in_place()
+    check_siblings()
+    if FAILURES:
+        print(f"\nFAIL: {len(FAILURES)} check(s) failed")
+        sys.exit(1)
+    print("\nOK")
+
+
+if __name__ == '__main__':
+    main_cli()
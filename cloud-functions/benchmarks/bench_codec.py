@@ -0,0 +1,133 @@
+"""
+Codec benchmark: JSON CPU cost per webhook turn.
+Replays the corpus once to collect each turn's request body, handler response
+and final response, then times only the JSON work a turn does:
+
+    previous  Flask get_json, the indented json.dumps request/response logging,
+              Flask's JSON response and the metrics size re-encoding
+    codec     codec.request_json, logging the received and encoded bytes,
+              one codec.dumps and codec.reply (with each available backend)
+
+Times are CPU time (process_time) per turn, best of --rounds.
+
+Usage:
+    python benchmarks/bench_codec.py
+    python benchmarks/bench_codec.py --gzip-min-bytes 1024 --rounds 9
+"""
+
+import os
+import sys
+import copy
+import glob
+import json
+import time
+import logging
+import argparse
+from typing import Dict, Any, List, Callable, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+os.environ.setdefault('USE_MOCK_DATA', 'true')
+
+import flask
+
+import main
+import codec
+from webhook_request import WebhookRequest
+from replay import load_corpus
+
+
+class Turn:
+    """One replayed turn and the objects the webhook serialized for it."""
+
+    def __init__(self, body: Dict[str, Any]):
+        self.raw = json.dumps(body).encode('utf-8')
+        request_json = copy.deepcopy(body)
+        session_info = request_json.get('sessionInfo', {})
+        self.parts = (
+            session_info,
+            request_json.get('intentInfo', {}),
+            request_json.get('pageInfo', {}),
+            session_info.get('parameters', {})
+        )
+        webhook_request = WebhookRequest.from_json(request_json)
+        self.response = main.route_request(webhook_request)
+        self.final_response = main.build_response(self.response, webhook_request)
+
+
+def previous_path(app: flask.Flask, turn: Turn) -> None:
+    """JSON work per turn before the codec layer."""
+    with app.test_request_context('/', method='POST', data=turn.raw, content_type='application/json'):
+        request_json = flask.request.get_json(silent=True)
+        json.dumps(request_json, indent=2)
+        for part in turn.parts:
+            json.dumps(part, indent=2)
+        json.dumps(turn.response, indent=2)
+        json.dumps(turn.final_response, indent=2)
+        app.make_response(turn.final_response)
+        json.dumps(turn.final_response, separators=(',', ':')).encode('utf-8')
+
+
+def codec_path(app: flask.Flask, turn: Turn) -> None:
+    """JSON work per turn through codec.py."""
+    with app.test_request_context('/', method='POST', data=turn.raw, content_type='application/json',
+                                  headers={'Accept-Encoding': 'gzip'}):
+        request = flask.request
+        codec.request_json(request)
+        request.get_data().decode('utf-8', 'replace')
+        body = codec.dumps(turn.final_response)
+        body.decode('utf-8')
+        app.make_response(codec.reply(body, request))
+
+
+def context_only(app: flask.Flask, turn: Turn) -> None:
+    """Request context setup shared by both paths (subtracted from each)."""
+    with app.test_request_context('/', method='POST', data=turn.raw, content_type='application/json'):
+        pass
+
+
+def measure(fn: Callable, app: flask.Flask, turns: List[Turn], rounds: int) -> float:
+    """Best CPU nanoseconds per turn over rounds."""
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.process_time_ns()
+        for turn in turns:
+            fn(app, turn)
+        best = min(best, (time.process_time_ns() - start) / len(turns))
+    return best
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description='Compare JSON CPU cost per turn with and without codec.py.')
+    parser.add_argument('corpus', nargs='*', help='JSONL corpus files (default: benchmarks/corpora/*.jsonl)')
+    parser.add_argument('--rounds', type=int, default=7, help='Timed passes over the corpus')
+    parser.add_argument('--repeat', type=int, default=20, help='Corpus copies per pass')
+    parser.add_argument('--gzip-min-bytes', type=int, default=0, help='Gzip codec replies at least this large')
+    args = parser.parse_args()
+    logging.disable(logging.ERROR)
+
+    paths = args.corpus or sorted(glob.glob(os.path.join(BENCH_DIR, 'corpora', '*.jsonl')))
+    turns = [Turn(body) for body in load_corpus(paths)] * args.repeat
+    codec.GZIP_MIN_BYTES = args.gzip_min_bytes
+    app = flask.Flask('bench_codec')
+
+    backends: List[Tuple[str, Tuple[str, Callable, Callable]]] = [('json', codec._select_backend('json'))]
+    if codec.BACKEND != 'json':
+        backends.append((codec.BACKEND, (codec.BACKEND, codec.loads, codec.dumps)))
+
+    base = measure(context_only, app, turns, args.rounds)
+    previous = measure(previous_path, app, turns, args.rounds) - base
+    sizes = sorted(len(turn.raw) + len(codec.dumps(turn.final_response)) for turn in turns)
+    print(f"{len(turns) // args.repeat} turns, median request+response {sizes[len(sizes) // 2]} B, "
+          f"gzip {'>= ' + str(args.gzip_min_bytes) + ' B' if args.gzip_min_bytes else 'off'}")
+    print(f"\n{'path':<20} {'CPU us/turn':>12} {'vs previous':>12}")
+    print(f"{'previous':<20} {previous / 1000:>12.1f} {'':>12}")
+    for label, (_name, loads, dumps) in backends:
+        codec.loads, codec.dumps = loads, dumps
+        cost = measure(codec_path, app, turns, args.rounds) - base
+        print(f"{'codec/' + label:<20} {cost / 1000:>12.1f} {cost / previous:>11.0%}")
+
+
+if __name__ == '__main__':
+    main_cli()
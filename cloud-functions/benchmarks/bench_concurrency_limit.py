@@ -0,0 +1,283 @@
+"""
+Adaptive concurrency limit checks and benchmark.
+Drives LibraryService._call_api from many threads against benchmarks/standin_server.py,
+with a books/search backend that serves --capacity requests at once (others
+queue), and checks that:
+
+    - without a limit, latency grows with the number of callers
+    - with LIBRARY_API_LIMIT=true the limit settles near what the backend serves
+      within the latency tolerance, latency stays near the no-load latency and
+      throughput near the backend's
+    - the limit follows the backend when its capacity drops and comes back
+    - injected 5xx errors shrink the limit, and it grows again once they stop
+    - a lightly loaded endpoint with jittery latency keeps its limit
+    - client errors (4xx) do not count as overload
+    - rejected calls and failed writes raise instead of answering with mock data
+    - the limit and the rejections are exported as metrics
+
+It also reports the cost of taking and returning a slot.
+Exits non-zero if a check fails.
+
+Usage:
+    python benchmarks/bench_concurrency_limit.py
+    python benchmarks/bench_concurrency_limit.py --latency 40 --capacity 16 --clients 96 --seconds 5
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import threading
+import statistics
+from typing import Dict, Any, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import metrics
+import library_service
+from concurrency_limit import AimdLimit
+from standin_server import start_server
+
+FAILURES: List[str] = []
+ROUTE = 'books/search'
+
+
+def check(condition: bool, message: str) -> None:
+    print(f"  {'ok  ' if condition else 'FAIL'} {message}")
+    if not condition:
+        FAILURES.append(message)
+
+
+def service(base_url: str, limited: bool) -> library_service.LibraryService:
+    os.environ.update({
+        'USE_MOCK_DATA': 'false',
+        'LIBRARY_API_URL': base_url,
+        'LIBRARY_CACHE': 'false',
+        'LIBRARY_API_POOL_SIZE': '128',
+        'LIBRARY_API_LIMIT': 'true' if limited else 'false'
+    })
+    return library_service.LibraryService()
+
+
+def backend(server, latency: str, capacity: int, error_rate: float = 0.0) -> None:
+    settings = {'latency': latency, 'concurrency': capacity, 'error_rate': error_rate}
+    server.RequestHandlerClass.state.configure({'endpoints': {ROUTE: settings}})
+
+
+def run(svc, clients: int, seconds: float) -> Dict[str, Any]:
+    """Call books/search from clients threads for seconds; rejected callers back off 10 ms."""
+    latencies, failed, limits = [], [0], []
+    lock = threading.Lock()
+    stop = time.monotonic() + seconds
+
+    def caller():
+        while time.monotonic() < stop:
+            start = time.perf_counter()
+            try:
+                _, ok = svc._call_api(ROUTE, 'GET', {'title': 'Dune'})
+            except library_service.LibraryBusyError:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok:
+                    latencies.append(elapsed * 1000)
+                else:
+                    failed[0] += 1
+            if not ok:
+                time.sleep(0.01)
+
+    threads = [threading.Thread(target=caller) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    while time.monotonic() < stop:
+        time.sleep(0.05)
+        if svc.limits is not None:
+            limits.append(svc.limits.get(ROUTE).limit)
+    for thread in threads:
+        thread.join()
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else [0.0] * 99
+    # The limit over the last third of the run, once it has settled
+    settled = limits[len(limits) * 2 // 3:]
+    return {
+        'served': len(latencies), 'failed': failed[0], 'rps': len(latencies) / seconds,
+        'p50': quantiles[49], 'p99': quantiles[98],
+        'limit': statistics.mean(settled) if settled else None
+    }
+
+
+def report(name: str, result: Dict[str, Any]) -> None:
+    limit = f"{result['limit']:.1f}" if result['limit'] is not None else '-'
+    print(f"  {name:<28} {result['served']:>7} {result['rps']:>7.0f} {result['failed']:>8} "
+          f"{result['p50']:>8.1f} {result['p99']:>8.1f} {limit:>6}")
+
+
+def header() -> None:
+    print(f"  {'run':<28} {'served':>7} {'rps':>7} {'rejected':>8} {'p50 ms':>8} {'p99 ms':>8} {'limit':>6}")
+
+
+def check_convergence(server, base_url: str, args) -> float:
+    latency, capacity = f"const:{args.latency}", args.capacity
+    ideal_rps = capacity * 1000 / args.latency
+    print(f"\nconvergence ({args.clients} callers, backend serves {capacity} at once in {args.latency:.0f} ms, "
+          f"{ideal_rps:.0f} rps at most)")
+    backend(server, latency, capacity)
+    header()
+    unlimited = run(service(base_url, False), args.clients, args.seconds)
+    report('no limit', unlimited)
+    svc = service(base_url, True)
+    limited = run(svc, args.clients, args.seconds)
+    report('adaptive limit', limited)
+    limit = svc.limits.get(ROUTE)
+    tolerance, baseline = limit.tolerance, limit.baseline * 1000
+    print(f"  learned no-load latency {baseline:.1f} ms, tolerance {tolerance}x")
+
+    check(unlimited['p50'] > args.latency * args.clients / capacity * 0.7,
+          f"without a limit callers queue at the backend (p50 {unlimited['p50']:.0f} ms)")
+    check(capacity * 0.75 <= limited['limit'] <= capacity * tolerance * 1.6,
+          f"limit settles near the backend's capacity ({limited['limit']:.1f} for {capacity})")
+    check(limited['p50'] <= baseline * tolerance * 1.25,
+          f"p50 stays within the tolerance of the no-load latency ({limited['p50']:.1f} ms)")
+    check(limited['p50'] < unlimited['p50'] / 2, 'p50 at least halved compared to no limit')
+    check(limited['rps'] >= min(unlimited['rps'], ideal_rps) * 0.75,
+          f"throughput kept ({limited['rps']:.0f} rps vs {unlimited['rps']:.0f} without a limit)")
+    check(limited['failed'] > 0 and metrics.backend_rejections.value(ROUTE) >= limited['failed'],
+          f"excess calls rejected and counted ({limited['failed']})")
+    return limited['limit']
+
+
+def check_capacity_steps(server, base_url: str, args, settled: float) -> None:
+    print("\ncapacity drops to a half, then recovers")
+    latency, capacity = f"const:{args.latency}", args.capacity
+    svc = service(base_url, True)
+    header()
+    report('full capacity', run(svc, args.clients, args.seconds))
+    backend(server, latency, capacity // 2)
+    halved = run(svc, args.clients, args.seconds)
+    report('half capacity', halved)
+    backend(server, latency, capacity)
+    recovered = run(svc, args.clients, args.seconds)
+    report('full capacity again', recovered)
+    check(halved['limit'] <= settled * 0.75, f"limit follows the capacity down ({halved['limit']:.1f})")
+    check(recovered['limit'] >= settled * 0.75, f"and back up ({recovered['limit']:.1f})")
+
+
+def check_errors(server, base_url: str, args) -> None:
+    print("\nbackend errors")
+    latency, capacity = f"const:{args.latency}", args.capacity
+    svc = service(base_url, True)
+    backend(server, latency, capacity)
+    header()
+    healthy = run(svc, args.clients, args.seconds)
+    report('healthy', healthy)
+    backend(server, latency, capacity, error_rate=0.3)
+    failing = run(svc, args.clients, args.seconds)
+    report('30% 5xx', failing)
+    backend(server, latency, capacity)
+    recovered = run(svc, args.clients, args.seconds)
+    report('healthy again', recovered)
+    check(failing['limit'] < healthy['limit'] / 2, f"errors shrink the limit ({failing['limit']:.1f})")
+    check(recovered['limit'] > failing['limit'] * 2, f"the limit grows again once they stop ({recovered['limit']:.1f})")
+
+
+def check_light_load(server, base_url: str, args) -> None:
+    print("\nlight load, jittery latency")
+    backend(server, f"lognormal:{args.latency}:0.5", args.capacity)
+    svc = service(base_url, True)
+    result = run(svc, 2, args.seconds)
+    header()
+    report('2 callers', result)
+    limit = svc.limits.get(ROUTE)
+    check(result['failed'] == 0 and limit.limit >= limit.min_limit + 1,
+          f"no rejections and the limit is not driven down ({limit.limit:.1f})")
+
+    class NotFound(Exception):
+        response = type('Response', (), {'status_code': 404})()
+
+    class Unavailable(Exception):
+        response = type('Response', (), {'status_code': 503})()
+
+    check(not library_service._overloaded(NotFound()) and library_service._overloaded(Unavailable())
+          and library_service._overloaded(ConnectionError()),
+          '404 is not overload; 503 and connection failures are')
+
+
+def check_no_mock_fallback(server, base_url: str) -> None:
+    print("\nrejected calls and failed writes")
+    # Imported here: main builds its singletons from the environment service() sets
+    import main
+    server.RequestHandlerClass.state.configure({})
+    svc = main.library_service = service(base_url, True)
+    limit = svc.limits.get('holds')
+    limit.limit, limit.max_wait = 1, 0
+    limit.acquire()
+    rejected = main.handle_holds('user123', {'book_id': '2'})
+    limit.release(0.02)
+    check('Successfully' not in rejected['message'] and 'try again' in rejected['message'],
+          f"a rejected hold is not reported as placed ({rejected['message']!r})")
+    limit = svc.limits.get('auth/login')
+    limit.limit, limit.max_wait = 1, 0
+    limit.acquire()
+    login = main.handle_authentication(type('Turn', (), {'parameters': {'user_id': 'nobody', 'password': 'wrong'}})())
+    limit.release(0.02)
+    check('Welcome' not in login['message'] and not login['parameters'].get('authenticated'),
+          f"a rejected login does not log anyone in ({login['message']!r})")
+
+    server.RequestHandlerClass.state.configure({'error_rate': 1.0})
+    for name, call in (('hold', lambda: svc.place_hold('user123', '2')),
+                       ('login', lambda: svc.authenticate_user('nobody', 'wrong')),
+                       ('payment', lambda: svc.pay_fine('user123', 'f1', 1.0))):
+        try:
+            call()
+            raised = False
+        except library_service.LibraryApiError:
+            raised = True
+        check(raised, f"a failed {name} raises instead of answering with mock data")
+    _, cacheable = svc._call_api(ROUTE, 'GET', {'title': 'Dune'})
+    check(not cacheable, 'a failed read still falls back to (uncached) mock data')
+    server.RequestHandlerClass.state.configure({})
+
+
+def check_metrics_and_cost() -> None:
+    print("\nmetrics and overhead")
+    rendered = metrics.render()
+    check(f'library_api_concurrency_limit{{endpoint="{ROUTE}"}}' in rendered
+          and '# TYPE library_api_concurrency_limit gauge' in rendered, 'limit exported as a gauge')
+    check(f'library_api_rejections_total{{endpoint="{ROUTE}"}}' in rendered, 'rejections exported')
+    limit = AimdLimit('bench', initial=50)
+    samples = []
+    for _ in range(20000):
+        start = time.perf_counter()
+        limit.acquire()
+        limit.release(0.02)
+        samples.append(time.perf_counter() - start)
+    print(f"  acquire + release, uncontended: {statistics.median(samples) * 1e6:.2f} us median")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description='Check and benchmark the adaptive concurrency limit on library API calls.')
+    parser.add_argument('--latency', type=float, default=20.0, help='Backend latency in milliseconds')
+    parser.add_argument('--capacity', type=int, default=8, help='Requests the backend serves at once')
+    parser.add_argument('--clients', type=int, default=48, help='Concurrent callers')
+    parser.add_argument('--seconds', type=float, default=3.0, help='Duration of each run')
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    server, base_url = start_server()
+    settled = check_convergence(server, base_url, args)
+    check_capacity_steps(server, base_url, args, settled)
+    check_errors(server, base_url, args)
+    check_light_load(server, base_url, args)
+    check_no_mock_fallback(server, base_url)
+    check_metrics_and_cost()
+    server.shutdown()
+
+    if FAILURES:
+        print(f"\nFAIL: {len(FAILURES)} check(s) failed")
+        sys.exit(1)
+    print("\nOK")
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,122 @@
+"""
+FAQ matching checks and benchmark.
+Runs everyday phrasings of the questions the keyword matcher used to answer
+(hours, borrowing policy, contact) and of the other corpus entries through
+the FAQ index, and checks that:
+
+    - each phrasing picks the expected entry with confidence at or above FAQ_MIN_CONFIDENCE
+    - off-topic questions stay below the threshold, so the handler gives the generic reply
+
+It also reports the cost of an uncached search.
+Exits non-zero if a check fails.
+
+Usage:
+    python benchmarks/bench_faq.py
+    python benchmarks/bench_faq.py --searches 20000
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('USE_MOCK_DATA', 'true')
+
+import main
+from faq_index import FaqIndex, tokenize
+
+# Phrasing -> expected entry. The first three groups were answered by the
+# keyword matcher ('hour', 'policy'/'borrow', 'contact') before the index.
+PHRASINGS = [
+    ('What are your hours?', 'hours'),
+    ('what are your opening hours', 'hours'),
+    ('library hours', 'hours'),
+    ('What are the hours on Saturday?', 'hours'),
+    ('When do you close on Sunday?', 'hours'),
+    ('What time do you open?', 'hours'),
+    ('How many books can I borrow?', 'borrowing-policy'),
+    ('What is the borrowing policy?', 'borrowing-policy'),
+    ('How long can I borrow a DVD?', 'borrowing-policy'),
+    ('borrowing policies', 'borrowing-policy'),
+    ('How do I contact you?', 'contact'),
+    ('contact information', 'contact'),
+    ('What is your phone number?', 'contact'),
+    ('How much are late fees?', 'fines'),
+    ('How much do overdue fines cost?', 'fines'),
+    ('Can I renew my books?', 'renewals'),
+    ('Do you have ebooks?', 'digital-resources'),
+    ('Is there wifi?', 'wifi-computers'),
+    ('How do I get a library card?', 'library-card'),
+    ('I lost my library card', 'lost-card'),
+    ('Can I print documents?', 'printing'),
+    ('Can I reserve a study room?', 'study-rooms'),
+]
+
+OFF_TOPIC = [
+    'Can I bring my dog?',
+    'Do you sell pizza?',
+    'What is the weather like today?',
+    'Who won the football game last night?',
+    'Can I book a flight?',
+    'What time is the game?',
+]
+
+FAILURES: List[str] = []
+
+
+def check(condition: bool, message: str) -> None:
+    print(f"  {'ok  ' if condition else 'FAIL'} {message}")
+    if not condition:
+        FAILURES.append(message)
+
+
+def check_phrasings(index: FaqIndex) -> None:
+    print(f"\neveryday phrasings (threshold {main.FAQ_MIN_CONFIDENCE})")
+    for query, expected in PHRASINGS:
+        match = index.search(query)
+        found = match['id'] if match else None
+        confidence = match['confidence'] if match else 0.0
+        check(found == expected and confidence >= main.FAQ_MIN_CONFIDENCE,
+              f"{query!r} -> {found} ({confidence:.2f}), expected {expected}")
+
+
+def check_off_topic(index: FaqIndex) -> None:
+    print("\noff-topic questions")
+    for query in OFF_TOPIC:
+        match = index.search(query)
+        confidence = match['confidence'] if match else 0.0
+        check(confidence < main.FAQ_MIN_CONFIDENCE,
+              f"{query!r} -> {match['id'] if match else None} ({confidence:.2f}) below threshold")
+
+
+def report_search_cost(index: FaqIndex, searches: int) -> None:
+    print("\nsearch cost")
+    queries = [query for query, _ in PHRASINGS] + OFF_TOPIC
+    start = time.perf_counter_ns()
+    for i in range(searches):
+        index._rank(tuple(sorted(set(tokenize(queries[i % len(queries)])))))
+    elapsed = time.perf_counter_ns() - start
+    print(f"  {elapsed / searches / 1000:.1f} us per uncached search")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description='Check FAQ matching against everyday phrasings.')
+    parser.add_argument('--searches', type=int, default=5000, help='Uncached searches to time')
+    args = parser.parse_args()
+    logging.disable(logging.ERROR)
+    index = FaqIndex.from_file()
+    check_phrasings(index)
+    check_off_topic(index)
+    report_search_cost(index, args.searches)
+    if FAILURES:
+        print(f"\nFAIL: {len(FAILURES)} check(s) failed")
+        sys.exit(1)
+    print("\nOK")
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,244 @@
+"""
+Popularity tracking checks and benchmark.
+Feeds Zipf-distributed query streams to popularity.SpaceSaving and
+popularity.Popularity, and checks that:
+
+    - the tracked top keys match the exact top keys, with counts within the error bound
+    - memory stays bounded by the capacity however many distinct keys are seen
+    - counts survive a save/load round trip and halving forgets the rare keys
+    - warming the top searches and books leaves their next reads with no backend call
+    - the empty search prompt suggests the trending books
+    - tick starts no run on a fresh instance and at most one per interval, on turns served from the
+      response cache too, and does it in bounded steps on the turns without a background thread
+
+It also reports the cost of recording a query.
+Exits non-zero if a check fails.
+
+Usage:
+    python benchmarks/bench_popularity.py
+    python benchmarks/bench_popularity.py --keys 50000 --events 500000
+"""
+
+import os
+import sys
+import time
+import random
+import logging
+import tempfile
+import threading
+import argparse
+import statistics
+from collections import Counter
+from typing import Dict, Any, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+TMP = tempfile.mkdtemp(prefix='bench-popularity-')
+os.environ.setdefault('USE_MOCK_DATA', 'true')
+os.environ['LIBRARY_CACHE'] = 'true'
+os.environ['LIBRARY_CACHE_L2'] = ''
+os.environ['RESPONSE_CACHE'] = 'true'
+os.environ['POPULARITY_TRACKING'] = 'true'
+os.environ['POPULARITY_FILE'] = os.path.join(TMP, 'main.json')
+os.environ['POPULARITY_INTERVAL'] = '3600'
+
+import main
+import codec
+import library_service
+from popularity import SpaceSaving, Popularity
+from replay import ReplayRequest
+
+FAILURES: List[str] = []
+
+
+def check(condition: bool, message: str) -> None:
+    print(f"  {'ok  ' if condition else 'FAIL'} {message}")
+    if not condition:
+        FAILURES.append(message)
+
+
+def zipf_stream(keys: int, events: int, seed: int = 7) -> List[str]:
+    rng = random.Random(seed)
+    weights = [1.0 / rank for rank in range(1, keys + 1)]
+    return [f"key-{index}" for index in rng.choices(range(keys), weights=weights, k=events)]
+
+
+def turn(tag: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
+    body = {
+        'fulfillmentInfo': {'tag': tag},
+        'sessionInfo': {'session': 'projects/p/locations/l/agents/a/sessions/bench', 'parameters': parameters},
+        'pageInfo': {'currentPage': {'displayName': 'Page'}, 'currentFlow': {'displayName': 'Book Search Flow'}}
+    }
+    return codec.reply_json(main.handle_webhook(ReplayRequest(body)))
+
+
+def count_calls(service) -> Dict[str, int]:
+    calls = {'count': 0}
+    original = service._call_api
+
+    def counted(endpoint, method='GET', data=None):
+        calls['count'] += 1
+        return original(endpoint, method, data)
+
+    service._call_api = counted
+    return calls
+
+
+def check_accuracy(keys: int, events: int, capacity: int) -> None:
+    print(f"\nSpace-Saving accuracy ({events} Zipf events over {keys} keys, {capacity} counters)")
+    stream = zipf_stream(keys, events)
+    exact = Counter(stream)
+    summary = SpaceSaving(capacity)
+    for key in stream:
+        summary.add(key)
+    check(len(summary) <= capacity, f"{len(summary)} counters kept for {len(exact)} distinct keys")
+    top = summary.top(20)
+    true_top = [key for key, _ in exact.most_common(20)]
+    found = len({key for key, _, _ in top} & set(true_top))
+    check(found >= 19, f"{found}/20 of the exact top 20 reported")
+    check(all(exact[key] <= count <= exact[key] + error for key, count, error in top),
+          'every reported count is within [true, true + error]')
+    check(all(key in summary for key, count in exact.items() if count > events / capacity),
+          f"every key seen more than events/capacity ({events / capacity:.0f}) times is tracked")
+
+
+def check_record_cost(keys: int, events: int) -> None:
+    print("\nrecord cost")
+    tracker = Popularity(enabled=True, path=os.path.join(TMP, 'cost.json'), capacity=200)
+    stream = zipf_stream(keys, events)
+    start = time.perf_counter()
+    for key in stream:
+        tracker.record('title', key)
+    elapsed = time.perf_counter() - start
+    samples = []
+    for key in stream[:2000]:
+        began = time.perf_counter()
+        tracker.record('title', key)
+        samples.append(time.perf_counter() - began)
+    print(f"  {elapsed / events * 1e6:.2f} us per query on average, {statistics.median(samples) * 1e6:.2f} us median")
+    check(elapsed / events < 50e-6, 'recording a query costs well under a webhook turn')
+
+
+def check_persistence() -> None:
+    print("\npersistence and decay")
+    path = os.path.join(TMP, 'round-trip.json')
+    tracker = Popularity(enabled=True, path=path, capacity=50)
+    for key in zipf_stream(500, 5000):
+        tracker.record('author', key.replace('key', 'Author'))
+    tracker.record('faq', '  How do I   renew a book? ')
+    check(tracker.save(), 'counts saved')
+    loaded = Popularity(enabled=True, path=path, capacity=50)
+    check(loaded.top('author') == tracker.top('author'), 'top authors survive a restart')
+    check(loaded.top('faq') == [('How do I renew a book?', 1)], 'spelling kept, whitespace collapsed')
+    rare = sum(1 for _, count in loaded.top('author', 50) if count == 1)
+    loaded.half_life = 1.0
+    loaded._halved_at = time.time() - 2.5
+    loaded._decay()
+    halved = loaded.top('author', 50)
+    check(halved[0][1] == tracker.top('author', 1)[0][1] // 4, 'two half-lives quarter the counts')
+    check(len(halved) <= 50 - rare and loaded.top('faq') == [], 'keys counted once are forgotten')
+    with open(path, 'w') as f:
+        f.write('{not json')
+    check(not Popularity(enabled=True, path=path).top('author'), 'an unreadable file is ignored')
+
+
+def check_warming() -> None:
+    print("\nwarming the catalog cache")
+    tracker = Popularity(enabled=True, path=os.path.join(TMP, 'warm.json'))
+    searches = [('title', 'Dune'), ('title', 'The Hobbit'), ('author', 'George Orwell'), ('genre', 'Fantasy')]
+    for weight, (kind, value) in enumerate(searches):
+        for _ in range(10 - weight):
+            tracker.record(kind, value)
+    for _ in range(5):
+        tracker.record('book', '7')
+    tracker.record('faq', 'What are your opening hours?')
+
+    service = library_service.LibraryService()
+    calls = count_calls(service)
+    start = time.perf_counter()
+    report = tracker.warm(service, main.faq_index, main.recommendation_table)
+    print(f"  warmed {report} in {(time.perf_counter() - start) * 1000:.1f} ms")
+    check(calls['count'] > 0, f"warming read the catalog ({calls['count']} backend calls)")
+    before = calls['count']
+    for kind, value in searches:
+        service.search_books(**{kind: value})
+    service.get_book_details('7')
+    check(calls['count'] == before, f"the popular reads that follow make no backend call ({calls['count'] - before})")
+    check(report['trending'] == ['Dune', 'The Hobbit', 'Pride and Prejudice'],
+          f"trending books ranked by count ({report['trending']})")
+    uncached = library_service.LibraryService()
+    uncached.cache = None
+    check(tracker.warm(uncached, main.faq_index, main.recommendation_table)['title'] == 0,
+          'nothing is read from the catalog when there is no cache to warm')
+
+
+def check_prompt_and_tick() -> None:
+    print("\nwebhook turns")
+    popularity = main.popularity
+    threads = threading.active_count()
+    for _ in range(3):
+        turn('book-search', {'book_title': 'Dune'})
+    check(popularity._steps is None, 'no run on the first turns of a fresh instance')
+    check(popularity.top('title') == [('Dune', 3)], 'searches counted, cached replies included')
+    popularity.trending = ()
+    plain = turn('book-search', {})
+    popularity.warm(main.library_service, main.faq_index, main.recommendation_table)
+    prompt = turn('book-search', {})
+    text = prompt['fulfillmentResponse']['messages'][0]['text']['text'][0]
+    check('Dune' not in str(plain) and 'Popular right now: Dune' in text, 'empty search prompt names the trending book')
+    check(main.book_search_prompt() is main.book_search_prompt(), 'trending prompt built once per trending set')
+
+    for title in ('The Hobbit', '1984', 'Emma', 'Dracula', 'Beloved'):
+        popularity.record('title', title)
+    started, steps = [], []
+    original_run = popularity._run
+
+    def counted_run(*args):
+        started.append(args)
+        for step in original_run(*args):
+            steps.append(step)
+            yield step
+
+    popularity._run = counted_run
+    popularity._next_run = 0.0
+    per_turn, turns = [], 0
+    while turns < 100 and (not started or popularity._steps is not None):
+        before = len(steps)
+        turn('book-search', {'author': 'Frank Herbert'})
+        per_turn.append(len(steps) - before)
+        turns += 1
+    check(len(started) == 1 and popularity._steps is None, f"a due run starts once and finishes over {turns} turns")
+    check(max(per_turn) <= popularity.steps_per_turn,
+          f"each turn does at most {popularity.steps_per_turn} steps ({max(per_turn)})")
+    check(threading.active_count() == threads, 'no thread is left working after the reply')
+    popularity._next_run = 0.0
+    with popularity._stepping:
+        check(not popularity.tick(main.library_service, main.faq_index, main.recommendation_table),
+              'a turn skips the run while another turn is stepping it')
+    popularity._next_run = time.monotonic() + 3600
+    turn('book-search', {'author': 'Frank Herbert'})
+    check(len(started) == 1, 'no new run before the interval has passed')
+    popularity._run = original_run
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description='Check and benchmark popularity tracking and warming.')
+    parser.add_argument('--keys', type=int, default=20000, help='Distinct keys in the Zipf stream')
+    parser.add_argument('--events', type=int, default=200000, help='Events in the Zipf stream')
+    parser.add_argument('--capacity', type=int, default=200, help='Space-Saving counters')
+    args = parser.parse_args()
+    logging.disable(logging.ERROR)
+    check_accuracy(args.keys, args.events, args.capacity)
+    check_record_cost(args.keys, args.events)
+    check_persistence()
+    check_warming()
+    check_prompt_and_tick()
+    if FAILURES:
+        print(f"\nFAIL: {len(FAILURES)} check(s) failed")
+        sys.exit(1)
+    print("\nOK")
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,90 @@
+"""
+Benchmark for the recommendation engine.
+Measures offline table build time and in-memory query latency on synthetic history.
+
+Usage:
+    python benchmarks/bench_recommendations.py --books 20000 --users 50000 --events 1000000
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from recommendations import RecommendationTable, build_recommendation_table
+
+
+def generate_history(books: int, users: int, events: int, seed: int = 42):
+    """Generate a synthetic catalog and circulation history with skewed popularity."""
+    rng = random.Random(seed)
+    catalog = [
+        {'id': str(i), 'title': f'Book {i}', 'author': f'Author {i % 997}', 'genre': f'Genre {i % 20}'}
+        for i in range(books)
+    ]
+    # Pareto-distributed popularity so a few titles dominate, as in real circulation
+    weights = [1.0 / (rank + 1) ** 1.1 for rank in range(books)]
+    book_ids = rng.choices(range(books), weights=weights, k=events)
+    history = [
+        {
+            'user_id': f'u{rng.randrange(users)}',
+            'book_id': str(book_id),
+            'event': 'hold' if rng.random() < 0.2 else 'checkout'
+        }
+        for book_id in book_ids
+    ]
+    return catalog, history
+
+
+def percentile(samples, pct):
+    """Return the pct-th percentile of a list of samples."""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark recommendation build and query latency.')
+    parser.add_argument('--books', type=int, default=5000)
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--events', type=int, default=200000)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=100000)
+    args = parser.parse_args()
+
+    catalog, history = generate_history(args.books, args.users, args.events)
+
+    start = time.perf_counter()
+    table = RecommendationTable(build_recommendation_table(history, catalog, top_k=args.top_k))
+    build_seconds = time.perf_counter() - start
+
+    book_ids = list(table.by_book) or ['0']
+    user_ids = list(table.by_user) or ['u0']
+    rng = random.Random(7)
+
+    results = {}
+    for name, lookup, keys in (
+        ('for_book', table.for_book, book_ids),
+        ('for_user', table.for_user, user_ids)
+    ):
+        samples = []
+        for _ in range(args.queries):
+            key = rng.choice(keys)
+            t0 = time.perf_counter_ns()
+            lookup(key, 5)
+            samples.append(time.perf_counter_ns() - t0)
+        results[name] = samples
+
+    print(f"Catalog: {args.books} books, {args.users} users, {args.events} events")
+    print(f"Build time: {build_seconds:.3f}s ({len(table.by_book)} books, {len(table.by_user)} users indexed)")
+    for name, samples in results.items():
+        print(
+            f"{name:<9} p50={percentile(samples, 50) / 1000:.2f}us "
+            f"p99={percentile(samples, 99) / 1000:.2f}us "
+            f"mean={sum(samples) / len(samples) / 1000:.2f}us"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Response cache benchmark: latency of repeated cacheable turns.
+Replays the corpus turns whose tags the response cache covers (FAQ, book
+search, book details) through handle_webhook with the cache off, then on
+after one priming pass, and reports the median latency per tag. Turns that
+are never cached (prompts, logged-in searches, unmatched questions) are
+reported as such; they still pay for the key lookup.
+
+Usage:
+    python benchmarks/bench_response_cache.py
+    python benchmarks/bench_response_cache.py --rounds 50
+"""
+
+import os
+import sys
+import glob
+import time
+import logging
+import argparse
+import statistics
+from typing import Dict, Any, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+os.environ.setdefault('USE_MOCK_DATA', 'true')
+
+import main
+from response_cache import POLICIES, ResponseCache
+from webhook_request import WebhookRequest
+from replay import ReplayRequest, load_corpus
+
+
+def timed_pass(bodies: List[Dict[str, Any]], samples: Dict[int, List[int]]) -> None:
+    """Serve each body once, appending its latency in nanoseconds."""
+    requests = [ReplayRequest(body) for body in bodies]
+    for index, request in enumerate(requests):
+        start = time.perf_counter_ns()
+        main.handle_webhook(request)
+        samples[index].append(time.perf_counter_ns() - start)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description='Compare cacheable turn latency with the response cache off and on.')
+    parser.add_argument('corpus', nargs='*', help='JSONL corpus files (default: benchmarks/corpora/*.jsonl)')
+    parser.add_argument('--rounds', type=int, default=30, help='Timed passes per mode')
+    args = parser.parse_args()
+    logging.disable(logging.ERROR)
+
+    paths = args.corpus or sorted(glob.glob(os.path.join(BENCH_DIR, 'corpora', '*.jsonl')))
+    bodies = [body for body in load_corpus(paths) if body.get('fulfillmentInfo', {}).get('tag') in POLICIES]
+    if not bodies:
+        print("No cacheable turns in the corpus")
+        sys.exit(1)
+
+    results = {}
+    for enabled in (False, True):
+        main.response_cache = ResponseCache(enabled=enabled)
+        # Warm the backend and, with the cache on, fill it
+        timed_pass(bodies, {index: [] for index in range(len(bodies))})
+        samples = {index: [] for index in range(len(bodies))}
+        for _ in range(args.rounds):
+            timed_pass(bodies, samples)
+        results[enabled] = [statistics.median(samples[index]) for index in range(len(bodies))]
+    cached = [main.response_cache.get(WebhookRequest.from_json(body)) is not None for body in bodies]
+
+    print(f"{len(bodies)} cacheable-tag turns, {sum(cached)} served from the cache, median of {args.rounds} rounds\n")
+    print(f"{'tag':<20} {'parameters':<36} {'off us':>9} {'on us':>9} {'speedup':>8}  cached")
+    for index, body in enumerate(bodies):
+        tag = body['fulfillmentInfo']['tag']
+        parameters = ', '.join(f"{k}={v}" for k, v in body.get('sessionInfo', {}).get('parameters', {}).items())
+        off, on = results[False][index] / 1000, results[True][index] / 1000
+        print(f"{tag:<20} {parameters[:36]:<36} {off:>9.1f} {on:>9.1f} {off / on:>7.1f}x  {'yes' if cached[index] else 'no'}")
+    print(f"\n{'total':<57} {sum(results[False]) / 1000:>9.1f} {sum(results[True]) / 1000:>9.1f}")
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,190 @@
+"""
+Stale-while-revalidate checks and benchmark.
+Calls get_upcoming_events and get_available_rooms against benchmarks/standin_server.py
+with injected latency, with the catalog cache off and with short TTLs and
+stale windows, and checks that:
+
+    - after the first load no call waits for the backend, though values keep being refreshed
+    - concurrent reads of a stale key start one background refresh
+    - failed refreshes are counted and the stale value is served until its stale window ends
+    - no value is served older than TTL + stale window
+    - booking a room drops the cached room listings
+
+Exits non-zero if a check fails.
+
+Usage:
+    python benchmarks/bench_revalidate.py
+    python benchmarks/bench_revalidate.py --latency 80 --seconds 5
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import threading
+import statistics
+from typing import Callable, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import metrics
+import library_service
+from api_cache import cache_key
+from standin_server import start_server
+
+FAILURES: List[str] = []
+TTL, STALE = 0.5, 2.0
+
+
+def check(condition: bool, message: str) -> None:
+    print(f"  {'ok  ' if condition else 'FAIL'} {message}")
+    if not condition:
+        FAILURES.append(message)
+
+
+def service(base_url: str, cache: bool) -> library_service.LibraryService:
+    os.environ.update({
+        'USE_MOCK_DATA': 'false',
+        'LIBRARY_API_URL': base_url,
+        'LIBRARY_CACHE': 'true' if cache else 'false',
+        'LIBRARY_CACHE_L2': '',
+        'LIBRARY_CACHE_TTLS': f"events/upcoming={TTL},rooms/available={TTL}",
+        'LIBRARY_CACHE_STALE': f"events/upcoming={STALE},rooms/available={STALE}"
+    })
+    return library_service.LibraryService()
+
+
+def latencies_ms(call: Callable[[], object], seconds: float, pause: float) -> List[float]:
+    samples = []
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        start = time.perf_counter()
+        call()
+        samples.append((time.perf_counter() - start) * 1000)
+        time.sleep(pause)
+    return samples
+
+
+def backend_count(server, route: str) -> int:
+    state = server.RequestHandlerClass.state
+    with state.stats_lock:
+        return sum(state.counts.get(route, {}).values())
+
+
+def check_latency(server, base_url: str, latency: float, seconds: float) -> None:
+    print(f"\nlisting latency ({latency:.0f} ms backend, TTL {TTL}s, stale window {STALE}s)")
+    listings = {
+        'events': (lambda s: s.get_upcoming_events(), 'events/upcoming'),
+        'rooms': (lambda s: s.get_available_rooms('2030-01-07', '16:00', '1 hour'), 'rooms/available')
+    }
+    print(f"  {'listing':<8} {'mode':<22} {'calls':>6} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'backend':>8}")
+    for name, (call, route) in listings.items():
+        for mode, cache in (('no cache', False), ('stale-while-revalidate', True)):
+            svc = service(base_url, cache)
+            call(svc)  # first load (and connection setup)
+            before = backend_count(server, route)
+            refreshed = metrics.cache_refreshes.value(route, 'ok')
+            samples = latencies_ms(lambda: call(svc), seconds, 0.01)
+            after = backend_count(server, route)
+            quantiles = statistics.quantiles(samples, n=100)
+            print(f"  {name:<8} {mode:<22} {len(samples):>6} {quantiles[49]:>8.2f} {quantiles[98]:>8.2f} "
+                  f"{max(samples):>8.2f} {after - before:>8}")
+            if cache:
+                check(max(samples) < latency / 2, f"{name}: no call after the first load waits for the backend")
+                refreshes = metrics.cache_refreshes.value(route, 'ok') - refreshed
+                check(refreshes >= seconds / (TTL + latency / 1000) * 0.5,
+                      f"{name}: refreshed in the background ({refreshes:.0f} refreshes in {seconds:.0f}s)")
+
+
+def check_single_flight(server, base_url: str, latency: float) -> None:
+    print("\nsingle flight")
+    svc = service(base_url, True)
+    svc.get_upcoming_events()
+    time.sleep(TTL + 0.05)
+    before = backend_count(server, 'events/upcoming')
+    start = threading.Barrier(16)
+    durations = []
+
+    def reader():
+        start.wait()
+        began = time.perf_counter()
+        for _ in range(20):
+            svc.get_upcoming_events()
+        durations.append((time.perf_counter() - began) * 1000)
+
+    threads = [threading.Thread(target=reader) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    time.sleep(latency / 1000 * 3)
+    calls = backend_count(server, 'events/upcoming') - before
+    check(calls == 1, f"320 concurrent reads of a stale key made {calls} backend call(s)")
+    check(max(durations) < latency, f"slowest reader took {max(durations):.1f} ms for 20 reads")
+
+
+def check_failures(server, base_url: str, latency: float) -> None:
+    print("\nrefresh failures and the staleness bound")
+    svc = service(base_url, True)
+    svc.get_upcoming_events()
+    key = cache_key('events/upcoming')
+    state = server.RequestHandlerClass.state
+    state.configure({'endpoints': {'events/upcoming': {'latency': f"const:{latency}", 'error_rate': 1.0}}})
+    failed = metrics.cache_refreshes.value('events/upcoming', 'error')
+    oldest, stale_served = 0.0, 0
+    end = time.monotonic() + TTL + STALE + 0.5
+    while time.monotonic() < end:
+        entry = svc.cache.get_entry(key)
+        start = time.perf_counter()
+        svc.get_upcoming_events()
+        elapsed = (time.perf_counter() - start) * 1000
+        if entry is not None:
+            age = time.time() - entry[1]
+            oldest = max(oldest, age)
+            stale_served += age >= TTL and elapsed < latency / 2
+        time.sleep(0.02)
+    failures = metrics.cache_refreshes.value('events/upcoming', 'error') - failed
+    check(failures >= 1, f"failed refreshes counted ({failures:.0f})")
+    check(stale_served > 0, f"stale value served without waiting while refreshes failed ({stale_served} reads)")
+    check(oldest <= TTL + STALE + 0.05, f"oldest value served was {oldest:.2f}s old (bound {TTL + STALE}s)")
+    check(svc.cache.get_entry(key) is None, 'nothing cacheable left once the stale window ran out')
+    state.configure({'endpoints': {'events/upcoming': {'latency': f"const:{latency}"},
+                                   'rooms/available': {'latency': f"const:{latency}"}}})
+
+
+def check_booking(base_url: str) -> None:
+    print("\nroom bookings")
+    svc = service(base_url, True)
+    rooms = svc.get_available_rooms('2030-01-08', '16:00', '1 hour')
+    result = svc.book_room('user1', rooms[0]['id'], '2030-01-08', '16:00', '1 hour')
+    after = svc.get_available_rooms('2030-01-08', '16:00', '1 hour')
+    check(result.get('success') and rooms[0]['id'] not in [room['id'] for room in after],
+          'a booked room leaves the cached listing at once')
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description='Check and benchmark stale-while-revalidate listings.')
+    parser.add_argument('--latency', type=float, default=40.0, help='Backend latency in milliseconds')
+    parser.add_argument('--seconds', type=float, default=3.0, help='Duration of each latency run')
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    config = {'endpoints': {'events/upcoming': {'latency': f"const:{args.latency}"},
+                            'rooms/available': {'latency': f"const:{args.latency}"}}}
+    server, base_url = start_server(config=config)
+    check_latency(server, base_url, args.latency, args.seconds)
+    check_single_flight(server, base_url, args.latency)
+    check_failures(server, base_url, args.latency)
+    check_booking(base_url)
+    server.shutdown()
+
+    if FAILURES:
+        print(f"\nFAIL: {len(FAILURES)} check(s) failed")
+        sys.exit(1)
+    print("\nOK")
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,188 @@
+"""
+Shared cache (L2) checks and benchmark.
+Runs api_cache.py's L2 backends against local stand-ins (a SQLite file and
+benchmarks/cache_server.py for memcached and Redis) and checks that:
+
+    - values round-trip between separate TieredCaches (sibling instances), compressed or not
+    - TTLs are honoured in both tiers
+    - the hash ring spreads keys evenly and adding a server moves only ~1/N of them
+    - a dead server turns into counted misses, not errors
+    - a new instance replaying the corpus after a sibling makes fewer backend calls with L2 than without
+
+It also reports the cost of an L1 hit, an L2 hit and a miss per backend.
+Exits non-zero if a check fails.
+
+Usage:
+    python benchmarks/bench_shared_cache.py
+"""
+
+import os
+import sys
+import glob
+import time
+import logging
+import tempfile
+import argparse
+import statistics
+from typing import Dict, Any, Callable, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+os.environ.setdefault('USE_MOCK_DATA', 'true')
+
+import main
+import metrics
+import library_service
+from api_cache import TieredCache, HashRing, SqliteBackend, MemcachedBackend, RedisBackend
+from cache_server import start_server
+from utils import thaw
+from replay import ReplayRequest, load_corpus
+
+FAILURES: List[str] = []
+
+
+def check(condition: bool, message: str) -> None:
+    print(f"  {'ok  ' if condition else 'FAIL'} {message}")
+    if not condition:
+        FAILURES.append(message)
+
+
+def per_call_us(fn: Callable[[], Any], calls: int) -> float:
+    """Median microseconds per call over 5 batches."""
+    samples = []
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        samples.append((time.perf_counter() - start) / calls * 1e6)
+    return statistics.median(samples)
+
+
+def check_backend(label: str, make_backend: Callable[[], Any], calls: int) -> None:
+    print(f"\n{label}")
+    writer, reader = TieredCache(l2=make_backend()), TieredCache(l2=make_backend())
+    small = {'books': [{'id': '1', 'title': 'Dune', 'availability': 'Available'}]}
+    large = {'books': [{'id': str(i), 'title': f'Book {i}', 'author': 'Somebody', 'genre': 'Fiction'} for i in range(200)]}
+    writer.set('books/search?title=dune', small, ttl=60)
+    writer.set('books/search?genre=fiction', large, ttl=60)
+    check(thaw(reader.get('books/search?title=dune')) == small, 'small value read back by a sibling instance')
+    check(thaw(reader.get('books/search?genre=fiction')) == large, 'compressed value read back by a sibling instance')
+    check(reader.get('books/search?title=none') is None, 'unknown key misses')
+
+    writer.set('short', {'value': 1}, ttl=1.0)
+    check(reader.get('short') == {'value': 1}, 'short-TTL value present before expiry')
+    time.sleep(1.2)
+    fresh = TieredCache(l2=make_backend())
+    check(reader.get('short') is None, 'L1 entry expires with its TTL')
+    check(fresh.get('short') is None, 'L2 entry expires with its TTL')
+
+    writer.delete('books/search?title=dune')
+    check(TieredCache(l2=make_backend()).get('books/search?title=dune') is None, 'delete removes the L2 entry')
+
+    l1_hit = per_call_us(lambda: reader.get('books/search?genre=fiction'), calls)
+    cold = TieredCache(l2=make_backend())
+
+    def l2_hit():
+        cold.clear_local()
+        return cold.get('books/search?genre=fiction')
+
+    l2_hit_us = per_call_us(l2_hit, max(1, calls // 10))
+    miss_us = per_call_us(lambda: cold.get('books/search?title=absent'), max(1, calls // 10))
+    print(f"  L1 hit {l1_hit:.2f} us, L2 hit {l2_hit_us:.1f} us (200-book value), L2 miss {miss_us:.1f} us")
+
+
+def check_ring(keys: int) -> None:
+    print("\nconsistent hashing")
+    nodes = [f"10.0.0.{i}:11211" for i in range(1, 5)]
+    ring = HashRing(nodes)
+    owners = {f"books/search?title=t{i}": ring.node(f"books/search?title=t{i}") for i in range(keys)}
+    loads = [list(owners.values()).count(node) for node in nodes]
+    check(max(loads) / min(loads) < 1.35, f"4 servers share keys evenly (loads {loads})")
+    grown = HashRing(nodes + ['10.0.0.5:11211'])
+    moved = [key for key, owner in owners.items() if grown.node(key) != owner]
+    check(all(grown.node(key) == '10.0.0.5:11211' for key in moved), 'keys only move to the added server')
+    check(0.1 < len(moved) / keys < 0.3, f"adding a 5th server moves {len(moved) / keys:.1%} of keys (ideal 20%)")
+
+
+def check_failure() -> None:
+    print("\nserver failure")
+    server, address = start_server()
+    backend = MemcachedBackend([address], timeout=0.05, retry_after=30)
+    cache = TieredCache(l2=backend)
+    cache.set('k', {'v': 1}, ttl=60)
+    server.shutdown()
+    server.server_close()
+    backend.close()
+    before = metrics.cache_backend_errors.value('memcached', 'get')
+    cache.clear_local()
+    start = time.perf_counter()
+    results = [cache.get('k') for _ in range(50)]
+    elapsed = time.perf_counter() - start
+    check(results == [None] * 50, 'reads from a dead server are misses')
+    check(metrics.cache_backend_errors.value('memcached', 'get') > before, 'failures are counted')
+    check(elapsed < 0.5, f"the dead server is skipped after the first failure ({elapsed * 1000:.1f} ms for 50 reads)")
+
+
+def backend_calls(bodies: List[Dict[str, Any]], l2_url: str) -> int:
+    """Replay the corpus on a new service instance; return cacheable backend calls."""
+    os.environ['LIBRARY_CACHE'] = 'true'
+    os.environ['LIBRARY_CACHE_L2'] = l2_url
+    service = library_service.LibraryService()
+    calls = {'count': 0}
+    original = service._call_api
+
+    def counted(endpoint, method='GET', data=None):
+        if method == 'GET' and metrics.endpoint_label(endpoint) in library_service.CACHE_TTLS:
+            calls['count'] += 1
+        return original(endpoint, method, data)
+
+    service._call_api = counted
+    main.library_service = service
+    for body in bodies:
+        main.handle_webhook(ReplayRequest(body))
+    return calls['count']
+
+
+def check_siblings(paths: List[str]) -> None:
+    print("\nsibling instances")
+    bodies = load_corpus(paths)
+    server, address = start_server()
+    l2_url = f"memcached://{address}"
+    first = backend_calls(bodies, l2_url)
+    second = backend_calls(bodies, l2_url)
+    isolated = backend_calls(bodies, '')
+    print(f"  catalog backend calls: first instance {first}, second with L2 {second}, second without L2 {isolated}")
+    check(second < isolated, 'a new instance starts warm from what its sibling fetched')
+    server.shutdown()
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description='Check and benchmark the shared cache tier.')
+    parser.add_argument('corpus', nargs='*', help='JSONL corpus files (default: benchmarks/corpora/*.jsonl)')
+    parser.add_argument('--calls', type=int, default=2000, help='Calls per timing batch')
+    args = parser.parse_args()
+    logging.disable(logging.ERROR)
+
+    servers = [start_server() for _ in range(2)]
+    addresses = [address for _, address in servers]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'l2.db')
+        check_backend('sqlite', lambda: SqliteBackend(path), args.calls)
+        check_backend('memcached (2 stand-in servers)', lambda: MemcachedBackend(addresses), args.calls)
+        check_backend('redis (2 stand-in servers)', lambda: RedisBackend(addresses), args.calls)
+    for server, _ in servers:
+        server.shutdown()
+
+    check_ring(20000)
+    check_failure()
+    check_siblings(args.corpus or sorted(glob.glob(os.path.join(BENCH_DIR, 'corpora', '*.jsonl'))))
+
+    if FAILURES:
+        print(f"\nFAIL: {len(FAILURES)} check(s) failed")
+        sys.exit(1)
+    print("\nOK")
+
+
+if __name__ == '__main__':
+    main_cli()
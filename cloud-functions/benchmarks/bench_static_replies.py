@@ -0,0 +1,115 @@
+"""
+Allocation benchmark for static response fragments.
+Compares the prebuilt StaticReply path of build_response with rebuilding the
+same reply per request (fresh handler dict, per-request message and chip
+dicts, as the handlers did before), reporting retained bytes, allocated
+blocks and time per reply.
+
+Usage:
+    python benchmarks/bench_static_replies.py
+    python benchmarks/bench_static_replies.py --replies 20000
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('USE_MOCK_DATA', 'true')
+
+import main
+from utils import StaticReply, thaw, create_quick_reply_response
+from webhook_request import WebhookRequest
+
+REQUEST = WebhookRequest(
+    session='projects/p/locations/l/agents/a/sessions/bench',
+    parameters={'user_id': 'user123', 'authenticated': True}
+)
+
+
+def rebuilt_quick_replies(suggestions):
+    """Chip set built per call, as before fragments were shared."""
+    chips = []
+    for suggestion in suggestions[:8]:
+        chips.append({'text': suggestion, 'image': None})
+        if chips[-1]['image'] is None:
+            del chips[-1]['image']
+    return {'payload': {'richContent': [[{'type': 'chips', 'options': chips}]]}}
+
+
+def rebuilt_response(reply: StaticReply, webhook_request: WebhookRequest):
+    """Handler dict and CX response built from scratch for every request."""
+    response = thaw(reply)
+    messages = []
+    if 'message' in response:
+        messages.append({'text': {'text': [response['message']]}})
+    if 'rich_response' in response:
+        messages.append(response['rich_response'])
+    if 'suggestions' in response:
+        messages.append(rebuilt_quick_replies(response['suggestions']))
+    final_parameters = {**webhook_request.parameters, **response.get('parameters', {})}
+    if response.get('redirect_to_flow') == 'Authentication Flow':
+        final_parameters['login_required'] = True
+    result = {'sessionInfo': {'parameters': final_parameters}, 'fulfillmentResponse': {'messages': messages}}
+    if 'redirect_to_flow' in response:
+        result['targetPage'] = response['redirect_to_flow']
+    return result
+
+
+def measure(build, count: int):
+    """Retained bytes and blocks per reply (replies kept alive) and ns per reply."""
+    replies = []
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for _ in range(count):
+        replies.append(build())
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, 'filename')
+    size = sum(s.size_diff for s in stats)
+    blocks = sum(s.count_diff for s in stats)
+    replies.clear()
+
+    start = time.perf_counter_ns()
+    for _ in range(count):
+        build()
+    elapsed = time.perf_counter_ns() - start
+    return size / count, blocks / count, elapsed / count
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description='Compare shared static replies with per-request rebuilding.')
+    parser.add_argument('--replies', type=int, default=10000, help='Replies built per case')
+    args = parser.parse_args()
+    logging.disable(logging.ERROR)
+
+    build_response = main.build_response.__wrapped__
+    static_replies = {name: value for name, value in vars(main).items() if isinstance(value, StaticReply)}
+    chips = ['Search books', 'View account', 'Make reservation', 'Get help']
+
+    cases = [('quick replies', lambda: rebuilt_quick_replies(chips), lambda: create_quick_reply_response(chips))]
+    for name, reply in sorted(static_replies.items()):
+        cases.append((
+            name,
+            lambda r=reply: rebuilt_response(r, REQUEST),
+            lambda r=reply: build_response(r, REQUEST)
+        ))
+
+    print(f"{'reply':<26} {'rebuilt B':>10} {'shared B':>9} {'rebuilt blk':>12} {'shared blk':>11} {'rebuilt ns':>11} {'shared ns':>10}")
+    totals = [0.0, 0.0]
+    for name, rebuilt, shared in cases:
+        r_size, r_blocks, r_ns = measure(rebuilt, args.replies)
+        s_size, s_blocks, s_ns = measure(shared, args.replies)
+        totals[0] += r_size
+        totals[1] += s_size
+        print(f"{name:<26} {r_size:>10.0f} {s_size:>9.0f} {r_blocks:>12.1f} {s_blocks:>11.1f} {r_ns:>11.0f} {s_ns:>10.0f}")
+    print(f"\nRetained per reply across cases: {totals[0] / len(cases):.0f} B rebuilt, "
+          f"{totals[1] / len(cases):.0f} B shared ({1 - totals[1] / totals[0]:.0%} less)")
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,206 @@
+"""
+Overhead benchmark for the per-stage timing instrumentation.
+Measures what the instrumentation adds to a webhook request, and replays the
+webhook corpus with stage timing switched off and on in alternating rounds.
+Requests are served through Flask's request/response cycle, as
+functions-framework serves them, so latency includes decoding the request
+and building the HTTP response.
+
+Timing runs with its default settings, so only every WEBHOOK_TIMING_EVERY_N-th
+request records its stages. The gated figure is the recording cost: a
+request wrapped in timed_request() running as many timed() stages as a
+corpus request records, with timing on against timing off, so sampling, the
+skipped stages, appends and folds are all included. It is measured in thread
+CPU time, best of several repeats, every round, and divided by the replayed
+request's CPU time; its median over the rounds moves by hundredths of a
+percent from run to run. The decorator layers themselves, paid with timing
+off too, are reported next to it.
+
+The replay A/B figure (median of the per-round paired on/off CPU time
+ratios) is printed as a cross-check with a 95% confidence interval: on a
+shared machine single rounds swing by several percent, so the run only
+fails on it when the whole interval is above --max-replay-overhead.
+
+Usage:
+    python benchmarks/bench_timing.py
+    python benchmarks/bench_timing.py --rounds 1000 --max-overhead 0.3
+"""
+
+import os
+import sys
+import gc
+import copy
+import glob
+import json
+import time
+import math
+import logging
+import argparse
+import statistics
+from typing import List, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from replay import load_corpus
+
+
+def noop():
+    return None
+
+
+def request_cost_ns(stages: int, calls: int, repeats: int = 5) -> Tuple[float, float]:
+    """
+    Thread CPU nanoseconds timing adds to one request (best of alternating repeats).
+
+    Args:
+        stages: Timed stages the request runs
+        calls: Requests per repeat (a multiple of EVERY_N samples evenly)
+        repeats: Alternating repeats of each variant
+
+    Returns:
+        (recording: timing on against off, with the same wrappers;
+         wrappers: timing off against undecorated functions)
+    """
+    import timing
+
+    stage = timing.timed('bench.stage')(noop)
+
+    def raw():
+        for _ in range(stages):
+            noop()
+
+    def staged():
+        for _ in range(stages):
+            stage()
+
+    instrumented = timing.timed_request('bench.request')(staged)
+    best = {'raw': float('inf'), 'off': float('inf'), 'on': float('inf')}
+    for _ in range(repeats):
+        for variant, fn in (('raw', raw), ('off', instrumented), ('on', instrumented)):
+            timing.set_enabled(variant == 'on')
+            start = time.thread_time_ns()
+            for _ in range(calls):
+                fn()
+            best[variant] = min(best[variant], time.thread_time_ns() - start)
+    timing.set_enabled(True)
+    return (best['on'] - best['off']) / calls, (best['off'] - best['raw']) / calls
+
+
+def median_interval(values: List[float]) -> Tuple[float, float]:
+    """95% confidence interval of the median (order statistics)."""
+    ordered = sorted(values)
+    half = 1.96 * math.sqrt(len(ordered)) / 2
+    low = max(0, int(len(ordered) / 2 - half))
+    high = min(len(ordered) - 1, int(math.ceil(len(ordered) / 2 + half)))
+    return ordered[low], ordered[high]
+
+
+def replay_pass(webhook, bodies, passes: int = 1) -> int:
+    """Serve request bodies passes times through a Flask request context; return thread CPU nanoseconds."""
+    import flask
+
+    app = _app()
+    payloads = [json.dumps(body).encode('utf-8') for body in bodies]
+    start = time.thread_time_ns()
+    for _ in range(passes):
+        for payload in payloads:
+            with app.test_request_context('/', method='POST', data=payload, content_type='application/json'):
+                app.make_response(webhook.handle_webhook(flask.request))
+    return time.thread_time_ns() - start
+
+
+_flask_app = None
+
+
+def _app():
+    global _flask_app
+    if _flask_app is None:
+        import flask
+        _flask_app = flask.Flask('bench_timing')
+    return _flask_app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure timing instrumentation overhead.')
+    parser.add_argument('corpus', nargs='*', help='JSONL corpus files (default: benchmarks/corpora/*.jsonl)')
+    parser.add_argument('--rounds', type=int, default=500, help='Alternating off/on rounds')
+    parser.add_argument('--passes', type=int, default=1, help='Corpus replays per off/on sample')
+    parser.add_argument('--calls', type=int, default=800, help='Requests per repeat of the instrumentation cost benchmark (each round)')
+    parser.add_argument('--max-overhead', type=float, default=0.5, help='Fail above this recording cost (%%)')
+    parser.add_argument('--max-replay-overhead', type=float, default=1.0,
+                        help='Fail when the replay A/B confidence interval is wholly above this (%%)')
+    args = parser.parse_args()
+
+    os.environ.setdefault('USE_MOCK_DATA', 'true')
+    os.environ['SERVER_TIMING_HEADER'] = 'false'
+    paths = args.corpus or sorted(glob.glob(os.path.join(BENCH_DIR, 'corpora', '*.jsonl')))
+    corpus = load_corpus(paths)
+
+    import main as webhook
+    import timing
+    logging.getLogger().setLevel(logging.WARNING)
+    webhook.logger.setLevel(logging.WARNING)
+
+    # Warm up caches and the mock backend
+    for _ in range(3):
+        replay_pass(webhook, copy.deepcopy(corpus))
+
+    # Stages recorded per request, besides the request itself
+    every_n = timing.EVERY_N
+    timing.set_enabled(True)
+    timing.set_every_n(1)
+    timing.reset()
+    replay_pass(webhook, copy.deepcopy(corpus))
+    recorded = sum(stats['count'] for stats in timing.snapshot().values())
+    stages_per_request = recorded / len(corpus) - 1
+    timing.set_every_n(every_n)
+    stages = math.ceil(stages_per_request)
+
+    requests = len(corpus) * args.passes
+    samples = {False: [], True: []}
+    costs, layers, estimates, ratios = [], [], [], []
+    for round_number in range(args.rounds):
+        order = (False, True) if round_number % 2 == 0 else (True, False)
+        for enabled in order:
+            bodies = copy.deepcopy(corpus)
+            timing.set_enabled(enabled)
+            # Collect beforehand, so the previous sample's garbage is not collected in this one
+            gc.collect()
+            samples[enabled].append(replay_pass(webhook, bodies, args.passes))
+        timing.set_enabled(True)
+        ratios.append(100.0 * (samples[True][-1] / samples[False][-1] - 1.0))
+        cost, layer = request_cost_ns(stages, args.calls)
+        costs.append(cost)
+        layers.append(layer)
+        estimates.append(100.0 * costs[-1] / (samples[False][-1] / requests))
+
+    off_ns = statistics.median(samples[False]) / requests
+    on_ns = statistics.median(samples[True]) / requests
+    cost_ns = statistics.median(costs)
+    estimated = statistics.median(estimates)
+    measured = statistics.median(ratios)
+    low, high = median_interval(ratios)
+
+    print(f"requests per sample:   {requests} ({len(corpus)} x {args.passes})")
+    print(f"stages per request:    {stages_per_request:.1f} besides the request, recorded for 1 request in {every_n}")
+    print(f"request CPU time:      {off_ns / 1000:.1f} us off, {on_ns / 1000:.1f} us on (median of {args.rounds})")
+    print(f"recording cost:        {cost_ns:.0f} ns per request with {stages} stages (median of {args.rounds})")
+    print(f"decorator layers:      {statistics.median(layers):.0f} ns per request, paid with timing off too")
+    print(f"overhead:              {estimated:.3f}% (limit {args.max_overhead}%)")
+    print(f"replay A/B:            {measured:+.2f}% (median of {args.rounds} paired rounds, "
+          f"95% interval {low:+.2f}% to {high:+.2f}%; limit {args.max_replay_overhead}%)")
+
+    failed = False
+    if estimated > args.max_overhead:
+        print("FAIL: recording cost above limit")
+        failed = True
+    if low > args.max_replay_overhead:
+        print("FAIL: replay A/B overhead above limit")
+        failed = True
+    if failed:
+        sys.exit(1)
+    print("OK")
+
+if __name__ == '__main__':
+    main()
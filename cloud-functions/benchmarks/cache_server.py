@@ -0,0 +1,255 @@
+"""
+Local stand-in for a shared cache server (memcached text protocol and Redis RESP).
+Lets the L2 tier of api_cache.py be exercised on one machine without either server installed.
+
+Each connection's protocol is detected from its first byte ('*' is RESP,
+anything else memcached text). Supported commands:
+
+    memcached   get <key>..., set|add <key> <flags> <exptime> <bytes>, delete <key>, incr <key> <n>, flush_all, stats
+    redis       GET, SET key value [EX s | PX ms], DEL key..., INCR key, FLUSHALL, PING, DBSIZE
+
+TTLs are honoured on read. --latency adds a fixed delay (milliseconds) per
+command, to see how the L2 timeout behaves.
+
+Usage:
+    python benchmarks/cache_server.py --port 11211
+    LIBRARY_CACHE=true LIBRARY_CACHE_L2=memcached://127.0.0.1:11211 python benchmarks/replay.py
+"""
+
+import time
+import argparse
+import threading
+import socketserver
+from typing import Dict, Optional, Tuple
+
+# memcached treats larger expiry values as absolute timestamps
+MEMCACHED_MAX_RELATIVE = 30 * 24 * 3600
+
+
+class CacheStore:
+    """Thread-safe key -> (value, absolute expiry or None) store."""
+
+    def __init__(self):
+        self._items: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+        self._lock = threading.Lock()
+        self.counts = {'get': 0, 'hit': 0, 'set': 0, 'delete': 0, 'incr': 0}
+
+    def get(self, key: bytes) -> Optional[bytes]:
+        with self._lock:
+            self.counts['get'] += 1
+            item = self._items.get(key)
+            if item is None:
+                return None
+            if item[1] is not None and item[1] <= time.time():
+                del self._items[key]
+                return None
+            self.counts['hit'] += 1
+            return item[0]
+
+    def set(self, key: bytes, value: bytes, ttl: Optional[float]) -> None:
+        with self._lock:
+            self.counts['set'] += 1
+            self._items[key] = (value, time.time() + ttl if ttl else None)
+
+    def add(self, key: bytes, value: bytes, ttl: Optional[float]) -> bool:
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and (item[1] is None or item[1] > time.time()):
+                return False
+            self.counts['set'] += 1
+            self._items[key] = (value, time.time() + ttl if ttl else None)
+            return True
+
+    def incr(self, key: bytes, amount: int, create: bool) -> Optional[int]:
+        """Increment a decimal value (None if missing and not create; raises ValueError if not a number)."""
+        with self._lock:
+            self.counts['incr'] += 1
+            item = self._items.get(key)
+            if item is not None and item[1] is not None and item[1] <= time.time():
+                item = None
+            if item is None and not create:
+                return None
+            value = int(item[0] if item is not None else 0) + amount
+            self._items[key] = (str(value).encode(), item[1] if item is not None else None)
+            return value
+
+    def delete(self, key: bytes) -> bool:
+        with self._lock:
+            self.counts['delete'] += 1
+            return self._items.pop(key, None) is not None
+
+    def flush(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class CacheHandler(socketserver.StreamRequestHandler):
+    """One client connection; the protocol is picked from its first byte."""
+
+    store: CacheStore
+    latency = 0.0
+
+    def handle(self):
+        first = self.rfile.peek(1)[:1]
+        serve = self._serve_resp if first == b'*' else self._serve_memcached
+        try:
+            while serve():
+                pass
+        except (ConnectionError, ValueError):
+            pass
+
+    def _pause(self) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _serve_memcached(self) -> bool:
+        line = self.rfile.readline()
+        if not line:
+            return False
+        parts = line.split()
+        if not parts:
+            self.wfile.write(b'ERROR\r\n')
+            return True
+        command = parts[0].lower()
+        self._pause()
+        if command == b'get' and len(parts) > 1:
+            reply = []
+            for key in parts[1:]:
+                value = self.store.get(key)
+                if value is not None:
+                    reply.append(b'VALUE %s 0 %d\r\n%s\r\n' % (key, len(value), value))
+            self.wfile.write(b''.join(reply) + b'END\r\n')
+        elif command in (b'set', b'add') and len(parts) >= 5:
+            value = self.rfile.read(int(parts[4]) + 2)[:-2]
+            expiry = int(parts[3])
+            ttl = expiry - time.time() if expiry > MEMCACHED_MAX_RELATIVE else expiry
+            stored = True
+            if expiry < 0:
+                self.store.delete(parts[1])
+            elif command == b'add':
+                stored = self.store.add(parts[1], value, ttl if expiry else None)
+            else:
+                self.store.set(parts[1], value, ttl if expiry else None)
+            if b'noreply' not in parts[5:]:
+                self.wfile.write(b'STORED\r\n' if stored else b'NOT_STORED\r\n')
+        elif command == b'incr' and len(parts) >= 3:
+            try:
+                value = self.store.incr(parts[1], int(parts[2]), create=False)
+                self.wfile.write(b'NOT_FOUND\r\n' if value is None else b'%d\r\n' % value)
+            except ValueError:
+                self.wfile.write(b'CLIENT_ERROR cannot increment or decrement non-numeric value\r\n')
+        elif command == b'delete' and len(parts) > 1:
+            self.wfile.write(b'DELETED\r\n' if self.store.delete(parts[1]) else b'NOT_FOUND\r\n')
+        elif command == b'flush_all':
+            self.store.flush()
+            self.wfile.write(b'OK\r\n')
+        elif command == b'stats':
+            stats = dict(self.store.counts, curr_items=len(self.store))
+            self.wfile.write(b''.join(b'STAT %s %d\r\n' % (name.encode(), value) for name, value in stats.items()) + b'END\r\n')
+        elif command == b'quit':
+            return False
+        else:
+            self.wfile.write(b'ERROR\r\n')
+        return True
+
+    def _read_resp_array(self) -> Optional[list]:
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            raise ValueError('expected a RESP array')
+        args = []
+        for _ in range(int(line[1:])):
+            header = self.rfile.readline()
+            if not header.startswith(b'$'):
+                raise ValueError('expected a bulk string')
+            args.append(self.rfile.read(int(header[1:]) + 2)[:-2])
+        return args
+
+    def _serve_resp(self) -> bool:
+        args = self._read_resp_array()
+        if args is None:
+            return False
+        if not args:
+            self.wfile.write(b'-ERR empty command\r\n')
+            return True
+        command = args[0].upper()
+        self._pause()
+        if command == b'GET' and len(args) == 2:
+            value = self.store.get(args[1])
+            self.wfile.write(b'$-1\r\n' if value is None else b'$%d\r\n%s\r\n' % (len(value), value))
+        elif command == b'SET' and len(args) >= 3:
+            ttl = None
+            options = [arg.upper() for arg in args[3:]]
+            if b'EX' in options:
+                ttl = float(args[3 + options.index(b'EX') + 1])
+            elif b'PX' in options:
+                ttl = float(args[3 + options.index(b'PX') + 1]) / 1000.0
+            self.store.set(args[1], args[2], ttl)
+            self.wfile.write(b'+OK\r\n')
+        elif command == b'DEL' and len(args) >= 2:
+            removed = sum(self.store.delete(key) for key in args[1:])
+            self.wfile.write(b':%d\r\n' % removed)
+        elif command == b'INCR' and len(args) == 2:
+            try:
+                self.wfile.write(b':%d\r\n' % self.store.incr(args[1], 1, create=True))
+            except ValueError:
+                self.wfile.write(b'-ERR value is not an integer or out of range\r\n')
+        elif command == b'FLUSHALL':
+            self.store.flush()
+            self.wfile.write(b'+OK\r\n')
+        elif command == b'PING':
+            self.wfile.write(b'+PONG\r\n')
+        elif command == b'DBSIZE':
+            self.wfile.write(b':%d\r\n' % len(self.store))
+        else:
+            self.wfile.write(b"-ERR unknown command '%s'\r\n" % args[0])
+        return True
+
+
+class CacheServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def start_server(port: int = 0, latency_ms: float = 0.0) -> Tuple[CacheServer, str]:
+    """
+    Start a stand-in cache server on a background thread.
+
+    Args:
+        port: Port to bind (0 picks a free one)
+        latency_ms: Delay added to every command
+
+    Returns:
+        (server, 'host:port'); server.store holds the data, server.shutdown() stops it
+    """
+    handler = type('BoundCacheHandler', (CacheHandler,), {'store': CacheStore(), 'latency': latency_ms / 1000.0})
+    server = CacheServer(('127.0.0.1', port), handler)
+    server.store = handler.store
+    threading.Thread(target=server.serve_forever, name='cache-server', daemon=True).start()
+    return server, f"127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a local memcached/Redis-protocol stand-in.')
+    parser.add_argument('--port', type=int, default=11211)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--latency', type=float, default=0.0, help='Milliseconds added to every command')
+    args = parser.parse_args()
+
+    handler = type('BoundCacheHandler', (CacheHandler,), {'store': CacheStore(), 'latency': args.latency / 1000.0})
+    server = CacheServer((args.host, args.port), handler)
+    print(f"Stand-in cache server on {args.host}:{args.port} (memcached and Redis protocols)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""
+Cold-start check: import-time budget and time to first response.
+Imports main in fresh interpreters with -X importtime, fails when the import
+exceeds its budget or loads modules that belong off the startup path, and
+measures how long a new process takes to answer its first webhook turn
+(with and without warm_up()).
+
+Flask is imported before main by default because functions-framework has
+already loaded it when the function module is imported; --no-preload counts
+it against the budget too.
+
+Usage:
+    python benchmarks/check_import_time.py
+    python benchmarks/check_import_time.py --budget-ms 30 --runs 7
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from typing import Dict, Any, List, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FUNCTION_DIR = os.path.dirname(BENCH_DIR)
+
+# Modules that should only load on first use
+FORBIDDEN = ('requests', 'urllib3', 'http.server', 'argparse', 'mock_backend')
+
+FIRST_TURN = """
+import json, time
+
+class TurnRequest:
+    headers = {{}}
+    data = json.dumps({body!r}).encode('utf-8')
+
+    def get_data(self):
+        return self.data
+
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+warmed = imported
+if {warm!r}:
+    main.warm_up()
+    warmed = time.perf_counter()
+main.handle_webhook(TurnRequest())
+first = time.perf_counter()
+main.handle_webhook(TurnRequest())
+second = time.perf_counter()
+print(json.dumps({{'import_ms': (imported - start) * 1000, 'warm_up_ms': (warmed - imported) * 1000,
+                  'first_ms': (first - warmed) * 1000, 'second_ms': (second - first) * 1000}}))
+"""
+
+SAMPLE_TURN = {
+    'fulfillmentInfo': {'tag': 'book-search'},
+    'sessionInfo': {
+        'session': 'projects/p/locations/l/agents/a/sessions/cold-start',
+        'parameters': {'book_title': 'Harry Potter'}
+    },
+    'intentInfo': {'displayName': 'SearchBooks'},
+    'pageInfo': {'currentFlow': {'displayName': 'Book Search Flow'}},
+    'languageCode': 'en'
+}
+
+
+def _env() -> Dict[str, str]:
+    env = dict(os.environ)
+    env.setdefault('USE_MOCK_DATA', 'true')
+    env['PYTHONDONTWRITEBYTECODE'] = '1'
+    return env
+
+
+def import_profile(preload: bool) -> Tuple[float, Dict[str, Tuple[float, float]]]:
+    """
+    Import main once.
+
+    Returns:
+        main's cumulative ms and {module: (self ms, cumulative ms)} for the
+        modules main loaded (-X importtime prints children before their parent)
+    """
+    code = ('import flask; ' if preload else '') + 'import main'
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=FUNCTION_DIR, env=_env(), capture_output=True, text=True, check=True
+    )
+    pending = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        top_level = not name.startswith('  ')
+        name = name.strip()
+        pending[name] = (int(self_us) / 1000.0, int(cumulative_us) / 1000.0)
+        if top_level:
+            if name == 'main':
+                return pending[name][1], pending
+            pending = {}
+    raise RuntimeError('main was not imported')
+
+
+def first_turn(warm: bool) -> Dict[str, float]:
+    """Time a fresh process from 'import main' to its first and second responses."""
+    proc = subprocess.run(
+        [sys.executable, '-c', FIRST_TURN.format(warm=warm, body=SAMPLE_TURN)],
+        cwd=FUNCTION_DIR, env=_env(), capture_output=True, text=True, check=True
+    )
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the import-time budget and time to first response.')
+    parser.add_argument('--budget-ms', type=float, default=float(os.environ.get('IMPORT_BUDGET_MS', '50')),
+                        help='Median import time allowed for main (default 50, or IMPORT_BUDGET_MS)')
+    parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters per measurement')
+    parser.add_argument('--no-preload', action='store_true', help='Count flask against the budget')
+    parser.add_argument('--top', type=int, default=10, help='Slowest modules to list')
+    args = parser.parse_args()
+
+    totals = []
+    profiles: List[Dict[str, Tuple[float, float]]] = []
+    for _ in range(args.runs):
+        total, modules = import_profile(not args.no_preload)
+        totals.append(total)
+        profiles.append(modules)
+    median = statistics.median(totals)
+    modules = profiles[totals.index(sorted(totals)[len(totals) // 2])]
+
+    print(f"import main: median {median:.1f} ms over {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+    print(f"\n{'module':<40} {'self ms':>9} {'cumulative ms':>14}")
+    for name, (self_ms, cumulative_ms) in sorted(modules.items(), key=lambda m: -m[1][0])[:args.top]:
+        print(f"{name:<40} {self_ms:>9.2f} {cumulative_ms:>14.2f}")
+
+    turns = {}
+    for warm in (False, True):
+        samples = [first_turn(warm) for _ in range(args.runs)]
+        turns[warm] = {key: statistics.median(s[key] for s in samples) for key in samples[0]}
+    print(f"\n{'fresh process':<16} {'import ms':>10} {'warm-up ms':>11} {'1st turn ms':>12} {'2nd turn ms':>12}")
+    for warm, label in ((False, 'cold'), (True, 'warmed')):
+        t = turns[warm]
+        print(f"{label:<16} {t['import_ms']:>10.1f} {t['warm_up_ms']:>11.1f} {t['first_ms']:>12.1f} {t['second_ms']:>12.1f}")
+
+    failures = []
+    if median > args.budget_ms:
+        failures.append(f"import took {median:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    loaded = [name for name in FORBIDDEN if name in modules]
+    if loaded:
+        failures.append(f"modules loaded at import that should load on first use: {', '.join(loaded)}")
+    if failures:
+        print('\nFAIL: ' + '; '.join(failures))
+        sys.exit(1)
+    print('\nOK')
+
+
+if __name__ == '__main__':
+    main()
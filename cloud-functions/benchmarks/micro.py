@@ -0,0 +1,306 @@
+"""
+Micro-benchmark suite for webhook hot paths.
+Times request decoding, route_request for every tag, flow and intent branch,
+the rich-response builders, build_response with large session parameters and
+mock catalog search at several catalog sizes, and compares the results against
+stored baselines.
+
+Each case is scored as its time divided by the time of a fixed pure-Python
+calibration workload measured alongside it, so baselines recorded on one
+machine stay comparable on another. The score is the median of the per-round
+ratios, and the spread of those ratios (interquartile range over median) is
+kept as the case's noise. A case regresses when its score is worse than its
+baseline by more than --threshold plus the larger of the two noises, and the
+slowdown is at least --floor-ns per call: sub-microsecond cases swing by tens
+of percent on scheduler noise alone.
+
+Route cases run against the stateful mock backend (renewals, bookings,
+holds), so each case starts from a fresh one.
+
+Usage:
+    python benchmarks/micro.py                      # compare with baselines/micro.json
+    python benchmarks/micro.py --threshold 0.25 -k route
+    python benchmarks/micro.py --floor-ns 1000
+    python benchmarks/micro.py --update             # record new baselines
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import statistics
+from typing import Dict, Any, Callable, List, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+BASELINE_PATH = os.path.join(BENCH_DIR, 'baselines', 'micro.json')
+SESSION = 'projects/p/locations/l/agents/a/sessions/micro'
+
+
+def calibration() -> None:
+    """Fixed workload of dict/list/string operations typical of the webhook."""
+    rows = []
+    for i in range(200):
+        row = {'id': str(i), 'title': f'Book {i}', 'tags': [i, i + 1]}
+        rows.append(row)
+    ''.join(r['title'] for r in rows if r['id'].endswith('7'))
+
+
+def _loops_for(fn: Callable[[], Any], target_ns: float) -> int:
+    loops = 1
+    while True:
+        start = time.perf_counter_ns()
+        for _ in range(loops):
+            fn()
+        if time.perf_counter_ns() - start >= target_ns or loops >= 1 << 20:
+            return loops
+        loops *= 2
+
+
+def _per_call(fn: Callable[[], Any], loops: int) -> float:
+    start = time.perf_counter_ns()
+    for _ in range(loops):
+        fn()
+    return (time.perf_counter_ns() - start) / loops
+
+
+def measure(fn: Callable[[], Any], reference: Callable[[], Any], rounds: int = 9, target_ns: float = 10e6) -> Dict[str, float]:
+    """
+    Time fn against the reference workload over several rounds.
+
+    The two are measured in alternating rounds so that frequency scaling or
+    a noisy neighbour affects both sides of the ratio alike.
+
+    Returns:
+        'ns' and 'reference_ns' (medians per call), 'score' (median of the
+        per-round ratios) and 'noise' (interquartile range of the ratios
+        over their median)
+    """
+    fn_loops = _loops_for(fn, target_ns)
+    ref_loops = _loops_for(reference, target_ns)
+    fn_ns, ref_ns, ratios = [], [], []
+    for _ in range(rounds):
+        ref_ns.append(_per_call(reference, ref_loops))
+        fn_ns.append(_per_call(fn, fn_loops))
+        ratios.append(fn_ns[-1] / ref_ns[-1])
+    score = statistics.median(ratios)
+    quartiles = statistics.quantiles(ratios, n=4) if rounds > 1 else [score] * 3
+    return {
+        'ns': statistics.median(fn_ns),
+        'reference_ns': statistics.median(ref_ns),
+        'score': score,
+        'noise': (quartiles[2] - quartiles[0]) / score
+    }
+
+
+def decode_cases() -> List[Tuple[str, Callable[[], Any]]]:
+    from webhook_request import WebhookRequest
+    body = {
+        'detectIntentResponseId': 'micro',
+        'fulfillmentInfo': {'tag': 'book-search'},
+        'sessionInfo': {'session': SESSION, 'parameters': {'user_id': 'user123', 'book_title': 'harry potter'}},
+        'intentInfo': {'displayName': 'SearchBooks', 'confidence': 0.9},
+        'pageInfo': {'currentFlow': {'displayName': 'Book Search Flow'}, 'currentPage': {'displayName': 'Search Page'}},
+        'languageCode': 'en'
+    }
+    return [('decode/webhook_request', lambda: WebhookRequest.from_json(body))]
+
+
+def route_cases(webhook) -> List[Tuple[str, Callable[[], Any]]]:
+    """One case per route_request branch."""
+    from webhook_request import WebhookRequest
+    user = {'user_id': 'user123', 'authenticated': True}
+    tagged = [
+        ('auth-webhook', {'user_id': 'user123', 'password': 'secretpass'}),
+        ('account-checkouts', user),
+        ('account-renew', dict(user, book_title='Dune')),
+        ('account-holds', user),
+        ('account-fines', user),
+        ('reservations-webhook', dict(user, reservation_type='study room', date='2030-01-07', time='6pm', duration='1 hour')),
+        ('book-search', {'book_title': 'harry potter'}),
+        ('get-book-details', {'selected_item_id': '5'}),
+        ('help-faq-webhook', {'help_query': 'what are your opening hours'}),
+        ('recommendations-webhook', dict(user))
+    ]
+    flows = ['Book Search Flow', 'Account Management Flow', 'Reservations Flow', 'Help & FAQ Flow', 'Authentication Flow']
+    intents = ['BookRoom', 'GetRecommendations', 'SearchBooks', 'AccountInfo', 'Help', 'Login', 'Unmatched']
+
+    cases = []
+    for tag, params in tagged:
+        request = WebhookRequest(tag=tag, session=SESSION, parameters=dict(params))
+        cases.append((f'route/tag/{tag}', lambda r=request: webhook.route_request(r)))
+    for flow in flows:
+        request = WebhookRequest(flow=flow, page='Start Page', session=SESSION, parameters=dict(user))
+        cases.append((f'route/flow/{flow}', lambda r=request: webhook.route_request(r)))
+    for intent in intents:
+        request = WebhookRequest(intent=intent, session=SESSION, parameters=dict(user))
+        cases.append((f'route/intent/{intent}', lambda r=request: webhook.route_request(r)))
+    return cases
+
+
+def builder_cases() -> List[Tuple[str, Callable[[], Any]]]:
+    from utils import create_card_response, create_list_response, create_quick_reply_response
+    books = [
+        {'id': str(i), 'title': f'Book {i}', 'author': f'Author {i}', 'cover_image': f'https://example.com/{i}.jpg'}
+        for i in range(20)
+    ]
+    suggestions = ['Search books', 'My account', 'Reserve room', 'Events', 'Help', 'Hours', 'Renew', 'Holds', 'Fines']
+    return [
+        ('build/card', lambda: create_card_response(
+            title='The Hobbit', subtitle='by J.R.R. Tolkien', text='Available',
+            image_url='https://example.com/hobbit.jpg', buttons=[{'text': 'Place hold', 'postback': 'hold'}])),
+        ('build/list', lambda: create_list_response(books, title_key='title', description_key='author')),
+        ('build/quick_replies', lambda: create_quick_reply_response(suggestions))
+    ]
+
+
+def build_response_cases(webhook) -> List[Tuple[str, Callable[[], Any]]]:
+    from webhook_request import WebhookRequest
+    books = [
+        {'id': str(i), 'title': f'Book title number {i}', 'author': f'Author {i}', 'isbn': f'978{i:010d}',
+         'genre': 'Fiction', 'availability': 'Available', 'cover_image': f'https://example.com/covers/{i}.jpg'}
+        for i in range(50)
+    ]
+    large_params = {f'param_{i}': f'value {i}' for i in range(200)}
+    large_params['search_results'] = books
+    response = {
+        'message': 'I found 50 books matching your search:',
+        'rich_response': {'payload': {'richContent': [[{'type': 'list', 'title': b['title']} for b in books[:5]]]}},
+        'parameters': {'search_results': books, 'last_query': 'book'},
+        'suggestions': ['Place hold', 'More details', 'New search']
+    }
+    request = WebhookRequest(session=SESSION, parameters=large_params)
+    return [('build_response/large_session', lambda: webhook.build_response(response, request))]
+
+
+def search_cases(sizes: List[int]) -> List[Tuple[str, Callable[[], Any]]]:
+    from library_service import LibraryService
+    from mock_backend import MockBackend
+    queries = {
+        'title': {'title': 'silent river'},
+        'author': {'author': 'rowling'},
+        'genre': {'genre': 'fantasy'},
+        'combined': {'title': 'the', 'genre': 'mystery', 'author': 'ada'},
+        'empty': {}
+    }
+    cases = []
+    for size in sizes:
+        service = LibraryService()
+        service._mock_backend = MockBackend(seed=42, catalog_size=size, user_count=0)
+        for label, query in queries.items():
+            cases.append((f'mock_search/{size}/{label}', lambda s=service, q=query:
+                          s._get_mock_response('books/search', 'GET', dict(q))))
+    return cases
+
+
+def compare(
+    results: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Any],
+    threshold: float,
+    floor_ns: float
+) -> List[str]:
+    """
+    Print the comparison table and return the names of regressed cases.
+
+    Args:
+        results: measure() results per case
+        baseline: Stored baseline file contents
+        threshold: Allowed slowdown as a fraction, before noise
+        floor_ns: Smallest slowdown per call (in this run's nanoseconds) that counts
+
+    Returns:
+        Names of the cases slower than their baseline by more than the
+        threshold plus noise, and by at least floor_ns
+    """
+    base_cases = baseline.get('cases', {})
+    regressions = []
+    print(f"{'case':<44} {'ns/op':>12} {'score':>10} {'baseline':>10} {'change':>8} {'allowed':>8}")
+    for name, result in results.items():
+        base = base_cases.get(name)
+        if base is None:
+            print(f"{name:<44} {result['ns']:>12.0f} {result['score']:>10.4f} {'-':>10} {'new':>8}")
+            continue
+        change = result['score'] / base['score'] - 1.0
+        allowed = threshold + max(result['noise'], base.get('noise', 0.0))
+        # The baseline's time per call on this machine, from this run's calibration
+        slower_ns = result['ns'] - base['score'] * result['reference_ns']
+        regressed = change > allowed and slower_ns >= floor_ns
+        flag = '  REGRESSION' if regressed else ''
+        print(f"{name:<44} {result['ns']:>12.0f} {result['score']:>10.4f} {base['score']:>10.4f} "
+              f"{change:>+7.1%} {allowed:>7.0%}{flag}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run micro-benchmarks and compare with baselines.')
+    parser.add_argument('-k', '--filter', default='', help='Only cases whose name contains this text')
+    parser.add_argument('--threshold', type=float, default=float(os.environ.get('MICROBENCH_THRESHOLD', '0.25')),
+                        help='Allowed slowdown as a fraction (default 0.25, or MICROBENCH_THRESHOLD)')
+    parser.add_argument('--floor-ns', type=float, default=float(os.environ.get('MICROBENCH_FLOOR_NS', '500')),
+                        help='Smallest slowdown per call that counts, in ns (default 500, or MICROBENCH_FLOOR_NS)')
+    parser.add_argument('--sizes', default='10,10000,100000', help='Mock catalog sizes for search cases')
+    parser.add_argument('--rounds', type=int, default=9, help='Alternating measurement rounds per case')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='Baseline file')
+    parser.add_argument('--update', action='store_true', help='Write results as the new baseline')
+    args = parser.parse_args()
+
+    os.environ['USE_MOCK_DATA'] = 'true'
+    os.environ.setdefault('WEBHOOK_TIMING', 'true')
+    import main as webhook
+    from mock_backend import MockBackend
+    # Handler logging is I/O, not the code under test
+    logging.disable(logging.ERROR)
+
+    sizes = [int(s) for s in args.sizes.split(',') if s]
+    cases = decode_cases() + route_cases(webhook) + builder_cases() + build_response_cases(webhook) + search_cases(sizes)
+    cases = [(name, fn) for name, fn in cases if args.filter in name]
+
+    results = {}
+    for name, fn in cases:
+        # Fresh mock state, so a case does not measure what earlier cases wrote
+        webhook.library_service._mock_backend = MockBackend()
+        fn()  # warm caches (FAQ LRU, room bitmaps, recommendation lookups)
+        result = measure(fn, calibration, args.rounds)
+        results[name] = {
+            'ns': round(result['ns'], 1),
+            'reference_ns': round(result['reference_ns'], 1),
+            'score': round(result['score'], 5),
+            'noise': round(result['noise'], 4)
+        }
+
+    if args.update:
+        baseline = {'cases': {}}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+        baseline['cases'].update(results)
+        baseline['python'] = sys.version.split()[0]
+        baseline['rounds'] = args.rounds
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Wrote {len(results)} baselines to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        parser.error(f'no baseline at {args.baseline}; run with --update first')
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline.get('rounds', args.rounds) != args.rounds:
+        print(f"warning: baselines were recorded with --rounds {baseline['rounds']}, comparing with {args.rounds}\n")
+
+    regressions = compare(results, baseline, args.threshold, args.floor_ns)
+    if regressions:
+        print(f"\nFAIL: {len(regressions)} case(s) regressed by more than {args.threshold:.0%} plus noise: {', '.join(regressions)}")
+        sys.exit(1)
+    print(f"\nOK: no case regressed by more than {args.threshold:.0%} plus noise")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,262 @@
+"""
+Webhook replay benchmark.
+Replays JSONL corpora of Dialogflow CX webhook requests through main.handle_webhook
+and reports latency percentiles, throughput, allocations and peak RSS per fulfillment tag,
+plus the per-stage breakdown recorded by timing.py.
+
+Each corpus line is either a raw webhook request body or an object with a
+"request" key (the format written by traffic capture).
+
+Usage:
+    python benchmarks/replay.py                                  # bundled corpus, mock data
+    python benchmarks/replay.py corpora/*.jsonl --iterations 20
+    python benchmarks/replay.py --backend-url http://127.0.0.1:8081
+    python benchmarks/replay.py --compare results/replay-abc1234.json
+"""
+
+import os
+import sys
+import copy
+import json
+import time
+import glob
+import logging
+import argparse
+import platform
+import resource
+import subprocess
+import tracemalloc
+from collections import defaultdict
+from typing import Dict, Any, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+
+class ReplayRequest:
+    """Minimal stand-in for the Flask request handed to handle_webhook."""
+
+    def __init__(self, body: Dict[str, Any]):
+        self._body = body
+        self._data = json.dumps(body).encode('utf-8')
+        self.headers = {}
+        self.args = {}
+        self.path = '/'
+
+    def get_json(self, silent: bool = True, **kwargs):
+        return self._body
+
+    def get_data(self, **kwargs):
+        return self._data
+
+
+def load_corpus(paths: List[str]) -> List[Dict[str, Any]]:
+    """Load webhook request bodies from JSONL files."""
+    requests = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                requests.append(record.get('request', record) if isinstance(record, dict) else record)
+    return requests
+
+
+def request_label(body: Dict[str, Any]) -> str:
+    """Group key for a request: its fulfillment tag, else flow or intent."""
+    tag = (body.get('fulfillmentInfo') or {}).get('tag')
+    if tag:
+        return tag
+    flow = ((body.get('pageInfo') or {}).get('currentFlow') or {}).get('displayName')
+    if flow:
+        return f"flow:{flow}"
+    intent = (body.get('intentInfo') or {}).get('displayName')
+    return f"intent:{intent}" if intent else '(untagged)'
+
+
+def payload_bytes(result: Any) -> int:
+    """Size of a webhook result as it would go on the wire."""
+    if isinstance(result, tuple):
+        result = result[0]
+    if isinstance(result, (bytes, bytearray)):
+        return len(result)
+    if hasattr(result, 'get_data'):
+        return len(result.get_data())
+    return len(json.dumps(result, separators=(',', ':')).encode('utf-8'))
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def git_commit() -> str:
+    """Short hash of the current commit, or 'unknown'."""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=BENCH_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run(corpus: List[Dict[str, Any]], iterations: int, warmup: int) -> Dict[str, Any]:
+    """Replay the corpus and collect per-tag and per-stage statistics."""
+    import main
+    import timing
+
+    labels = [request_label(body) for body in corpus]
+
+    for _ in range(warmup):
+        for body in corpus:
+            main.handle_webhook(ReplayRequest(copy.deepcopy(body)))
+
+    # Timing pass (no tracing overhead); the stage breakdown covers every request
+    timing.set_every_n(1)
+    timing.reset()
+    latencies = defaultdict(list)
+    sizes = defaultdict(list)
+    busy = defaultdict(float)
+    rss = defaultdict(int)
+    wall_start = time.perf_counter()
+    for _ in range(iterations):
+        for body, label in zip(corpus, labels):
+            request = ReplayRequest(copy.deepcopy(body))
+            start = time.perf_counter()
+            result = main.handle_webhook(request)
+            elapsed = time.perf_counter() - start
+            latencies[label].append(elapsed * 1000.0)
+            busy[label] += elapsed
+            sizes[label].append(payload_bytes(result))
+            rss[label] = max(rss[label], resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+    wall_seconds = time.perf_counter() - wall_start
+    stages = timing.snapshot()
+
+    # Allocation pass: peak traced memory per request
+    allocations = defaultdict(list)
+    tracemalloc.start()
+    for body, label in zip(corpus, labels):
+        request = ReplayRequest(copy.deepcopy(body))
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+        main.handle_webhook(request)
+        _, peak = tracemalloc.get_traced_memory()
+        allocations[label].append(peak - baseline)
+    tracemalloc.stop()
+
+    tags = {}
+    for label in sorted(latencies):
+        samples = latencies[label]
+        tags[label] = {
+            'count': len(samples),
+            'p50_ms': round(percentile(samples, 50), 4),
+            'p95_ms': round(percentile(samples, 95), 4),
+            'p99_ms': round(percentile(samples, 99), 4),
+            'mean_ms': round(sum(samples) / len(samples), 4),
+            'rps': round(len(samples) / busy[label], 1) if busy[label] else 0.0,
+            'alloc_peak_bytes': int(sum(allocations[label]) / len(allocations[label])) if allocations[label] else 0,
+            'response_bytes': int(sum(sizes[label]) / len(sizes[label])),
+            'peak_rss_kib': rss[label]
+        }
+
+    everything = [s for samples in latencies.values() for s in samples]
+    overall = {
+        'count': len(everything),
+        'p50_ms': round(percentile(everything, 50), 4),
+        'p95_ms': round(percentile(everything, 95), 4),
+        'p99_ms': round(percentile(everything, 99), 4),
+        'rps': round(len(everything) / wall_seconds, 1) if wall_seconds else 0.0,
+        'peak_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    }
+    return {'tags': tags, 'overall': overall, 'stages': stages}
+
+
+def compare(current: Dict[str, Any], previous_path: str) -> None:
+    """Print p50/p99 deltas against an earlier result file."""
+    with open(previous_path, 'r', encoding='utf-8') as f:
+        previous = json.load(f)
+    print(f"\nCompared with {previous.get('meta', {}).get('commit', previous_path)}:")
+    for label, stats in current['tags'].items():
+        before = previous.get('tags', {}).get(label)
+        if not before:
+            print(f"  {label:<28} (new)")
+            continue
+        deltas = []
+        for key in ('p50_ms', 'p99_ms', 'alloc_peak_bytes'):
+            if before.get(key):
+                deltas.append(f"{key} {100.0 * (stats[key] - before[key]) / before[key]:+.1f}%")
+        print(f"  {label:<28} {'  '.join(deltas)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay webhook request corpora and report latency.')
+    parser.add_argument('corpus', nargs='*', help='JSONL corpus files (default: benchmarks/corpora/*.jsonl)')
+    parser.add_argument('--iterations', type=int, default=50, help='Times to replay the corpus')
+    parser.add_argument('--warmup', type=int, default=2, help='Untimed warm-up passes')
+    parser.add_argument('--backend-url', help='Library API base URL (default: USE_MOCK_DATA)')
+    parser.add_argument('--log-level', default='WARNING', help='Webhook log level during replay')
+    parser.add_argument('--output', help='Result file (default: benchmarks/results/replay-<commit>.json)')
+    parser.add_argument('--compare', help='Earlier result file to compare against')
+    args = parser.parse_args()
+
+    if args.backend_url:
+        os.environ['USE_MOCK_DATA'] = 'false'
+        os.environ['LIBRARY_API_URL'] = args.backend_url
+    else:
+        os.environ.setdefault('USE_MOCK_DATA', 'true')
+
+    paths = args.corpus or sorted(glob.glob(os.path.join(BENCH_DIR, 'corpora', '*.jsonl')))
+    corpus = load_corpus(paths)
+    if not corpus:
+        parser.error('corpus is empty')
+
+    import main as webhook
+    logging.getLogger().setLevel(args.log_level.upper())
+    webhook.logger.setLevel(args.log_level.upper())
+
+    commit = git_commit()
+    result = {
+        'meta': {
+            'commit': commit,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'corpus': [os.path.relpath(p) for p in paths],
+            'requests': len(corpus),
+            'iterations': args.iterations,
+            'backend': args.backend_url or 'mock'
+        },
+        **run(corpus, args.iterations, args.warmup)
+    }
+
+    output = args.output or os.path.join(BENCH_DIR, 'results', f'replay-{commit}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2, sort_keys=True)
+
+    print(f"{'tag':<28} {'count':>6} {'p50ms':>8} {'p95ms':>8} {'p99ms':>8} {'rps':>9} {'allocB':>9} {'rssKiB':>8}")
+    for label, stats in result['tags'].items():
+        print(
+            f"{label:<28} {stats['count']:>6} {stats['p50_ms']:>8.3f} {stats['p95_ms']:>8.3f} "
+            f"{stats['p99_ms']:>8.3f} {stats['rps']:>9.1f} {stats['alloc_peak_bytes']:>9} {stats['peak_rss_kib']:>8}"
+        )
+    overall = result['overall']
+    print(f"{'overall':<28} {overall['count']:>6} {overall['p50_ms']:>8.3f} {overall['p95_ms']:>8.3f} "
+          f"{overall['p99_ms']:>8.3f} {overall['rps']:>9.1f}")
+    print(f"\n{'stage':<28} {'count':>6} {'p50ms':>8} {'p99ms':>8} {'sum ms':>9}")
+    for name, stats in result['stages'].items():
+        print(f"{name:<28} {stats['count']:>6} {stats['p50_ms']:>8.3f} {stats['p99_ms']:>8.3f} {stats['sum_ms']:>9.1f}")
+    print(f"\nWrote {output}")
+
+    if args.compare:
+        compare(result, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,362 @@
+"""
+Multi-turn conversation simulator for whole-flow load testing.
+Runs scripted conversations through main.handle_webhook, carrying session parameters
+between turns the way Dialogflow CX does, across many processes in parallel.
+
+Turn utterances are sampled from config/intents/csv and their annotated
+parameters ("(Dune)[@BookTitle, book_id]") are filled with random values from
+config/entities/csv, so every session exercises different slot values.
+
+Usage:
+    python benchmarks/simulate.py --sessions 2000 --processes 4
+    python benchmarks/simulate.py --scenario search-hold-login --sessions 500
+"""
+
+import os
+import re
+import sys
+import csv
+import json
+import time
+import random
+import argparse
+import multiprocessing
+from collections import defaultdict
+from typing import Dict, Any, List, Optional, Callable
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(BENCH_DIR)), 'config')
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from replay import ReplayRequest, percentile, git_commit
+import codec
+
+SESSION_PREFIX = 'projects/library-assistant/locations/us-central1/agents/library-agent/sessions/'
+ANNOTATION_PATTERN = re.compile(r'\(([^)]*)\)\[@([\w.]+),\s*(\w+)\]')
+PERSON_NAMES = ['Alex', 'Sam', 'Priya', 'Jordan', 'Mei', 'Carlos', 'Fatima', 'Noah']
+CREDENTIALS = ('user123', 'secretpass')
+
+
+def load_entities() -> Dict[str, List[str]]:
+    """Entity type -> canonical values, from config/entities/csv."""
+    entities = {'sys.person': PERSON_NAMES}
+    for path in sorted(os.listdir(os.path.join(CONFIG_DIR, 'entities', 'csv'))):
+        with open(os.path.join(CONFIG_DIR, 'entities', 'csv', path), newline='', encoding='utf-8') as f:
+            rows = list(csv.reader(f, skipinitialspace=True))
+        entities[os.path.splitext(path)[0]] = [row[0] for row in rows[1:] if row]
+    return entities
+
+
+def load_intents() -> Dict[str, List[str]]:
+    """Intent display name -> training phrases, from config/intents/csv."""
+    intents = {}
+    for path in sorted(os.listdir(os.path.join(CONFIG_DIR, 'intents', 'csv'))):
+        with open(os.path.join(CONFIG_DIR, 'intents', 'csv', path), newline='', encoding='utf-8') as f:
+            rows = list(csv.reader(f))
+        intents[os.path.splitext(path)[0]] = [row[2] for row in rows[1:] if len(row) > 2 and row[2]]
+    return intents
+
+
+class Conversation:
+    """One simulated Dialogflow CX session."""
+
+    def __init__(self, session_id: str, rng: random.Random, entities, intents, webhook):
+        self.session = SESSION_PREFIX + session_id
+        self.parameters: Dict[str, Any] = {}
+        self.rng = rng
+        self.entities = entities
+        self.intents = intents
+        self.webhook = webhook
+        self.turn_ms: List[float] = []
+        self.payload_bytes: List[int] = []
+        self.last_response: Dict[str, Any] = {}
+
+    def utterance(self, intent: str) -> Dict[str, Any]:
+        """Sample a training phrase and resolve its annotated parameters."""
+        phrases = self.intents.get(intent) or ['']
+        phrase = self.rng.choice(phrases)
+        params = {}
+        for _, entity_type, name in ANNOTATION_PATTERN.findall(phrase):
+            values = self.entities.get(entity_type)
+            if values:
+                params[name] = self.rng.choice(values)
+        return params
+
+    def turn(
+        self,
+        tag: str,
+        flow: str,
+        page: str,
+        intent: str = '',
+        parameters: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Send one webhook turn and merge the returned parameters into the session."""
+        if intent:
+            self.parameters.update(self.utterance(intent))
+        self.parameters.update(parameters or {})
+        body = {
+            'detectIntentResponseId': f'sim-{len(self.turn_ms)}',
+            'fulfillmentInfo': {'tag': tag},
+            'sessionInfo': {'session': self.session, 'parameters': json.loads(json.dumps(self.parameters))},
+            'intentInfo': {'displayName': intent, 'confidence': 0.9} if intent else {},
+            'pageInfo': {'currentFlow': {'displayName': flow}, 'currentPage': {'displayName': page}},
+            'languageCode': 'en'
+        }
+        start = time.perf_counter()
+        response = self.webhook.handle_webhook(ReplayRequest(body))
+        self.turn_ms.append((time.perf_counter() - start) * 1000.0)
+
+        if hasattr(response, 'get_data'):
+            response = json.loads(response.get_data())
+        else:
+            response = codec.reply_json(response)
+
+        # Dialogflow drops parameters set to null and keeps everything else
+        for key, value in (response.get('sessionInfo') or {}).get('parameters', {}).items():
+            if value is None:
+                self.parameters.pop(key, None)
+            else:
+                self.parameters[key] = value
+        self.payload_bytes.append(len(json.dumps(self.parameters, separators=(',', ':'))))
+        self.last_response = response
+        return response
+
+
+def scenario_search_hold_login(c: Conversation) -> None:
+    """Search, open a result, place a hold, get redirected to login, resume the hold."""
+    c.turn('book-search', 'Book Search Flow', 'Search Results Page', 'SearchBooks',
+           {'book_title': c.rng.choice(c.entities['BookTitle'])})
+    results = c.parameters.get('search_results') or []
+    if results:
+        book = c.rng.choice(results)
+        c.turn('get-book-details', 'Book Search Flow', 'Book Details Page', '',
+               {'selected_item_id': book.get('id')})
+    c.turn('account-holds', 'Account Management Flow', 'Holds Page', 'PlaceHold')
+    if c.parameters.get('login_required'):
+        c.turn('auth-webhook', 'Authentication Flow', 'Login Page', 'Login',
+               {'user_id': CREDENTIALS[0], 'password': CREDENTIALS[1]})
+
+
+def scenario_account(c: Conversation) -> None:
+    """Log in, view checkouts, renew one, view fines."""
+    c.turn('auth-webhook', 'Authentication Flow', 'Login Page', 'Login',
+           {'user_id': CREDENTIALS[0], 'password': CREDENTIALS[1]})
+    c.parameters.pop('password', None)
+    c.turn('account-checkouts', 'Account Management Flow', 'Checkouts Page', 'ViewCheckouts')
+    checkouts = c.parameters.get('checkouts') or []
+    if checkouts:
+        c.turn('account-renew', 'Account Management Flow', 'Renewal Page', 'RenewBook',
+               {'book_title': c.rng.choice(checkouts).get('title')})
+    c.turn('account-fines', 'Account Management Flow', 'Fines Page', 'ManageFines')
+
+
+def scenario_reservations(c: Conversation) -> None:
+    """Log in, book a study room at a random time, reserve equipment."""
+    c.turn('auth-webhook', 'Authentication Flow', 'Login Page', 'Login',
+           {'user_id': CREDENTIALS[0], 'password': CREDENTIALS[1]})
+    c.parameters.pop('password', None)
+    c.turn('reservations-webhook', 'Reservations Flow', 'Room Booking Page', 'BookRoom', {
+        'reservation_type': 'study room',
+        'date': time.strftime('%Y-%m-%d', time.localtime(time.time() + 86400)),
+        'time': f"{c.rng.randint(9, 18)}:{c.rng.choice(['00', '30'])}",
+        'duration': f"{c.rng.choice([1, 2, 3])} hours"
+    })
+    c.turn('reservations-webhook', 'Reservations Flow', 'Equipment Page', 'ReserveEquipment', {
+        'reservation_type': 'equipment',
+        'equipment_type': c.rng.choice(['laptop', 'projector', 'camera'])
+    })
+
+
+def scenario_help(c: Conversation) -> None:
+    """Greet, then ask a few FAQ questions."""
+    c.turn('', '', 'Start Page', 'Greeting')
+    for _ in range(c.rng.randint(1, 3)):
+        c.turn('help-faq-webhook', 'Help & FAQ Flow', 'FAQ Entry Page', 'GetHelp',
+               {'help_query': c.rng.choice(FAQ_QUERIES)})
+
+
+def scenario_recommendations(c: Conversation) -> None:
+    """Search, then ask for recommendations based on the searched title."""
+    c.turn('book-search', 'Book Search Flow', 'Search Results Page', 'FindBook')
+    c.turn('recommendations-webhook', 'Book Search Flow', 'Recommendations Page', 'GetRecommendations',
+           {'book_title': c.parameters.get('book_title') or c.rng.choice(c.entities['BookTitle'])})
+
+
+FAQ_QUERIES = [
+    'What are your hours?', 'When do you close on Sunday?', 'How long can I borrow a DVD?',
+    'How much are late fees?', 'Do you have ebooks?', 'Is there wifi?', 'How do I get a library card?',
+    'Can I print documents?', 'Where can I park?', 'How do I contact you?', 'Can I bring my dog?'
+]
+
+SCENARIOS: Dict[str, Callable[[Conversation], None]] = {
+    'search-hold-login': scenario_search_hold_login,
+    'account': scenario_account,
+    'reservations': scenario_reservations,
+    'help': scenario_help,
+    'recommendations': scenario_recommendations
+}
+
+# Relative frequency of each scenario in the default traffic mix
+SCENARIO_MIX = {
+    'search-hold-login': 4,
+    'help': 3,
+    'account': 2,
+    'recommendations': 2,
+    'reservations': 1
+}
+
+
+def _count_backend_calls(service) -> Dict[str, int]:
+    """Wrap the service's request entry points with a per-conversation call counter."""
+    counter = {'calls': 0}
+    for name in ('_call_api', '_search_branch'):
+        original = getattr(service, name, None)
+        if original is None:
+            continue
+
+        def counted(*args, _original=original, **kwargs):
+            counter['calls'] += 1
+            return _original(*args, **kwargs)
+
+        setattr(service, name, counted)
+    return counter
+
+
+def worker(job) -> List[Dict[str, Any]]:
+    """Run a batch of sessions in one process and return per-session records."""
+    worker_id, names, seed, log_level = job
+    import logging
+    import main as webhook
+    logging.getLogger().setLevel(log_level)
+    webhook.logger.setLevel(log_level)
+
+    counter = _count_backend_calls(webhook.library_service)
+    entities, intents = load_entities(), load_intents()
+    rng = random.Random(seed)
+    records = []
+    for index, name in enumerate(names):
+        conversation = Conversation(f'sim-{worker_id}-{index}', rng, entities, intents, webhook)
+        counter['calls'] = 0
+        start = time.perf_counter()
+        SCENARIOS[name](conversation)
+        records.append({
+            'scenario': name,
+            'total_ms': (time.perf_counter() - start) * 1000.0,
+            'turn_ms': conversation.turn_ms,
+            'turns': len(conversation.turn_ms),
+            'backend_calls': counter['calls'],
+            'payload_first': conversation.payload_bytes[0] if conversation.payload_bytes else 0,
+            'payload_last': conversation.payload_bytes[-1] if conversation.payload_bytes else 0,
+            'payload_max': max(conversation.payload_bytes, default=0)
+        })
+    return records
+
+
+def summarize(records: List[Dict[str, Any]], wall_seconds: float) -> Dict[str, Any]:
+    """Aggregate session records per scenario."""
+    grouped = defaultdict(list)
+    for record in records:
+        grouped[record['scenario']].append(record)
+
+    flows = {}
+    for name, group in sorted(grouped.items()):
+        totals = [r['total_ms'] for r in group]
+        turns = [t for r in group for t in r['turn_ms']]
+        flows[name] = {
+            'sessions': len(group),
+            'turns_mean': round(sum(r['turns'] for r in group) / len(group), 2),
+            'conversation_p50_ms': round(percentile(totals, 50), 3),
+            'conversation_p95_ms': round(percentile(totals, 95), 3),
+            'conversation_p99_ms': round(percentile(totals, 99), 3),
+            'turn_p50_ms': round(percentile(turns, 50), 3),
+            'turn_p99_ms': round(percentile(turns, 99), 3),
+            'backend_calls_mean': round(sum(r['backend_calls'] for r in group) / len(group), 2),
+            'backend_calls_max': max(r['backend_calls'] for r in group),
+            'session_bytes_first_mean': int(sum(r['payload_first'] for r in group) / len(group)),
+            'session_bytes_last_mean': int(sum(r['payload_last'] for r in group) / len(group)),
+            'session_bytes_max': max(r['payload_max'] for r in group)
+        }
+    return {
+        'flows': flows,
+        'overall': {
+            'sessions': len(records),
+            'turns': sum(r['turns'] for r in records),
+            'sessions_per_second': round(len(records) / wall_seconds, 1) if wall_seconds else 0.0,
+            'turns_per_second': round(sum(r['turns'] for r in records) / wall_seconds, 1) if wall_seconds else 0.0
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate multi-turn conversations against the webhook.')
+    parser.add_argument('--sessions', type=int, default=1000)
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS), help='Run one scenario instead of the mix')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--backend-url', help='Library API base URL (default: USE_MOCK_DATA)')
+    parser.add_argument('--log-level', default='WARNING')
+    parser.add_argument('--output', help='Result file (default: benchmarks/results/simulate-<commit>.json)')
+    args = parser.parse_args()
+
+    if args.backend_url:
+        os.environ['USE_MOCK_DATA'] = 'false'
+        os.environ['LIBRARY_API_URL'] = args.backend_url
+    else:
+        os.environ.setdefault('USE_MOCK_DATA', 'true')
+
+    rng = random.Random(args.seed)
+    if args.scenario:
+        names = [args.scenario] * args.sessions
+    else:
+        names = rng.choices(list(SCENARIO_MIX), weights=list(SCENARIO_MIX.values()), k=args.sessions)
+
+    processes = max(1, min(args.processes, args.sessions))
+    jobs = [
+        (i, names[i::processes], args.seed * 1000 + i, args.log_level.upper())
+        for i in range(processes)
+    ]
+
+    start = time.perf_counter()
+    if processes == 1:
+        batches = [worker(jobs[0])]
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            batches = pool.map(worker, jobs)
+    wall_seconds = time.perf_counter() - start
+
+    records = [record for batch in batches for record in batch]
+    commit = git_commit()
+    result = {
+        'meta': {
+            'commit': commit,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'sessions': args.sessions,
+            'processes': processes,
+            'scenario': args.scenario or 'mix',
+            'seed': args.seed,
+            'backend': args.backend_url or 'mock'
+        },
+        **summarize(records, wall_seconds)
+    }
+
+    output = args.output or os.path.join(BENCH_DIR, 'results', f'simulate-{commit}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2, sort_keys=True)
+
+    print(f"{'flow':<20} {'sessions':>8} {'turns':>6} {'p50ms':>8} {'p99ms':>8} {'calls':>6} {'bytes0':>7} {'bytesN':>7} {'max':>7}")
+    for name, stats in result['flows'].items():
+        print(
+            f"{name:<20} {stats['sessions']:>8} {stats['turns_mean']:>6} {stats['conversation_p50_ms']:>8.3f} "
+            f"{stats['conversation_p99_ms']:>8.3f} {stats['backend_calls_mean']:>6} "
+            f"{stats['session_bytes_first_mean']:>7} {stats['session_bytes_last_mean']:>7} {stats['session_bytes_max']:>7}"
+        )
+    overall = result['overall']
+    print(f"\n{overall['sessions']} sessions, {overall['turns']} turns in {wall_seconds:.2f}s "
+          f"({overall['sessions_per_second']} sessions/s, {overall['turns_per_second']} turns/s)")
+    print(f"Wrote {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,360 @@
+"""
+Local stand-in for the library API with latency and fault injection.
+Serves every endpoint LibraryService calls over real HTTP so connection handling,
+timeouts and fallback paths can be exercised and benchmarked on one machine.
+
+Response bodies come from LibraryService's mock backend, so they match what
+USE_MOCK_DATA returns. Faults are configured globally and per endpoint:
+
+    --latency SPEC          const:MS | uniform:LO:HI | normal:MEAN:SD | lognormal:MEDIAN:SIGMA | exp:MEAN
+    --error-rate P          fraction of requests answered with 500/503
+    --timeout-rate P        fraction of requests that hang for --hang-seconds
+    --slowloris-rate P      fraction of responses dribbled out one byte at a time
+    --throttle-rps N        token-bucket limit; excess requests get 429
+    --concurrency N         requests served at once (per endpoint override); others queue, so latency grows with load
+
+Per-endpoint overrides live in a JSON file passed with --config:
+
+    {"endpoints": {"books/search": {"latency": "lognormal:40:0.6", "error_rate": 0.1}}}
+
+Runtime control (handy for convergence tests):
+
+    GET  /__admin/stats     request counts and the last headers seen per endpoint
+    POST /__admin/config    replace the fault configuration (same JSON shape)
+    POST /__admin/reset     clear the statistics
+
+Usage:
+    python benchmarks/standin_server.py --port 8081 --latency lognormal:20:0.5 --error-rate 0.02
+    LIBRARY_API_URL=http://127.0.0.1:8081 USE_MOCK_DATA=false python benchmarks/replay.py
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qsl
+from typing import Dict, Any, Optional, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+# (method, path pattern) for every endpoint LibraryService calls
+ROUTES = [
+    ('GET', r'books/search'),
+    ('GET', r'books/[^/]+'),
+    ('POST', r'auth/login'),
+    ('GET', r'users/[^/]+'),
+    ('GET', r'users/[^/]+/checkouts'),
+    ('GET', r'users/[^/]+/holds'),
+    ('GET', r'users/[^/]+/fines'),
+    ('POST', r'checkouts/renew'),
+    ('POST', r'holds'),
+    ('POST', r'fines/pay'),
+    ('GET', r'rooms/available'),
+    ('GET', r'rooms/schedule'),
+    ('POST', r'rooms/book'),
+    ('GET', r'equipment/availability'),
+    ('GET', r'equipment/schedule'),
+    ('POST', r'equipment/reserve'),
+    ('GET', r'events/upcoming'),
+    ('POST', r'events/register'),
+    ('GET', r'circulation/history')
+]
+COMPILED_ROUTES = [(method, pattern, re.compile(f'^{pattern}$')) for method, pattern in ROUTES]
+
+
+def parse_latency(spec: Optional[str]):
+    """Turn a latency spec into a sampler returning seconds."""
+    if not spec:
+        return lambda rng: 0.0
+    kind, *args = spec.split(':')
+    values = [float(a) for a in args]
+    if kind == 'const':
+        return lambda rng: values[0] / 1000.0
+    if kind == 'uniform':
+        return lambda rng: rng.uniform(values[0], values[1]) / 1000.0
+    if kind == 'normal':
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1])) / 1000.0
+    if kind == 'lognormal':
+        import math
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1]) / 1000.0
+    if kind == 'exp':
+        return lambda rng: rng.expovariate(1.0 / values[0]) / 1000.0
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class FaultProfile:
+    """Fault settings for one endpoint (or the server default)."""
+
+    def __init__(self, settings: Dict[str, Any], defaults: Optional['FaultProfile'] = None):
+        def pick(key, fallback):
+            return settings.get(key, getattr(defaults, key) if defaults else fallback)
+
+        self.latency = pick('latency', None)
+        self.error_rate = float(pick('error_rate', 0.0))
+        self.timeout_rate = float(pick('timeout_rate', 0.0))
+        self.slowloris_rate = float(pick('slowloris_rate', 0.0))
+        self.hang_seconds = float(pick('hang_seconds', 30.0))
+        self.concurrency = int(pick('concurrency', 0))
+        self.sample_latency = parse_latency(self.latency)
+        # Worker slots: requests past the capacity wait for one before their latency starts
+        self.slots = threading.Semaphore(self.concurrency) if self.concurrency > 0 else None
+
+
+class TokenBucket:
+    """Thread-safe token bucket for request throttling."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+class StandInState:
+    """Shared server state: backend, fault configuration and statistics."""
+
+    def __init__(self, config: Dict[str, Any], seed: int = 0):
+        os.environ['USE_MOCK_DATA'] = 'true'
+        from library_service import LibraryService
+        self.backend = LibraryService()
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        self.counts: Dict[str, Dict[str, int]] = {}
+        self.last_headers: Dict[str, Dict[str, str]] = {}
+        self.configure(config)
+
+    def configure(self, config: Dict[str, Any]) -> None:
+        """Replace the fault configuration."""
+        self.config = config
+        self.default = FaultProfile(config)
+        self.endpoints = {
+            pattern: FaultProfile(settings, self.default)
+            for pattern, settings in config.get('endpoints', {}).items()
+        }
+        rps = config.get('throttle_rps')
+        self.bucket = TokenBucket(float(rps)) if rps else None
+
+    def profile(self, route: str) -> FaultProfile:
+        return self.endpoints.get(route, self.default)
+
+    def roll(self) -> float:
+        with self.rng_lock:
+            return self.rng.random()
+
+    def latency(self, profile: FaultProfile) -> float:
+        with self.rng_lock:
+            return profile.sample_latency(self.rng)
+
+    def record(self, route: str, outcome: str, headers: Dict[str, str]) -> None:
+        with self.stats_lock:
+            counts = self.counts.setdefault(route, {})
+            counts[outcome] = counts.get(outcome, 0) + 1
+            self.last_headers[route] = headers
+
+
+def match_route(method: str, path: str) -> Optional[str]:
+    """Return the route pattern serving method + path, if any."""
+    for route_method, pattern, regex in COMPILED_ROUTES:
+        if route_method == method and regex.match(path):
+            return pattern
+    return None
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Request handler applying faults before delegating to the mock backend."""
+
+    protocol_version = 'HTTP/1.1'
+    state: StandInState = None
+
+    def setup(self):
+        super().setup()
+        # Headers and body go out in separate writes; without this Nagle's
+        # algorithm adds ~40ms per keep-alive response
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: Dict[str, Any], extra_headers: Dict[str, str] = None,
+                   slowloris: bool = False) -> None:
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for key, value in (extra_headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if slowloris:
+            # Dribble the body out so clients hit read timeouts, not connect timeouts
+            for i in range(len(payload)):
+                self.wfile.write(payload[i:i + 1])
+                self.wfile.flush()
+                time.sleep(0.2)
+        else:
+            self.wfile.write(payload)
+
+    def _read_body(self) -> Dict[str, Any]:
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length))
+        except ValueError:
+            return {}
+
+    def _admin(self, method: str, path: str) -> None:
+        state = self.state
+        if method == 'GET' and path == '__admin/stats':
+            with state.stats_lock:
+                body = {'counts': state.counts, 'last_headers': state.last_headers, 'config': state.config}
+            self._send_json(200, body)
+        elif method == 'POST' and path == '__admin/config':
+            state.configure(self._read_body())
+            self._send_json(200, {'success': True, 'config': state.config})
+        elif method == 'POST' and path == '__admin/reset':
+            with state.stats_lock:
+                state.counts.clear()
+                state.last_headers.clear()
+            self._send_json(200, {'success': True})
+        else:
+            self._send_json(404, {'error': 'unknown admin endpoint'})
+
+    def _handle(self, method: str) -> None:
+        parsed = urlparse(self.path)
+        path = parsed.path.strip('/')
+        if path.startswith('__admin/'):
+            return self._admin(method, path)
+
+        state = self.state
+        data = self._read_body() if method in ('POST', 'PUT') else dict(parse_qsl(parsed.query))
+        route = match_route(method, path)
+        headers = {key: value for key, value in self.headers.items()}
+        if route is None:
+            state.record(path, 'not_found', headers)
+            return self._send_json(404, {'error': f'No route for {method} /{path}'})
+
+        if state.bucket and not state.bucket.allow():
+            state.record(route, 'throttled', headers)
+            return self._send_json(429, {'error': 'Too many requests'}, {'Retry-After': '1'})
+
+        profile = state.profile(route)
+        delay = state.latency(profile)
+        if profile.slots is not None:
+            with profile.slots:
+                time.sleep(delay)
+        elif delay:
+            time.sleep(delay)
+
+        if state.roll() < profile.timeout_rate:
+            state.record(route, 'hang', headers)
+            time.sleep(profile.hang_seconds)
+            self.close_connection = True
+            return
+
+        if state.roll() < profile.error_rate:
+            state.record(route, 'error', headers)
+            status = 503 if state.roll() < 0.5 else 500
+            return self._send_json(status, {'error': 'Injected failure'})
+
+        body = state.backend._get_mock_response(path, method, data)
+        slowloris = state.roll() < profile.slowloris_rate
+        state.record(route, 'slowloris' if slowloris else 'ok', headers)
+        self._send_json(200, body, slowloris=slowloris)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 drops connection bursts from concurrent
+    # clients, which then retry after a second
+    request_queue_size = 128
+
+
+def _make_server(host: str, port: int, config: Dict[str, Any], seed: int) -> ThreadingHTTPServer:
+    """Bind a server whose handler shares one StandInState."""
+    handler = type('BoundStandInHandler', (StandInHandler,), {'state': StandInState(config, seed)})
+    return StandInServer((host, port), handler)
+
+
+def start_server(port: int = 0, config: Optional[Dict[str, Any]] = None, seed: int = 0) -> Tuple[ThreadingHTTPServer, str]:
+    """
+    Start the stand-in server on a background thread.
+
+    Args:
+        port: Port to bind (0 picks a free one)
+        config: Fault configuration
+        seed: Random seed for fault injection
+
+    Returns:
+        (server, base_url); call server.shutdown() to stop it
+    """
+    server = _make_server('127.0.0.1', port, config or {}, seed)
+    threading.Thread(target=server.serve_forever, name='standin-server', daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a local stand-in library API with fault injection.')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--config', help='JSON fault configuration file (per-endpoint overrides)')
+    parser.add_argument('--latency', help='Default latency distribution, e.g. lognormal:20:0.5')
+    parser.add_argument('--error-rate', type=float)
+    parser.add_argument('--timeout-rate', type=float)
+    parser.add_argument('--slowloris-rate', type=float)
+    parser.add_argument('--hang-seconds', type=float)
+    parser.add_argument('--throttle-rps', type=float)
+    parser.add_argument('--concurrency', type=int)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    config = {}
+    if args.config:
+        with open(args.config, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    for key in ('latency', 'error_rate', 'timeout_rate', 'slowloris_rate', 'hang_seconds', 'throttle_rps', 'concurrency'):
+        value = getattr(args, key)
+        if value is not None:
+            config[key] = value
+
+    server = _make_server(args.host, args.port, config, args.seed)
+    print(f"Stand-in library API on http://{args.host}:{args.port} (faults: {json.dumps(config)})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
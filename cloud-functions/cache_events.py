@@ -0,0 +1,440 @@
+"""
+Cache Events - Push invalidation of the catalog caches from library system change events
+Applies batched book and event changes to cached catalog reads, cached replies and the recommendation table.
+
+The library system POSTs batches to handle_cache_events (main.py):
+
+    {"events": [
+        {"id": "e-1", "type": "book.availability_changed", "book_id": "12", "availability": "Checked Out", "version": 41},
+        {"id": "e-2", "type": "book.updated", "book_id": "12", "changes": {"title": "..."}, "version": 42},
+        {"id": "e-3", "type": "event.added", "event": {"id": "ev-9", "title": "...", "date": "..."}}
+    ]}
+
+signed with HMAC-SHA256 of "<timestamp>.<body>" under CACHE_EVENTS_SECRET
+(headers X-Signature: sha256=<hex> and X-Signature-Timestamp: <unix
+seconds>, at most CACHE_EVENTS_TOLERANCE seconds old). Without a secret the
+endpoint answers 503.
+
+Changes are applied in place: cached catalog values holding the book are
+patched (a book.updated without changes drops them instead, as does an
+availability change to a federated search, whose per-branch availability
+the event cannot update), the event is added to the cached upcoming events,
+cached replies showing the book are dropped and the recommendation table's
+metadata is updated. Every change sets values rather than adjusting them,
+and an event is skipped when its id was seen before or, per book field,
+its version is not newer than the last one applied, so redelivered and
+reordered batches are harmless.
+
+With a shared cache tier (LIBRARY_CACHE_L2) accepted events are also
+appended to a change log there. Each instance reads the log at most every
+LIBRARY_CACHE_SYNC seconds, on a webhook turn, and applies what it has not
+seen, LIBRARY_CACHE_SYNC_BATCH entries per turn at most (main.warm_up reads
+the backlog of up to MAX_BACKLOG entries a new instance starts with); values it loads from L2 that were stored before a logged change are
+patched as they are read. Log entries are kept for CACHE_EVENTS_RETENTION
+seconds (default: the longest catalog TTL plus its stale window), so no
+shared value outlives the changes that apply to it.
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Mapping, Optional, Tuple
+
+import codec
+import metrics
+from api_cache import CacheBackendError, cache_key
+from library_service import catalog_books
+
+logger = logging.getLogger(__name__)
+
+EVENT_TYPES = ('book.updated', 'book.availability_changed', 'event.added')
+EVENTS_KEY = cache_key('events/upcoming')
+# Cache keys whose books carry per-branch availability
+FEDERATED_PREFIX = 'federated/'
+# Slack when comparing timestamps taken on different instances
+CLOCK_SKEW = 5.0
+# Log entries a starting instance reads at most
+MAX_BACKLOG = 256
+
+
+def sign(secret: str, body: bytes, timestamp: str) -> str:
+    """X-Signature value of a body sent at a timestamp."""
+    # Imported here: only the events endpoint and its senders sign anything
+    import hmac
+    import hashlib
+    digest = hmac.new(secret.encode('utf-8'), timestamp.encode('utf-8') + b'.' + body, hashlib.sha256)
+    return f"sha256={digest.hexdigest()}"
+
+
+def verify_signature(
+    secret: str,
+    body: bytes,
+    timestamp: str,
+    signature: str,
+    tolerance: float,
+    now: Optional[float] = None
+) -> bool:
+    """
+    Check a batch's signature and that it is recent.
+
+    Args:
+        secret: Shared secret
+        body: Raw request body
+        timestamp: X-Signature-Timestamp header (unix seconds)
+        signature: X-Signature header ('sha256=<hex>')
+        tolerance: Maximum age (and clock skew) in seconds
+        now: Current time (default: time.time())
+
+    Returns:
+        True if the signature matches and the timestamp is within tolerance
+    """
+    import hmac
+    try:
+        sent_at = float(timestamp)
+    except (TypeError, ValueError):
+        return False
+    if abs((time.time() if now is None else now) - sent_at) > tolerance:
+        return False
+    return hmac.compare_digest(sign(secret, body, timestamp), signature or '')
+
+
+class ChangeEvent:
+    """One validated change event."""
+
+    __slots__ = ('id', 'type', 'book_id', 'changes', 'event', 'version')
+
+    def __init__(self, raw: Any):
+        """
+        Validate a raw event.
+
+        Raises:
+            ValueError: If the event is malformed
+        """
+        if not isinstance(raw, dict):
+            raise ValueError('event is not an object')
+        self.id, self.type = raw.get('id'), raw.get('type')
+        if not isinstance(self.id, (str, int)) or self.id == '':
+            raise ValueError('event has no id')
+        if self.type not in EVENT_TYPES:
+            raise ValueError(f"unknown event type '{self.type}'")
+        self.version = raw.get('version')
+        if self.version is not None and not isinstance(self.version, (int, float)):
+            raise ValueError('version is not a number')
+        self.book_id = self.changes = self.event = None
+        if self.type == 'event.added':
+            self.event = raw.get('event')
+            if not isinstance(self.event, dict) or self.event.get('id') is None:
+                raise ValueError('event.added needs an event with an id')
+            return
+        if raw.get('book_id') is None:
+            raise ValueError(f"{self.type} needs a book_id")
+        self.book_id = str(raw['book_id'])
+        if self.type == 'book.availability_changed':
+            if not isinstance(raw.get('availability'), str):
+                raise ValueError('book.availability_changed needs an availability')
+            self.changes = {'availability': raw['availability']}
+        else:
+            changes = raw.get('changes', raw.get('book'))
+            if changes is not None and not isinstance(changes, dict):
+                raise ValueError('changes is not an object')
+            # No changes: the book changed in ways the event does not describe
+            self.changes = {field: value for field, value in changes.items() if field != 'id'} if changes else None
+
+
+def patch_books(value: Any, book_id: str, changes: Mapping[str, Any]) -> Any:
+    """Set changed fields on a book's records in a writable catalog value; returns the value."""
+    for book in catalog_books(value):
+        if str(book['id']) == book_id:
+            book.update(changes)
+    return value
+
+
+def add_event(value: Any, event: Mapping[str, Any]) -> Any:
+    """Add (or replace) an event in a writable {'events': [...]} value; returns the value."""
+    if isinstance(value, dict):
+        events = [item for item in value.get('events') or () if not (isinstance(item, dict) and item.get('id') == event['id'])]
+        events.append(dict(event))
+        value['events'] = events
+    return value
+
+
+class CacheEvents:
+    """
+    Receives change event batches and keeps the caches consistent with them.
+
+    Holds, for the retention window, the changes applied per book and the
+    events added, which is what patches values loaded from L2.
+    """
+
+    def __init__(
+        self,
+        library_service,
+        response_cache,
+        recommendation_table,
+        secret: Optional[str] = None,
+        tolerance: Optional[float] = None,
+        sync_interval: Optional[float] = None,
+        sync_batch: Optional[int] = None,
+        retention: Optional[float] = None,
+        max_seen: int = 10000
+    ):
+        """
+        Initialize and hook into the library service's cache.
+
+        Args:
+            library_service: LibraryService whose cache is kept current
+            response_cache: ResponseCache to drop replies from
+            recommendation_table: RecommendationTable to update
+            secret: Signing secret (default: CACHE_EVENTS_SECRET; empty disables the endpoint)
+            tolerance: Maximum batch age in seconds (default: CACHE_EVENTS_TOLERANCE, 300)
+            sync_interval: Seconds between change log reads (default: LIBRARY_CACHE_SYNC, 2)
+            sync_batch: Log entries read per turn at most (default: LIBRARY_CACHE_SYNC_BATCH, 16)
+            retention: Seconds changes are kept (default: CACHE_EVENTS_RETENTION, or the longest catalog lifetime)
+            max_seen: Event ids remembered for duplicate detection
+        """
+        self.response_cache = response_cache
+        self.recommendation_table = recommendation_table
+        self.cache = library_service.cache
+        self.secret = secret if secret is not None else os.environ.get('CACHE_EVENTS_SECRET', '')
+        self.tolerance = tolerance if tolerance is not None else float(os.environ.get('CACHE_EVENTS_TOLERANCE', '300'))
+        self.sync_interval = sync_interval if sync_interval is not None else float(os.environ.get('LIBRARY_CACHE_SYNC', '2'))
+        self.sync_batch = sync_batch if sync_batch is not None else int(os.environ.get('LIBRARY_CACHE_SYNC_BATCH', '16'))
+        if retention is None:
+            retention = float(os.environ.get('CACHE_EVENTS_RETENTION', '0')) or max(
+                ttl + library_service.stale_ttls.get(label, 0) for label, ttl in library_service.cache_ttls.items())
+        self.retention = retention
+        self.max_seen = max_seen
+        self.log = self.cache.l2 if self.cache is not None else None
+        if self.cache is not None:
+            self.cache.on_load = self._patch_loaded
+            self._log_prefix = f"{self.cache.namespace}:changes"
+        self._seen: 'OrderedDict[str, None]' = OrderedDict()
+        # (book_id, field) -> last version applied ('*' for drops)
+        self._versions: Dict[Tuple[str, str], float] = {}
+        # book_id -> (applied at, merged changes or None for dropped), oldest first
+        self._recent_books: 'OrderedDict[str, Tuple[float, Optional[Dict[str, Any]]]]' = OrderedDict()
+        self._recent_events: List[Tuple[float, Dict[str, Any]]] = []
+        # Last log entry read, and the log length seen on the previous read
+        self._cursor: Optional[int] = None
+        self._numbered: Optional[int] = None
+        self._next_sync = 0.0
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    def handle(self, body: bytes, headers: Mapping[str, str]) -> Tuple[int, Dict[str, Any]]:
+        """
+        Verify and apply a pushed batch.
+
+        Args:
+            body: Raw request body
+            headers: Request headers
+
+        Returns:
+            (HTTP status, result with per-result event counts)
+        """
+        if not self.secret:
+            return 503, {'error': 'cache events are not configured'}
+        if not verify_signature(self.secret, body, headers.get('X-Signature-Timestamp', ''),
+                                headers.get('X-Signature', ''), self.tolerance):
+            logger.warning("Rejected cache event batch with a bad or expired signature")
+            return 401, {'error': 'invalid signature'}
+        try:
+            batch = codec.loads(body)
+        except ValueError:
+            batch = None
+        if not isinstance(batch, dict) or not isinstance(batch.get('events'), list):
+            return 400, {'error': "expected {\"events\": [...]}"}
+
+        at = time.time()
+        counts, accepted = self.apply(batch['events'], at, 'push')
+        if accepted and self.log is not None:
+            self._publish(accepted, at)
+        logger.info(f"Cache events: {counts}")
+        return 200, counts
+
+    def apply(self, raw_events: List[Any], at: float, source: str = 'push') -> Tuple[Dict[str, int], List[Any]]:
+        """
+        Apply events in order, skipping duplicates and stale versions.
+
+        Args:
+            raw_events: Events as received
+            at: When the batch was received (compared with L2 stored_at)
+            source: 'push' or 'sync' (metrics label)
+
+        Returns:
+            (counts of applied, duplicate, stale and invalid events, the applied raw events)
+        """
+        counts = {'applied': 0, 'duplicate': 0, 'stale': 0, 'invalid': 0}
+        accepted = []
+        for raw in raw_events:
+            try:
+                event = ChangeEvent(raw)
+            except ValueError as e:
+                logger.warning(f"Ignoring invalid cache event: {str(e)}")
+                result, event_type = 'invalid', str(raw.get('type') if isinstance(raw, dict) else None)
+            else:
+                event_type = event.type
+                with self._lock:
+                    result = self._apply_event(event, at)
+                if result == 'applied':
+                    accepted.append(raw)
+            counts[result] += 1
+            metrics.cache_events.inc(event_type, source, result)
+        return counts, accepted
+
+    def _apply_event(self, event: ChangeEvent, at: float) -> str:
+        """Apply one event (caller holds the lock); returns its result."""
+        event_id = str(event.id)
+        if event_id in self._seen:
+            return 'duplicate'
+        self._seen[event_id] = None
+        while len(self._seen) > self.max_seen:
+            self._seen.popitem(last=False)
+
+        if event.type == 'event.added':
+            self._recent_events.append((at, event.event))
+            self._prune(at)
+            if self.cache is not None:
+                self.cache.update(EVENTS_KEY, lambda value: add_event(value, event.event))
+            return 'applied'
+
+        changes = self._fresh_changes(event)
+        if changes is False:
+            return 'stale'
+        previous = self._recent_books.pop(event.book_id, None)
+        merged = None if changes is None or (previous and previous[1] is None) else {**(previous[1] if previous else {}), **changes}
+        self._recent_books[event.book_id] = (at, merged)
+        self._prune(at)
+        self._apply_book(event.book_id, changes)
+        return 'applied'
+
+    def _fresh_changes(self, event: ChangeEvent):
+        """The event's changes newer than those applied (None: drop the book; False: all stale)."""
+        if event.version is None:
+            return event.changes
+        if event.changes is None:
+            if event.version <= self._versions.get((event.book_id, '*'), float('-inf')):
+                return False
+            self._versions[(event.book_id, '*')] = event.version
+            return None
+        fresh = {}
+        for field, value in event.changes.items():
+            if event.version > self._versions.get((event.book_id, field), float('-inf')):
+                self._versions[(event.book_id, field)] = event.version
+                fresh[field] = value
+        return fresh or False
+
+    def _apply_book(self, book_id: str, changes: Optional[Dict[str, Any]]) -> None:
+        if self.cache is not None:
+            keys = set(self.cache.tagged(f"book:{book_id}"))
+            keys.add(cache_key(f"books/{book_id}"))
+            for key in keys:
+                if changes is None or ('availability' in changes and key.startswith(FEDERATED_PREFIX)):
+                    self.cache.delete(key)
+                else:
+                    self.cache.update(key, lambda value: patch_books(value, book_id, changes))
+        self.response_cache.discard_books([book_id])
+        if changes:
+            self.recommendation_table.update_book(book_id, changes)
+
+    def _prune(self, now: float) -> None:
+        """Forget changes older than the retention window."""
+        horizon = now - self.retention - CLOCK_SKEW
+        while self._recent_books:
+            book_id, (at, _) = next(iter(self._recent_books.items()))
+            if at > horizon:
+                break
+            del self._recent_books[book_id]
+        if self._recent_events and self._recent_events[0][0] <= horizon:
+            self._recent_events = [item for item in self._recent_events if item[0] > horizon]
+
+    def _patch_loaded(self, key: str, value: Any, stored_at: float) -> Any:
+        """TieredCache.on_load: bring a value read from L2 up to date with later changes."""
+        since = stored_at - CLOCK_SKEW
+        if key == EVENTS_KEY:
+            for at, event in list(self._recent_events):
+                if at > since:
+                    add_event(value, event)
+        for book in catalog_books(value):
+            recent = self._recent_books.get(str(book['id']))
+            if recent is None or recent[0] <= since:
+                continue
+            changes = recent[1]
+            if changes is None or ('availability' in changes and key.startswith(FEDERATED_PREFIX)):
+                return None
+            book.update(changes)
+        return value
+
+    def _log_failed(self, operation: str, error: Exception) -> None:
+        metrics.cache_backend_errors.inc(self.log.name, operation)
+        logger.warning(f"Cache change log {operation} failed: {str(error)}")
+
+    def _publish(self, events: List[Any], at: float) -> None:
+        """Append applied events to the shared change log."""
+        try:
+            seq = self.log.incr(f"{self._log_prefix}:seq")
+            self.log.set(f"{self._log_prefix}:{seq}", codec.dumps({'at': at, 'events': events}), self.retention)
+        except CacheBackendError as e:
+            self._log_failed('publish', e)
+
+    def sync(self, force: bool = False, limit: Optional[int] = None) -> int:
+        """
+        Apply change log entries published since the last read.
+
+        Cheap to call on every turn: reads the log at most every
+        sync_interval seconds, only when there is a shared tier, and at most
+        limit entries per read. A read that leaves entries behind lets the
+        next turn continue without waiting for the interval.
+
+        Args:
+            force: Read now regardless of the interval
+            limit: Log entries read at most (default: sync_batch; main.warm_up reads the whole backlog)
+
+        Returns:
+            Events applied
+        """
+        if self.log is None:
+            return 0
+        now = time.monotonic()
+        if (now < self._next_sync and not force) or not self._sync_lock.acquire(blocking=False):
+            return 0
+        try:
+            self._next_sync = now + self.sync_interval
+            return self._read_log(self.sync_batch if limit is None else limit)
+        except CacheBackendError as e:
+            self._log_failed('sync', e)
+            return 0
+        finally:
+            self._sync_lock.release()
+
+    def _read_log(self, limit: int) -> int:
+        raw = self.log.get(f"{self._log_prefix}:seq")
+        last = int(raw) if raw else 0
+        seq = self._cursor if self._cursor is not None else max(last - MAX_BACKLOG, 0)
+        numbered = self._numbered if self._numbered is not None else last
+        self._numbered = last
+        applied = 0
+        end = min(last, seq + max(1, limit))
+        while seq < end:
+            data = self.log.get(f"{self._log_prefix}:{seq + 1}")
+            if data is None and seq + 1 > numbered:
+                # Numbered since the last read but not written yet: look again next time
+                break
+            seq += 1
+            if data is None:
+                # Expired, or its write failed
+                continue
+            try:
+                entry = codec.loads(data)
+                applied += self.apply(entry['events'], float(entry['at']), 'sync')[0]['applied']
+            except (ValueError, KeyError, TypeError) as e:
+                logger.warning(f"Skipping unreadable cache change log entry {seq}: {str(e)}")
+        self._cursor = seq
+        if seq == end < last:
+            # Cut short by the limit: the next turn reads on
+            self._next_sync = 0.0
+        if applied:
+            logger.info(f"Applied {applied} catalog change(s) from the shared change log")
+        return applied
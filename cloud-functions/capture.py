@@ -0,0 +1,263 @@
+"""
+Capture - Sampled, redacted traffic capture for replayable corpora
+Writes a sample of live webhook requests, with their stage timings, to rotating JSONL files.
+
+Sampling is per Dialogflow session (CAPTURE_RATE of sessions, every turn of
+each), so captured files replay whole conversations. Records are handed to a
+bounded queue and redacted and written by a background thread; when the
+queue is full the record is dropped rather than delaying the reply.
+
+Each line is {"request": <redacted body>, "captured_at": ..., "latency_ms": ...,
+"timings": {<stage>: ms}}, which benchmarks/replay.py reads directly.
+
+Redaction: secrets (passwords, PINs, tokens) are replaced outright; member
+IDs, names, utterance text, emails and session IDs are replaced with keyed
+hashes, so the same value maps to the same token and sessions and users stay
+linked across turns. A key that marks a secret or an identifier covers its
+whole subtree: CX sends intent parameters as {"originalValue": ...,
+"resolvedValue": ...} and form parameters as {"displayName": ..., "value":
+...}. Set CAPTURE_HASH_KEY to keep hashes stable across restarts.
+"""
+
+import os
+import re
+import json
+import glob
+import time
+import zlib
+import queue
+import logging
+import threading
+from functools import wraps
+from typing import Dict, Any, Callable, Optional
+
+import codec
+import timing
+import metrics
+
+logger = logging.getLogger(__name__)
+
+RATE = float(os.environ.get('CAPTURE_RATE', '0'))
+CAPTURE_DIR = os.environ.get('CAPTURE_DIR', '/tmp/webhook-capture')
+FILE_BYTES = int(os.environ.get('CAPTURE_FILE_BYTES', str(10 * 1024 * 1024)))
+MAX_FILES = int(os.environ.get('CAPTURE_MAX_FILES', '10'))
+QUEUE_SIZE = int(os.environ.get('CAPTURE_QUEUE_SIZE', '1000'))
+HASH_KEY = os.environ.get('CAPTURE_HASH_KEY', '')
+
+REDACTED = '[REDACTED]'
+
+_SECRET_KEY = re.compile(r'pass(word|wd|code)?$|^pin$|secret|token|credential|api_?key', re.IGNORECASE)
+_MEMBER_KEY = re.compile(r'^(user|member|patron|account|card|library_card)(_?(id|number|no))?$', re.IGNORECASE)
+# Person names ('name', 'user_name', 'firstName'...), but not CX display names, which routing needs
+_NAME_KEY = re.compile(r'^(?!display_?name$).*name$', re.IGNORECASE)
+# What the user said or typed
+_TEXT_KEY = re.compile(r'^(text|transcript)$', re.IGNORECASE)
+_EMAIL_KEY = re.compile(r'e_?mail', re.IGNORECASE)
+_EMAIL = re.compile(r'[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}')
+
+
+class Redactor:
+    """Deterministic redaction of webhook request bodies."""
+
+    def __init__(self, key: str = HASH_KEY):
+        # Imported here to keep them off the cold-start path when capture is off
+        import hmac
+        import hashlib
+        self._key = key.encode('utf-8') if key else os.urandom(16)
+        self._hmac, self._sha256 = hmac.new, hashlib.sha256
+
+    def token(self, kind: str, value: Any) -> str:
+        """Stable pseudonym for a value ('member-3f9a0c...')."""
+        digest = self._hmac(self._key, f"{kind}:{value}".encode('utf-8'), self._sha256).hexdigest()
+        return f"{kind}-{digest[:12]}"
+
+    def email(self, match) -> str:
+        return f"{self.token('user', match.group(0).lower())}@example.invalid"
+
+    @staticmethod
+    def kind(key: str) -> Optional[str]:
+        """What a key marks its value (and everything under it) as: 'secret', 'member', 'name', 'text' or None."""
+        if _SECRET_KEY.search(key):
+            return 'secret'
+        if _MEMBER_KEY.match(key):
+            return 'member'
+        if _NAME_KEY.match(key):
+            return 'name'
+        if _TEXT_KEY.match(key):
+            return 'text'
+        return None
+
+    def redact(self, value: Any, key: str = '', kind: Optional[str] = None) -> Any:
+        """
+        Redacted copy of a JSON value.
+
+        Args:
+            value: JSON value
+            key: Name it was stored under
+            kind: Set under a key that marks the whole subtree (see kind())
+        """
+        kind = kind or self.kind(key)
+        if isinstance(value, dict):
+            # Form parameters name themselves: {"displayName": "password", "value": ...}
+            named = self.kind(value['displayName']) if isinstance(value.get('displayName'), str) else None
+            return {k: self.redact(v, k, kind or (named if k == 'value' else None)) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self.redact(v, key, kind) for v in value]
+        if value is None or isinstance(value, bool):
+            return value
+        if kind == 'secret':
+            return REDACTED
+        if kind is not None:
+            return self.token(kind, value)
+        if key == 'session' and isinstance(value, str):
+            prefix, _, session_id = value.rpartition('/')
+            return f"{prefix}/{self.token('session', session_id)}" if prefix else self.token('session', session_id)
+        if isinstance(value, str):
+            if _EMAIL_KEY.search(key) or '@' in value:
+                return _EMAIL.sub(self.email, value)
+        return value
+
+
+class TrafficCapture:
+    """Samples webhook calls and writes redacted records from a background thread."""
+
+    def __init__(
+        self,
+        rate: float = RATE,
+        directory: str = CAPTURE_DIR,
+        file_bytes: int = FILE_BYTES,
+        max_files: int = MAX_FILES,
+        queue_size: int = QUEUE_SIZE,
+        redactor: Optional[Redactor] = None
+    ):
+        self.rate = max(0.0, min(1.0, rate))
+        self.directory = directory
+        self.file_bytes = file_bytes
+        self.max_files = max(1, max_files)
+        self.redactor = redactor or (Redactor() if self.rate > 0 else None)
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._threshold = int(self.rate * 0x100000000)
+        self._writer: Optional[threading.Thread] = None
+        self._writer_lock = threading.Lock()
+        self._file = None
+        self._file_size = 0
+        self._sequence = 0
+
+    @property
+    def active(self) -> bool:
+        return self.rate > 0
+
+    def select(self, body: Any) -> bool:
+        """Whether to capture this call (stable per session, so whole sessions are kept)."""
+        if not isinstance(body, dict):
+            return False
+        session = str((body.get('sessionInfo') or {}).get('session', ''))
+        return zlib.crc32(session.encode('utf-8')) < self._threshold
+
+    def submit(self, raw: bytes, latency_ns: int, stages: Dict[str, list]) -> None:
+        """Queue a captured call; never blocks."""
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait((raw, time.time(), latency_ns, stages))
+        except queue.Full:
+            metrics.capture_records.inc('dropped')
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Wait until queued records are written (for benchmarks and shutdown)."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return not self._queue.unfinished_tasks
+
+    def _ensure_writer(self) -> None:
+        if self._writer is not None:
+            return
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run, name='webhook-capture', daemon=True)
+                self._writer.start()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                self._write(self._record(*item))
+                metrics.capture_records.inc('written')
+            except Exception as e:
+                metrics.capture_records.inc('error')
+                logger.error(f"Could not capture request: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    def _record(self, raw: bytes, captured_at: float, latency_ns: int, stages: Dict[str, list]) -> str:
+        body = json.loads(raw)
+        record = {
+            'request': self.redactor.redact(body),
+            'captured_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(captured_at)),
+            'latency_ms': round(latency_ns / 1e6, 3),
+            'timings': {stage: round(total_ns / 1e6, 3) for stage, (total_ns, _calls) in stages.items()}
+        }
+        return json.dumps(record, separators=(',', ':')) + '\n'
+
+    def _write(self, line: str) -> None:
+        data = line.encode('utf-8')
+        if self._file is None or self._file_size + len(data) > self.file_bytes:
+            self._rotate()
+        self._file.write(data)
+        self._file.flush()
+        self._file_size += len(data)
+
+    def _rotate(self) -> None:
+        if self._file is not None:
+            self._file.close()
+        os.makedirs(self.directory, exist_ok=True)
+        self._sequence += 1
+        path = os.path.join(self.directory, f"capture-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{self._sequence}.jsonl")
+        self._file = open(path, 'ab')
+        self._file_size = 0
+        # Keep the newest max_files files
+        files = sorted(glob.glob(os.path.join(self.directory, 'capture-*.jsonl')), key=os.path.getmtime)
+        for old in files[:-self.max_files]:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+        logger.info(f"Capturing webhook traffic to {path}")
+
+
+_capture = TrafficCapture()
+
+
+def capture() -> TrafficCapture:
+    """The process-wide traffic capture."""
+    return _capture
+
+
+def configure(instance: TrafficCapture) -> None:
+    """Replace the process-wide capture (e.g. from a benchmark)."""
+    global _capture
+    _capture = instance
+
+
+def captured_request() -> Callable:
+    """Decorator for the webhook entry point that captures sampled calls."""
+    def decorator(fn: Callable) -> Callable:
+        @wraps(fn)
+        def wrapper(request, *args, **kwargs):
+            current = _capture
+            if not current.active:
+                return fn(request, *args, **kwargs)
+            # The parsed body is kept on the request, so the handler does not parse again
+            if not current.select(codec.request_json(request)):
+                return fn(request, *args, **kwargs)
+            raw = request.get_data()
+            owner = timing.begin_request()
+            start = time.perf_counter_ns()
+            try:
+                return fn(request, *args, **kwargs)
+            finally:
+                latency = time.perf_counter_ns() - start
+                stages = timing.end_request() if owner else timing.request_stages()
+                current.submit(raw, latency, stages)
+        return wrapper
+    return decorator
@@ -0,0 +1,128 @@
+"""
+Codec - JSON encoding and decoding for webhook requests and responses
+Parses request bodies once and encodes responses to compact UTF-8 bytes, with optional gzip.
+
+Uses orjson when it is installed and the standard library otherwise
+(WEBHOOK_JSON_BACKEND=json forces the fallback). Both produce compact JSON
+(no whitespace, non-ASCII kept as UTF-8); read-only fragments from utils.py
+(FrozenDict, tuples) encode like dicts and lists.
+
+Responses are returned to the framework as (bytes, 200, headers), so Flask
+does not encode them again. With RESPONSE_GZIP_MIN_BYTES set, bodies of at
+least that size are gzipped for callers that send Accept-Encoding: gzip.
+"""
+
+import os
+import json
+import logging
+from typing import Dict, Any, Tuple
+
+logger = logging.getLogger(__name__)
+
+BACKEND_SETTING = os.environ.get('WEBHOOK_JSON_BACKEND', 'auto').lower()
+GZIP_MIN_BYTES = int(os.environ.get('RESPONSE_GZIP_MIN_BYTES', '0'))
+GZIP_LEVEL = int(os.environ.get('RESPONSE_GZIP_LEVEL', '5'))
+
+CONTENT_TYPE = 'application/json'
+
+# Attribute the parsed body is kept under on the request object
+_PARSED_ATTR = '_webhook_json'
+_UNSET = object()
+
+
+def _json_dumps(value: Any) -> bytes:
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def _select_backend(setting: str):
+    """(name, loads, dumps) for the configured JSON library."""
+    if setting in ('auto', 'orjson'):
+        try:
+            import orjson
+        except ImportError:
+            if setting == 'orjson':
+                logger.warning("WEBHOOK_JSON_BACKEND=orjson but orjson is not installed; using json")
+        else:
+            options = orjson.OPT_NON_STR_KEYS
+            return 'orjson', orjson.loads, lambda value: orjson.dumps(value, option=options)
+    return 'json', json.loads, _json_dumps
+
+
+# loads(bytes or str) -> value; dumps(value) -> compact UTF-8 bytes
+BACKEND, loads, dumps = _select_backend(BACKEND_SETTING)
+
+
+def request_json(request) -> Any:
+    """
+    Parsed JSON body of a webhook request, decoded once per request.
+
+    Args:
+        request: Flask request (or any object with get_data())
+
+    Returns:
+        The decoded body, or None when it is empty or not valid JSON
+    """
+    parsed = getattr(request, _PARSED_ATTR, _UNSET)
+    if parsed is _UNSET:
+        try:
+            parsed = loads(request.get_data())
+        except ValueError:
+            parsed = None
+        try:
+            setattr(request, _PARSED_ATTR, parsed)
+        except AttributeError:
+            pass
+    return parsed
+
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    for item in accept_encoding.split(','):
+        coding, _, params = item.strip().partition(';')
+        if coding.strip().lower() in ('gzip', '*'):
+            quality = params.strip()
+            return not (quality.startswith('q=') and float(quality[2:] or 0) == 0)
+    return False
+
+
+def reply(body: bytes, request=None) -> Tuple[bytes, int, Dict[str, str]]:
+    """
+    Framework reply for an encoded JSON body.
+
+    Args:
+        body: Encoded response from dumps()
+        request: Incoming request, for its Accept-Encoding header
+
+    Returns:
+        (body, 200, headers), gzipped when the body is large enough and the caller accepts it
+    """
+    headers = {'Content-Type': CONTENT_TYPE}
+    if GZIP_MIN_BYTES and len(body) >= GZIP_MIN_BYTES and request is not None:
+        headers['Vary'] = 'Accept-Encoding'
+        try:
+            accepted = _accepts_gzip(request.headers.get('Accept-Encoding', ''))
+        except (AttributeError, ValueError):
+            accepted = False
+        if accepted:
+            # Imported here to keep it off the cold-start path when gzip is off
+            import gzip
+            body = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+            headers['Content-Encoding'] = 'gzip'
+    return body, 200, headers
+
+
+def reply_json(reply_value: Any) -> Any:
+    """
+    Decoded body of a webhook reply (benchmarks and scripts calling handle_webhook directly).
+
+    Accepts a (body, status, headers) tuple, bytes or an already decoded dict.
+    """
+    body, headers = reply_value, {}
+    if isinstance(reply_value, tuple):
+        body = reply_value[0]
+        headers = reply_value[2] if len(reply_value) > 2 else {}
+    if isinstance(body, (bytes, bytearray)):
+        if headers.get('Content-Encoding') == 'gzip':
+            import gzip
+            body = gzip.decompress(body)
+        return loads(body)
+    return body
@@ -0,0 +1,191 @@
+"""
+Concurrency Limit - Adaptive (AIMD) limits on concurrent library API calls
+Keeps each endpoint's calls in flight near what the backend can serve without queueing.
+
+Every endpoint label (see metrics.endpoint_label) has its own limit. Calls
+over the limit wait up to LIBRARY_API_LIMIT_QUEUE_MS for a slot and are
+rejected after that: LibraryService raises LibraryBusyError, which handlers
+answer with a "please try again" reply (and background refreshes count as
+failed, serving the stale value meanwhile).
+
+The limit is adjusted once per window of completed calls (at least
+MIN_WINDOW, and at least the limit, i.e. about one round trip of the calls
+in flight):
+
+    - a window with a connection failure, timeout, 429 or 5xx, or whose median
+      latency is over LIBRARY_API_LIMIT_TOLERANCE times the baseline, shrinks
+      the limit by LIBRARY_API_LIMIT_BACKOFF
+    - any other window in which at least half the limit was in use grows it by one
+
+Limits start low (LIBRARY_API_LIMIT_INITIAL) so the first windows measure
+the backend without our own queueing, and grow from there. The baseline is
+the no-load latency: it drops at once to a lower window median, and drifts
+slowly towards higher ones from windows that used less than half the limit
+(or ran at the minimum limit), so a backend that got slower for good, rather
+than queueing behind our own calls, is relearned.
+
+Off unless LIBRARY_API_LIMIT=true.
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Dict, List, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Completed calls per adjustment, at the least
+MIN_WINDOW = 10
+# Share of the distance to a higher window median the baseline moves per window
+BASELINE_DRIFT = 0.05
+
+
+class AimdLimit:
+    """Additive-increase, multiplicative-decrease concurrency limit of one endpoint."""
+
+    def __init__(
+        self,
+        name: str,
+        initial: float = 4,
+        min_limit: float = 1,
+        max_limit: float = 100,
+        backoff: float = 0.9,
+        tolerance: float = 1.5,
+        max_wait: float = 0.05
+    ):
+        """
+        Args:
+            name: Endpoint label (metrics and logs)
+            initial: Starting limit
+            min_limit: Smallest limit
+            max_limit: Largest limit
+            backoff: Factor applied to the limit on overload
+            tolerance: Window median latency over baseline that counts as overload
+            max_wait: Seconds a call over the limit waits for a slot (0 rejects at once)
+        """
+        self.name = name
+        self.min_limit = max(1.0, float(min_limit))
+        self.max_limit = max(self.min_limit, float(max_limit))
+        self.limit = min(self.max_limit, max(self.min_limit, float(initial)))
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.max_wait = max_wait
+        self.inflight = 0
+        self.baseline: Optional[float] = None
+        self._condition = threading.Condition()
+        self._latencies: List[float] = []
+        self._overloaded = False
+        self._completed = 0
+        self._peak = 0
+        metrics.backend_limits.set(int(self.limit), name)
+
+    def acquire(self) -> bool:
+        """
+        Take a slot, waiting up to max_wait for one.
+
+        Returns:
+            False if the call is rejected (no slot to release)
+        """
+        with self._condition:
+            deadline = None
+            while self.inflight >= int(self.limit):
+                if deadline is None:
+                    deadline = time.monotonic() + self.max_wait
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            self.inflight += 1
+            self._peak = max(self._peak, self.inflight)
+            return True
+
+    def release(self, seconds: float, overloaded: bool = False) -> None:
+        """
+        Give a slot back and record how the call went.
+
+        Args:
+            seconds: Time the call took (from taking the slot)
+            overloaded: The backend failed in a way that signals overload
+        """
+        with self._condition:
+            self.inflight -= 1
+            self._completed += 1
+            if overloaded:
+                self._overloaded = True
+            else:
+                self._latencies.append(seconds)
+            if self._completed >= max(MIN_WINDOW, int(self.limit)):
+                self._adjust()
+            self._condition.notify_all()
+
+    def _adjust(self) -> None:
+        """End the window: move the baseline and the limit (called holding the lock)."""
+        previous = int(self.limit)
+        overloaded = self._overloaded
+        if self._latencies:
+            self._latencies.sort()
+            median = self._latencies[len(self._latencies) // 2]
+            if self.baseline is None or median < self.baseline:
+                self.baseline = median
+            else:
+                overloaded = overloaded or median > self.baseline * self.tolerance
+                if self._peak * 2 < self.limit or self.limit <= self.min_limit:
+                    # Not queueing behind our own calls: latency this high is the backend's new normal
+                    self.baseline += (median - self.baseline) * BASELINE_DRIFT
+        if overloaded:
+            self.limit = max(self.min_limit, self.limit * self.backoff)
+        elif self._peak * 2 >= self.limit:
+            self.limit = min(self.max_limit, self.limit + 1)
+        self._latencies, self._overloaded, self._completed, self._peak = [], False, 0, self.inflight
+        if int(self.limit) != previous:
+            logger.debug(f"Concurrency limit of '{self.name}': {previous} -> {int(self.limit)}")
+            metrics.backend_limits.set(int(self.limit), self.name)
+
+
+class ConcurrencyLimits:
+    """AimdLimit per endpoint label, created on first use with shared settings."""
+
+    def __init__(self, **settings):
+        """
+        Args:
+            settings: AimdLimit keyword arguments applied to every endpoint
+        """
+        self.settings = settings
+        self._limits: Dict[str, AimdLimit] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> 'ConcurrencyLimits':
+        """Build the limits from LIBRARY_API_LIMIT_* settings."""
+        return cls(
+            initial=float(os.environ.get('LIBRARY_API_LIMIT_INITIAL', '4')),
+            min_limit=float(os.environ.get('LIBRARY_API_LIMIT_MIN', '1')),
+            max_limit=float(os.environ.get('LIBRARY_API_LIMIT_MAX', '100')),
+            backoff=float(os.environ.get('LIBRARY_API_LIMIT_BACKOFF', '0.9')),
+            tolerance=float(os.environ.get('LIBRARY_API_LIMIT_TOLERANCE', '1.5')),
+            max_wait=float(os.environ.get('LIBRARY_API_LIMIT_QUEUE_MS', '50')) / 1000.0
+        )
+
+    def get(self, label: str) -> AimdLimit:
+        """The limit of an endpoint label."""
+        limit = self._limits.get(label)
+        if limit is None:
+            with self._lock:
+                limit = self._limits.get(label)
+                if limit is None:
+                    limit = self._limits[label] = AimdLimit(label, **self.settings)
+        return limit
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Current limit, calls in flight and baseline latency (ms) per endpoint."""
+        return {
+            label: {
+                'limit': int(limit.limit),
+                'inflight': limit.inflight,
+                'baseline_ms': round(limit.baseline * 1000, 3) if limit.baseline is not None else None
+            }
+            for label, limit in list(self._limits.items())
+        }
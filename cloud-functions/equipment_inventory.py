@@ -0,0 +1,293 @@
+"""
+Equipment Inventory - Capacity timeline for lendable equipment
+Answers "how many are free" and "when is the next one free" locally, writing reservations through to the library API.
+"""
+
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SLOT_MINUTES = 60
+
+
+class _UsageTree:
+    """
+    Segment tree over time slots holding the number of units in use.
+
+    Supports range add, range max and first-index searches, each in
+    O(log n) for n slots.
+    """
+
+    def __init__(self, size: int):
+        """Create a tree over size slots, all at zero usage."""
+        self.size = max(1, size)
+        self.max = [0] * (4 * self.size)
+        self.min = [0] * (4 * self.size)
+        self.lazy = [0] * (4 * self.size)
+
+    def _push(self, node: int) -> None:
+        """Propagate a pending add to both children."""
+        pending = self.lazy[node]
+        if pending:
+            for child in (2 * node, 2 * node + 1):
+                self.max[child] += pending
+                self.min[child] += pending
+                self.lazy[child] += pending
+            self.lazy[node] = 0
+
+    def add(self, left: int, right: int, value: int, node: int = 1, lo: int = 0, hi: Optional[int] = None) -> None:
+        """Add value to every slot in [left, right)."""
+        hi = self.size if hi is None else hi
+        if right <= lo or hi <= left:
+            return
+        if left <= lo and hi <= right:
+            self.max[node] += value
+            self.min[node] += value
+            self.lazy[node] += value
+            return
+        self._push(node)
+        mid = (lo + hi) // 2
+        self.add(left, right, value, 2 * node, lo, mid)
+        self.add(left, right, value, 2 * node + 1, mid, hi)
+        self.max[node] = max(self.max[2 * node], self.max[2 * node + 1])
+        self.min[node] = min(self.min[2 * node], self.min[2 * node + 1])
+
+    def query_max(self, left: int, right: int, node: int = 1, lo: int = 0, hi: Optional[int] = None) -> int:
+        """Maximum usage over [left, right)."""
+        hi = self.size if hi is None else hi
+        if right <= lo or hi <= left:
+            return 0
+        if left <= lo and hi <= right:
+            return self.max[node]
+        self._push(node)
+        mid = (lo + hi) // 2
+        return max(
+            self.query_max(left, right, 2 * node, lo, mid),
+            self.query_max(left, right, 2 * node + 1, mid, hi)
+        )
+
+    def first_above(self, start: int, limit: int, node: int = 1, lo: int = 0, hi: Optional[int] = None) -> int:
+        """First slot at or after start with usage above limit, or -1."""
+        hi = self.size if hi is None else hi
+        if hi <= start or self.max[node] <= limit:
+            return -1
+        if hi - lo == 1:
+            return lo
+        self._push(node)
+        mid = (lo + hi) // 2
+        found = self.first_above(start, limit, 2 * node, lo, mid)
+        return found if found >= 0 else self.first_above(start, limit, 2 * node + 1, mid, hi)
+
+    def first_at_most(self, start: int, limit: int, node: int = 1, lo: int = 0, hi: Optional[int] = None) -> int:
+        """First slot at or after start with usage at or below limit, or -1."""
+        hi = self.size if hi is None else hi
+        if hi <= start or self.min[node] > limit:
+            return -1
+        if hi - lo == 1:
+            return lo
+        self._push(node)
+        mid = (lo + hi) // 2
+        found = self.first_at_most(start, limit, 2 * node, lo, mid)
+        return found if found >= 0 else self.first_at_most(start, limit, 2 * node + 1, mid, hi)
+
+
+class _Timeline:
+    """Capacity and usage tree for one equipment type."""
+
+    def __init__(self, capacity: int, origin: datetime, slots: int):
+        self.capacity = capacity
+        self.origin = origin
+        self.tree = _UsageTree(slots)
+        self.loaded_at = time.monotonic()
+
+    def slot(self, moment: datetime) -> int:
+        """Slot index of a moment, clamped to the horizon."""
+        index = int((moment - self.origin).total_seconds() // (SLOT_MINUTES * 60))
+        return min(max(index, 0), self.tree.size)
+
+    def span(self, start: datetime, minutes: int):
+        """Slot range [first, last) covering start .. start + minutes."""
+        end = start + timedelta(minutes=minutes)
+        last = -(-int((end - self.origin).total_seconds()) // (SLOT_MINUTES * 60))
+        return self.slot(start), min(max(last, 0), self.tree.size)
+
+    def moment(self, slot: int) -> datetime:
+        """Start time of a slot."""
+        return self.origin + timedelta(minutes=slot * SLOT_MINUTES)
+
+    def covers(self, start: datetime, minutes: int) -> bool:
+        """Whether start .. start + minutes lies within the modelled horizon."""
+        return self.origin <= start and start + timedelta(minutes=minutes) <= self.moment(self.tree.size)
+
+
+class EquipmentInventory:
+    """
+    Per-type equipment capacity with a usage timeline of existing reservations.
+
+    Timelines cover EQUIPMENT_HORIZON_DAYS from today in hourly slots and are
+    rebuilt from the library API once older than EQUIPMENT_INVENTORY_TTL
+    seconds; periods outside them (see covers()) must be checked with the API.
+    A schedule read that fails (a mock fallback) is not modelled or cached:
+    covers() is False for that type until a read succeeds. Reservations made through reserve() are written to the API first and
+    applied locally only when the API accepts them. Tree reads and writes hold
+    the inventory lock, since reads push pending updates down the tree.
+    """
+
+    def __init__(self, library_service, ttl: Optional[float] = None, horizon_days: Optional[int] = None):
+        """
+        Initialize the inventory.
+
+        Args:
+            library_service: LibraryService used for schedules and reservations
+            ttl: Seconds before a type's timeline is rebuilt
+            horizon_days: Days of schedule to model
+        """
+        self.library_service = library_service
+        self.ttl = ttl if ttl is not None else float(os.environ.get('EQUIPMENT_INVENTORY_TTL', '60'))
+        self.horizon_days = horizon_days or int(os.environ.get('EQUIPMENT_HORIZON_DAYS', '60'))
+        self._timelines: Dict[str, _Timeline] = {}
+        self._lock = threading.Lock()
+
+    def _load(self, equipment_type: str) -> Optional[_Timeline]:
+        """Get the timeline for a type, rebuilding it from the backend when stale (None if that failed)."""
+        key = equipment_type.lower()
+        timeline = self._timelines.get(key)
+        if timeline and time.monotonic() - timeline.loaded_at < self.ttl:
+            metrics.cache_hit('equipment_schedule')
+            return timeline
+        metrics.cache_miss('equipment_schedule')
+
+        schedule, cacheable = self.library_service.get_equipment_schedule(equipment_type)
+        if not cacheable:
+            logger.warning(f"Equipment schedule for '{equipment_type}' unavailable; not modelling it")
+            return None
+        origin = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        timeline = _Timeline(
+            int(schedule.get('capacity', 0)),
+            origin,
+            self.horizon_days * 24 * 60 // SLOT_MINUTES
+        )
+        for reservation in schedule.get('reservations', []):
+            try:
+                start = datetime.fromisoformat(reservation['start'])
+                end = datetime.fromisoformat(reservation['end'])
+            except (KeyError, TypeError, ValueError):
+                continue
+            first, last = timeline.span(start, int((end - start).total_seconds() // 60))
+            timeline.tree.add(first, last, int(reservation.get('quantity', 1)))
+
+        with self._lock:
+            self._timelines[key] = timeline
+        return timeline
+
+    def capacity(self, equipment_type: str) -> int:
+        """Total units of a type (0 if the type is not lent, or its schedule could not be read)."""
+        timeline = self._load(equipment_type)
+        return timeline.capacity if timeline is not None else 0
+
+    def covers(self, equipment_type: str, start: datetime, minutes: int) -> bool:
+        """Whether a period lies within the type's timeline (today to the horizon)."""
+        timeline = self._load(equipment_type)
+        return timeline is not None and timeline.covers(start, minutes)
+
+    def units_free(self, equipment_type: str, start: datetime, minutes: int) -> int:
+        """Units of a type free for the whole of start .. start + minutes."""
+        timeline = self._load(equipment_type)
+        if timeline is None or not timeline.covers(start, minutes):
+            return 0
+        first, last = timeline.span(start, minutes)
+        if first >= last:
+            return 0
+        with self._lock:
+            return max(0, timeline.capacity - timeline.tree.query_max(first, last))
+
+    def is_available(self, equipment_type: str, start: datetime, minutes: int, quantity: int = 1) -> bool:
+        """Whether quantity units are free for the whole period."""
+        return self.units_free(equipment_type, start, minutes) >= quantity
+
+    def earliest_available(
+        self,
+        equipment_type: str,
+        after: datetime,
+        minutes: int,
+        quantity: int = 1
+    ) -> Optional[datetime]:
+        """
+        Find the earliest start at or after a time with quantity units free for the duration.
+
+        Each probe is a pair of O(log n) tree descents; the search jumps
+        straight from a blocked slot to the next slot with enough free
+        units, so it visits at most one probe per busy stretch.
+
+        Args:
+            equipment_type: Equipment type
+            after: Earliest acceptable start (moved up to now if it has passed)
+            minutes: Duration in minutes
+            quantity: Units needed
+
+        Returns:
+            Start time, or None if nothing is free within the horizon
+        """
+        timeline = self._load(equipment_type)
+        if timeline is None:
+            return None
+        limit = timeline.capacity - quantity
+        if limit < 0:
+            return None
+        start = max(after, datetime.now())
+
+        with self._lock:
+            while timeline.covers(start, minutes):
+                # The same slot range a reservation from start blocks (a start
+                # inside a slot can reach into one more at the end)
+                first, last = timeline.span(start, minutes)
+                last = max(last, first + 1)
+                blocked = timeline.tree.first_above(first, limit)
+                if blocked < 0 or blocked >= last:
+                    return start
+                candidate = timeline.tree.first_at_most(blocked, limit)
+                if candidate < 0:
+                    return None
+                start = timeline.moment(candidate)
+        return None
+
+    def reserve(
+        self,
+        user_id: str,
+        equipment_type: str,
+        date: str,
+        duration: str,
+        start: datetime,
+        minutes: int,
+        quantity: int = 1
+    ) -> Dict[str, Any]:
+        """
+        Reserve equipment through the library API and record it locally on success.
+
+        Args:
+            user_id: User ID
+            equipment_type: Equipment type
+            date: Date as sent to the API
+            duration: Duration as sent to the API
+            start: Parsed start time
+            minutes: Parsed duration in minutes
+            quantity: Units reserved
+
+        Returns:
+            Library API reservation result
+        """
+        result = self.library_service.reserve_equipment(user_id, equipment_type, date, duration)
+        if result.get('success'):
+            timeline = self._load(equipment_type)
+            if timeline is not None:
+                first, last = timeline.span(start, minutes)
+                with self._lock:
+                    timeline.tree.add(first, last, quantity)
+        return result
@@ -0,0 +1,198 @@
+"""
+FAQ Index - Local ranked retrieval over the library FAQ corpus
+Stands in for the Knowledge Connector with BM25 scoring over precomputed document vectors.
+"""
+
+import os
+import re
+import json
+import math
+import time
+import logging
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'faq.json')
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a about also am an and any are as at be bring can could do does for from get go got have how i
+if in is it just know like many me more much my need of on or our please should so some take
+tell that the there this to us use want was what when where which who why will with would you
+your
+""".split())
+
+
+class _PartialRanking(Exception):
+    """A search cut short by the latency budget; raised so the LRU cache does not keep it."""
+
+    def __init__(self, match: Optional[Dict[str, Any]]):
+        super().__init__('FAQ search exceeded its latency budget')
+        self.match = match
+
+
+def _stem(token: str) -> str:
+    """Strip common English suffixes so 'renewing', 'renewals' and 'renew' match (and 'close' and 'closed')."""
+    for suffix in ('ings', 'ing', 'als', 'al', 'ies', 'ed', 'es', 's', 'e'):
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            return token[:-len(suffix)] + ('y' if suffix == 'ies' else '')
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase, split, drop stopwords and stem."""
+    return [_stem(t) for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+
+class FaqIndex:
+    """
+    BM25 index over FAQ entries.
+
+    Document vectors (the BM25 weight of every term in every entry) are
+    computed once at startup and stored as postings lists, so answering a
+    query is a sparse dot product over the query's terms only.
+    """
+
+    def __init__(
+        self,
+        entries: List[Dict[str, Any]],
+        k1: float = 1.2,
+        b: float = 0.75,
+        cache_size: int = 1024
+    ):
+        """
+        Build the index.
+
+        Args:
+            entries: FAQ entries with 'id', 'question' and 'answer'
+            k1: BM25 term frequency saturation
+            b: BM25 length normalization
+            cache_size: Number of answered queries kept in the LRU cache
+        """
+        self.entries = entries
+        self.budget_ms = float(os.environ.get('FAQ_LATENCY_BUDGET_MS', '5'))
+
+        documents = [tokenize(f"{e.get('question', '')} {e.get('answer', '')}") for e in entries]
+        doc_count = len(documents)
+        avg_length = sum(len(d) for d in documents) / doc_count if doc_count else 0.0
+
+        doc_freq = {}
+        for tokens in documents:
+            for term in set(tokens):
+                doc_freq[term] = doc_freq.get(term, 0) + 1
+
+        self.idf = {
+            term: math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+            for term, df in doc_freq.items()
+        }
+        self.max_idf = max(self.idf.values(), default=0.0)
+
+        # Postings: term -> [(doc index, precomputed BM25 weight)]
+        self.postings = {}
+        for index, tokens in enumerate(documents):
+            norm = k1 * (1 - b + b * len(tokens) / avg_length) if avg_length else k1
+            counts = {}
+            for term in tokens:
+                counts[term] = counts.get(term, 0) + 1
+            for term, tf in counts.items():
+                weight = self.idf[term] * tf * (k1 + 1) / (tf + norm)
+                self.postings.setdefault(term, []).append((index, weight))
+
+        self._cached_search = lru_cache(maxsize=cache_size)(self._search)
+
+    @classmethod
+    def from_file(cls, path: Optional[str] = None) -> 'FaqIndex':
+        """
+        Load the FAQ corpus from disk and build the index.
+
+        Args:
+            path: Corpus path (defaults to FAQ_CORPUS_PATH or the bundled corpus)
+
+        Returns:
+            FaqIndex (empty if the corpus is missing or unreadable)
+        """
+        path = path or os.environ.get('FAQ_CORPUS_PATH', DEFAULT_CORPUS_PATH)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return cls(json.load(f))
+        except (OSError, ValueError) as e:
+            logger.warning(f"FAQ corpus unavailable at {path}: {str(e)}")
+            return cls([])
+
+    def search(self, query: str) -> Optional[Dict[str, Any]]:
+        """
+        Find the best FAQ entry for a query.
+
+        Args:
+            query: Free-text user question
+
+        Returns:
+            Dictionary with 'id', 'question', 'answer', 'score' and 'confidence',
+            or None if nothing matches
+        """
+        terms = tuple(sorted(set(tokenize(query))))
+        if not terms:
+            return None
+        try:
+            match = self._cached_search(terms)
+        except _PartialRanking as partial:
+            # Not cached, so the next identical query gets a full ranking
+            match = partial.match
+        return dict(match) if match else None
+
+    def _search(self, terms: tuple) -> Optional[Dict[str, Any]]:
+        """
+        Score all entries for a normalized term tuple (cached by search).
+
+        Raises:
+            _PartialRanking: The latency budget ran out before every term was scored
+        """
+        match, complete = self._rank(terms)
+        if not complete:
+            raise _PartialRanking(match)
+        return match
+
+    def _rank(self, terms: tuple) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """Best entry for a term tuple, and whether every term was scored within the budget."""
+        complete = True
+        deadline = time.perf_counter() + self.budget_ms / 1000.0
+        scores = [0.0] * len(self.entries)
+        coverage = [0.0] * len(self.entries)
+
+        # Most informative terms first, so a blown budget still ranks on the best evidence
+        ordered = sorted(terms, key=lambda t: -self.idf.get(t, 0.0))
+        for position, term in enumerate(ordered, 1):
+            idf = self.idf.get(term, 0.0)
+            for index, weight in self.postings.get(term, ()):
+                scores[index] += weight
+                coverage[index] += idf
+            if position < len(ordered) and time.perf_counter() > deadline:
+                logger.warning(f"FAQ search exceeded {self.budget_ms}ms budget, returning partial ranking")
+                complete = False
+                break
+
+        if not scores:
+            return None, complete
+        best = max(range(len(scores)), key=scores.__getitem__)
+        if scores[best] <= 0:
+            return None, complete
+
+        # Confidence is the share of the query's information the entry covers;
+        # an unknown term weighs as much as the rarest known one, so off-topic
+        # words count against it without swamping an otherwise clear match
+        total = sum(self.idf.get(term, self.max_idf) for term in terms)
+        entry = self.entries[best]
+        return {
+            'id': entry.get('id'),
+            'question': entry.get('question'),
+            'answer': entry.get('answer'),
+            'score': round(scores[best], 4),
+            'confidence': round(coverage[best] / total, 4) if total else 0.0
+        }, complete
+
+    def cache_info(self):
+        """Expose LRU cache statistics."""
+        return self._cached_search.cache_info()
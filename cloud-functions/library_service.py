@@ -4,13 +4,96 @@ Handles all interactions with the library backend system.
 """
 
 import os
-import requests
+import json
+import time
 import logging
-from typing import Dict, Any, List, Optional
-from datetime import datetime, timedelta
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Any, Callable, List, Optional, Tuple, TYPE_CHECKING
+import timing
+import metrics
+import tracing
+from api_cache import TieredCache, cache_key, parse_ttls
+from concurrency_limit import ConcurrencyLimits
+
+if TYPE_CHECKING:
+    import requests
 
 logger = logging.getLogger(__name__)
 
+# Catalog reads cached with LIBRARY_CACHE=true: seconds per endpoint label
+# (see metrics.endpoint_label). Per-user endpoints are never cached.
+CACHE_TTLS = {
+    'books/search': 60,
+    'books/{id}': 300,
+    'events/upcoming': 300,
+    'rooms/available': 30,
+    'circulation/history': 3600
+}
+
+# Stale-while-revalidate: seconds past its TTL a value may still be served
+# while one background refresh per key replaces it
+STALE_TTLS = {
+    'events/upcoming': 3600,
+    'rooms/available': 120
+}
+
+# Threads running background refreshes
+REFRESH_WORKERS = 2
+
+# Searches per branch that may still be running (past their deadline, at
+# worst) before the branch is skipped, and the bytes read between deadline checks
+BRANCH_MAX_IN_FLIGHT = 4
+BRANCH_CHUNK_SIZE = 16384
+
+
+def catalog_books(value: Any) -> List[Dict[str, Any]]:
+    """Book records of a cached catalog value ({'books': [...]}, {'book': {...}} or a federated result list)."""
+    if isinstance(value, dict):
+        books = value.get('books') or ([value['book']] if value.get('book') else [])
+    else:
+        books = value or []
+    return [book for book in books if isinstance(book, dict) and book.get('id') is not None]
+
+
+def cache_tags(key: str, value: Any) -> List[str]:
+    """Cache tags of a catalog value: 'book:<id>' for every book it contains, 'rooms' for room listings."""
+    tags = [f"book:{book['id']}" for book in catalog_books(value)]
+    if key.startswith('rooms/'):
+        tags.append('rooms')
+    return tags
+
+
+def _requests():
+    """The requests module, imported on first use (mock-data instances never load it)."""
+    import requests
+    return requests
+
+
+class LibraryApiError(Exception):
+    """The library API could not serve a call that has no safe fallback (a write, or a login)."""
+
+
+class LibraryBusyError(LibraryApiError):
+    """A call was turned away by its endpoint's concurrency limit."""
+
+
+def _overloaded(error: Exception) -> bool:
+    """Whether a failed call signals an overloaded backend (no response, 429 or 5xx) rather than a bad request."""
+    response = getattr(error, 'response', None)
+    return response is None or response.status_code == 429 or response.status_code >= 500
+
+
+def _create_session(pool_size: int) -> 'requests.Session':
+    """Create an HTTP session with its own connection pool."""
+    from requests.adapters import HTTPAdapter
+    session = _requests().Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
 
 class LibraryService:
     """Service class for library system integration."""
@@ -20,14 +103,177 @@ class LibraryService:
         self.base_url = os.environ.get('LIBRARY_API_URL', 'https://api.library.example.com')
         self.api_key = os.environ.get('LIBRARY_API_KEY', '')
         self.timeout = 10
+        self.pool_size = int(os.environ.get('LIBRARY_API_POOL_SIZE', '10'))
+        self._session = None
+        self._session_lock = threading.Lock()
         
         # For development/demo: use mock data if API not configured
         self.use_mock = os.environ.get('USE_MOCK_DATA', 'false').lower() == 'true'
+        self._mock_backend = None
+        
+        # Consortium branches with their own catalog APIs (see _load_branches)
+        self.branch_deadline = float(os.environ.get('LIBRARY_BRANCH_DEADLINE', '3'))
+        self.branches = self._load_branches()
+        self._branch_executor = None
+        self._branch_calls: Dict[str, int] = {}
+        self._branch_lock = threading.Lock()
+        
+        # Catalog read cache: in-process, optionally over a tier shared by all instances (see api_cache.py)
+        self.cache = TieredCache.from_env() if os.environ.get('LIBRARY_CACHE', 'false').lower() == 'true' else None
+        if self.cache is not None:
+            self.cache.tagger = cache_tags
+        self.cache_ttls = {**CACHE_TTLS, **parse_ttls(os.environ.get('LIBRARY_CACHE_TTLS', ''), CACHE_TTLS, 'LIBRARY_CACHE_TTLS')}
+        self.stale_ttls = {**STALE_TTLS, **parse_ttls(os.environ.get('LIBRARY_CACHE_STALE', ''), CACHE_TTLS, 'LIBRARY_CACHE_STALE')}
+        self._refresh_executor = None
+        self._refreshing = set()
+        self._refresh_lock = threading.Lock()
+        
+        # Adaptive per-endpoint concurrency limits on library API calls (see concurrency_limit.py)
+        self.limits = ConcurrencyLimits.from_env() if os.environ.get('LIBRARY_API_LIMIT', 'false').lower() == 'true' else None
+    
+    @property
+    def session(self) -> 'requests.Session':
+        """HTTP session for the library API, created on first use."""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    self._session = _create_session(self.pool_size)
+        return self._session
+    
+    def _branch_session(self, branch: Dict[str, Any]) -> 'requests.Session':
+        """HTTP session for a consortium branch, created on first use."""
+        if branch['session'] is None:
+            with self._session_lock:
+                if branch['session'] is None:
+                    branch['session'] = _create_session(self.pool_size)
+        return branch['session']
+    
+    def warm_up(self) -> Dict[str, Any]:
+        """
+        Prepare for the first real turn: build the mock backend, or create the
+        connection pools and open one connection to each API.
+        
+        Returns:
+            Per-target status ('ok', 'mock' or an error message)
+        """
+        if self.use_mock:
+            self._get_mock_response('books/search', 'GET', {})
+            return {'library_api': 'mock'}
+        targets = {'library_api': (self.base_url, self.session)}
+        for name, branch in self.branches.items():
+            targets[name] = (branch['url'], self._branch_session(branch))
+        status = {}
+        for name, (url, session) in targets.items():
+            try:
+                # Any HTTP status will do: the point is a pooled, TLS-established connection
+                session.head(url, timeout=self.timeout)
+                status[name] = 'ok'
+            except _requests().RequestException as e:
+                status[name] = str(e)
+        return status
+    
+    def _load_branches(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Load per-branch catalog API configuration.
+        
+        LIBRARY_BRANCHES is a JSON object keyed by branch name (matching the
+        LibraryLocation entity), e.g.
+        {"Main Library": {"url": "https://main.example.com", "api_key": "...", "deadline": 2.5}}.
+        Missing api_key and deadline fall back to LIBRARY_API_KEY and
+        LIBRARY_BRANCH_DEADLINE. Each branch gets a dedicated connection pool.
+        
+        Returns:
+            Branch configuration keyed by branch name (empty when not federated)
+        """
+        raw = os.environ.get('LIBRARY_BRANCHES', '')
+        if not raw:
+            return {}
+        try:
+            config = json.loads(raw)
+        except ValueError as e:
+            logger.error(f"Invalid LIBRARY_BRANCHES configuration: {str(e)}")
+            return {}
+        
+        branches = {}
+        for name, settings in config.items():
+            if not isinstance(settings, dict) or not settings.get('url'):
+                logger.error(f"Ignoring branch '{name}': missing url")
+                continue
+            branches[name] = {
+                'url': settings['url'].rstrip('/'),
+                'api_key': settings.get('api_key', self.api_key),
+                'deadline': float(settings.get('deadline', self.branch_deadline)),
+                'session': None
+            }
+        return branches
+    
+    def _send(
+        self,
+        base_url: str,
+        api_key: str,
+        session: 'requests.Session',
+        endpoint: str,
+        method: str = 'GET',
+        data: Dict = None,
+        timeout: float = None,
+        deadline: float = None
+    ) -> Dict[str, Any]:
+        """
+        Send one HTTP request to a library API and decode the JSON body.
+        
+        requests' timeout bounds each socket read rather than the call, so a
+        GET with a deadline (a time.monotonic() value) streams the body and
+        gives up once the deadline passes between chunks.
+        """
+        url = f"{base_url}/{endpoint}"
+        headers = tracing.inject_headers({
+            'Authorization': f'Bearer {api_key}',
+            'Content-Type': 'application/json'
+        })
+        timeout = timeout or self.timeout
+        
+        if method == 'GET' and deadline is not None:
+            timeout = min(timeout, deadline - time.monotonic())
+            if timeout <= 0:
+                raise _requests().Timeout(f"GET {endpoint} deadline passed before it was sent")
+            response = session.get(url, headers=headers, params=data, timeout=timeout, stream=True)
+            try:
+                response.raise_for_status()
+                # read1 returns what one socket read brings (urllib3 2.x), so a
+                # trickling body is checked often; iter_content fills whole chunks
+                read1 = getattr(response.raw, 'read1', None)
+                if read1 is not None:
+                    chunks = iter(lambda: read1(BRANCH_CHUNK_SIZE, decode_content=True), b'')
+                else:
+                    chunks = response.iter_content(BRANCH_CHUNK_SIZE)
+                body = []
+                for chunk in chunks:
+                    body.append(chunk)
+                    if time.monotonic() > deadline:
+                        raise _requests().Timeout(f"GET {endpoint} missed its deadline while reading the body")
+            finally:
+                response.close()
+            return json.loads(b''.join(body))
+        elif method == 'GET':
+            response = session.get(url, headers=headers, params=data, timeout=timeout)
+        elif method == 'POST':
+            response = session.post(url, headers=headers, json=data, timeout=timeout)
+        elif method == 'PUT':
+            response = session.put(url, headers=headers, json=data, timeout=timeout)
+        else:
+            response = session.delete(url, headers=headers, timeout=timeout)
+        
+        response.raise_for_status()
+        return response.json()
     
     def _make_request(self, endpoint: str, method: str = 'GET', data: Dict = None) -> Dict[str, Any]:
         """
         Make HTTP request to library API.
         
+        GET requests to endpoints in CACHE_TTLS are served from the cache
+        when it is enabled (cached values are read-only), those in
+        STALE_TTLS stale-while-revalidate.
+        
         Args:
             endpoint: API endpoint
             method: HTTP method
@@ -36,33 +282,244 @@ class LibraryService:
         Returns:
             Response dictionary
         """
-        if self.use_mock:
-            return self._get_mock_response(endpoint, method, data)
+        if self.cache is not None and method == 'GET':
+            label = metrics.endpoint_label(endpoint)
+            ttl = self.cache_ttls.get(label, 0)
+            if ttl > 0:
+                fetch = lambda: self._call_api(endpoint, method, data)
+                if self.stale_ttls.get(label, 0) > 0:
+                    return self._revalidated(label, cache_key(endpoint, data), ttl, self.stale_ttls[label], fetch)
+                return self._cached(cache_key(endpoint, data), ttl, fetch)
+        return self._call_api(endpoint, method, data)[0]
+    
+    def _cached(self, key: str, ttl: float, fetch: Callable[[], Tuple[Any, bool]]) -> Any:
+        """Serve a read from the cache, or fetch it and store it if the fetch says it may be cached."""
+        value = self.cache.get(key)
+        if value is not None:
+            return value
+        value, cacheable = fetch()
+        return self.cache.set(key, value, ttl) if cacheable else value
+    
+    def _revalidated(self, label: str, key: str, ttl: float, max_stale: float, fetch: Callable[[], Tuple[Any, bool]]) -> Any:
+        """
+        Serve a read stale-while-revalidate.
+        
+        Values are kept for ttl + max_stale seconds. Past ttl they are still
+        served, and the first such read starts a background refresh; only a
+        miss (first load, or nothing refreshed within max_stale) waits for the
+        backend.
         
+        Cloud Functions throttles an instance's CPU once it has sent its
+        response, so the refresh only makes progress while a request is
+        being served. It is started as soon as the stale read happens, early
+        in the turn, so it overlaps the rest of that request without holding
+        up its reply; one still running afterwards completes during the next
+        request.
+        """
+        entry = self.cache.get_entry(key)
+        if entry is not None:
+            value, stored_at = entry
+            if time.time() - stored_at >= ttl:
+                self._refresh(label, key, ttl + max_stale, fetch)
+            return value
+        value, cacheable = fetch()
+        return self.cache.set(key, value, ttl + max_stale) if cacheable else value
+    
+    def _refresh(self, label: str, key: str, lifetime: float, fetch: Callable[[], Tuple[Any, bool]]) -> None:
+        """Start a background refresh of a key unless one is already running."""
+        with self._refresh_lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            if self._refresh_executor is None:
+                self._refresh_executor = ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix='cache-refresh')
+        self._refresh_executor.submit(self._run_refresh, label, key, lifetime, fetch)
+    
+    def _run_refresh(self, label: str, key: str, lifetime: float, fetch: Callable[[], Tuple[Any, bool]]) -> None:
+        outcome = 'error'
         try:
-            url = f"{self.base_url}/{endpoint}"
-            headers = {
-                'Authorization': f'Bearer {self.api_key}',
-                'Content-Type': 'application/json'
-            }
-            
-            if method == 'GET':
-                response = requests.get(url, headers=headers, params=data, timeout=self.timeout)
-            elif method == 'POST':
-                response = requests.post(url, headers=headers, json=data, timeout=self.timeout)
-            elif method == 'PUT':
-                response = requests.put(url, headers=headers, json=data, timeout=self.timeout)
+            value, cacheable = fetch()
+            if cacheable:
+                self.cache.set(key, value, lifetime)
+                outcome = 'ok'
             else:
-                response = requests.delete(url, headers=headers, timeout=self.timeout)
+                # A mock fallback: keep serving the stale value until it runs out
+                logger.warning(f"Background refresh of '{key}' failed; serving the cached value until it expires")
+        except Exception as e:
+            logger.error(f"Background refresh of '{key}' failed: {str(e)}")
+        finally:
+            metrics.cache_refreshes.inc(label, outcome)
+            with self._refresh_lock:
+                self._refreshing.discard(key)
+    
+    @timing.timed('backend')
+    @tracing.traced(kind='CLIENT')
+    def _call_api(self, endpoint: str, method: str = 'GET', data: Dict = None) -> Tuple[Dict[str, Any], bool]:
+        """
+        Call the library API (or the mock backend), falling back to mock data when a read fails.
+        
+        Writes (including logins) that fail raise instead: mock data would
+        report a hold, payment or login that never happened. With
+        LIBRARY_API_LIMIT=true, calls over the endpoint's concurrency limit
+        wait briefly for a slot and raise if none frees up.
+        
+        Returns:
+            (response, True unless it is a fallback that must not be cached)
             
-            response.raise_for_status()
-            return response.json()
+        Raises:
+            LibraryBusyError: The call was rejected by the concurrency limit
+            LibraryApiError: A write failed
+        """
+        start = time.perf_counter()
+        tracing.set_attributes({'http.method': method, 'library.endpoint': metrics.endpoint_label(endpoint)})
+        if self.use_mock:
+            response = self._get_mock_response(endpoint, method, data)
+            metrics.observe_backend(endpoint, method, 'mock', time.perf_counter() - start)
+            return response, True
+        
+        label = metrics.endpoint_label(endpoint)
+        limit = self.limits.get(label) if self.limits is not None else None
+        if limit is not None and not limit.acquire():
+            logger.warning(f"Library API call to '{label}' rejected by its concurrency limit ({int(limit.limit)})")
+            metrics.backend_rejections.inc(label)
+            tracing.set_attributes({'library.rejected': True})
+            raise LibraryBusyError(f"The library system is busy ({method} {label})")
+        
+        sent, overloaded = time.perf_counter(), False
+        try:
+            response = self._send(self.base_url, self.api_key, self.session, endpoint, method, data)
+            metrics.observe_backend(endpoint, method, 'ok', time.perf_counter() - start)
+            return response, True
             
-        except requests.exceptions.RequestException as e:
+        except _requests().RequestException as e:
+            overloaded = _overloaded(e)
             logger.error(f"API request failed: {str(e)}")
+            metrics.observe_backend(endpoint, method, 'error', time.perf_counter() - start)
+            if method != 'GET':
+                tracing.set_attributes({'error.message': str(e)})
+                raise LibraryApiError(f"{method} {label} failed: {str(e)}") from e
+            metrics.backend_fallbacks.inc(label)
+            tracing.set_attributes({'library.fallback': 'mock', 'error.message': str(e)})
             # Fallback to mock data on error
-            return self._get_mock_response(endpoint, method, data)
+            return self._get_mock_response(endpoint, method, data), False
+        
+        finally:
+            if limit is not None:
+                limit.release(time.perf_counter() - sent, overloaded)
+    
+    @tracing.traced(kind='CLIENT')
+    def _search_branch(self, name: str, params: Dict[str, Any], deadline: float) -> List[Dict[str, Any]]:
+        """Search one branch catalog by a time.monotonic() deadline (errors propagate to the caller)."""
+        try:
+            tracing.set_attributes({'library.branch': name})
+            if self.use_mock:
+                return self._get_mock_response('books/search', 'GET', params).get('books', [])
+            branch = self.branches[name]
+            response = self._send(
+                branch['url'], branch['api_key'], self._branch_session(branch),
+                'books/search', 'GET', params, timeout=branch['deadline'], deadline=deadline
+            )
+            return response.get('books', [])
+        finally:
+            with self._branch_lock:
+                self._branch_calls[name] -= 1
+    
+    def _federated_search(self, params: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Search every branch concurrently and merge the results.
+        
+        Each branch has its own deadline; a search that misses it is
+        cancelled (or, once sent, its result dropped) and counted as a
+        timeout, so total latency is bounded by the slowest branch still
+        being waited for rather than the sum of all branches. A search
+        already sent stops reading at its deadline too (see _send), and a
+        branch with BRANCH_MAX_IN_FLIGHT searches still running is skipped
+        and counted as busy, so a stalled branch cannot take over the pool. When no branch
+        answers, the single library API search endpoint is asked instead,
+        so an outage reads as one rather than as "no books found".
+        
+        Args:
+            params: Search parameters
+            
+        Returns:
+            (books deduplicated by ISBN, each annotated with per-branch
+            availability; True if every branch answered)
+        """
+        if self._branch_executor is None:
+            self._branch_executor = ThreadPoolExecutor(
+                max_workers=len(self.branches) * BRANCH_MAX_IN_FLIGHT,
+                thread_name_prefix='branch-search'
+            )
+        
+        start = time.monotonic()
+        pending, deadlines = {}, {}
+        for name, branch in self.branches.items():
+            with self._branch_lock:
+                running = self._branch_calls.get(name, 0)
+                if running < BRANCH_MAX_IN_FLIGHT:
+                    self._branch_calls[name] = running + 1
+            if running >= BRANCH_MAX_IN_FLIGHT:
+                logger.warning(f"Branch '{name}' still has {running} searches running; skipping it")
+                metrics.branch_searches.inc(name, 'busy')
+                continue
+            deadline = start + branch['deadline']
+            future = self._branch_executor.submit(
+                contextvars.copy_context().run, self._search_branch, name, params, deadline)
+            pending[future], deadlines[future] = name, deadline
+        results = {}
+        
+        while pending:
+            now = time.monotonic()
+            for future in [f for f in pending if deadlines[f] <= now]:
+                name = pending.pop(future)
+                if future.cancel():
+                    # Never started, so _search_branch will not release its slot
+                    with self._branch_lock:
+                        self._branch_calls[name] -= 1
+                logger.warning(f"Branch '{name}' missed its search deadline")
+                metrics.branch_searches.inc(name, 'timeout')
+            if not pending:
+                break
+            done, _ = wait(
+                list(pending),
+                timeout=min(deadlines[f] for f in pending) - now,
+                return_when=FIRST_COMPLETED
+            )
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    results[name] = future.result()
+                    metrics.branch_searches.inc(name, 'ok')
+                except Exception as e:
+                    logger.error(f"Branch '{name}' search failed: {str(e)}")
+                    metrics.branch_searches.inc(name, 'error')
+        
+        if not results:
+            logger.error("No branch answered the search; asking the library API search endpoint instead")
+            tracing.set_attributes({'library.fallback': 'books/search'})
+            response, _ = self._call_api('books/search', 'GET', params)
+            return response.get('books', []), False
+        
+        # Merge in configured branch order so the output is deterministic
+        merged = {}
+        for name in self.branches:
+            for book in results.get(name, []):
+                key = book.get('isbn') or f"{book.get('title', '')}|{book.get('author', '')}".lower()
+                entry = merged.get(key)
+                if entry is None:
+                    entry = merged[key] = {**book, 'branch_availability': {}}
+                entry['branch_availability'][name] = book.get('availability', 'Unknown')
+        
+        for book in merged.values():
+            statuses = book['branch_availability']
+            available_at = [name for name, status in statuses.items() if status == 'Available']
+            book['available_at'] = available_at
+            if available_at:
+                book['availability'] = 'Available'
+        
+        return list(merged.values()), len(results) == len(self.branches)
     
+    @tracing.traced()
     def search_books(
         self,
         title: str = '',
@@ -82,7 +539,8 @@ class LibraryService:
             subject: Subject
             
         Returns:
-            List of book dictionaries
+            List of book dictionaries (merged across branches when
+            LIBRARY_BRANCHES is configured)
         """
         params = {}
         if title:
@@ -96,29 +554,23 @@ class LibraryService:
         if subject:
             params['subject'] = subject
         
+        if self.branches:
+            ttl = self.cache_ttls['books/search'] if self.cache is not None else 0
+            if ttl > 0:
+                # Partial results (a branch missed its deadline or failed) are not cached
+                return self._cached(cache_key('federated/books/search', params), ttl, lambda: self._federated_search(params))
+            return self._federated_search(params)[0]
+        
         response = self._make_request('books/search', 'GET', params)
         return response.get('books', [])
     
+    @tracing.traced()
     def get_book_details(self, book_id: str) -> Dict[str, Any]:
         """Get detailed information about a book."""
         response = self._make_request(f'books/{book_id}', 'GET')
         return response.get('book', {})
-
-    # Helper to get shared mock data
-    def _get_mock_books(self):
-        return [
-            {'id': '1', 'title': 'The Great Gatsby', 'author': 'F. Scott Fitzgerald', 'isbn': '9780743273565', 'genre': 'Fiction', 'availability': 'Available', 'cover_image': 'https://example.com/gatsby.jpg'},
-            {'id': '2', 'title': 'To Kill a Mockingbird', 'author': 'Harper Lee', 'isbn': '9780061120084', 'genre': 'Fiction', 'availability': 'Available', 'cover_image': 'https://example.com/mockingbird.jpg'},
-            {'id': '3', 'title': 'Harry Potter and the Sorcerer\'s Stone', 'author': 'J.K. Rowling', 'isbn': '9780590353427', 'genre': 'Fantasy', 'availability': 'Checked Out', 'cover_image': 'https://example.com/hp1.jpg'},
-            {'id': '4', 'title': 'Harry Potter and the Chamber of Secrets', 'author': 'J.K. Rowling', 'isbn': '9780439064873', 'genre': 'Fantasy', 'availability': 'Available', 'cover_image': 'https://example.com/hp2.jpg'},
-            {'id': '5', 'title': 'The Hobbit', 'author': 'J.R.R. Tolkien', 'isbn': '9780547928227', 'genre': 'Fantasy', 'availability': 'Available', 'cover_image': 'https://example.com/hobbit.jpg'},
-            {'id': '6', 'title': '1984', 'author': 'George Orwell', 'isbn': '9780451524935', 'genre': 'Dystopian', 'availability': 'Available', 'cover_image': 'https://example.com/1984.jpg'},
-            {'id': '7', 'title': 'Pride and Prejudice', 'author': 'Jane Austen', 'isbn': '9780141439518', 'genre': 'Romance', 'availability': 'Available', 'cover_image': 'https://example.com/pride.jpg'},
-            {'id': '8', 'title': 'Python Crash Course', 'author': 'Eric Matthes', 'isbn': '9781593279288', 'genre': 'Technology', 'availability': 'Available', 'cover_image': 'https://example.com/python.jpg'},
-            {'id': '9', 'title': 'Introduction to Algorithms', 'author': 'Thomas H. Cormen', 'isbn': '9780262033848', 'genre': 'Technology', 'availability': 'Reference Only', 'cover_image': 'https://example.com/algo.jpg'},
-            {'id': '10', 'title': 'Dune', 'author': 'Frank Herbert', 'isbn': '9780441172719', 'genre': 'Sci-Fi', 'availability': 'Checked Out', 'cover_image': 'https://example.com/dune.jpg'}
-        ]
     
+    @tracing.traced()
     def authenticate_user(self, user_id: str, password: str) -> Dict[str, Any]:
         """Authenticate user and return user information."""
         data = {
@@ -128,16 +580,19 @@ class LibraryService:
         response = self._make_request('auth/login', 'POST', data)
         return response
     
+    @tracing.traced()
     def get_account_info(self, user_id: str) -> Dict[str, Any]:
         """Get user account information."""
         response = self._make_request(f'users/{user_id}', 'GET')
         return response.get('user', {})
     
+    @tracing.traced()
     def get_checkouts(self, user_id: str) -> List[Dict[str, Any]]:
         """Get user's current checkouts."""
         response = self._make_request(f'users/{user_id}/checkouts', 'GET')
         return response.get('checkouts', [])
     
+    @tracing.traced()
     def renew_book(self, user_id: str, book_id: str) -> Dict[str, Any]:
         """Renew a checked-out book."""
         data = {
@@ -147,11 +602,13 @@ class LibraryService:
         response = self._make_request('checkouts/renew', 'POST', data)
         return response
     
+    @tracing.traced()
     def get_holds(self, user_id: str) -> List[Dict[str, Any]]:
         """Get user's current holds."""
         response = self._make_request(f'users/{user_id}/holds', 'GET')
         return response.get('holds', [])
     
+    @tracing.traced()
     def place_hold(self, user_id: str, book_id: str) -> Dict[str, Any]:
         """Place a hold on a book."""
         data = {
@@ -161,11 +618,13 @@ class LibraryService:
         response = self._make_request('holds', 'POST', data)
         return response
     
+    @tracing.traced()
     def get_fines(self, user_id: str) -> List[Dict[str, Any]]:
         """Get user's fines."""
         response = self._make_request(f'users/{user_id}/fines', 'GET')
         return response.get('fines', [])
     
+    @tracing.traced()
     def pay_fine(self, user_id: str, fine_id: str, amount: float) -> Dict[str, Any]:
         """Pay a fine."""
         data = {
@@ -176,6 +635,7 @@ class LibraryService:
         response = self._make_request('fines/pay', 'POST', data)
         return response
     
+    @tracing.traced()
     def get_available_rooms(self, date: str, time: str, duration: str) -> List[Dict[str, Any]]:
         """Get available study rooms for given date/time."""
         params = {
@@ -186,6 +646,21 @@ class LibraryService:
         response = self._make_request('rooms/available', 'GET', params)
         return response.get('rooms', [])
     
+    @tracing.traced()
+    def get_room_schedule(self, date: str) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Get every study room's opening hours and existing bookings for a date.
+        
+        Returns:
+            (rooms, False if they are a mock fallback that must not be cached)
+        """
+        params = {
+            'date': date
+        }
+        response, cacheable = self._call_api('rooms/schedule', 'GET', params)
+        return response.get('rooms', []), cacheable
+    
+    @tracing.traced()
     def book_room(self, user_id: str, room_id: str, date: str, time: str, duration: str) -> Dict[str, Any]:
         """Book a study room."""
         data = {
@@ -196,8 +671,13 @@ class LibraryService:
             'duration': duration
         }
         response = self._make_request('rooms/book', 'POST', data)
+        if self.cache is not None and response.get('success'):
+            # Cached room listings may still offer the booked slot
+            for key in self.cache.tagged('rooms'):
+                self.cache.delete(key)
         return response
     
+    @tracing.traced()
     def check_equipment_availability(self, equipment_type: str, date: str, duration: str) -> bool:
         """Check if equipment is available."""
         params = {
@@ -208,6 +688,20 @@ class LibraryService:
         response = self._make_request('equipment/availability', 'GET', params)
         return response.get('available', False)
     
+    @tracing.traced()
+    def get_equipment_schedule(self, equipment_type: str) -> Tuple[Dict[str, Any], bool]:
+        """
+        Get capacity and existing reservations for an equipment type.
+        
+        Returns:
+            (schedule, False if it is a mock fallback that must not be cached)
+        """
+        params = {
+            'equipment_type': equipment_type
+        }
+        return self._call_api('equipment/schedule', 'GET', params)
+    
+    @tracing.traced()
     def reserve_equipment(self, user_id: str, equipment_type: str, date: str, duration: str) -> Dict[str, Any]:
         """Reserve equipment."""
         data = {
@@ -219,11 +713,13 @@ class LibraryService:
         response = self._make_request('equipment/reserve', 'POST', data)
         return response
     
+    @tracing.traced()
     def get_upcoming_events(self) -> List[Dict[str, Any]]:
         """Get upcoming library events."""
         response = self._make_request('events/upcoming', 'GET')
         return response.get('events', [])
     
+    @tracing.traced()
     def register_for_event(self, user_id: str, event_id: str) -> Dict[str, Any]:
         """Register user for an event."""
         data = {
@@ -233,193 +729,15 @@ class LibraryService:
         response = self._make_request('events/register', 'POST', data)
         return response
     
+    @tracing.traced()
+    def get_circulation_history(self) -> List[Dict[str, Any]]:
+        """Get anonymized checkout and hold history (used to build recommendations)."""
+        response = self._make_request('circulation/history', 'GET')
+        return response.get('events', [])
+    
     def _get_mock_response(self, endpoint: str, method: str, data: Dict = None) -> Dict[str, Any]:
-        """Generate mock responses for development/testing."""
-        # Mock book details
-        if endpoint.startswith('books/') and 'search' not in endpoint:
-            book_id = endpoint.split('/')[-1]
-            all_books = self._get_mock_books()
-            for book in all_books:
-                if book['id'] == book_id:
-                    return {'book': book}
-            return {'book': {}}
-
-        if 'books/search' in endpoint:
-            # Enhanced Mock Database
-            all_books = self._get_mock_books()
-            
-            # Simple Filter Logic
-            query_title = data.get('title', '').lower()
-            query_author = data.get('author', '').lower()
-            query_genre = data.get('genre', '').lower()
-            
-            filtered_books = []
-            for book in all_books:
-                # If a filter is provided, check if it matches. 
-                # If multiple filters are provided, strict AND match (or lenient OR, let's do lenient for demo)
-                match = True
-                if query_title and query_title not in book['title'].lower():
-                    match = False
-                if query_author and match and query_author not in book['author'].lower():
-                    match = False
-                if query_genre and match and query_genre not in book['genre'].lower():
-                    match = False
-                
-                # If no filters provided, return everything (or logic to return none? usually search returns all/popular)
-                if not any([query_title, query_author, query_genre]):
-                    match = True
-                    
-                if match:
-                    filtered_books.append(book)
-                    
-            return {'books': filtered_books}
-        
-        # Mock authentication
-        if 'auth/login' in endpoint:
-            return {
-                'success': True,
-                'user_id': data.get('user_id', 'user123'),
-                'name': 'John Doe',
-                'email': 'john.doe@example.com'
-            }
-        
-        # Mock checkouts
-        if 'checkouts' in endpoint and method == 'GET':
-            return {
-                'checkouts': [
-                    {
-                        'id': '1',
-                        'book_id': '1',
-                        'title': 'The Great Gatsby',
-                        'due_date': (datetime.now() + timedelta(days=7)).strftime('%Y-%m-%d'),
-                        'renewable': True,
-                        'cover_image': 'https://example.com/covers/gatsby.jpg'
-                    }
-                ]
-            }
-        
-        # Mock holds
-        if 'holds' in endpoint:
-            if method == 'GET':
-                return {
-                    'holds': [
-                        {
-                            'id': '1',
-                            'book_id': '2',
-                            'title': 'To Kill a Mockingbird',
-                            'position': 3,
-                            'cover_image': 'https://example.com/covers/mockingbird.jpg'
-                        }
-                    ]
-                }
-            elif method == 'POST':
-                return {
-                    'success': True,
-                    'hold_id': 'hold123',
-                    # In our demo flow, 'book_id' often contains the title string
-                    'title': data.get('book_id', 'Requested Book')
-                }
-        
-        # Mock renewals
-        if 'renew' in endpoint:
-            return {
-                'success': True,
-                # Use the book_id/title passed in request
-                'title': data.get('book_id', 'Requested Book'),
-                'new_due_date': (datetime.now() + timedelta(days=21)).strftime('%Y-%m-%d')
-            }
-        
-        # Mock rooms
-        if 'rooms' in endpoint:
-            if 'available' in endpoint:
-                return {
-                    'rooms': [
-                        {
-                            'id': 'room1',
-                            'room_name': 'Study Room A',
-                            'capacity': 4,
-                            'amenities': ['Whiteboard', 'Projector']
-                        },
-                        {
-                            'id': 'room2',
-                            'room_name': 'Study Room B',
-                            'capacity': 6,
-                            'amenities': ['Whiteboard']
-                        }
-                    ]
-                }
-            elif 'book' in endpoint:
-                return {
-                    'success': True,
-                    'confirmation_id': 'BOOK123',
-                    'room_name': 'Study Room A'
-                }
-        
-        # Mock equipment
-        if 'equipment' in endpoint:
-            if 'availability' in endpoint:
-                return {'available': True}
-            elif 'reserve' in endpoint:
-                return {
-                    'success': True,
-                    'confirmation_id': 'EQ123',
-                    'equipment_type': data.get('equipment_type', 'laptop')
-                }
-        
-        # Mock events
-        if 'events' in endpoint:
-            if 'upcoming' in endpoint:
-                return {
-                    'events': [
-                        {
-                            'id': 'event1',
-                            'title': 'Book Club Meeting',
-                            'date': (datetime.now() + timedelta(days=3)).strftime('%Y-%m-%d'),
-                            'time': '6:00 PM',
-                            'image_url': 'https://example.com/events/bookclub.jpg'
-                        }
-                    ]
-                }
-            elif 'register' in endpoint:
-                return {
-                    'success': True,
-                    'confirmation_id': 'EVENT123',
-                    'event_title': 'Book Club Meeting'
-                }
-        
-        # Mock user info
-        if 'users' in endpoint and method == 'GET':
-            return {
-                'user': {
-                    'user_id': 'user123',
-                    'name': 'John Doe',
-                    'email': 'john.doe@example.com',
-                    'member_id': 'M123456',
-                    'status': 'Active',
-                    'checkout_count': 3,
-                    'hold_count': 1
-                }
-            }
-        
-        # Mock fines
-        if 'fines' in endpoint:
-            if method == 'GET':
-                return {
-                    'fines': [
-                        {
-                            'id': 'fine1',
-                            'description': 'Overdue: The Great Gatsby',
-                            'amount': 2.50,
-                            'due_date': '2024-01-15'
-                        }
-                    ]
-                }
-            elif 'pay' in endpoint:
-                return {
-                    'success': True,
-                    'transaction_id': 'TXN123',
-                    'amount': data.get('amount', 0)
-                }
-        
-        # Default mock response
-        return {'success': True, 'message': 'Mock response'}
+        """Serve a request from the in-memory mock backend (development/testing)."""
+        if self._mock_backend is None:
+            from mock_backend import MockBackend
+            self._mock_backend = MockBackend()
+        return self._mock_backend.handle(endpoint, method, data)
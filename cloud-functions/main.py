@@ -5,34 +5,90 @@ Professional-grade webhook with advanced features for library system integration
 
 import json
 import os
+import time
 import logging
-from typing import Dict, Any, Optional, List
-from flask import Request
+from functools import lru_cache
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, List, Tuple, TYPE_CHECKING
+import timing
+import metrics
+import tracing
+import profiling
+import capture
+import codec
+from webhook_request import WebhookRequest
+from response_cache import ResponseCache
+from cache_events import CacheEvents, MAX_BACKLOG
+from popularity import Popularity
 from library_service import LibraryService
+from recommendations import RecommendationTable
+from faq_index import FaqIndex
+from room_availability import RoomAvailability, parse_date, parse_time, parse_duration
+from equipment_inventory import EquipmentInventory
 from utils import (
+    StaticReply,
     create_rich_response,
     create_card_response,
     create_list_response,
-    create_quick_reply_response,
+    create_messages,
     format_error_response,
     validate_parameters
 )
 
-# Configure logging with more detail
+if TYPE_CHECKING:
+    from flask import Request
+
+# Configure logging (once, before any module logs)
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
-
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize library service
+# Initialize library service (HTTP sessions are created on first use)
 library_service = LibraryService()
 
+# Load precomputed recommendations (built offline by recommendations.py)
+recommendation_table = RecommendationTable.from_file()
+
+# Build the FAQ knowledge index (local stand-in for the Knowledge Connector)
+faq_index = FaqIndex.from_file()
+FAQ_MIN_CONFIDENCE = float(os.environ.get('FAQ_MIN_CONFIDENCE', '0.45'))
+
+# Study room slot bitmaps, refreshed from the library API
+room_availability = RoomAvailability(library_service)
+
+# Equipment capacity timelines, written through to the library API
+equipment_inventory = EquipmentInventory(library_service)
+
+# Replies that depend only on their parameters (opt-in: RESPONSE_CACHE=true)
+response_cache = ResponseCache()
+
+# Push invalidation from the library system (handle_cache_events; needs CACHE_EVENTS_SECRET)
+cache_events = CacheEvents(library_service, response_cache, recommendation_table)
+
+# Most requested searches, books and questions, warmed periodically (opt-in: POPULARITY_TRACKING=true)
+popularity = Popularity()
+
+
+def _mirror_faq_cache() -> None:
+    info = faq_index.cache_info()
+    metrics.cache_requests.mirror(info.hits, 'faq', 'hit')
+    metrics.cache_requests.mirror(info.misses, 'faq', 'miss')
+
+
+metrics.REGISTRY.add_hook(_mirror_faq_cache)
 
-def handle_webhook(request: Request) -> Dict[str, Any]:
+# Optional local /metrics listener for scraping this process
+if os.environ.get('METRICS_PORT'):
+    metrics.start_http_server(int(os.environ['METRICS_PORT']))
+
+
+@timing.timed_request()
+@capture.captured_request()
+@tracing.traced_request()
+@profiling.profiled_request()
+def handle_webhook(request: 'Request'):
     """
     Main webhook handler for DialogFlow CX fulfillment.
     Routes requests to appropriate handlers based on intent and flow.
@@ -41,95 +97,171 @@ def handle_webhook(request: Request) -> Dict[str, Any]:
         request: Flask request object from Cloud Functions
         
     Returns:
-        JSON response compatible with DialogFlow CX webhook format
+        (body, 200, headers) with the JSON response in DialogFlow CX webhook format
     """
+    start = time.perf_counter()
+    tag = flow_name = ''
+    outcome = 'error'
+    body = None
     try:
-        request_json = request.get_json(silent=True)
-        
-        logger.info("=" * 50)
-        logger.info("WEBHOOK REQUEST RECEIVED")
-        logger.info("=" * 50)
-        logger.info(f"Full request JSON: {json.dumps(request_json, indent=2)}")
-        
-        if not request_json:
+        parse_start = timing.clock()
+        webhook_request = WebhookRequest.from_json(codec.request_json(request))
+        timing.record('parse', timing.clock() - parse_start)
+        
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("=" * 50)
+            logger.info("WEBHOOK REQUEST RECEIVED")
+            logger.info("=" * 50)
+            # Log the body as received rather than encoding it again
+            logger.info(f"Full request JSON: {request.get_data().decode('utf-8', 'replace')}")
+        
+        if webhook_request is None:
             logger.error("Invalid request format: No JSON body")
-            return format_error_response("Invalid request format")
-        
-        # Extract request information
-        session_info = request_json.get('sessionInfo', {})
-        intent_info = request_json.get('intentInfo', {})
-        page_info = request_json.get('pageInfo', {})
-        
-        logger.info(f"Session Info: {json.dumps(session_info, indent=2)}")
-        logger.info(f"Intent Info: {json.dumps(intent_info, indent=2)}")
-        logger.info(f"Page Info: {json.dumps(page_info, indent=2)}")
-        
-        intent_name = intent_info.get('displayName', '') if isinstance(intent_info, dict) else ''
-        
-        # Safely extract flow and page names
-        current_flow = page_info.get('currentFlow', {}) if isinstance(page_info, dict) else {}
-        current_page = page_info.get('currentPage', {}) if isinstance(page_info, dict) else {}
-        
-        flow_name = current_flow.get('displayName', '') if isinstance(current_flow, dict) else ''
-        page_name = current_page.get('displayName', '') if isinstance(current_page, dict) else ''
-        
-        # Extract parameters
-        parameters = session_info.get('parameters', {})
-        
-        # Extract fulfillment tag
-        fulfillment_info = request_json.get('fulfillmentInfo', {})
-        tag = fulfillment_info.get('tag', '')
-        
-        logger.info(f"Extracted - Flow: {flow_name}, Page: {page_name}, Intent: {intent_name}, Tag: {tag}")
-        logger.info(f"Extracted Parameters: {json.dumps(parameters, indent=2)}")
-        
-        # Route based on flow and intent
-        logger.info("Routing request to handler...")
-        response = route_request(flow_name, page_name, intent_name, parameters, session_info, tag)
-        logger.info(f"Handler Response: {json.dumps(response, indent=2)}")
+            outcome = 'invalid'
+            body = codec.dumps(format_error_response("Invalid request format"))
+            return codec.reply(body, request)
+        
+        tag, flow_name = webhook_request.tag, webhook_request.flow
+        tracing.set_attributes({
+            'dialogflow.session_id': webhook_request.session_id,
+            'dialogflow.tag': tag,
+            'dialogflow.intent': webhook_request.intent,
+            'dialogflow.flow': flow_name,
+            'dialogflow.page': webhook_request.page
+        })
+        logger.info(f"Extracted - Flow: {flow_name}, Page: {webhook_request.page}, Intent: {webhook_request.intent}, Tag: {tag}")
+        
+        # Catch up with catalog changes pushed to sibling instances, then serve
+        # cached non-personal replies without the handler or route on flow and intent
+        cache_events.sync()
+        popularity.tick(library_service, faq_index, recommendation_table)
+        response = response_cache.get(webhook_request)
+        if response is not None:
+            logger.info(f"Serving cached reply for tag '{tag}'")
+            # The handler did not run, so count its queries here
+            track_cached_turn(webhook_request)
+        else:
+            logger.info("Routing request to handler...")
+            response = response_cache.put(webhook_request, route_request(webhook_request))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Handler Response: {codec.dumps(response).decode('utf-8')}")
         
         # Build DialogFlow CX response
-        final_response = build_response(response, session_info)
-        logger.info(f"Final Response to DialogFlow: {json.dumps(final_response, indent=2)}")
-        logger.info("=" * 50)
+        final_response = build_response(response, webhook_request)
+        body = codec.dumps(final_response)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(f"Final Response to DialogFlow: {body.decode('utf-8')}")
+            logger.info("=" * 50)
         
-        return final_response
+        outcome = 'ok'
+        return codec.reply(body, request)
         
     except Exception as e:
         logger.error(f"Error processing webhook: {str(e)}", exc_info=True)
-        return format_error_response(f"An error occurred: {str(e)}")
+        outcome = 'error'
+        body = codec.dumps(format_error_response(f"An error occurred: {str(e)}"))
+        return codec.reply(body, request)
 
+    finally:
+        metrics.observe_request(tag, flow_name, outcome, time.perf_counter() - start, body)
 
-def route_request(
-    flow_name: str,
-    page_name: str,
-    intent_name: str,
-    parameters: Dict[str, Any],
-    session_info: Dict[str, Any],
-    tag: str = ''
-) -> Dict[str, Any]:
+
+def handle_metrics(request: 'Request'):
+    """
+    Metrics entry point: this process's metrics in Prometheus text format.
+
+    The registry lives in the memory of the process serving handle_webhook,
+    so this is only useful from that same process (e.g. an app that routes
+    both). Deploying it as its own target (functions-framework --target
+    handle_metrics) is not supported: that process never serves a webhook
+    turn and reports an empty registry. To scrape webhook instances, set
+    METRICS_PORT instead.
+    """
+    return metrics.render(), 200, {'Content-Type': metrics.CONTENT_TYPE}
+
+
+def handle_cache_events(request: 'Request'):
+    """
+    Cache events entry point: signed batches of catalog changes from the library system.
+
+    Deploy it next to handle_webhook (e.g. functions-framework --target
+    handle_cache_events); see cache_events.py for the batch format and
+    signing. A separate deployment reaches webhook instances only through
+    the shared cache tier (LIBRARY_CACHE_L2).
+
+    Returns:
+        (JSON body, status, headers) with counts of applied, duplicate, stale and invalid events
+    """
+    status, result = cache_events.handle(request.get_data(), request.headers)
+    return codec.dumps(result), status, {'Content-Type': codec.CONTENT_TYPE}
+
+
+def warm_up() -> Dict[str, Any]:
+    """
+    Do the work a cold instance would otherwise do on its first turns: open
+    library API connections (or build the mock backend), apply the backlog of
+    the shared catalog change log, load today's room schedule and the common
+    equipment timelines, exercise the FAQ and recommendation indexes, and warm
+    the most requested searches, books and questions when popularity tracking
+    is on.
+
+    Returns:
+        Per-step status and duration in milliseconds
+    """
+    today = datetime.now().strftime('%Y-%m-%d')
+    steps = {
+        'library_api': library_service.warm_up,
+        'cache_events': lambda: cache_events.sync(force=True, limit=MAX_BACKLOG),
+        'rooms': lambda: len(room_availability.available_rooms(today, 9 * 60, 60)),
+        'equipment': lambda: {kind: equipment_inventory.capacity(kind) for kind in ('laptop', 'projector', 'camera')},
+        'faq': lambda: bool(faq_index.search('What are your opening hours?')),
+        'recommendations': lambda: len(recommendation_table.get_popular())
+    }
+    if popularity.enabled:
+        steps['popular'] = lambda: popularity.warm(library_service, faq_index, recommendation_table)
+    report = {}
+    for name, step in steps.items():
+        start = time.perf_counter()
+        try:
+            result = step()
+            report[name] = {'status': 'ok', 'result': result}
+        except Exception as e:
+            logger.error(f"Warm-up step {name} failed: {str(e)}")
+            report[name] = {'status': 'error', 'error': str(e)}
+        report[name]['ms'] = round((time.perf_counter() - start) * 1000, 3)
+    return report
+
+
+def handle_warmup(request: 'Request'):
+    """
+    Warm-up entry point: prime pools, indexes and caches before real traffic.
+
+    Deploy it next to handle_webhook and call it after each deploy or scale-up
+    (e.g. from a startup probe), or set WARM_UP_ON_START=true to run the same
+    steps while the module loads.
+    """
+    return warm_up(), 200
+
+
+@timing.timed('route')
+@tracing.traced()
+def route_request(webhook_request: WebhookRequest) -> Dict[str, Any]:
     """
     Route request to appropriate handler based on flow, intent, and tag.
     
     Args:
-        flow_name: Current flow name
-        page_name: Current page name
-        intent_name: Matched intent name
-        parameters: Extracted parameters
-        session_info: Session information
-        tag: Webhook tag
+        webhook_request: Decoded webhook request
         
     Returns:
         Response dictionary from handler
     """
+    flow_name, intent_name, tag = webhook_request.flow, webhook_request.intent, webhook_request.tag
+    parameters, user_id = webhook_request.parameters, webhook_request.user_id
     logger.info(f"Routing logic - Flow: '{flow_name}', Intent: '{intent_name}', Tag: '{tag}'")
     
     # Priority 0: Tag-based routing (Most specific)
     if tag == 'auth-webhook' or tag == 'auth_webhook':
-        return handle_authentication(parameters, session_info)
-    
-    # Extract user_id for account-specific tags
-    user_id = session_info.get('parameters', {}).get('user_id') or parameters.get('user_id')
+        return handle_authentication(webhook_request)
     
     # helper for login redirect
     # Modified to save state if present
@@ -159,77 +291,135 @@ def route_request(
         return handle_fines(user_id, parameters) if user_id else create_login_redirect('account-fines')
 
     if tag == 'reservations-webhook':
-        return handle_reservations(intent_name, parameters, session_info)
+        return handle_reservations(webhook_request)
         
     if tag == 'book-search':
-        return handle_book_search(parameters, session_info)
+        return handle_book_search(webhook_request)
         
     if tag == 'get-book-details':
         return handle_book_details(parameters)
         
     if tag == 'help-faq-webhook':
-        return handle_help_faq(intent_name, parameters, session_info)
+        return handle_help_faq(webhook_request)
+        
+    if tag == 'recommendations-webhook':
+        return handle_recommendations(webhook_request)
     
     # Priority 1: Flow-based routing
     # If we are strictly in a specific flow, prioritize its handler
     if flow_name == "Book Search Flow":
-        return handle_book_search(intent_name, parameters)
+        return handle_book_search(webhook_request)
     
     elif flow_name == "Account Management Flow":
-        return handle_account_management(intent_name, parameters, session_info)
+        return handle_account_management(webhook_request)
         
     elif flow_name == "Reservations Flow":
-        return handle_reservations(intent_name, parameters, session_info)
+        return handle_reservations(webhook_request)
         
     elif flow_name == "Help & FAQ Flow":
-        return handle_help_faq(intent_name, parameters, session_info)
+        return handle_help_faq(webhook_request)
         
     elif flow_name == "Authentication Flow":
-        return handle_authentication(parameters, session_info)
+        return handle_authentication(webhook_request)
 
     # If simple Flow match didn't catch it (e.g. entry intents), check Intents
     # Be strict to avoid overlap (e.g. "BookRoom" vs "SearchBooks")
     
     # Reservations/Booking
     if "BookRoom" == intent_name or "Reserve" in intent_name or "reservation" in intent_name.lower():
-         return handle_reservations(intent_name, parameters, session_info)
+         return handle_reservations(webhook_request)
+
+    # Recommendations (Check this BEFORE Book Search, utterances often mention 'book')
+    if "GetRecommendations" == intent_name or "recommend" in intent_name.lower():
+         return handle_recommendations(webhook_request)
 
     # Book Search (Check this AFTER Reservations to avoid 'BookRoom' matching 'book')
     if "SearchBooks" == intent_name or "FindBook" == intent_name or ("book" in intent_name.lower() and "room" not in intent_name.lower()):
-         return handle_book_search(parameters, session_info)
+         return handle_book_search(webhook_request)
 
     # Account
     if "Account" in intent_name or "checkout" in intent_name.lower() or "fine" in intent_name.lower():
-         return handle_account_management(intent_name, parameters, session_info)
+         return handle_account_management(webhook_request)
 
     # Help
     if "Help" in intent_name or "faq" in intent_name.lower():
-         return handle_help_faq(intent_name, parameters, session_info)
+         return handle_help_faq(webhook_request)
          
     # Auth
     if "Login" == intent_name or "login" in intent_name.lower():
-        return handle_authentication(parameters, session_info)
+        return handle_authentication(webhook_request)
     
     # Default handler
     else:
-        return handle_default(parameters, session_info)
+        return handle_default(webhook_request)
+
+
+# Static replies (built once, see utils.StaticReply)
+BOOK_SEARCH_PROMPT = StaticReply(
+    message="I'd be happy to help you search for books! What would you like to search for? You can search by title, author, ISBN, genre, or subject.",
+    parameters={},
+    suggestions=['Search by title', 'Search by author', 'Browse by genre']
+)
 
 
-def handle_book_search(parameters: Dict[str, Any], session_info: Dict[str, Any]) -> Dict[str, Any]:
+@lru_cache(maxsize=8)
+def _trending_search_prompt(trending: Tuple[str, ...]) -> StaticReply:
+    """Search prompt suggesting the trending books (built once per trending set)."""
+    return StaticReply(
+        message=f"I'd be happy to help you search for books! Popular right now: {', '.join(trending)}. "
+                "What would you like to search for? You can search by title, author, ISBN, genre, or subject.",
+        parameters={},
+        suggestions=[*trending, 'Search by author', 'Browse by genre']
+    )
+
+
+def book_search_prompt() -> StaticReply:
+    """The empty-search prompt, with trending books once popularity tracking has found some."""
+    return _trending_search_prompt(popularity.trending) if popularity.trending else BOOK_SEARCH_PROMPT
+
+
+def track_search(parameters: Dict[str, Any]) -> None:
+    """Count a search's title, author and genre as queries."""
+    popularity.record('title', parameters.get('book_title'))
+    popularity.record('author', parameters.get('author'))
+    popularity.record('genre', parameters.get('genre'))
+
+
+def track_cached_turn(webhook_request: WebhookRequest) -> None:
+    """Count the queries of a turn answered from the response cache."""
+    tag, parameters = webhook_request.tag, webhook_request.parameters
+    if tag == 'book-search':
+        track_search(parameters)
+    elif tag == 'get-book-details':
+        popularity.record('book', parameters.get('selected_item_id'))
+    elif tag == 'help-faq-webhook':
+        popularity.record('faq', parameters.get('help_query') or parameters.get('faq_query'))
+
+
+BOOK_SEARCH_NO_RESULTS = StaticReply(
+    message="I couldn't find any books matching your search. Would you like to try a different search term?",
+    parameters={},
+    suggestions=['Try different keywords', 'Browse by genre', 'Get recommendations']
+)
+
+@timing.timed()
+@tracing.traced()
+def handle_book_search(webhook_request: WebhookRequest) -> Dict[str, Any]:
     """
     Handle book search requests with advanced filtering.
     
     Args:
-        parameters: Search parameters (title, author, genre, etc.)
-        session_info: Session information
+        webhook_request: Decoded request (search parameters: title, author, genre, etc.)
         
     Returns:
         Response dictionary with search results
     """
+    parameters = webhook_request.parameters
     try:
         logger.info("=" * 30)
         logger.info("HANDLE_BOOK_SEARCH CALLED")
-        logger.info(f"Received parameters: {json.dumps(parameters, indent=2)}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Received parameters: {codec.dumps(dict(parameters)).decode('utf-8')}")
         
         # Extract search parameters
         title = parameters.get('book_title', '')
@@ -244,11 +434,8 @@ def handle_book_search(parameters: Dict[str, Any], session_info: Dict[str, Any])
         # Validate parameters
         if not any([title, author, isbn, genre, subject]):
             logger.info("No search parameters provided, returning prompt message")
-            return {
-                'message': "I'd be happy to help you search for books! What would you like to search for? You can search by title, author, ISBN, genre, or subject.",
-                'parameters': {},
-                'suggestions': ['Search by title', 'Search by author', 'Browse by genre']
-            }
+            return book_search_prompt()
+        track_search(parameters)
         
         # Perform search
         logger.info(f"Calling library_service.search_books with title='{title}'")
@@ -262,22 +449,21 @@ def handle_book_search(parameters: Dict[str, Any], session_info: Dict[str, Any])
         logger.info(f"Search returned {len(search_results) if search_results else 0} results")
         
         if not search_results:
-            return {
-                'message': f"I couldn't find any books matching your search. Would you like to try a different search term?",
-                'parameters': {},
-                'suggestions': ['Try different keywords', 'Browse by genre', 'Get recommendations']
-            }
+            return BOOK_SEARCH_NO_RESULTS
         
         # Format results based on count
         if len(search_results) == 1:
             # Single result - show detailed card
             book = search_results[0]
+            status = book.get('availability', 'Unknown')
+            if book.get('available_at'):
+                status = f"Available at {', '.join(book['available_at'])}"
             return {
                 'message': f"I found a book matching your search:",
                 'rich_response': create_card_response(
                     title=book.get('title', 'Unknown'),
                     subtitle=f"By {book.get('author', 'Unknown Author')}",
-                    text=f"ISBN: {book.get('isbn', 'N/A')}\nGenre: {book.get('genre', 'N/A')}\nStatus: {book.get('availability', 'Unknown')}",
+                    text=f"ISBN: {book.get('isbn', 'N/A')}\nGenre: {book.get('genre', 'N/A')}\nStatus: {status}",
                     image_url=book.get('cover_image', ''),
                     buttons=[
                         {'text': 'Place Hold', 'postback': f"place_hold_{book.get('id')}"},
@@ -308,24 +494,21 @@ def handle_book_search(parameters: Dict[str, Any], session_info: Dict[str, Any])
         }
 
 
-def handle_account_management(
-    intent_name: str,
-    parameters: Dict[str, Any],
-    session_info: Dict[str, Any]
-) -> Dict[str, Any]:
+@timing.timed()
+@tracing.traced()
+def handle_account_management(webhook_request: WebhookRequest) -> Dict[str, Any]:
     """
     Handle account management requests (checkouts, renewals, holds, fines).
     
     Args:
-        intent_name: Detected intent name
-        parameters: Request parameters
-        session_info: Session information
+        webhook_request: Decoded request (intent, user and parameters)
         
     Returns:
         Response dictionary
     """
+    intent_name, parameters = webhook_request.intent, webhook_request.parameters
     try:
-        user_id = session_info.get('parameters', {}).get('user_id') or parameters.get('user_id')
+        user_id = webhook_request.user_id
         
         if not user_id:
             return {
@@ -360,6 +543,8 @@ def handle_account_management(
         }
 
 
+@timing.timed()
+@tracing.traced()
 def handle_book_details(parameters: Dict[str, Any]) -> Dict[str, Any]:
     """Handle request for specific book details (e.g. from list selection)."""
     try:
@@ -367,6 +552,7 @@ def handle_book_details(parameters: Dict[str, Any]) -> Dict[str, Any]:
         book_id = parameters.get('selected_item_id')
         if not book_id:
              return {'message': "I couldn't identify which book you selected.", 'parameters': {}}
+        popularity.record('book', book_id)
 
         # In a real app, we'd fetch specific ID.
         # For mock, search_books returns list with IDs, we can't search by ID directly yet in 'search_books' 
@@ -398,6 +584,67 @@ def handle_book_details(parameters: Dict[str, Any]) -> Dict[str, Any]:
         return {'message': "Error retrieving book details.", 'parameters': {}}
 
 
+@timing.timed()
+@tracing.traced()
+def handle_recommendations(webhook_request: WebhookRequest) -> Dict[str, Any]:
+    """
+    Handle book recommendations from the precomputed recommendation table.
+    
+    Args:
+        webhook_request: Decoded request (book_id, selected_item_id or book_title seed)
+        
+    Returns:
+        Response dictionary with recommended books
+    """
+    parameters = webhook_request.parameters
+    try:
+        user_id = webhook_request.user_id
+        seed_id = recommendation_table.resolve_book_id(
+            book_id=parameters.get('book_id') or parameters.get('selected_item_id') or '',
+            title=parameters.get('book_title', '')
+        )
+        
+        # Prefer an explicit seed book, then the user's history, then popular books
+        if seed_id:
+            seed_title = recommendation_table.books[seed_id].get('title')
+            recommendations = recommendation_table.for_book(seed_id)
+            message = f"If you enjoyed '{seed_title}', you might also like:"
+        elif user_id:
+            recommendations = recommendation_table.for_user(user_id)
+            message = "Based on your reading history, you might enjoy:"
+        else:
+            recommendations = recommendation_table.get_popular()
+            message = "Here are some of our most popular books right now:"
+        
+        if not recommendations:
+            return {
+                'message': "I don't have any recommendations for you yet. Would you like to search the catalog instead?",
+                'parameters': {},
+                'suggestions': ['Search books', 'Browse by genre']
+            }
+        
+        return {
+            'message': message,
+            'rich_response': create_list_response(
+                items=recommendations,
+                title_key='title',
+                description_key='author',
+                image_key='cover_image'
+            ),
+            'parameters': {'recommendations': [book['id'] for book in recommendations]},
+            'suggestions': ['Get more recommendations', 'Place hold', 'Search books']
+        }
+        
+    except Exception as e:
+        logger.error(f"Error getting recommendations: {str(e)}")
+        return {
+            'message': "I'm having trouble finding recommendations right now. Please try again in a moment.",
+            'parameters': {}
+        }
+
+
+@timing.timed()
+@tracing.traced()
 def handle_checkouts(user_id: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
     """Handle viewing and managing checkouts."""
     try:
@@ -430,6 +677,8 @@ def handle_checkouts(user_id: str, parameters: Dict[str, Any]) -> Dict[str, Any]
         }
 
 
+@timing.timed()
+@tracing.traced()
 def handle_renewal(user_id: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
     """Handle book renewals."""
     try:
@@ -478,6 +727,8 @@ def handle_renewal(user_id: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
         }
 
 
+@timing.timed()
+@tracing.traced()
 def handle_holds(user_id: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
     """Handle viewing and managing holds."""
     try:
@@ -542,6 +793,8 @@ def handle_holds(user_id: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
         }
 
 
+@timing.timed()
+@tracing.traced()
 def handle_fines(user_id: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
     """Handle viewing and paying fines."""
     try:
@@ -600,6 +853,8 @@ def handle_fines(user_id: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
         }
 
 
+@timing.timed()
+@tracing.traced()
 def handle_account_info(user_id: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
     """Handle account information requests."""
     try:
@@ -632,17 +887,35 @@ def handle_account_info(user_id: str, parameters: Dict[str, Any]) -> Dict[str, A
         }
 
 
-def handle_reservations(intent_name: str, parameters: Dict[str, Any], session_info: Dict[str, Any]) -> Dict[str, Any]:
+RESERVATIONS_LOGIN = StaticReply(
+    message="Please log in to make reservations.",
+    parameters={},
+    redirect_to_flow='Authentication Flow'
+)
+RESERVATIONS_PROMPT = StaticReply(
+    message="What would you like to reserve? I can help you book study rooms, equipment, or register for events.",
+    parameters={},
+    suggestions=['Study room', 'Equipment', 'Event']
+)
+RESERVATIONS_UNKNOWN_TYPE = StaticReply(
+    message="I can help you reserve study rooms, equipment, or register for events. What would you like to do?",
+    parameters={}
+)
+RESERVATIONS_ERROR = StaticReply(
+    message="I'm having trouble processing your reservation. Please try again.",
+    parameters={}
+)
+
+@timing.timed()
+@tracing.traced()
+def handle_reservations(webhook_request: WebhookRequest) -> Dict[str, Any]:
     """Handle reservation requests (study rooms, equipment, events)."""
+    parameters = webhook_request.parameters
     try:
-        user_id = session_info.get('parameters', {}).get('user_id') or parameters.get('user_id')
+        user_id = webhook_request.user_id
         
         if not user_id:
-            return {
-                'message': "Please log in to make reservations.",
-                'parameters': {},
-                'redirect_to_flow': 'Authentication Flow'
-            }
+            return RESERVATIONS_LOGIN
         
         reservation_type = parameters.get('reservation_type', '')
         date = parameters.get('date', '')
@@ -650,11 +923,7 @@ def handle_reservations(intent_name: str, parameters: Dict[str, Any], session_in
         duration = parameters.get('duration', '')
         
         if not reservation_type:
-            return {
-                'message': "What would you like to reserve? I can help you book study rooms, equipment, or register for events.",
-                'parameters': {},
-                'suggestions': ['Study room', 'Equipment', 'Event']
-            }
+            return RESERVATIONS_PROMPT
         
         if reservation_type.lower() in ['study room', 'room']:
             return handle_study_room_booking(user_id, date, time, duration, parameters)
@@ -663,19 +932,15 @@ def handle_reservations(intent_name: str, parameters: Dict[str, Any], session_in
         elif reservation_type.lower() in ['event', 'program']:
             return handle_event_registration(user_id, parameters)
         else:
-            return {
-                'message': "I can help you reserve study rooms, equipment, or register for events. What would you like to do?",
-                'parameters': {}
-            }
+            return RESERVATIONS_UNKNOWN_TYPE
             
     except Exception as e:
         logger.error(f"Error handling reservations: {str(e)}")
-        return {
-            'message': "I'm having trouble processing your reservation. Please try again.",
-            'parameters': {}
-        }
+        return RESERVATIONS_ERROR
 
 
+@timing.timed()
+@tracing.traced()
 def handle_study_room_booking(
     user_id: str,
     date: str,
@@ -691,10 +956,59 @@ def handle_study_room_booking(
                 'parameters': {}
             }
         
-        # Check availability
-        available_rooms = library_service.get_available_rooms(date, time, duration)
+        # Check availability against the local slot bitmaps when the slot parses,
+        # otherwise ask the backend for the exact slot
+        day = parse_date(date)
+        start_minutes = parse_time(time)
+        duration_minutes = parse_duration(duration)
+        now = datetime.now()
+        today = now.strftime('%Y-%m-%d')
+        if day and day < today:
+            return {
+                'message': f"{date} has already passed. When would you like to reserve a study room?",
+                'parameters': {}
+            }
+        now_minutes = now.hour * 60 + now.minute if day == today else 0
+        if day == today and start_minutes is not None and start_minutes < now_minutes:
+            return {
+                'message': "That time has already passed. When would you like to reserve a study room?",
+                'parameters': {}
+            }
+        use_bitmaps = bool(day) and start_minutes is not None and bool(duration_minutes)
+        
+        available_rooms = room_availability.available_rooms(day, start_minutes, duration_minutes) if use_bitmaps else None
+        if available_rooms is None:
+            # Unparsed slot, or the day's schedule could not be read
+            use_bitmaps = False
+            available_rooms = library_service.get_available_rooms(date, time, duration)
         
         if not available_rooms:
+            alternatives = room_availability.nearest_alternatives(
+                day, start_minutes, duration_minutes, not_before=now_minutes
+            ) if use_bitmaps else []
+            
+            if alternatives:
+                return {
+                    'message': f"Sorry, no study rooms are available for {date} at {time}. Here are the closest open times:",
+                    'rich_response': create_list_response(
+                        items=[
+                            {
+                                'id': f"{alt['id']}@{alt['start_minutes']}",
+                                'title': f"{alt['room_name']} at {alt['start']}",
+                                'description': f"Until {alt['end']} (seats {alt['capacity']})"
+                            }
+                            for alt in alternatives
+                        ]
+                    ),
+                    'parameters': {
+                        'alternative_slots': [
+                            {'room_id': alt['id'], 'room_name': alt['room_name'], 'time': alt['start']}
+                            for alt in alternatives
+                        ]
+                    },
+                    'suggestions': [f"{alt['room_name']} at {alt['start']}" for alt in alternatives[:3]] + ['Try different date']
+                }
+            
             return {
                 'message': f"Sorry, no study rooms are available for {date} at {time}. Would you like to try a different time?",
                 'parameters': {},
@@ -706,6 +1020,8 @@ def handle_study_room_booking(
         if room_id:
             result = library_service.book_room(user_id, room_id, date, time, duration)
             if result.get('success'):
+                if use_bitmaps:
+                    room_availability.mark_booked(day, room_id, start_minutes, duration_minutes)
                 return {
                     'message': f"Successfully booked {result.get('room_name')} for {date} at {time}. Confirmation: {result.get('confirmation_id')}",
                     'parameters': {'booking_result': result}
@@ -737,6 +1053,8 @@ def handle_study_room_booking(
         }
 
 
+@timing.timed()
+@tracing.traced()
 def handle_equipment_reservation(
     user_id: str,
     date: str,
@@ -760,22 +1078,69 @@ def handle_equipment_reservation(
                 'parameters': {}
             }
         
-        # Check availability
-        available = library_service.check_equipment_availability(equipment_type, date, duration)
-        
-        if not available:
-            return {
-                'message': f"Sorry, {equipment_type} is not available for {date}. Would you like to try a different date?",
-                'parameters': {},
-                'suggestions': ['Try different date', 'Try different equipment']
-            }
-        
-        # Reserve equipment
-        result = library_service.reserve_equipment(user_id, equipment_type, date, duration)
+        # Answer from the local inventory timeline when the type and date are known to it
+        day = parse_date(date)
+        start = datetime.strptime(day, '%Y-%m-%d') if day else None
+        now = datetime.now()
+        if start is not None:
+            if start.date() < now.date():
+                return {
+                    'message': f"{date} has already passed. When would you like to reserve the {equipment_type}?",
+                    'parameters': {}
+                }
+            minute = parse_time(time)
+            if minute is not None:
+                start += timedelta(minutes=minute)
+                if start < now:
+                    return {
+                        'message': f"That time has already passed. When would you like to reserve the {equipment_type}?",
+                        'parameters': {}
+                    }
+            else:
+                start = max(start + timedelta(hours=9), now)
+        minutes = parse_duration(duration) or 24 * 60
+        # Periods past the timeline's horizon are checked with the library API
+        in_timeline = start is not None and equipment_inventory.covers(equipment_type, start, minutes)
+        capacity = equipment_inventory.capacity(equipment_type) if in_timeline else 0
+        
+        if capacity:
+            units_free = equipment_inventory.units_free(equipment_type, start, minutes)
+            
+            if units_free < 1:
+                next_start = equipment_inventory.earliest_available(equipment_type, start, minutes)
+                if next_start:
+                    when = next_start.strftime('%A, %B %d at %I:%M %p')
+                    return {
+                        'message': f"Sorry, all {capacity} {equipment_type} units are reserved for {date}. The next one is free from {when}. Would you like to reserve it then?",
+                        'parameters': {'next_available': next_start.isoformat()},
+                        'suggestions': ['Reserve next available', 'Try different date', 'Try different equipment']
+                    }
+                return {
+                    'message': f"Sorry, {equipment_type} is not available for {date}. Would you like to try a different date?",
+                    'parameters': {},
+                    'suggestions': ['Try different date', 'Try different equipment']
+                }
+            
+            result = equipment_inventory.reserve(user_id, equipment_type, date, duration, start, minutes)
+            remaining = f" ({units_free - 1} of {capacity} still available)"
+        else:
+            # Check availability
+            available = library_service.check_equipment_availability(equipment_type, date, duration)
+            
+            if not available:
+                return {
+                    'message': f"Sorry, {equipment_type} is not available for {date}. Would you like to try a different date?",
+                    'parameters': {},
+                    'suggestions': ['Try different date', 'Try different equipment']
+                }
+            
+            # Reserve equipment
+            result = library_service.reserve_equipment(user_id, equipment_type, date, duration)
+            remaining = ''
         
         if result.get('success'):
             return {
-                'message': f"Successfully reserved {equipment_type} for {date}. Confirmation: {result.get('confirmation_id')}",
+                'message': f"Successfully reserved {equipment_type} for {date}{remaining}. Confirmation: {result.get('confirmation_id')}",
                 'parameters': {'reservation_result': result}
             }
         else:
@@ -792,6 +1157,8 @@ def handle_equipment_reservation(
         }
 
 
+@timing.timed()
+@tracing.traced()
 def handle_event_registration(user_id: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
     """Handle event registrations."""
     try:
@@ -841,63 +1208,64 @@ def handle_event_registration(user_id: str, parameters: Dict[str, Any]) -> Dict[
         }
 
 
-def handle_help_faq(intent_name: str, parameters: Dict[str, Any], session_info: Dict[str, Any]) -> Dict[str, Any]:
+HELP_PROMPT = StaticReply(
+    message="I'm here to help! What would you like to know? I can help with library hours, policies, services, or answer general questions.",
+    parameters={},
+    suggestions=['Library hours', 'Borrowing policies', 'Services', 'Contact information']
+)
+HELP_ERROR = StaticReply(
+    message="I'm having trouble finding that information. Please try rephrasing your question or contact support.",
+    parameters={}
+)
+
+@timing.timed()
+@tracing.traced()
+def handle_help_faq(webhook_request: WebhookRequest) -> Dict[str, Any]:
     """Handle help and FAQ requests."""
+    parameters = webhook_request.parameters
     try:
         query = parameters.get('help_query', '') or parameters.get('faq_query', '')
         
         if not query:
-            return {
-                'message': "I'm here to help! What would you like to know? I can help with library hours, policies, services, or answer general questions.",
-                'parameters': {},
-                'suggestions': ['Library hours', 'Borrowing policies', 'Services', 'Contact information']
-            }
+            return HELP_PROMPT
+        popularity.record('faq', query)
         
-        # This would typically integrate with knowledge connector
-        # For now, handle common queries
-        query_lower = query.lower()
+        match = faq_index.search(query)
         
-        if 'hour' in query_lower:
-            return {
-                'message': "Library Hours:\nMonday-Friday: 9:00 AM - 9:00 PM\nSaturday: 10:00 AM - 6:00 PM\nSunday: 12:00 PM - 5:00 PM",
-                'parameters': {}
-            }
-        elif 'policy' in query_lower or 'borrow' in query_lower:
-            return {
-                'message': "Borrowing Policies:\n• Books: 3 weeks (2 renewals allowed)\n• DVDs: 1 week (1 renewal)\n• Maximum 20 items checked out\n• Fines: $0.25/day for overdue items",
-                'parameters': {}
-            }
-        elif 'contact' in query_lower:
+        if match and match['confidence'] >= FAQ_MIN_CONFIDENCE:
+            logger.info(f"FAQ match '{match['id']}' (score={match['score']}, confidence={match['confidence']})")
             return {
-                'message': "Contact Information:\nPhone: (555) 123-4567\nEmail: library@example.com\nAddress: 123 Library Street, City, State 12345",
-                'parameters': {}
+                'message': match['answer'],
+                'parameters': {'faq_id': match['id'], 'faq_confidence': match['confidence']}
             }
         else:
             return {
-                'message': f"I found information about '{query}'. For more details, please visit our website or contact us directly.",
+                'message': f"I couldn't find a specific answer about '{query}'. For more details, please visit our website or contact us directly.",
                 'parameters': {},
                 'suggestions': ['More information', 'Contact support', 'View website']
             }
             
     except Exception as e:
         logger.error(f"Error handling help request: {str(e)}")
-        return {
-            'message': "I'm having trouble finding that information. Please try rephrasing your question or contact support.",
-            'parameters': {}
-        }
+        return HELP_ERROR
 
 
-def handle_authentication(parameters: Dict[str, Any], session_info: Dict[str, Any]) -> Dict[str, Any]:
+LOGIN_PROMPT = StaticReply(
+    message="Please provide your member ID or username to log in.",
+    parameters={}
+)
+
+@timing.timed()
+@tracing.traced()
+def handle_authentication(webhook_request: WebhookRequest) -> Dict[str, Any]:
     """Handle user authentication."""
+    parameters = webhook_request.parameters
     try:
         user_id = parameters.get('user_id') or parameters.get('member_id')
         password = parameters.get('password', '')
         
         if not user_id:
-            return {
-                'message': "Please provide your member ID or username to log in.",
-                'parameters': {}
-            }
+            return LOGIN_PROMPT
         
         if not password:
             return {
@@ -942,28 +1310,31 @@ def handle_authentication(parameters: Dict[str, Any], session_info: Dict[str, An
 
                 # SMART RESUME LOGIC
                 # Check if there was a pending action before login
-                pending_tag = parameters.get('pending_tag') or session_info.get('parameters', {}).get('pending_tag')
+                pending_tag = parameters.get('pending_tag')
                 if pending_tag:
                     logger.info(f"Checking smart resume for pending tag: {pending_tag}")
                     
-                    # Merge session params with current params to ensure we have all context (like book_id)
-                    combined_params = {**session_info.get('parameters', {}), **parameters}
-                    combined_params['user_id'] = result.get('user_id') # Ensure authenticated user_id is used
+                    # Session params carry the context (like book_id); use the authenticated user_id
+                    combined_params = {**parameters, 'user_id': result.get('user_id')}
                     
                     # Dispatch to the pending handler
                     if pending_tag == 'account-holds':
                         follow_up_response = handle_holds(result.get('user_id'), combined_params)
-                        # Prepend a success login message to the action response
-                        follow_up_response['message'] = f"Welcome back, {result.get('name', 'User')}! \n\n" + follow_up_response.get('message', '')
-                        # Clear pending tag
-                        follow_up_response['parameters']['pending_tag'] = None
-                        return follow_up_response
                         
                     elif pending_tag == 'account-renew':
                         follow_up_response = handle_renewal(result.get('user_id'), combined_params)
-                        follow_up_response['message'] = f"Welcome back, {result.get('name', 'User')}! \n\n" + follow_up_response.get('message', '')
-                        follow_up_response['parameters']['pending_tag'] = None
-                        return follow_up_response
+                    
+                    else:
+                        follow_up_response = None
+                    
+                    if follow_up_response is not None:
+                        # Prepend a success login message and clear the pending tag
+                        # (merged into a new dict: handler replies may be shared templates)
+                        return {
+                            **follow_up_response,
+                            'message': f"Welcome back, {result.get('name', 'User')}! \n\n" + follow_up_response.get('message', ''),
+                            'parameters': {**follow_up_response.get('parameters', {}), 'pending_tag': None}
+                        }
 
                 return response
             except Exception:
@@ -992,47 +1363,36 @@ def handle_authentication(parameters: Dict[str, Any], session_info: Dict[str, An
         }
 
 
-def handle_default(parameters: Dict[str, Any], session_info: Dict[str, Any]) -> Dict[str, Any]:
+DEFAULT_REPLY = StaticReply(
+    message="I'm here to help you with library services. I can help you search for books, manage your account, make reservations, or answer questions. What would you like to do?",
+    parameters={},
+    suggestions=['Search books', 'View account', 'Make reservation', 'Get help']
+)
+
+@timing.timed()
+@tracing.traced()
+def handle_default(webhook_request: WebhookRequest) -> Dict[str, Any]:
     """Handle default/unrecognized requests."""
-    return {
-        'message': "I'm here to help you with library services. I can help you search for books, manage your account, make reservations, or answer questions. What would you like to do?",
-        'parameters': {},
-        'suggestions': ['Search books', 'View account', 'Make reservation', 'Get help']
-    }
+    return DEFAULT_REPLY
 
 
-def build_response(response: Dict[str, Any], session_info: Dict[str, Any]) -> Dict[str, Any]:
+@timing.timed()
+def build_response(response: Dict[str, Any], webhook_request: WebhookRequest) -> Dict[str, Any]:
     """
     Build DialogFlow CX compatible response.
     
     Args:
         response: Response dictionary from handler
-        session_info: Session information
+        webhook_request: Decoded request (its session parameters are carried over)
         
     Returns:
         DialogFlow CX response format
     """
-    messages = []
-    
-    # Add text message
-    if 'message' in response:
-        messages.append({
-            'text': {
-                'text': [response['message']]
-            }
-        })
-    
-    # Add rich response if available
-    if 'rich_response' in response:
-        messages.append(response['rich_response'])
-    
-    # Add quick replies if available
-    if 'suggestions' in response:
-        quick_replies = create_quick_reply_response(response['suggestions'])
-        messages.append(quick_replies)
+    # Static replies carry their messages prebuilt
+    messages = response.messages if isinstance(response, StaticReply) else create_messages(response)
     
     # Calculate merged parameters
-    final_parameters = {**session_info.get('parameters', {}), **response.get('parameters', {})}
+    final_parameters = {**webhook_request.parameters, **response.get('parameters', {})}
 
     # Handle Redirection via Parameters (The "CX Way")
     if 'redirect_to_flow' in response and response['redirect_to_flow'] == 'Authentication Flow':
@@ -1054,3 +1414,8 @@ def build_response(response: Dict[str, Any], session_info: Dict[str, Any]) -> Di
         result['targetPage'] = response['redirect_to_flow']
     
     return result
+
+
+# Optional warm-up while the instance starts (before the first turn is routed)
+if os.environ.get('WARM_UP_ON_START', 'false').lower() == 'true':
+    logger.info(f"Warm-up on start: {json.dumps(warm_up())}")
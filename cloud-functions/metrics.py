@@ -0,0 +1,335 @@
+"""
+Metrics - Prometheus text exposition for the webhook process
+Counters, gauges and histograms for requests, backend calls, fallbacks, caches and payload sizes.
+
+Metrics live in a process-wide registry and are rendered on demand by
+render(). Set METRICS_PORT to start a small HTTP listener in the webhook
+process for a local scraper; main.handle_metrics renders the same registry,
+but only for the process it runs in, so it is no use as a separate deployment.
+"""
+
+import re
+import logging
+import threading
+from typing import Dict, Any, Callable, Iterable, List, Optional, Tuple, TYPE_CHECKING
+
+import timing
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BYTES_BUCKETS = (256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072)
+
+# Label sets per metric before new ones are folded into 'other' (bounds
+# cardinality when clients send arbitrary tags or flow names)
+MAX_SERIES = 500
+
+# Path segments that identify a record rather than a route
+_ID_SEGMENT = re.compile(r'^(users|books)/(?!search$)[^/]+')
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[Any, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def endpoint_label(endpoint: str) -> str:
+    """Collapse record IDs out of an API endpoint ('users/u1/holds' -> 'users/{id}/holds')."""
+    return _ID_SEGMENT.sub(lambda m: f"{m.group(1)}/{{id}}", endpoint.strip('/'))
+
+
+class Counter:
+    """
+    Monotonic counter with labels.
+
+    Updates take no lock (see timing.Histogram): a concurrent increment can
+    very rarely be lost, which is acceptable for telemetry.
+    """
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels: Any, amount: float = 1) -> None:
+        """Increment the series for a label set."""
+        value = self._values.get(labels)
+        if value is None:
+            if len(self._values) >= MAX_SERIES:
+                labels = ('other',) * len(labels)
+            value = self._values.get(labels, 0)
+        self._values[labels] = value + amount
+
+    def mirror(self, value: float, *labels: Any) -> None:
+        """Set a series from a count maintained elsewhere (e.g. lru_cache statistics)."""
+        self._values[labels] = value
+
+    def value(self, *labels: Any) -> float:
+        """Current value of a series."""
+        return self._values.get(labels, 0)
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+            for labels, value in sorted(self._values.items())
+        ]
+
+
+class Gauge(Counter):
+    """Value that goes up and down, with labels (same lock-free updates as Counter)."""
+
+    kind = 'gauge'
+
+    def set(self, value: float, *labels: Any) -> None:
+        """Set the series for a label set."""
+        if labels not in self._values and len(self._values) >= MAX_SERIES:
+            labels = ('other',) * len(labels)
+        self._values[labels] = value
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels."""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple, List[float]] = {}
+
+    def observe(self, value: float, *labels: Any) -> None:
+        """Record one observation for a label set."""
+        series = self._series.get(labels)
+        if series is None:
+            if len(self._series) >= MAX_SERIES:
+                labels = ('other',) * len(labels)
+            # Per-bucket counts, then sum and count
+            series = self._series.setdefault(labels, [0] * (len(self.buckets) + 2))
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[index] += 1
+                break
+        series[-2] += value
+        series[-1] += 1
+
+    def samples(self) -> List[str]:
+        lines = []
+        for labels, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {int(series[-1])}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(series[-2])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {int(series[-1])}")
+        return lines
+
+
+class Registry:
+    """Named metrics, hooks that refresh them, and collectors that add lines at render time."""
+
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+        self._hooks: List[Callable[[], None]] = []
+        self._collectors: List[Callable[[], Iterable[str]]] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """Add a metric (returns the existing one if the name is taken)."""
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def add_hook(self, hook: Callable[[], None]) -> None:
+        """Add a callable run before each render (to mirror counts kept elsewhere)."""
+        with self._lock:
+            self._hooks.append(hook)
+
+    def add_collector(self, collector: Callable[[], Iterable[str]]) -> None:
+        """Add a callable returning complete exposition lines (HELP/TYPE included)."""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Render every metric in Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+            hooks = list(self._hooks)
+            collectors = list(self._collectors)
+        for hook in hooks:
+            try:
+                hook()
+            except Exception as e:
+                logger.error(f"Metrics hook failed: {str(e)}")
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        for collector in collectors:
+            try:
+                lines.extend(collector())
+            except Exception as e:
+                logger.error(f"Metrics collector failed: {str(e)}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+webhook_requests = REGISTRY.register(Counter(
+    'webhook_requests_total', 'Webhook requests by fulfillment tag, flow and outcome.', ('tag', 'flow', 'outcome')))
+webhook_latency = REGISTRY.register(Histogram(
+    'webhook_request_duration_seconds', 'Webhook request latency.', ('tag',)))
+webhook_response_bytes = REGISTRY.register(Histogram(
+    'webhook_response_bytes', 'Serialized webhook response size.', ('tag',), BYTES_BUCKETS))
+backend_requests = REGISTRY.register(Counter(
+    'library_api_requests_total', 'Library API calls by endpoint and outcome.', ('endpoint', 'method', 'outcome')))
+backend_latency = REGISTRY.register(Histogram(
+    'library_api_request_duration_seconds', 'Library API call latency.', ('endpoint',)))
+backend_fallbacks = REGISTRY.register(Counter(
+    'library_api_mock_fallbacks_total', 'Library API failures answered with mock data.', ('endpoint',)))
+branch_searches = REGISTRY.register(Counter(
+    'library_branch_searches_total', 'Federated branch searches by branch and outcome (ok, error, timeout or busy).',
+    ('branch', 'outcome')))
+backend_limits = REGISTRY.register(Gauge(
+    'library_api_concurrency_limit', 'Adaptive concurrency limit on library API calls by endpoint.', ('endpoint',)))
+backend_rejections = REGISTRY.register(Counter(
+    'library_api_rejections_total', 'Library API calls turned away by the concurrency limit.', ('endpoint',)))
+cache_requests = REGISTRY.register(Counter(
+    'cache_requests_total', 'Cache lookups by cache and result (hit or miss).', ('cache', 'result')))
+cache_backend_errors = REGISTRY.register(Counter(
+    'cache_backend_errors_total', 'Shared cache backend failures by backend and operation.', ('backend', 'operation')))
+cache_refreshes = REGISTRY.register(Counter(
+    'cache_refreshes_total', 'Background refreshes of stale catalog reads by endpoint and outcome (ok or error).',
+    ('endpoint', 'outcome')))
+cache_events = REGISTRY.register(Counter(
+    'cache_events_total', 'Catalog change events by type, source (push or sync) and result.', ('type', 'source', 'result')))
+capture_records = REGISTRY.register(Counter(
+    'webhook_capture_records_total', 'Captured requests by result (written, dropped or error).', ('result',)))
+
+
+def observe_request(tag: str, flow: str, outcome: str, seconds: float, body: Optional[bytes]) -> None:
+    """Record one webhook request and the size of its encoded (uncompressed) response."""
+    webhook_requests.inc(tag or '(none)', flow or '(none)', outcome)
+    webhook_latency.observe(seconds, tag or '(none)')
+    if body is not None:
+        webhook_response_bytes.observe(len(body), tag or '(none)')
+
+
+def observe_backend(endpoint: str, method: str, outcome: str, seconds: float) -> None:
+    """Record one library API call."""
+    label = endpoint_label(endpoint)
+    backend_requests.inc(label, method, outcome)
+    backend_latency.observe(seconds, label)
+
+
+def cache_hit(cache: str) -> None:
+    cache_requests.inc(cache, 'hit')
+
+
+def cache_miss(cache: str) -> None:
+    cache_requests.inc(cache, 'miss')
+
+
+def _stage_lines() -> List[str]:
+    """
+    Per-stage timing histograms from timing.py, re-bucketed to LATENCY_BUCKETS.
+
+    Only one webhook request in WEBHOOK_TIMING_EVERY_N records its stages;
+    the N is exported alongside, so totals can be scaled up to full traffic.
+    """
+    every_n = 'webhook_stage_sample_every_n'
+    name = 'webhook_stage_duration_seconds'
+    lines = [
+        f"# HELP {every_n} Webhook requests per request whose stages are recorded in {name}.",
+        f"# TYPE {every_n} gauge",
+        f"{every_n} {timing.EVERY_N}",
+        f"# HELP {name} Time spent per webhook stage (stages nest), for one request in {every_n}.",
+        f"# TYPE {name} histogram"
+    ]
+    for stage, hist in sorted(timing.stages().items()):
+        occupied = list(hist.buckets())
+        if not occupied:
+            continue
+        label = f'stage="{_escape(stage)}"'
+        position, cumulative = 0, 0
+        for bound in LATENCY_BUCKETS:
+            while position < len(occupied) and occupied[position][0] / 1e6 <= bound:
+                cumulative = occupied[position][1]
+                position += 1
+            lines.append(f'{name}_bucket{{{label},le="{_number(bound)}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{label},le="+Inf"}} {occupied[-1][1]}')
+        lines.append(f"{name}_sum{{{label}}} {_number(hist.total / 1e6)}")
+        lines.append(f"{name}_count{{{label}}} {occupied[-1][1]}")
+    return lines
+
+
+REGISTRY.add_collector(_stage_lines)
+
+
+def render() -> str:
+    """Current metrics in Prometheus text format."""
+    return REGISTRY.render()
+
+
+def start_http_server(port: int, host: str = '127.0.0.1') -> Optional['ThreadingHTTPServer']:
+    """
+    Serve /metrics from a daemon thread.
+
+    Args:
+        port: Port to listen on
+        host: Interface to bind (local scraping only by default)
+
+    Returns:
+        The server, or None if the port could not be bound
+    """
+    # Imported here: http.server is only needed when the listener is enabled
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class _MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        logger.warning(f"Metrics listener not started on {host}:{port}: {str(e)}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,646 @@
+"""
+Mock Backend - Stateful in-memory stand-in for the library API
+Dispatches endpoints through an exact route table and keeps state that writes change.
+
+By default it serves the small demo dataset (10 books, the demo user's
+checkouts, holds and fines). Set MOCK_CATALOG_SIZE / MOCK_USER_COUNT (and
+optionally MOCK_DATA_SEED) to generate a synthetic dataset instead; books are
+stored column-wise and users are materialized from the seed on first access,
+so catalogs and user bases in the millions stay cheap until they are touched.
+"""
+
+import os
+import re
+import random
+import bisect
+import logging
+import threading
+from array import array
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Callable, Tuple
+
+from room_availability import parse_time, parse_duration, parse_date
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+DEMO_BOOKS = [
+    ('The Great Gatsby', 'F. Scott Fitzgerald', '9780743273565', 'Fiction', 'Available', 'https://example.com/gatsby.jpg'),
+    ('To Kill a Mockingbird', 'Harper Lee', '9780061120084', 'Fiction', 'Available', 'https://example.com/mockingbird.jpg'),
+    ("Harry Potter and the Sorcerer's Stone", 'J.K. Rowling', '9780590353427', 'Fantasy', 'Checked Out', 'https://example.com/hp1.jpg'),
+    ('Harry Potter and the Chamber of Secrets', 'J.K. Rowling', '9780439064873', 'Fantasy', 'Available', 'https://example.com/hp2.jpg'),
+    ('The Hobbit', 'J.R.R. Tolkien', '9780547928227', 'Fantasy', 'Available', 'https://example.com/hobbit.jpg'),
+    ('1984', 'George Orwell', '9780451524935', 'Dystopian', 'Available', 'https://example.com/1984.jpg'),
+    ('Pride and Prejudice', 'Jane Austen', '9780141439518', 'Romance', 'Available', 'https://example.com/pride.jpg'),
+    ('Python Crash Course', 'Eric Matthes', '9781593279288', 'Technology', 'Available', 'https://example.com/python.jpg'),
+    ('Introduction to Algorithms', 'Thomas H. Cormen', '9780262033848', 'Technology', 'Reference Only', 'https://example.com/algo.jpg'),
+    ('Dune', 'Frank Herbert', '9780441172719', 'Sci-Fi', 'Checked Out', 'https://example.com/dune.jpg')
+]
+
+# Demo reading lists behind circulation/history (used to build recommendations)
+DEMO_READING_LISTS = {
+    'user123': ['1', '2', '7', '6'],
+    'user201': ['3', '4', '5'],
+    'user202': ['3', '4', '10'],
+    'user203': ['5', '10', '6'],
+    'user204': ['1', '7', '2'],
+    'user205': ['8', '9'],
+    'user206': ['8', '9', '6'],
+    'user207': ['4', '5', '3', '10']
+}
+
+TITLE_WORDS = (
+    'Silent River Winter Garden Shadow Empire Midnight Ocean Glass House Iron Crown Hidden City '
+    'Last Letter Golden Road Broken Star Forgotten Island Secret History Wild Heart Distant Shore '
+    'Northern Light Paper Moon Burning Sky Quiet War Lost Kingdom Crimson Tide Stone Circle'
+).split()
+FIRST_NAMES = 'Ada Ben Chloe Dev Elena Farah Gus Hana Ivan Jade Kofi Lena Milo Nora Omar Pia Quinn Ravi Sara Theo'.split()
+LAST_NAMES = 'Adams Brooks Chen Diaz Evans Fischer Garcia Hughes Ito Jensen Khan Lopez Moreau Novak Okafor Park'.split()
+GENRES = ['Fiction', 'Non-Fiction', 'Fantasy', 'Sci-Fi', 'Mystery', 'Romance', 'Technology', 'History', 'Biography', 'Dystopian']
+AVAILABILITY = ['Available'] * 14 + ['Checked Out'] * 5 + ['Reference Only']
+
+
+def _tokens(text: str) -> List[str]:
+    """Lowercase word tokens used by the search indexes."""
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+
+def _today() -> datetime:
+    return datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class _Catalog:
+    """
+    Column-oriented book catalog with token indexes for search.
+
+    Books are addressed by position; IDs are str(position + 1). Generated
+    books compute their ISBN and cover URL from the position instead of
+    storing them.
+    """
+
+    def __init__(self):
+        self.titles: List[str] = []
+        self.authors: List[str] = []
+        self.genres: List[str] = []
+        self.availability: List[str] = []
+        self.isbns: List[Optional[str]] = []
+        self.covers: List[Optional[str]] = []
+        self.isbn_index: Dict[str, int] = {}
+        self.title_index: Dict[str, int] = {}
+        self.field_postings: Dict[str, Dict[str, array]] = {'title': {}, 'author': {}, 'genre': {}}
+        self.field_vocab: Dict[str, List[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self.titles)
+
+    def add(self, title: str, author: str, genre: str, availability: str,
+            isbn: Optional[str] = None, cover: Optional[str] = None) -> int:
+        position = len(self.titles)
+        self.titles.append(title)
+        self.authors.append(author)
+        self.genres.append(genre)
+        self.availability.append(availability)
+        self.isbns.append(isbn)
+        self.covers.append(cover)
+        if isbn:
+            self.isbn_index[isbn] = position
+        self.title_index.setdefault(title.lower(), position)
+        for field, value in (('title', title), ('author', author), ('genre', genre)):
+            postings = self.field_postings[field]
+            for token in set(_tokens(value)):
+                bucket = postings.get(token)
+                if bucket is None:
+                    bucket = postings[token] = array('I')
+                bucket.append(position)
+        return position
+
+    def finalize(self) -> None:
+        """Sort each field's vocabulary for prefix lookups."""
+        self.field_vocab = {field: sorted(postings) for field, postings in self.field_postings.items()}
+
+    def isbn(self, position: int) -> str:
+        return self.isbns[position] or f"979{position + 1:010d}"
+
+    def book(self, position: int) -> Dict[str, Any]:
+        """Materialize a book dictionary."""
+        book_id = str(position + 1)
+        return {
+            'id': book_id,
+            'title': self.titles[position],
+            'author': self.authors[position],
+            'isbn': self.isbn(position),
+            'genre': self.genres[position],
+            'availability': self.availability[position],
+            'cover_image': self.covers[position] or f"https://example.com/covers/{book_id}.jpg"
+        }
+
+    def position(self, book_id: Any) -> Optional[int]:
+        """Position of a book ID, if it exists."""
+        try:
+            position = int(str(book_id)) - 1
+        except ValueError:
+            return None
+        return position if 0 <= position < len(self.titles) else None
+
+    def find(self, reference: Any) -> Optional[int]:
+        """Resolve a book from an ID, an ISBN or an exact title (the demo flow passes titles)."""
+        position = self.position(reference)
+        if position is not None:
+            return position
+        text = str(reference or '').strip()
+        if text in self.isbn_index:
+            return self.isbn_index[text]
+        if text.startswith('979') and len(text) == 13 and text.isdigit():
+            return self.position(int(text[3:]))
+        return self.title_index.get(text.lower())
+
+    def _field_matches(self, field: str, query: str) -> Optional[set]:
+        """Positions where every query token prefixes some token of the field."""
+        vocab = self.field_vocab.get(field, [])
+        postings = self.field_postings[field]
+        result = None
+        for token in sorted(set(_tokens(query)), key=len, reverse=True):
+            matches = set()
+            start = bisect.bisect_left(vocab, token)
+            for word in vocab[start:]:
+                if not word.startswith(token):
+                    break
+                matches.update(postings[word])
+            result = matches if result is None else result & matches
+            if not result:
+                return set()
+        return result
+
+    def search(self, title: str = '', author: str = '', genre: str = '', isbn: str = '',
+               limit: int = 25) -> List[Dict[str, Any]]:
+        """AND-search over the provided fields; no filters returns the first books."""
+        if isbn:
+            position = self.find(isbn)
+            return [self.book(position)] if position is not None else []
+
+        candidates = None
+        for field, query in (('title', title), ('author', author), ('genre', genre)):
+            if not query:
+                continue
+            matches = self._field_matches(field, query)
+            candidates = matches if candidates is None else candidates & matches
+            if not candidates:
+                return []
+
+        if candidates is None:
+            positions = range(min(limit, len(self.titles)))
+        else:
+            positions = sorted(candidates)[:limit]
+        return [self.book(p) for p in positions]
+
+
+class MockBackend:
+    """
+    Stateful in-memory library API.
+
+    Every endpoint is registered in an exact route table keyed by method and
+    path template, and reads reflect earlier writes (a placed hold appears in
+    get_holds, a booked room disappears from rooms/available, and so on).
+    """
+
+    def __init__(self, seed: Optional[int] = None, catalog_size: Optional[int] = None, user_count: Optional[int] = None):
+        """
+        Initialize the backend.
+
+        Args:
+            seed: Random seed for synthetic data (MOCK_DATA_SEED)
+            catalog_size: Synthetic catalog size, 0 for the demo catalog (MOCK_CATALOG_SIZE)
+            user_count: Synthetic user count, 0 for demo users only (MOCK_USER_COUNT)
+        """
+        self.seed = seed if seed is not None else int(os.environ.get('MOCK_DATA_SEED', '42'))
+        self.catalog_size = catalog_size if catalog_size is not None else int(os.environ.get('MOCK_CATALOG_SIZE', '0'))
+        self.user_count = user_count if user_count is not None else int(os.environ.get('MOCK_USER_COUNT', '0'))
+        self._lock = threading.RLock()
+        self._counter = 0
+
+        self.catalog = _Catalog()
+        for title, author, isbn, genre, availability, cover in DEMO_BOOKS:
+            self.catalog.add(title, author, genre, availability, isbn, cover)
+        if self.catalog_size > len(DEMO_BOOKS):
+            self._generate_catalog(self.catalog_size - len(DEMO_BOOKS))
+        self.catalog.finalize()
+
+        self.users: Dict[str, Dict[str, Any]] = {}
+        self.hold_queues: Dict[int, int] = {}
+        self.room_bookings: Dict[str, Dict[str, List[Dict[str, str]]]] = {}
+        self.equipment_reservations: Dict[str, List[Dict[str, Any]]] = {}
+        self.event_registrations: Dict[str, List[str]] = {}
+        self.rooms = [
+            {'id': 'room1', 'room_name': 'Study Room A', 'capacity': 4, 'amenities': ['Whiteboard', 'Projector'],
+             'open': '09:00', 'close': '21:00', 'bookings': [('10:00', '12:00'), ('14:00', '15:30')]},
+            {'id': 'room2', 'room_name': 'Study Room B', 'capacity': 6, 'amenities': ['Whiteboard'],
+             'open': '09:00', 'close': '21:00', 'bookings': [('09:00', '11:00'), ('13:00', '17:00')]}
+        ]
+        self.equipment = {'laptop': 3, 'projector': 2, 'camera': 1}
+        self._seed_equipment()
+        self.events = [
+            {'id': 'event1', 'title': 'Book Club Meeting', 'days_ahead': 3, 'time': '6:00 PM',
+             'image_url': 'https://example.com/events/bookclub.jpg', 'capacity': 30}
+        ]
+
+        self._static_routes: Dict[Tuple[str, str], Callable] = {}
+        self._param_routes: Dict[Tuple[str, int], List[Tuple[List[Optional[str]], Callable]]] = {}
+        for method, template, handler in (
+            ('GET', 'books/search', self._search_books),
+            ('GET', 'books/{book_id}', self._get_book),
+            ('POST', 'auth/login', self._login),
+            ('GET', 'users/{user_id}', self._get_user),
+            ('GET', 'users/{user_id}/checkouts', self._get_checkouts),
+            ('GET', 'users/{user_id}/holds', self._get_holds),
+            ('GET', 'users/{user_id}/fines', self._get_fines),
+            ('POST', 'checkouts/renew', self._renew),
+            ('POST', 'holds', self._place_hold),
+            ('POST', 'fines/pay', self._pay_fine),
+            ('GET', 'rooms/available', self._available_rooms),
+            ('GET', 'rooms/schedule', self._room_schedule),
+            ('POST', 'rooms/book', self._book_room),
+            ('GET', 'equipment/availability', self._equipment_availability),
+            ('GET', 'equipment/schedule', self._equipment_schedule),
+            ('POST', 'equipment/reserve', self._reserve_equipment),
+            ('GET', 'events/upcoming', self._upcoming_events),
+            ('POST', 'events/register', self._register_event),
+            ('GET', 'circulation/history', self._circulation_history)
+        ):
+            self._register(method, template, handler)
+
+    def _register(self, method: str, template: str, handler: Callable) -> None:
+        segments = template.split('/')
+        if not any(s.startswith('{') for s in segments):
+            self._static_routes[(method, template)] = handler
+            return
+        pattern = [None if s.startswith('{') else s for s in segments]
+        self._param_routes.setdefault((method, len(segments)), []).append((pattern, handler))
+
+    def handle(self, endpoint: str, method: str = 'GET', data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Serve one API call.
+
+        Literal routes win over parameterized ones, so 'books/search' never
+        reaches 'books/{book_id}' regardless of registration order.
+
+        Args:
+            endpoint: API endpoint (e.g. 'users/user123/holds')
+            method: HTTP method
+            data: Query parameters or JSON body
+
+        Returns:
+            Response dictionary (an 'error' response for unknown routes)
+        """
+        endpoint = endpoint.strip('/')
+        data = data or {}
+        handler = self._static_routes.get((method, endpoint))
+        args = []
+        if handler is None:
+            segments = endpoint.split('/')
+            for pattern, candidate in self._param_routes.get((method, len(segments)), ()):
+                if all(p is None or p == s for p, s in zip(pattern, segments)):
+                    handler = candidate
+                    args = [s for p, s in zip(pattern, segments) if p is None]
+                    break
+        if handler is None:
+            logger.warning(f"Mock backend has no route for {method} {endpoint}")
+            return {'success': False, 'error': f'No route for {method} {endpoint}'}
+        with self._lock:
+            return handler(*args, data)
+
+    # ------------------------------------------------------------------
+    # Synthetic data
+    # ------------------------------------------------------------------
+
+    def _generate_catalog(self, count: int) -> None:
+        rng = random.Random(self.seed)
+        authors = [f"{first} {last}" for first in FIRST_NAMES for last in LAST_NAMES]
+        words = TITLE_WORDS
+        add = self.catalog.add
+        for _ in range(count):
+            title = f"The {rng.choice(words)} {rng.choice(words)}"
+            if rng.random() < 0.3:
+                title += f" {rng.choice(['Returns', 'Rising', 'Chronicles', 'Volume II', 'Revisited'])}"
+            add(title, rng.choice(authors), rng.choice(GENRES), rng.choice(AVAILABILITY))
+
+    def _popular_position(self, rng: random.Random) -> int:
+        """Pick a book with skewed popularity (low positions circulate more)."""
+        return int(len(self.catalog) * rng.random() ** 3)
+
+    def _new_id(self, prefix: str) -> str:
+        self._counter += 1
+        return f"{prefix}{self._counter}"
+
+    def _user(self, user_id: str) -> Dict[str, Any]:
+        """Get a user's state, materializing it on first access."""
+        user_id = str(user_id)
+        user = self.users.get(user_id)
+        if user is not None:
+            return user
+
+        match = re.fullmatch(r'user(\d+)', user_id)
+        index = int(match.group(1)) if match else -1
+        if self.user_count and 0 <= index < self.user_count and user_id != 'user123':
+            user = self._generated_user(user_id, index)
+        else:
+            user = self._demo_user(user_id)
+        self.users[user_id] = user
+        return user
+
+    def _demo_user(self, user_id: str) -> Dict[str, Any]:
+        """The demo account (every unknown user sees it, as the demo expects)."""
+        today = _today()
+        return {
+            'profile': {'user_id': user_id, 'name': 'John Doe', 'email': 'john.doe@example.com',
+                        'member_id': 'M123456', 'status': 'Active'},
+            'checkouts': [{'id': '1', 'book_id': '1', 'title': 'The Great Gatsby',
+                           'due_date': (today + timedelta(days=7)).strftime('%Y-%m-%d'),
+                           'renewable': True, 'renewals': 0, 'cover_image': 'https://example.com/covers/gatsby.jpg'}],
+            'holds': [{'id': '1', 'book_id': '2', 'title': 'To Kill a Mockingbird', 'position': 3,
+                       'cover_image': 'https://example.com/covers/mockingbird.jpg'}],
+            'fines': [{'id': 'fine1', 'description': 'Overdue: The Great Gatsby', 'amount': 2.50, 'due_date': '2024-01-15'}]
+        }
+
+    def _generated_user(self, user_id: str, index: int) -> Dict[str, Any]:
+        """Deterministically generate a user's account from the seed."""
+        rng = random.Random(self.seed * 1000003 + index)
+        today = _today()
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        checkouts = []
+        for n in range(rng.choice([0, 1, 1, 2, 3, 5, 8])):
+            book = self.catalog.book(self._popular_position(rng))
+            due = today + timedelta(days=rng.randint(-10, 21))
+            checkouts.append({'id': f"{index}-c{n}", 'book_id': book['id'], 'title': book['title'],
+                              'due_date': due.strftime('%Y-%m-%d'), 'renewable': rng.random() < 0.8,
+                              'renewals': 0, 'cover_image': book['cover_image']})
+        holds = []
+        for n in range(rng.choice([0, 0, 1, 2, 3])):
+            book = self.catalog.book(self._popular_position(rng))
+            holds.append({'id': f"{index}-h{n}", 'book_id': book['id'], 'title': book['title'],
+                          'position': rng.randint(1, 12), 'cover_image': book['cover_image']})
+        fines = [
+            {'id': f"{index}-f{c['id']}", 'description': f"Overdue: {c['title']}",
+             'amount': round(0.25 * (today - datetime.strptime(c['due_date'], '%Y-%m-%d')).days, 2),
+             'due_date': c['due_date']}
+            for c in checkouts if c['due_date'] < today.strftime('%Y-%m-%d')
+        ]
+        return {
+            'profile': {'user_id': user_id, 'name': name,
+                        'email': f"{name.lower().replace(' ', '.')}{index}@example.com",
+                        'member_id': f"M{index:07d}", 'status': 'Active'},
+            'checkouts': checkouts,
+            'holds': holds,
+            'fines': fines
+        }
+
+    def _seed_equipment(self) -> None:
+        today = _today()
+        self.equipment_reservations = {
+            # All laptops are out until the day after tomorrow
+            'laptop': [
+                {'start': (today + timedelta(hours=9)).isoformat(),
+                 'end': (today + timedelta(days=2, hours=9 + i)).isoformat(), 'quantity': 1}
+                for i in range(3)
+            ],
+            'projector': [
+                {'start': (today + timedelta(days=1, hours=9)).isoformat(),
+                 'end': (today + timedelta(days=1, hours=17)).isoformat(), 'quantity': 1}
+            ],
+            'camera': []
+        }
+
+    # ------------------------------------------------------------------
+    # Catalog
+    # ------------------------------------------------------------------
+
+    def _search_books(self, data):
+        limit = int(data.get('limit', 25) or 25)
+        return {'books': self.catalog.search(
+            title=data.get('title', ''), author=data.get('author', ''),
+            genre=data.get('genre', ''), isbn=data.get('isbn', ''), limit=limit
+        )}
+
+    def _get_book(self, book_id, data):
+        position = self.catalog.position(book_id)
+        return {'book': self.catalog.book(position) if position is not None else {}}
+
+    def _circulation_history(self, data):
+        events = []
+        if self.user_count:
+            for index in range(self.user_count):
+                user = self._generated_user(f"user{index}", index)
+                for checkout in user['checkouts']:
+                    events.append({'user_id': f"user{index}", 'book_id': checkout['book_id'], 'event': 'checkout'})
+                for hold in user['holds']:
+                    events.append({'user_id': f"user{index}", 'book_id': hold['book_id'], 'event': 'hold'})
+        else:
+            for user_id, book_ids in DEMO_READING_LISTS.items():
+                for i, book_id in enumerate(book_ids):
+                    # Most recent item in each list is still on hold
+                    event = 'hold' if i == len(book_ids) - 1 and i > 1 else 'checkout'
+                    events.append({'user_id': user_id, 'book_id': book_id, 'event': event})
+        return {'events': events}
+
+    # ------------------------------------------------------------------
+    # Accounts
+    # ------------------------------------------------------------------
+
+    def _login(self, data):
+        user_id, password = data.get('user_id', ''), data.get('password', '')
+        if not user_id or not password:
+            return {'success': False, 'reason': 'Missing credentials'}
+        profile = self._user(user_id)['profile']
+        return {'success': True, 'user_id': user_id, 'name': profile['name'], 'email': profile['email']}
+
+    def _get_user(self, user_id, data):
+        user = self._user(user_id)
+        return {'user': {**user['profile'], 'checkout_count': len(user['checkouts']), 'hold_count': len(user['holds'])}}
+
+    def _get_checkouts(self, user_id, data):
+        return {'checkouts': [dict(c) for c in self._user(user_id)['checkouts']]}
+
+    def _get_holds(self, user_id, data):
+        return {'holds': [dict(h) for h in self._user(user_id)['holds']]}
+
+    def _get_fines(self, user_id, data):
+        return {'fines': [dict(f) for f in self._user(user_id)['fines']]}
+
+    def _renew(self, data):
+        user = self._user(data.get('user_id', ''))
+        reference = str(data.get('book_id', ''))
+        for checkout in user['checkouts']:
+            if reference in (checkout['book_id'], checkout['id']) or reference.lower() == checkout['title'].lower():
+                if not checkout.get('renewable') or checkout.get('renewals', 0) >= 2:
+                    return {'success': False, 'reason': 'This item has reached its renewal limit.'}
+                due = datetime.strptime(checkout['due_date'], '%Y-%m-%d') + timedelta(days=21)
+                checkout['due_date'] = due.strftime('%Y-%m-%d')
+                checkout['renewals'] = checkout.get('renewals', 0) + 1
+                return {'success': True, 'title': checkout['title'], 'new_due_date': checkout['due_date']}
+        return {'success': False, 'reason': "That book isn't checked out on your account."}
+
+    def _place_hold(self, data):
+        user = self._user(data.get('user_id', ''))
+        reference = data.get('book_id', '')
+        position = self.catalog.find(reference)
+        if position is not None:
+            book = self.catalog.book(position)
+            book_id, title, cover = book['id'], book['title'], book['cover_image']
+        else:
+            # In our demo flow, 'book_id' often contains a title the catalog doesn't know
+            book_id, title, cover = str(reference), str(reference or 'Requested Book'), ''
+        for hold in user['holds']:
+            if hold['book_id'] == book_id:
+                return {'success': True, 'hold_id': hold['id'], 'title': title, 'position': hold['position']}
+        queue = self.hold_queues.get(position, 0) + 1 if position is not None else 1
+        if position is not None:
+            self.hold_queues[position] = queue
+        hold = {'id': self._new_id('hold'), 'book_id': book_id, 'title': title, 'position': queue, 'cover_image': cover}
+        user['holds'].append(hold)
+        return {'success': True, 'hold_id': hold['id'], 'title': title, 'position': queue}
+
+    def _pay_fine(self, data):
+        user = self._user(data.get('user_id', ''))
+        try:
+            amount = float(data.get('amount', 0))
+        except (TypeError, ValueError):
+            return {'success': False, 'reason': 'Invalid amount.'}
+        for fine in user['fines']:
+            if fine['id'] == data.get('fine_id'):
+                if amount <= 0:
+                    return {'success': False, 'reason': 'Invalid amount.'}
+                fine['amount'] = round(fine['amount'] - amount, 2)
+                if fine['amount'] <= 0:
+                    user['fines'].remove(fine)
+                return {'success': True, 'transaction_id': self._new_id('TXN'), 'amount': amount}
+        return {'success': False, 'reason': 'Fine not found.'}
+
+    # ------------------------------------------------------------------
+    # Rooms
+    # ------------------------------------------------------------------
+
+    def _room_bookings(self, room: Dict[str, Any], date: str) -> List[Dict[str, str]]:
+        booked = self.room_bookings.get(date, {}).get(room['id'], [])
+        return [{'start': s, 'end': e} for s, e in room['bookings']] + booked
+
+    def _room_is_free(self, room: Dict[str, Any], date: str, start: int, end: int) -> bool:
+        if start < parse_time(room['open']) or end > parse_time(room['close']):
+            return False
+        return all(
+            end <= parse_time(b['start']) or start >= parse_time(b['end'])
+            for b in self._room_bookings(room, date)
+        )
+
+    def _slot(self, data) -> Optional[Tuple[str, int, int]]:
+        start, minutes = parse_time(data.get('time')), parse_duration(data.get('duration'))
+        if start is None or not minutes:
+            return None
+        return parse_date(data.get('date')), start, start + minutes
+
+    @staticmethod
+    def _room_info(room):
+        return {key: room[key] for key in ('id', 'room_name', 'capacity', 'amenities')}
+
+    def _available_rooms(self, data):
+        slot = self._slot(data)
+        if slot is None:
+            return {'rooms': [self._room_info(r) for r in self.rooms]}
+        return {'rooms': [self._room_info(r) for r in self.rooms if self._room_is_free(r, *slot)]}
+
+    def _room_schedule(self, data):
+        date = parse_date(data.get('date'))
+        return {'rooms': [
+            {**self._room_info(r), 'open': r['open'], 'close': r['close'], 'bookings': self._room_bookings(r, date)}
+            for r in self.rooms
+        ]}
+
+    def _book_room(self, data):
+        room = next((r for r in self.rooms if r['id'] == data.get('room_id')), None)
+        if room is None:
+            return {'success': False, 'reason': 'Unknown room.'}
+        slot = self._slot(data)
+        if slot is not None:
+            date, start, end = slot
+            if not self._room_is_free(room, date, start, end):
+                return {'success': False, 'reason': 'That room is already booked at that time.'}
+            self.room_bookings.setdefault(date, {}).setdefault(room['id'], []).append({
+                'start': f"{start // 60:02d}:{start % 60:02d}", 'end': f"{end // 60:02d}:{end % 60:02d}"
+            })
+        return {'success': True, 'confirmation_id': self._new_id('BOOK'), 'room_name': room['room_name']}
+
+    # ------------------------------------------------------------------
+    # Equipment
+    # ------------------------------------------------------------------
+
+    def _equipment_window(self, data) -> Tuple[datetime, datetime]:
+        day = parse_date(data.get('date'))
+        start = (datetime.strptime(day, '%Y-%m-%d') if day else _today()) + timedelta(hours=9)
+        return start, start + timedelta(minutes=parse_duration(data.get('duration')) or 24 * 60)
+
+    def _equipment_in_use(self, equipment_type: str, start: datetime, end: datetime) -> int:
+        """Peak number of units reserved at any moment in [start, end)."""
+        points = []
+        for r in self.equipment_reservations.get(equipment_type, []):
+            r_start, r_end = datetime.fromisoformat(r['start']), datetime.fromisoformat(r['end'])
+            if r_start < end and r_end > start:
+                points.append((max(r_start, start), r.get('quantity', 1)))
+                points.append((min(r_end, end), -r.get('quantity', 1)))
+        peak = current = 0
+        for _, change in sorted(points, key=lambda p: (p[0], p[1])):
+            current += change
+            peak = max(peak, current)
+        return peak
+
+    def _equipment_availability(self, data):
+        equipment_type = data.get('equipment_type', '').lower()
+        start, end = self._equipment_window(data)
+        capacity = self.equipment.get(equipment_type, 0)
+        return {'available': capacity > self._equipment_in_use(equipment_type, start, end)}
+
+    def _equipment_schedule(self, data):
+        equipment_type = data.get('equipment_type', '').lower()
+        return {
+            'capacity': self.equipment.get(equipment_type, 0),
+            'reservations': [dict(r) for r in self.equipment_reservations.get(equipment_type, [])]
+        }
+
+    def _reserve_equipment(self, data):
+        equipment_type = data.get('equipment_type', 'laptop').lower()
+        start, end = self._equipment_window(data)
+        capacity = self.equipment.get(equipment_type)
+        if capacity is not None:
+            if self._equipment_in_use(equipment_type, start, end) >= capacity:
+                return {'success': False, 'reason': f'No {equipment_type} units are free for that period.'}
+            self.equipment_reservations.setdefault(equipment_type, []).append({
+                'start': start.isoformat(), 'end': end.isoformat(), 'quantity': 1,
+                'user_id': data.get('user_id')
+            })
+        return {'success': True, 'confirmation_id': self._new_id('EQ'), 'equipment_type': equipment_type}
+
+    # ------------------------------------------------------------------
+    # Events
+    # ------------------------------------------------------------------
+
+    def _upcoming_events(self, data):
+        today = _today()
+        return {'events': [
+            {'id': e['id'], 'title': e['title'],
+             'date': (today + timedelta(days=e['days_ahead'])).strftime('%Y-%m-%d'),
+             'time': e['time'], 'image_url': e['image_url'],
+             'spots_left': e['capacity'] - len(self.event_registrations.get(e['id'], []))}
+            for e in self.events
+        ]}
+
+    def _register_event(self, data):
+        reference = str(data.get('event_id', ''))
+        event = next((e for e in self.events if reference in (e['id'], e['title']) or reference.lower() == e['title'].lower()), None)
+        if event is None:
+            # The demo flow passes free-text event names; register for the only event
+            event = self.events[0]
+        registered = self.event_registrations.setdefault(event['id'], [])
+        user_id = data.get('user_id')
+        if user_id not in registered:
+            if len(registered) >= event['capacity']:
+                return {'success': False, 'reason': 'This event is full.'}
+            registered.append(user_id)
+        return {'success': True, 'confirmation_id': self._new_id('EVENT'), 'event_title': event['title']}
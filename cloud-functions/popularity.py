@@ -0,0 +1,340 @@
+"""
+Popularity - Heavy-hitter tracking of catalog and FAQ queries, and a cache warmer driven by it
+Counts searched titles, authors and genres, viewed books and FAQ questions in constant memory.
+
+Each kind of key has a Space-Saving summary (Metwally et al.) of
+POPULARITY_CAPACITY counters: a key that is not tracked replaces the least
+counted one and inherits its count as its error bound, so any key seen more
+than 1/capacity of the time is always tracked, and each update is O(1).
+Counts are halved every POPULARITY_HALF_LIFE seconds so the summary follows
+what is popular now.
+
+Every POPULARITY_INTERVAL seconds (checked on webhook turns) the summaries
+are written to POPULARITY_FILE and the top POPULARITY_TOP_K keys of each
+kind are warmed: searches and book details through the catalog cache (when
+LIBRARY_CACHE is on) and questions through the FAQ index's cache. The run
+is spread over the following turns, POPULARITY_STEPS_PER_TURN steps each. A new instance reads the file at startup and warms
+from it in main.warm_up. The most viewed and searched books also become the
+suggestions of the empty search prompt.
+
+Off unless POPULARITY_TRACKING=true.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+KINDS = ('title', 'author', 'genre', 'book', 'faq')
+DEFAULT_PATH = '/tmp/library-popularity.json'
+# Trending books suggested by the empty search prompt
+TRENDING_SIZE = 3
+
+
+def _key(value: Any) -> str:
+    """Counter key of a query value: whitespace collapsed, casefolded."""
+    return ' '.join(str(value).split()).casefold()
+
+
+class SpaceSaving:
+    """
+    Space-Saving top-k summary with at most capacity counters.
+
+    Counters are grouped in buckets by count and the smallest count is
+    tracked, so adding a key (and evicting the least counted one) is O(1).
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self._counts: Dict[str, int] = {}
+        self._errors: Dict[str, int] = {}
+        # count -> keys with that count, oldest first
+        self._buckets: Dict[int, Dict[str, None]] = {}
+        self._min = 0
+
+    def _unbucket(self, key: str, count: int) -> None:
+        bucket = self._buckets[count]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[count]
+
+    def add(self, key: str) -> Optional[str]:
+        """
+        Count one occurrence of a key.
+
+        Returns:
+            The key evicted to make room, if any
+        """
+        evicted = None
+        count = self._counts.get(key)
+        if count is None:
+            if len(self._counts) < self.capacity:
+                count = 0
+                self._errors[key] = 0
+            else:
+                count = self._min
+                evicted = next(iter(self._buckets[count]))
+                self._unbucket(evicted, count)
+                del self._counts[evicted], self._errors[evicted]
+                self._errors[key] = count
+        else:
+            self._unbucket(key, count)
+        self._counts[key] = count + 1
+        self._buckets.setdefault(count + 1, {})[key] = None
+        if count == 0:
+            self._min = 1
+        elif self._min not in self._buckets:
+            self._min = count + 1
+        return evicted
+
+    def top(self, k: int) -> List[Tuple[str, int, int]]:
+        """The k most counted keys as (key, count, error), most counted first."""
+        ranked = sorted(self._counts.items(), key=lambda item: -item[1])[:k]
+        return [(key, count, self._errors[key]) for key, count in ranked]
+
+    def load(self, entries: List[Tuple[str, int, int]]) -> None:
+        """Replace the counters (the most counted entries that fit)."""
+        self._counts, self._errors, self._buckets = {}, {}, {}
+        for key, count, error in sorted(entries, key=lambda entry: -entry[1])[:self.capacity]:
+            if count > 0 and key not in self._counts:
+                self._counts[key] = int(count)
+                self._errors[key] = min(int(error), int(count))
+                self._buckets.setdefault(int(count), {})[key] = None
+        self._min = min(self._buckets) if self._buckets else 0
+
+    def halve(self) -> None:
+        """Halve every count (keys whose count drops to 0 are forgotten)."""
+        self.load([(key, count // 2, self._errors[key] // 2) for key, count in self._counts.items()])
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._counts
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+
+class Popularity:
+    """Heavy-hitter summaries per kind, their persistence and the warmer they drive."""
+
+    def __init__(
+        self,
+        enabled: Optional[bool] = None,
+        path: Optional[str] = None,
+        capacity: Optional[int] = None,
+        top_k: Optional[int] = None,
+        interval: Optional[float] = None,
+        half_life: Optional[float] = None,
+        steps_per_turn: Optional[int] = None
+    ):
+        """
+        Initialize the summaries and load the persisted counts, if any.
+
+        Args:
+            enabled: Track at all (default: POPULARITY_TRACKING)
+            path: File the counts are saved to (default: POPULARITY_FILE)
+            capacity: Counters per kind (default: POPULARITY_CAPACITY, 200)
+            top_k: Keys warmed per kind (default: POPULARITY_TOP_K, 20)
+            interval: Seconds between save-and-warm runs (default: POPULARITY_INTERVAL, 300)
+            half_life: Seconds after which counts are halved (default: POPULARITY_HALF_LIFE, 86400)
+            steps_per_turn: Run steps done per webhook turn (default: POPULARITY_STEPS_PER_TURN, 2)
+        """
+        if enabled is None:
+            enabled = os.environ.get('POPULARITY_TRACKING', 'false').lower() == 'true'
+        self.enabled = enabled
+        self.path = path if path is not None else os.environ.get('POPULARITY_FILE', DEFAULT_PATH)
+        capacity = capacity if capacity is not None else int(os.environ.get('POPULARITY_CAPACITY', '200'))
+        self.top_k = top_k if top_k is not None else int(os.environ.get('POPULARITY_TOP_K', '20'))
+        self.interval = interval if interval is not None else float(os.environ.get('POPULARITY_INTERVAL', '300'))
+        self.half_life = half_life if half_life is not None else float(os.environ.get('POPULARITY_HALF_LIFE', '86400'))
+        if steps_per_turn is None:
+            steps_per_turn = int(os.environ.get('POPULARITY_STEPS_PER_TURN', '2'))
+        self.steps_per_turn = max(1, steps_per_turn)
+        self.summaries = {kind: SpaceSaving(capacity) for kind in KINDS}
+        # Last spelling seen of each tracked key (searches are sent as typed)
+        self.labels: Dict[str, Dict[str, str]] = {kind: {} for kind in KINDS}
+        self.trending: Tuple[str, ...] = ()
+        self._halved_at = time.time()
+        # The first run waits a full interval: main.warm_up warms a new instance
+        self._next_run = time.monotonic() + self.interval
+        # Steps of the run in progress, advanced by tick under _stepping
+        self._steps: Optional[Iterator[bool]] = None
+        self._stepping = threading.Lock()
+        self._lock = threading.Lock()
+        if self.enabled:
+            self.load()
+
+    def record(self, kind: str, value: Any) -> None:
+        """Count one query of a kind ('title', 'author', 'genre', 'book' or 'faq'); empty values are ignored."""
+        if not self.enabled or not value:
+            return
+        label = ' '.join(str(value).split())
+        key = _key(label)
+        with self._lock:
+            evicted = self.summaries[kind].add(key)
+            labels = self.labels[kind]
+            if evicted is not None:
+                labels.pop(evicted, None)
+            labels[key] = label
+
+    def top(self, kind: str, k: Optional[int] = None) -> List[Tuple[str, int]]:
+        """The most counted queries of a kind as (spelling last seen, count)."""
+        with self._lock:
+            ranked = self.summaries[kind].top(self.top_k if k is None else k)
+            labels = self.labels[kind]
+            return [(labels.get(key, key), count) for key, count, _ in ranked]
+
+    def save(self) -> bool:
+        """Write the counts to the file (atomically); False if it could not be written."""
+        with self._lock:
+            state = {
+                'saved_at': time.time(),
+                'halved_at': self._halved_at,
+                'kinds': {
+                    kind: [[self.labels[kind].get(key, key), count, error] for key, count, error in summary.top(len(summary))]
+                    for kind, summary in self.summaries.items()
+                }
+            }
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(temporary, 'w', encoding='utf-8') as f:
+                json.dump(state, f, separators=(',', ':'))
+            os.replace(temporary, self.path)
+            return True
+        except OSError as e:
+            logger.warning(f"Could not save popularity counts to {self.path}: {str(e)}")
+            return False
+
+    def load(self) -> bool:
+        """Replace the counts with the file's, if it exists and is readable."""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            kinds = state['kinds']
+            with self._lock:
+                for kind, summary in self.summaries.items():
+                    entries = [(_key(label), count, error) for label, count, error in kinds.get(kind, [])]
+                    summary.load(entries)
+                    self.labels[kind] = {_key(label): label for label, _, _ in kinds.get(kind, []) if _key(label) in summary}
+                self._halved_at = float(state.get('halved_at', time.time()))
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable popularity file {self.path}: {str(e)}")
+            return False
+        logger.info(f"Loaded popularity counts from {self.path}")
+        return True
+
+    def _decay(self) -> None:
+        """Halve the counts for every half-life elapsed since the last halving."""
+        now = time.time()
+        with self._lock:
+            while self.half_life > 0 and now - self._halved_at >= self.half_life:
+                for kind, summary in self.summaries.items():
+                    summary.halve()
+                    self.labels[kind] = {key: label for key, label in self.labels[kind].items() if key in summary}
+                self._halved_at += self.half_life
+
+    def warm(self, library_service, faq_index, recommendation_table) -> Dict[str, Any]:
+        """
+        Warm the caches for the top keys of every kind and refresh the trending books.
+
+        Catalog reads are only made when the catalog cache is on (there is
+        nothing to warm otherwise); trending titles come from the
+        recommendation table, or from the warmed book details.
+
+        Returns:
+            Keys warmed per kind
+        """
+        report: Dict[str, Any] = {}
+        for _ in self._warming(library_service, faq_index, recommendation_table, report):
+            pass
+        return report
+
+    def _warming(self, library_service, faq_index, recommendation_table, report: Dict[str, Any]) -> Iterator[None]:
+        """Do the work of warm, pausing after each cache read so tick can spread it over turns."""
+        cached = library_service.cache is not None
+        candidates: List[Tuple[int, str]] = []
+        for kind in ('title', 'author', 'genre'):
+            top = self.top(kind)
+            if cached:
+                for label, _ in top:
+                    library_service.search_books(**{kind: label})
+                    yield
+            report[kind] = len(top) if cached else 0
+            if kind == 'title':
+                candidates += [(count, recommendation_table.resolve_book_id(title=label)) for label, count in top]
+        top = self.top('book')
+        for book_id, count in top:
+            candidates.append((count, book_id))
+            if cached:
+                library_service.get_book_details(book_id)
+                yield
+        report['book'] = len(top) if cached else 0
+        top = self.top('faq')
+        for query, _ in top:
+            faq_index.search(query)
+            yield
+        report['faq'] = len(top)
+
+        trending, seen = [], set()
+        for _, book_id in sorted((c for c in candidates if c[1]), key=lambda c: -c[0]):
+            book = recommendation_table.books.get(str(book_id))
+            if book is None and cached:
+                book = library_service.get_book_details(book_id)
+            title = (book or {}).get('title')
+            if title and title not in seen:
+                seen.add(title)
+                trending.append(title)
+            if len(trending) == TRENDING_SIZE:
+                break
+        self.trending = tuple(trending)
+        report['trending'] = list(self.trending)
+
+    def tick(self, library_service, faq_index, recommendation_table) -> bool:
+        """
+        Advance the save-and-warm run by a few steps if one is due (cheap otherwise).
+
+        Cloud Functions throttles an instance's CPU once it has replied, so the
+        run is not left to a background thread: each turn does at most
+        POPULARITY_STEPS_PER_TURN steps of it (the save, or one cache read)
+        on the request path. A turn that finds another turn stepping the run
+        skips it rather than wait.
+
+        Returns:
+            True if this turn did part of a run
+        """
+        if not self.enabled or (self._steps is None and time.monotonic() < self._next_run):
+            return False
+        if not self._stepping.acquire(blocking=False):
+            return False
+        try:
+            if self._steps is None:
+                if time.monotonic() < self._next_run:
+                    return False
+                self._next_run = time.monotonic() + self.interval
+                self._steps = self._run(library_service, faq_index, recommendation_table)
+            for _ in range(self.steps_per_turn):
+                if next(self._steps, True):
+                    self._steps = None
+                    break
+            return True
+        finally:
+            self._stepping.release()
+
+    def _run(self, library_service, faq_index, recommendation_table) -> Iterator[bool]:
+        """One save-and-warm run as steps; yields False after each and True when done."""
+        try:
+            self._decay()
+            self.save()
+            yield False
+            report: Dict[str, Any] = {}
+            for _ in self._warming(library_service, faq_index, recommendation_table, report):
+                yield False
+            logger.info(f"Warmed popular keys: {json.dumps(report)}")
+        except Exception as e:
+            logger.error(f"Popularity warm-up failed: {str(e)}")
+        yield True
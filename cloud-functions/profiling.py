@@ -0,0 +1,252 @@
+"""
+Profiling - Opt-in request profiler for the webhook
+Profiles every Nth webhook call (or calls carrying a profiling header) and writes per-tag output.
+
+Modes (PROFILE_MODE):
+    off            Default; the wrapper only checks a flag.
+    sample         A sampler thread records the request thread's stack every
+                   PROFILE_INTERVAL_MS and merges it into
+                   <PROFILE_DIR>/<tag>.collapsed (flamegraph.pl / speedscope input).
+    deterministic  cProfile for the request, written to
+                   <PROFILE_DIR>/<tag>/<time>-<n>.prof (pstats format).
+                   One request at a time: a selected call that overlaps a
+                   profiled one runs unprofiled (Python 3.12+ refuses a
+                   second active profiler).
+
+PROFILE_EVERY_N picks which calls are profiled. If PROFILE_TOKEN is set, a
+request with header 'X-Profile-Request: <token>' is profiled regardless of
+the rate (in sample mode when PROFILE_MODE is off). Output stops once
+PROFILE_DIR holds PROFILE_MAX_BYTES.
+"""
+
+import os
+import re
+import sys
+import time
+import cProfile
+import logging
+import itertools
+import threading
+from collections import Counter
+from functools import wraps
+from typing import Dict, Callable, Optional
+
+import codec
+
+logger = logging.getLogger(__name__)
+
+MODE = os.environ.get('PROFILE_MODE', 'off').lower()
+EVERY_N = max(1, int(os.environ.get('PROFILE_EVERY_N', '100')))
+TOKEN = os.environ.get('PROFILE_TOKEN', '')
+PROFILE_DIR = os.environ.get('PROFILE_DIR', '/tmp/webhook-profiles')
+MAX_BYTES = int(os.environ.get('PROFILE_MAX_BYTES', str(50 * 1024 * 1024)))
+INTERVAL = float(os.environ.get('PROFILE_INTERVAL_MS', '1')) / 1000.0
+MAX_STACKS = int(os.environ.get('PROFILE_MAX_STACKS', '10000'))
+HEADER = 'X-Profile-Request'
+
+_SAFE_NAME = re.compile(r'[^A-Za-z0-9_.-]+')
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class _Sampler(threading.Thread):
+    """Samples one thread's Python stack at a fixed interval, from root_code down."""
+
+    def __init__(self, target_ident: int, interval: float, root_code=None):
+        super().__init__(name='webhook-profiler', daemon=True)
+        self.target_ident = target_ident
+        self.interval = interval
+        self.root_code = root_code
+        self.stacks: Counter = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.target_ident)
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                if frame.f_code is self.root_code:
+                    break
+                frame = frame.f_back
+            if labels:
+                self.stacks[';'.join(reversed(labels))] += 1
+
+    def stop(self) -> Counter:
+        self._stop_event.set()
+        self.join()
+        return self.stacks
+
+
+class RequestProfiler:
+    """Decides which calls to profile, runs the profiler and writes capped output."""
+
+    def __init__(
+        self,
+        mode: str = MODE,
+        every_n: int = EVERY_N,
+        token: str = TOKEN,
+        directory: str = PROFILE_DIR,
+        max_bytes: int = MAX_BYTES,
+        interval: float = INTERVAL
+    ):
+        self.mode = mode
+        self.every_n = max(1, every_n)
+        self.token = token
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self._calls = 0
+        self._sequence = itertools.count(1)
+        self._written = 0
+        self._stacks: Dict[str, Counter] = {}
+        self._active_samplers = 0
+        self._switch_interval = sys.getswitchinterval()
+        self._lock = threading.Lock()
+        # Held while a cProfile is enabled
+        self._deterministic = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        """Whether any call can be profiled."""
+        return self.mode != 'off' or bool(self.token)
+
+    def select(self, request) -> Optional[str]:
+        """Profiling mode for this call, or None to run it unprofiled."""
+        if self.token:
+            headers = getattr(request, 'headers', None) or {}
+            if headers.get(HEADER) == self.token:
+                return self.mode if self.mode != 'off' else 'sample'
+        if self.mode == 'off':
+            return None
+        self._calls += 1
+        return self.mode if self._calls % self.every_n == 0 else None
+
+    def _has_room(self, size: int) -> bool:
+        with self._lock:
+            if self._written + size > self.max_bytes:
+                return False
+            self._written += size
+            return True
+
+    def run(self, mode: str, tag: str, fn: Callable, *args, **kwargs):
+        """Call fn under the chosen profiler and record the output for tag."""
+        if mode == 'deterministic':
+            if not self._deterministic.acquire(blocking=False):
+                logger.debug(f"Another request is being profiled; running {tag} unprofiled")
+                return fn(*args, **kwargs)
+            try:
+                profiler = cProfile.Profile()
+                try:
+                    profiler.enable()
+                except ValueError as e:
+                    # A profiler this class does not own (e.g. one wrapping the process)
+                    logger.warning(f"Could not profile {tag}: {str(e)}")
+                    return fn(*args, **kwargs)
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    profiler.disable()
+                    self._write_pstats(tag, profiler)
+            finally:
+                self._deterministic.release()
+
+        sampler = _Sampler(threading.get_ident(), self.interval, getattr(fn, '__code__', None))
+        self._begin_sampling()
+        sampler.start()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            stacks = sampler.stop()
+            self._end_sampling()
+            self._merge_stacks(tag, stacks)
+
+    def _begin_sampling(self) -> None:
+        # The sampler needs the GIL at least once per interval
+        with self._lock:
+            self._active_samplers += 1
+            if self._active_samplers == 1:
+                self._switch_interval = sys.getswitchinterval()
+                sys.setswitchinterval(min(self._switch_interval, self.interval / 2))
+
+    def _end_sampling(self) -> None:
+        with self._lock:
+            self._active_samplers -= 1
+            if self._active_samplers == 0:
+                sys.setswitchinterval(self._switch_interval)
+
+    def _write_pstats(self, tag: str, profiler: cProfile.Profile) -> None:
+        directory = os.path.join(self.directory, tag)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"{time.strftime('%Y%m%dT%H%M%S')}-{next(self._sequence)}.prof")
+            profiler.dump_stats(path)
+            if not self._has_room(os.path.getsize(path)):
+                os.remove(path)
+                logger.warning(f"Profile output cap reached ({self.max_bytes} bytes); dropped {path}")
+        except OSError as e:
+            logger.error(f"Could not write profile for {tag}: {str(e)}")
+
+    def _merge_stacks(self, tag: str, stacks: Counter) -> None:
+        if not stacks:
+            return
+        with self._lock:
+            merged = self._stacks.setdefault(tag, Counter())
+            for stack, count in stacks.items():
+                if stack in merged or len(merged) < MAX_STACKS:
+                    merged[stack] += count
+            lines = [f"{stack} {count}\n" for stack, count in merged.items()]
+        body = ''.join(lines)
+        path = os.path.join(self.directory, f"{tag}.collapsed")
+        try:
+            previous = os.path.getsize(path) if os.path.exists(path) else 0
+            if not self._has_room(max(0, len(body) - previous)):
+                logger.warning(f"Profile output cap reached ({self.max_bytes} bytes); not updating {path}")
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(body)
+        except OSError as e:
+            logger.error(f"Could not write profile for {tag}: {str(e)}")
+
+
+_profiler = RequestProfiler()
+
+
+def profiler() -> RequestProfiler:
+    """The process-wide request profiler."""
+    return _profiler
+
+
+def configure(instance: RequestProfiler) -> None:
+    """Replace the process-wide profiler (e.g. from a benchmark)."""
+    global _profiler
+    _profiler = instance
+
+
+def _request_tag(request) -> str:
+    try:
+        body = codec.request_json(request) or {}
+        tag = (body.get('fulfillmentInfo') or {}).get('tag') or 'untagged'
+    except Exception:
+        tag = 'untagged'
+    return _SAFE_NAME.sub('_', str(tag))[:64]
+
+
+def profiled_request() -> Callable:
+    """Decorator for the webhook entry point that profiles selected calls."""
+    def decorator(fn: Callable) -> Callable:
+        @wraps(fn)
+        def wrapper(request, *args, **kwargs):
+            current = _profiler
+            if not current.active:
+                return fn(request, *args, **kwargs)
+            mode = current.select(request)
+            if mode is None:
+                return fn(request, *args, **kwargs)
+            return current.run(mode, _request_tag(request), fn, request, *args, **kwargs)
+        return wrapper
+    return decorator
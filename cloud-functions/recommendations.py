@@ -0,0 +1,281 @@
+"""
+Recommendation Engine - Item-item recommendations from circulation history
+Builds similarity tables offline and serves them from memory at request time.
+"""
+
+import os
+import json
+import logging
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Iterable
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'recommendations.json')
+
+# Relative weight of each circulation event when building the user-item matrix
+EVENT_WEIGHTS = {
+    'checkout': 1.0,
+    'hold': 0.5
+}
+
+
+def normalize_title(title: str) -> str:
+    """Normalize a book title for lookup (case and whitespace insensitive)."""
+    return ' '.join(str(title).lower().split())
+
+
+class RecommendationTable:
+    """
+    Precomputed recommendation table served from memory.
+
+    Every lookup is a dictionary access plus a slice of a precomputed list,
+    so serving cost does not depend on catalog or history size.
+    """
+
+    def __init__(self, table: Optional[Dict[str, Any]] = None):
+        """Initialize from a table dictionary produced by build_recommendation_table."""
+        table = table or {}
+        self.top_k = table.get('top_k', 0)
+        self.built_at = table.get('built_at')
+        self.books = table.get('books', {})
+        self.titles = table.get('titles', {})
+        self.by_book = table.get('by_book', {})
+        self.by_user = table.get('by_user', {})
+        self.popular = table.get('popular', [])
+
+    @classmethod
+    def from_file(cls, path: Optional[str] = None) -> 'RecommendationTable':
+        """
+        Load a precomputed table from disk.
+
+        Args:
+            path: Table path (defaults to RECOMMENDATIONS_TABLE or the bundled table)
+
+        Returns:
+            RecommendationTable (empty if the file is missing or unreadable)
+        """
+        path = path or os.environ.get('RECOMMENDATIONS_TABLE', DEFAULT_TABLE_PATH)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return cls(json.load(f))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Recommendation table unavailable at {path}: {str(e)}")
+            return cls()
+
+    def resolve_book_id(self, book_id: str = '', title: str = '') -> Optional[str]:
+        """Resolve a seed book from an ID or a title."""
+        if book_id and str(book_id) in self.books:
+            return str(book_id)
+        if title:
+            return self.titles.get(normalize_title(title))
+        return None
+
+    def for_book(self, book_id: str, k: int = 5) -> List[Dict[str, Any]]:
+        """Get the top-k books similar to a seed book."""
+        return self._expand(self.by_book.get(str(book_id), [])[:k])
+
+    def for_user(self, user_id: str, k: int = 5) -> List[Dict[str, Any]]:
+        """Get the top-k books for a user, falling back to popular books."""
+        entries = self.by_user.get(str(user_id))
+        if not entries:
+            return self.get_popular(k)
+        return self._expand(entries[:k])
+
+    def get_popular(self, k: int = 5) -> List[Dict[str, Any]]:
+        """Get the k most circulated books."""
+        return self._expand(self.popular[:k])
+
+    def update_book(self, book_id: str, changes: Dict[str, Any]) -> bool:
+        """
+        Apply catalog changes to a known book's metadata (and the title index).
+
+        Only fields the table already stores are updated; unknown books are
+        ignored, since they have no recommendations until the next rebuild.
+
+        Returns:
+            True if the book's metadata changed
+        """
+        book_id = str(book_id)
+        book = self.books.get(book_id)
+        if book is None:
+            return False
+        updates = {field: value for field, value in changes.items() if field in book and book[field] != value}
+        if not updates:
+            return False
+        if 'title' in updates:
+            if self.titles.get(normalize_title(book['title'])) == book_id:
+                del self.titles[normalize_title(book['title'])]
+            self.titles[normalize_title(updates['title'])] = book_id
+        self.books[book_id] = {**book, **updates}
+        return True
+
+    def _expand(self, entries: List[List[Any]]) -> List[Dict[str, Any]]:
+        """Attach book metadata to (book_id, score) entries."""
+        results = []
+        for book_id, score in entries:
+            book = self.books.get(book_id)
+            if book:
+                results.append({**book, 'id': book_id, 'score': score})
+        return results
+
+
+def _top_k_rows(matrix, labels: List[str], k: int) -> Dict[int, List[List[Any]]]:
+    """
+    Extract the top-k entries of every row of a CSR matrix.
+
+    Args:
+        matrix: scipy.sparse CSR matrix
+        labels: Column labels
+        k: Entries to keep per row
+
+    Returns:
+        Mapping of row index to [label, score] lists, best first
+    """
+    import numpy as np
+
+    rows = {}
+    for i in range(matrix.shape[0]):
+        start, end = matrix.indptr[i], matrix.indptr[i + 1]
+        if start == end:
+            continue
+        data = matrix.data[start:end]
+        cols = matrix.indices[start:end]
+        if len(data) > k:
+            top = np.argpartition(-data, k - 1)[:k]
+        else:
+            top = np.arange(len(data))
+        top = top[np.argsort(-data[top], kind='stable')]
+        rows[i] = [[labels[cols[j]], round(float(data[j]), 4)] for j in top if data[j] > 0]
+    return rows
+
+
+def build_recommendation_table(
+    history: Iterable[Dict[str, Any]],
+    catalog: List[Dict[str, Any]],
+    top_k: int = 10
+) -> Dict[str, Any]:
+    """
+    Build the recommendation table from circulation history.
+
+    Requires numpy and scipy, which are only needed for this offline batch
+    step and are not part of the deployed function's requirements.
+
+    Args:
+        history: Events with 'user_id', 'book_id' and 'event' ('checkout' or 'hold')
+        catalog: Book dictionaries used for metadata
+        top_k: Recommendations to precompute per book and per user
+
+    Returns:
+        Table dictionary suitable for RecommendationTable
+    """
+    import numpy as np
+    from scipy import sparse
+
+    books = {
+        str(book['id']): {
+            'title': book.get('title', 'Unknown'),
+            'author': book.get('author', ''),
+            'genre': book.get('genre', ''),
+            'cover_image': book.get('cover_image', '')
+        }
+        for book in catalog if book.get('id')
+    }
+
+    item_index = {book_id: i for i, book_id in enumerate(books)}
+    user_index = {}
+    rows, cols, vals = [], [], []
+    for event in history:
+        book_id = str(event.get('book_id', ''))
+        weight = EVENT_WEIGHTS.get(event.get('event', 'checkout'), 0.0)
+        if book_id not in item_index or not weight:
+            continue
+        user_id = str(event.get('user_id', ''))
+        rows.append(user_index.setdefault(user_id, len(user_index)))
+        cols.append(item_index[book_id])
+        vals.append(weight)
+
+    item_labels = list(item_index)
+    user_labels = list(user_index)
+
+    # User-item interaction matrix; repeated events accumulate weight
+    interactions = sparse.csr_matrix(
+        (np.asarray(vals, dtype=np.float64), (rows, cols)),
+        shape=(len(user_labels), len(item_labels))
+    )
+    interactions.sum_duplicates()
+
+    # Item-item co-occurrence normalized to cosine similarity
+    cooccurrence = (interactions.T @ interactions).tocsr()
+    norms = np.sqrt(cooccurrence.diagonal())
+    norms[norms == 0] = 1.0
+    scale = sparse.diags(1.0 / norms)
+    similarity = (scale @ cooccurrence @ scale).tocsr()
+    similarity.setdiag(0)
+    similarity.eliminate_zeros()
+
+    # User scores: similarity-weighted history, excluding books already seen
+    user_scores = (interactions @ similarity).tocsr()
+    seen = interactions.copy()
+    seen.data[:] = 1.0
+    user_scores = (user_scores - user_scores.multiply(seen)).tocsr()
+    user_scores.eliminate_zeros()
+
+    by_book = {item_labels[i]: entries for i, entries in _top_k_rows(similarity, item_labels, top_k).items()}
+    by_user = {user_labels[i]: entries for i, entries in _top_k_rows(user_scores, item_labels, top_k).items()}
+
+    counts = np.asarray(interactions.sum(axis=0)).ravel()
+    popular = [
+        [item_labels[i], round(float(counts[i]), 4)]
+        for i in np.argsort(-counts, kind='stable')[:top_k] if counts[i] > 0
+    ]
+
+    return {
+        'version': 1,
+        'built_at': datetime.now().isoformat(timespec='seconds'),
+        'top_k': top_k,
+        'books': books,
+        'titles': {normalize_title(book['title']): book_id for book_id, book in books.items()},
+        'by_book': by_book,
+        'by_user': by_user,
+        'popular': popular
+    }
+
+
+def _read_jsonl(path: str) -> List[Dict[str, Any]]:
+    """Read a JSON Lines file."""
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Offline batch entry point: build the table and write it to disk."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Build the book recommendation table.')
+    parser.add_argument('--history', help='JSONL circulation history (defaults to the library API)')
+    parser.add_argument('--catalog', help='JSONL book catalog (defaults to the library API)')
+    parser.add_argument('--output', default=DEFAULT_TABLE_PATH, help='Output table path')
+    parser.add_argument('--top-k', type=int, default=10, help='Recommendations kept per book and user')
+    args = parser.parse_args(argv)
+
+    if args.history and args.catalog:
+        history, catalog = _read_jsonl(args.history), _read_jsonl(args.catalog)
+    else:
+        from library_service import LibraryService
+        service = LibraryService()
+        history = _read_jsonl(args.history) if args.history else service.get_circulation_history()
+        catalog = _read_jsonl(args.catalog) if args.catalog else service.search_books()
+
+    table = build_recommendation_table(history, catalog, top_k=args.top_k)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(table, f, indent=2, sort_keys=True)
+
+    logger.info(f"Wrote recommendations for {len(table['by_book'])} books and {len(table['by_user'])} users to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    raise SystemExit(main())
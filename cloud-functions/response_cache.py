@@ -0,0 +1,254 @@
+"""
+Response Cache - Webhook-level cache for replies that do not depend on the user
+Answers repeated FAQ questions, anonymous book searches and book detail lookups without running their handlers.
+
+Only the tags in POLICIES are cached. The key is (tag, language, normalized
+values of the tag's own parameters); nothing else from the request, and never
+the user, goes into it. A reply is stored only when it is a real answer (its
+policy's answer parameter is set, so prompts and error replies are skipped)
+and, for anonymous-only tags, when the session has no user_id. Entries are
+frozen StaticReplies: a hit skips the handler and its backend calls, and
+build_response merges the live session parameters over the cached reply just
+as it does for static replies. Entries are also indexed by the books they
+show, so cache_events.py can drop them when a book changes.
+
+Off unless RESPONSE_CACHE=true. RESPONSE_CACHE_TTLS overrides the per-tag
+TTLs ('help-faq-webhook=3600,book-search=30'; 0 turns a tag off).
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Iterable, Mapping, Optional, Set, Tuple
+
+import metrics
+from utils import StaticReply
+from webhook_request import WebhookRequest
+
+logger = logging.getLogger(__name__)
+
+
+class CachePolicy:
+    """What makes one tag's replies cacheable."""
+
+    __slots__ = ('parameters', 'answer_parameter', 'ttl', 'anonymous_only', 'fold_case')
+
+    def __init__(
+        self,
+        parameters: Tuple[str, ...],
+        answer_parameter: str,
+        ttl: float,
+        anonymous_only: bool = False,
+        fold_case: bool = True
+    ):
+        """
+        Args:
+            parameters: Session parameters the handler reads (the key)
+            answer_parameter: Reply parameter that marks a real answer
+            ttl: Default seconds an entry is served
+            anonymous_only: Cache only sessions without a user_id
+            fold_case: Compare text parameters case-insensitively
+        """
+        self.parameters = parameters
+        self.answer_parameter = answer_parameter
+        self.ttl = ttl
+        self.anonymous_only = anonymous_only
+        self.fold_case = fold_case
+
+
+POLICIES: Dict[str, CachePolicy] = {
+    # FAQ answers change with the knowledge base, i.e. on deploy
+    'help-faq-webhook': CachePolicy(('help_query', 'faq_query'), 'faq_id', ttl=3600),
+    # Search results carry availability, so they go stale quickly
+    'book-search': CachePolicy(('book_title', 'author', 'isbn', 'genre', 'subject'), 'search_results',
+                               ttl=60, anonymous_only=True),
+    # Book IDs may be case-sensitive
+    'get-book-details': CachePolicy(('selected_item_id',), 'book_id', ttl=300, fold_case=False)
+}
+
+
+def _parse_ttls(raw: str) -> Dict[str, float]:
+    """Parse 'tag=seconds,tag=seconds' (unknown tags and bad values are skipped)."""
+    ttls = {}
+    for entry in raw.split(','):
+        if not entry.strip():
+            continue
+        tag, _, seconds = entry.partition('=')
+        tag = tag.strip()
+        try:
+            if tag not in POLICIES:
+                raise ValueError(f"not a cacheable tag (one of {', '.join(POLICIES)})")
+            ttls[tag] = float(seconds)
+        except ValueError as e:
+            logger.warning(f"Ignoring RESPONSE_CACHE_TTLS entry '{entry.strip()}': {str(e)}")
+    return ttls
+
+
+def _reply_books(reply: Mapping[str, Any]) -> Tuple[str, ...]:
+    """IDs of the books a reply shows (its search_results and book_id parameters)."""
+    parameters = reply.get('parameters') or {}
+    books = [book.get('id') for book in parameters.get('search_results') or () if isinstance(book, Mapping)]
+    books.append(parameters.get('book_id'))
+    return tuple(str(book_id) for book_id in books if book_id is not None)
+
+
+def _normalize(value: Any, fold_case: bool) -> Optional[str]:
+    """Key form of a parameter value: whitespace collapsed, optionally casefolded (None if not a scalar)."""
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        text = ' '.join(value.split())
+        return text.casefold() if fold_case else text
+    if isinstance(value, (int, float)):
+        return str(value)
+    return None
+
+
+class ResponseCache:
+    """
+    TTL + LRU cache of frozen handler replies, per POLICIES.
+
+    Lookups take the lock only to reorder or evict; a hit costs one key
+    build, a dict lookup and a clock read.
+    """
+
+    def __init__(
+        self,
+        enabled: Optional[bool] = None,
+        ttls: Optional[Mapping[str, float]] = None,
+        max_entries: Optional[int] = None
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            enabled: Cache replies at all (default: RESPONSE_CACHE)
+            ttls: Seconds per tag, overriding the policy defaults (default: RESPONSE_CACHE_TTLS)
+            max_entries: Entries kept before the least recently used is evicted
+        """
+        if enabled is None:
+            enabled = os.environ.get('RESPONSE_CACHE', 'false').lower() == 'true'
+        if ttls is None:
+            ttls = _parse_ttls(os.environ.get('RESPONSE_CACHE_TTLS', ''))
+        self.ttls = {tag: ttls.get(tag, policy.ttl) for tag, policy in POLICIES.items()}
+        self.enabled = enabled and any(ttl > 0 for ttl in self.ttls.values())
+        self.max_entries = max_entries if max_entries is not None else int(os.environ.get('RESPONSE_CACHE_SIZE', '2048'))
+        self._entries: 'OrderedDict[Tuple, Tuple[float, StaticReply]]' = OrderedDict()
+        # book ID -> keys of the entries showing it
+        self._books: Dict[str, Set[Tuple]] = {}
+        self._lock = threading.Lock()
+
+    def key(self, webhook_request: WebhookRequest) -> Optional[Tuple]:
+        """Cache key for a request, or None if its reply must not be cached."""
+        policy = POLICIES.get(webhook_request.tag)
+        if policy is None or self.ttls[webhook_request.tag] <= 0:
+            return None
+        if policy.anonymous_only and webhook_request.user_id:
+            return None
+        parameters = webhook_request.parameters
+        values = []
+        for name in policy.parameters:
+            value = _normalize(parameters.get(name), policy.fold_case)
+            if value is None:
+                return None
+            values.append(value)
+        return (webhook_request.tag, webhook_request.language, *values)
+
+    def get(self, webhook_request: WebhookRequest) -> Optional[StaticReply]:
+        """
+        Cached reply for a request.
+
+        Args:
+            webhook_request: Decoded request
+
+        Returns:
+            The frozen reply, or None on a miss (or if the tag is not cached)
+        """
+        if not self.enabled:
+            return None
+        key = self.key(webhook_request)
+        if key is None:
+            return None
+        entry = self._entries.get(key)
+        cache = f"response:{webhook_request.tag}"
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                with self._lock:
+                    if self._entries.get(key) is entry:
+                        self._drop(key)
+            metrics.cache_miss(cache)
+            return None
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+        metrics.cache_hit(cache)
+        return entry[1]
+
+    def put(self, webhook_request: WebhookRequest, response: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Store a handler reply if its policy allows it.
+
+        Args:
+            webhook_request: Request the reply answers
+            response: Handler response
+
+        Returns:
+            The frozen reply when it was stored (serve that: its messages are
+            prebuilt), otherwise response unchanged
+        """
+        if not self.enabled or isinstance(response, StaticReply):
+            return response
+        key = self.key(webhook_request)
+        if key is None:
+            return response
+        policy = POLICIES[webhook_request.tag]
+        reply_parameters = response.get('parameters')
+        if 'redirect_to_flow' in response or not reply_parameters or not reply_parameters.get(policy.answer_parameter):
+            return response
+        reply = StaticReply(**response)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttls[webhook_request.tag], reply)
+            for book_id in _reply_books(reply):
+                self._books.setdefault(book_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+        return reply
+
+    def _drop(self, key: Tuple) -> None:
+        """Remove an entry and its book index references (caller holds the lock)."""
+        _, reply = self._entries.pop(key)
+        for book_id in _reply_books(reply):
+            keys = self._books.get(book_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._books[book_id]
+
+    def discard_books(self, book_ids: Iterable[str]) -> int:
+        """
+        Drop the entries showing any of the given books.
+
+        Returns:
+            Entries dropped
+        """
+        dropped = 0
+        with self._lock:
+            for book_id in book_ids:
+                for key in list(self._books.get(str(book_id), ())):
+                    if key in self._entries:
+                        self._drop(key)
+                        dropped += 1
+        return dropped
+
+    def clear(self) -> None:
+        """Drop every entry."""
+        with self._lock:
+            self._entries.clear()
+            self._books.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,296 @@
+"""
+Room Availability Engine - Bitmap model of study room schedules
+Answers exact-slot checks and nearest-alternative searches without extra backend round trips.
+"""
+
+import os
+import re
+import time
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+
+TIME_PATTERN = re.compile(r'^\s*(\d{1,2})(?::(\d{2}))?(?::\d{2})?\s*([ap]\.?m\.?)?\s*$', re.IGNORECASE)
+DURATION_PATTERN = re.compile(r'(\d+(?:\.\d+)?)\s*(d|day|days|h|hr|hrs|hour|hours|m|min|mins|minute|minutes)?(?![a-z])', re.IGNORECASE)
+
+
+def parse_date(value: Any) -> Optional[str]:
+    """
+    Normalize a date parameter (string or Dialogflow date object) to YYYY-MM-DD.
+
+    Returns None when the value is not a valid date.
+    """
+    if isinstance(value, dict):
+        try:
+            value = f"{int(value['year']):04d}-{int(value['month']):02d}-{int(value['day']):02d}"
+        except (KeyError, TypeError, ValueError):
+            return None
+    text = str(value or '').strip()[:10]
+    try:
+        datetime.strptime(text, '%Y-%m-%d')
+    except ValueError:
+        return None
+    return text
+
+
+def parse_time(value: Any) -> Optional[int]:
+    """
+    Parse a time parameter to minutes after midnight.
+
+    Accepts '14:30', '2:30 PM', '2pm' and Dialogflow time objects.
+    """
+    if isinstance(value, dict):
+        try:
+            return int(value.get('hours', 0)) * 60 + int(value.get('minutes', 0))
+        except (TypeError, ValueError):
+            return None
+    text = str(value or '')
+    # Dialogflow sys.time values may arrive as full ISO timestamps
+    if 'T' in text:
+        text = text.split('T', 1)[1][:5]
+    match = TIME_PATTERN.match(text)
+    if not match:
+        return None
+    hours, minutes, meridiem = int(match.group(1)), int(match.group(2) or 0), match.group(3)
+    if meridiem:
+        hours = hours % 12 + (12 if meridiem.lower().startswith('p') else 0)
+    if hours > 23 or minutes > 59:
+        return None
+    return hours * 60 + minutes
+
+
+def parse_duration(value: Any) -> Optional[int]:
+    """
+    Parse a duration parameter to minutes.
+
+    Accepts '2 hours', '90 minutes', '1.5h', '3 days', combinations such as
+    '1h30m' or '1 hour 30', bare numbers (hours) and Dialogflow duration
+    objects ({'amount': 2, 'unit': 'h'}).
+    """
+    if isinstance(value, dict):
+        try:
+            parts = [(float(value.get('amount', 0)), str(value.get('unit', 'h')).lower())]
+        except (TypeError, ValueError):
+            return None
+    else:
+        parts, previous = [], None
+        for match in DURATION_PATTERN.finditer(str(value or '')):
+            # A bare number after hours is minutes ('1 hour 30'), otherwise hours
+            unit = (match.group(2) or ('m' if previous == 'h' else 'h')).lower()
+            parts.append((float(match.group(1)), unit))
+            previous = unit[0]
+        if not parts:
+            return None
+    minutes = sum(
+        amount * 24 * 60 if unit.startswith('d') else amount if unit.startswith('m') else amount * 60
+        for amount, unit in parts
+    )
+    return int(minutes) or None
+
+
+def format_time(minutes: int) -> str:
+    """Format minutes after midnight as a 12-hour clock time (1440 is midnight again)."""
+    hours, mins = divmod(minutes % (24 * 60), 60)
+    return f"{(hours % 12) or 12}:{mins:02d} {'AM' if hours < 12 else 'PM'}"
+
+
+def _slot_mask(start_slot: int, slot_count: int) -> int:
+    """Bitmask with slot_count bits set starting at start_slot."""
+    return ((1 << slot_count) - 1) << start_slot
+
+
+def _window_starts(free: int, slot_count: int) -> int:
+    """
+    Bitmap of start slots where slot_count consecutive slots are free.
+
+    Shifts-and-ANDs by doubling widths, so the cost is O(log slot_count)
+    big-int operations regardless of how many slots are in the day.
+    """
+    starts, width = free, 1
+    while width < slot_count:
+        step = min(width, slot_count - width)
+        starts &= starts >> step
+        width += step
+    return starts
+
+
+class RoomAvailability:
+    """
+    Per-room, per-day bitmaps of free 15-minute slots.
+
+    Bit i of a room's bitmap is set when slot i (minutes i*15 to i*15+15)
+    is open and unbooked. Schedules are refreshed from the library API once
+    they are older than ROOM_AVAILABILITY_TTL seconds; expired days are
+    dropped whenever a day is loaded. A schedule read that fails (a mock
+    fallback) is not modelled: callers then ask the library API for the
+    exact slot.
+    """
+
+    def __init__(self, library_service, ttl: Optional[float] = None):
+        """
+        Initialize the engine.
+
+        Args:
+            library_service: LibraryService used to fetch room schedules
+            ttl: Seconds before a day's schedule is refetched
+        """
+        self.library_service = library_service
+        self.ttl = ttl if ttl is not None else float(os.environ.get('ROOM_AVAILABILITY_TTL', '60'))
+        self._days: Dict[str, Tuple[float, Dict[str, Dict[str, Any]]]] = {}
+        self._lock = threading.Lock()
+
+    def _load_day(self, date: str) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Get the room bitmaps for a day, refreshing from the backend when stale (None if it failed)."""
+        cached = self._days.get(date)
+        if cached and time.monotonic() - cached[0] < self.ttl:
+            metrics.cache_hit('room_schedule')
+            return cached[1]
+        metrics.cache_miss('room_schedule')
+
+        schedule, cacheable = self.library_service.get_room_schedule(date)
+        if not cacheable:
+            logger.warning(f"Room schedule for {date} unavailable; not modelling it")
+            return None
+        rooms = {}
+        for room in schedule:
+            open_slot = (parse_time(room.get('open', '00:00')) or 0) // SLOT_MINUTES
+            close_minutes = parse_time(room.get('close', '')) if room.get('close') else None
+            close_slot = SLOTS_PER_DAY if close_minutes is None else -(-close_minutes // SLOT_MINUTES)
+            free = _slot_mask(open_slot, max(0, close_slot - open_slot))
+            for booking in room.get('bookings', []):
+                start, end = parse_time(booking.get('start')), parse_time(booking.get('end'))
+                if start is None or end is None:
+                    continue
+                first, last = start // SLOT_MINUTES, -(-end // SLOT_MINUTES)
+                free &= ~_slot_mask(first, max(0, last - first))
+            rooms[str(room.get('id'))] = {
+                'id': str(room.get('id')),
+                'room_name': room.get('room_name', room.get('id')),
+                'capacity': room.get('capacity'),
+                'amenities': room.get('amenities', []),
+                'free': free
+            }
+
+        now = time.monotonic()
+        with self._lock:
+            # Drop expired days so dates nobody asks about again do not pile up
+            for stale in [d for d, (loaded, _) in self._days.items() if now - loaded >= self.ttl]:
+                del self._days[stale]
+            self._days[date] = (now, rooms)
+        return rooms
+
+    def available_rooms(self, date: str, start_minutes: int, duration_minutes: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        List rooms free for an exact slot.
+
+        Args:
+            date: Date (YYYY-MM-DD)
+            start_minutes: Start time in minutes after midnight
+            duration_minutes: Duration in minutes
+
+        Returns:
+            Room dictionaries (without bitmaps), or None if the day's
+            schedule could not be read
+        """
+        start_slot = start_minutes // SLOT_MINUTES
+        slot_count = max(1, -(-duration_minutes // SLOT_MINUTES))
+        if start_slot + slot_count > SLOTS_PER_DAY:
+            return []
+        rooms = self._load_day(date)
+        if rooms is None:
+            return None
+        mask = _slot_mask(start_slot, slot_count)
+        return [
+            self._public(room)
+            for room in rooms.values()
+            if room['free'] & mask == mask
+        ]
+
+    def nearest_alternatives(
+        self,
+        date: str,
+        start_minutes: int,
+        duration_minutes: int,
+        limit: int = 5,
+        not_before: int = 0
+    ) -> List[Dict[str, Any]]:
+        """
+        Find the free slots closest to the requested start time, across all rooms.
+
+        Args:
+            date: Date (YYYY-MM-DD)
+            start_minutes: Requested start in minutes after midnight
+            duration_minutes: Duration in minutes
+            limit: Number of alternatives to return
+            not_before: Earliest start offered, in minutes after midnight
+                (the current time when date is today)
+
+        Returns:
+            Alternatives sorted by distance from the requested time, each with
+            room details plus 'start', 'end' and 'start_minutes' (none if the
+            day's schedule could not be read)
+        """
+        slot_count = max(1, -(-duration_minutes // SLOT_MINUTES))
+        target = start_minutes // SLOT_MINUTES
+        # Windows starting before not_before (rounded up to a slot) are not offered
+        past = _slot_mask(0, min(SLOTS_PER_DAY, -(-not_before // SLOT_MINUTES)))
+        candidates = []
+
+        for room in (self._load_day(date) or {}).values():
+            starts = _window_starts(room['free'], slot_count) & ~past
+            # Nearest set bits at or after the target, then before it
+            later = starts >> target << target
+            earlier = starts & ((1 << target) - 1)
+            for _ in range(limit * slot_count):
+                if later:
+                    slot = (later & -later).bit_length() - 1
+                    candidates.append((slot - target, slot, room))
+                    later &= later - 1
+                if earlier:
+                    slot = earlier.bit_length() - 1
+                    candidates.append((target - slot, slot, room))
+                    earlier &= ~(1 << slot)
+
+        candidates.sort(key=lambda c: (c[0], c[1], c[2]['id']))
+
+        # Skip windows overlapping one already chosen in the same room, so the
+        # alternatives are distinct options rather than 15-minute shifts
+        chosen = []
+        for _, slot, room in candidates:
+            if len(chosen) == limit:
+                break
+            if any(r['id'] == room['id'] and abs(s - slot) < slot_count for s, r in chosen):
+                continue
+            chosen.append((slot, room))
+
+        return [
+            {
+                **self._public(room),
+                'start_minutes': slot * SLOT_MINUTES,
+                'start': format_time(slot * SLOT_MINUTES),
+                'end': format_time((slot + slot_count) * SLOT_MINUTES)
+            }
+            for slot, room in chosen
+        ]
+
+    def mark_booked(self, date: str, room_id: str, start_minutes: int, duration_minutes: int) -> None:
+        """Clear booked slots locally after a successful booking."""
+        day = self._days.get(date)
+        if not day or str(room_id) not in day[1]:
+            return
+        slot_count = max(1, -(-duration_minutes // SLOT_MINUTES))
+        with self._lock:
+            day[1][str(room_id)]['free'] &= ~_slot_mask(start_minutes // SLOT_MINUTES, slot_count)
+
+    @staticmethod
+    def _public(room: Dict[str, Any]) -> Dict[str, Any]:
+        """Strip the internal bitmap from a room record."""
+        return {key: value for key, value in room.items() if key != 'free'}
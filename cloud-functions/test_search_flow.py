@@ -13,10 +13,14 @@ sys.modules['flask'] = mock_flask
 class MockRequest:
     def __init__(self, json_data):
         self._json_data = json_data
+        self.headers = {}
 
     def get_json(self, silent=True):
         return self._json_data
 
+    def get_data(self):
+        return json.dumps(self._json_data).encode('utf-8')
+
 mock_flask.Request = MockRequest
 
 # Set environment variable to use mock data
@@ -74,7 +78,7 @@ def test_search_flow():
             request = MockRequest(request_json)
             
             # Call the webhook handler
-            response = main.handle_webhook(request)
+            response = main.codec.reply_json(main.handle_webhook(request))
             
             # Extract and print readable response
             messages = response.get('fulfillmentResponse', {}).get('messages', [])
@@ -0,0 +1,418 @@
+"""
+Timing - Per-stage latency instrumentation for the webhook
+Records monotonic stage timings into HDR-style histograms and renders Server-Timing headers.
+
+Stages are recorded by the timed() decorator (clock() and record() for inline blocks).
+Each stage feeds a process-wide histogram. Only every WEBHOOK_TIMING_EVERY_N-th
+webhook request records its stages (1 records them all), so the histogram
+counts cover one request in N (metrics exports N next to them); the other
+requests skip the clock, which keeps the instrumentation well under 1% of a
+request (benchmarks/bench_timing.py). The decision is kept per request in a
+context variable. Stages outside webhook requests (warm-up, background cache
+refreshes) are always recorded. With SERVER_TIMING_HEADER=true every request
+also accumulates its stage totals and returns them in a Server-Timing header;
+begin_request() does the same for a single request (traffic capture uses it
+for sampled calls). Neither adds unsampled requests to the histograms.
+Set WEBHOOK_TIMING=false to turn recording off.
+"""
+
+import os
+import time
+import itertools
+import threading
+from contextvars import ContextVar
+from functools import wraps
+from typing import Dict, Any, Callable, Iterator, List, Optional, Tuple
+
+ENABLED = os.environ.get('WEBHOOK_TIMING', 'true').lower() == 'true'
+SERVER_TIMING = os.environ.get('SERVER_TIMING_HEADER', 'false').lower() == 'true'
+EVERY_N = max(1, int(os.environ.get('WEBHOOK_TIMING_EVERY_N', '8')))
+
+# Values below 2**SUB_BUCKET_BITS microseconds are recorded exactly; above
+# that each power of two is split into 2**(SUB_BUCKET_BITS - 1) buckets,
+# which keeps every recorded value within ~1.6% of its true value.
+SUB_BUCKET_BITS = 7
+_SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+_HALF_BITS = SUB_BUCKET_BITS - 1
+# Highest trackable value is about 2**36 us (19 hours); larger values clamp
+_MAX_SHIFT = 30
+_BUCKET_COUNT = ((_MAX_SHIFT + 1) << _HALF_BITS) + _SUB_BUCKETS
+# Largest index a value within range maps to
+_LAST_INDEX = (_MAX_SHIFT << _HALF_BITS) + _SUB_BUCKETS - 1
+
+_clock = time.perf_counter_ns
+_fold_lock = threading.Lock()
+
+
+def _bucket_index(micros: int) -> int:
+    """Histogram bucket of a value in microseconds."""
+    if micros < _SUB_BUCKETS:
+        return micros
+    shift = micros.bit_length() - SUB_BUCKET_BITS
+    if shift > _MAX_SHIFT:
+        return _BUCKET_COUNT - 1
+    return (shift << _HALF_BITS) + (micros >> shift)
+
+
+def _bucket_bounds(index: int) -> Tuple[int, int]:
+    """Lowest and highest microsecond value that map to a bucket."""
+    if index < _SUB_BUCKETS:
+        return index, index
+    shift = (index >> _HALF_BITS) - 1
+    mantissa = index - (shift << _HALF_BITS)
+    return mantissa << shift, ((mantissa + 1) << shift) - 1
+
+
+class Histogram:
+    """
+    Log-linear latency histogram (HDR-style) in microseconds.
+
+    Recording is O(1) and takes no lock: under the GIL a concurrent thread can
+    at worst lose an increment, which telemetry tolerates, and a lock would
+    cost more than the rest of the recording path.
+
+    Timed stages only append their raw duration in nanoseconds to a pending
+    list (a single C call); pending durations are folded into the buckets in
+    batches, before every read and every FOLD_EVERY sampled requests.
+    """
+
+    def __init__(self):
+        self._counts = [0] * _BUCKET_COUNT
+        self._total = 0
+        self._pending: List[int] = []
+
+    def reset(self) -> None:
+        """Zero all counts (in place, so decorated stages keep recording here)."""
+        with _fold_lock:
+            del self._pending[:]
+        for index in range(_BUCKET_COUNT):
+            self._counts[index] = 0
+        self._total = 0
+
+    def record(self, micros: int) -> None:
+        """Record one value in microseconds."""
+        self._counts[micros if micros < _SUB_BUCKETS else _bucket_index(micros)] += 1
+        self._total += micros
+
+    def fold(self) -> None:
+        """Move pending nanosecond durations into the buckets."""
+        pending = self._pending
+        if not pending:
+            return
+        with _fold_lock:
+            count = len(pending)
+            values = pending[:count]
+            # Appends made meanwhile land after index count and stay pending
+            del pending[:count]
+        # _bucket_index inlined: this loop runs once per recorded stage
+        counts = self._counts
+        for elapsed in values:
+            micros = elapsed // 1000
+            if micros < _SUB_BUCKETS:
+                counts[micros] += 1
+            else:
+                shift = micros.bit_length() - SUB_BUCKET_BITS
+                index = (shift << _HALF_BITS) + (micros >> shift)
+                counts[index if index <= _LAST_INDEX else _BUCKET_COUNT - 1] += 1
+        self._total += sum(values) // 1000
+
+    @property
+    def total(self) -> int:
+        """Sum of recorded values in microseconds."""
+        self.fold()
+        return self._total
+
+    @property
+    def count(self) -> int:
+        """Number of recorded values."""
+        self.fold()
+        return sum(self._counts)
+
+    @property
+    def max(self) -> int:
+        """Largest recorded value (upper bound of its bucket)."""
+        self.fold()
+        for index in range(_BUCKET_COUNT - 1, -1, -1):
+            if self._counts[index]:
+                return _bucket_bounds(index)[1]
+        return 0
+
+    def percentile(self, pct: float) -> float:
+        """Value at a percentile in microseconds (midpoint of its bucket)."""
+        self.fold()
+        counts = list(self._counts)
+        total = sum(counts)
+        if not total:
+            return 0.0
+        target = max(1, -(-total * pct // 100))
+        seen = 0
+        for index, count in enumerate(counts):
+            if count:
+                seen += count
+                if seen >= target:
+                    low, high = _bucket_bounds(index)
+                    return (low + high) / 2.0
+        return 0.0
+
+    def buckets(self) -> Iterator[Tuple[int, int]]:
+        """Yield (upper bound in microseconds, cumulative count) per occupied bucket."""
+        self.fold()
+        seen = 0
+        for index, count in enumerate(list(self._counts)):
+            if count:
+                seen += count
+                yield _bucket_bounds(index)[1], seen
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Summary statistics in milliseconds."""
+        count = self.count
+        return {
+            'count': count,
+            'sum_ms': round(self.total / 1000.0, 3),
+            'mean_ms': round(self.total / count / 1000.0, 4) if count else 0.0,
+            'max_ms': round(self.max / 1000.0, 4),
+            'p50_ms': round(self.percentile(50) / 1000.0, 4),
+            'p90_ms': round(self.percentile(90) / 1000.0, 4),
+            'p99_ms': round(self.percentile(99) / 1000.0, 4),
+            'p999_ms': round(self.percentile(99.9) / 1000.0, 4)
+        }
+
+
+_histograms: Dict[str, Histogram] = {}
+_histograms_lock = threading.Lock()
+# Sampled requests between folds of the pending stage durations (bounds their memory)
+FOLD_EVERY = 64
+_unfolded_requests = 0
+_request_numbers = itertools.count()
+
+# What stages do in the current context: bit RECORD feeds the process
+# histograms, bit COLLECT the request's stage totals; 0 skips the clock.
+# The context holds a one-item list, set once per thread and updated in
+# place per webhook request: setting a context variable per request costs
+# more than the sampling saves. Copied contexts (branch searches) share it.
+# Outside a webhook request (warm-up, background work) stages record.
+RECORD, COLLECT = 1, 2
+_OUTSIDE_REQUESTS = [RECORD]
+_mode: ContextVar[List[int]] = ContextVar('timing_mode', default=_OUTSIDE_REQUESTS)
+# Stage totals of the current request while it collects them
+_request_stages: ContextVar[Optional[Dict[str, List[int]]]] = ContextVar('timing_request_stages', default=None)
+
+
+def set_enabled(enabled: bool) -> None:
+    """Turn stage recording on or off at runtime."""
+    global ENABLED
+    ENABLED = enabled
+
+
+def set_every_n(every_n: int) -> None:
+    """Record the stages of every Nth webhook request (1 records them all)."""
+    global EVERY_N
+    EVERY_N = max(1, every_n)
+
+
+def histogram(stage: str) -> Histogram:
+    """Get (or create) the histogram for a stage."""
+    hist = _histograms.get(stage)
+    if hist is None:
+        with _histograms_lock:
+            hist = _histograms.setdefault(stage, Histogram())
+    return hist
+
+
+def _request_mode() -> List[int]:
+    """The current context's mode list, created on its first webhook request."""
+    mode = _mode.get()
+    if mode is _OUTSIDE_REQUESTS:
+        mode = [RECORD]
+        _mode.set(mode)
+    return mode
+
+
+def _add_to_request(stage: str, elapsed_ns: int) -> None:
+    """Accumulate a stage into the current request's totals."""
+    stages = _request_stages.get()
+    if stages is not None:
+        entry = stages.get(stage)
+        if entry is None:
+            stages[stage] = [elapsed_ns, 1]
+        else:
+            entry[0] += elapsed_ns
+            entry[1] += 1
+
+
+def record(stage: str, elapsed_ns: int) -> None:
+    """Record a stage duration in the process histogram (and the current request)."""
+    mode = _mode.get()[0] if ENABLED else 0
+    if mode & RECORD:
+        (_histograms.get(stage) or histogram(stage))._pending.append(elapsed_ns)
+    if mode & COLLECT:
+        _add_to_request(stage, elapsed_ns)
+
+
+def timed(stage: Optional[str] = None) -> Callable:
+    """
+    Decorator recording a function's duration as a stage.
+
+    Args:
+        stage: Stage name (defaults to the function name)
+    """
+    def decorator(fn: Callable) -> Callable:
+        name = stage or fn.__name__
+        # Bound as closure variables: this path runs several times per request
+        append, clock, mode_of = histogram(name)._pending.append, _clock, _mode.get
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            mode = mode_of()[0] if ENABLED else 0
+            if not mode:
+                return fn(*args, **kwargs)
+            start = clock()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                if mode == RECORD:
+                    append(clock() - start)
+                else:
+                    elapsed = clock() - start
+                    if mode & RECORD:
+                        append(elapsed)
+                    _add_to_request(name, elapsed)
+        return wrapper
+    return decorator
+
+
+# Monotonic timestamp in nanoseconds for inline stages (pair with record());
+# the clock itself rather than a wrapper, so inline stages pay no extra call
+clock = _clock
+
+
+def fold() -> None:
+    """Fold every stage's pending durations into its buckets."""
+    global _unfolded_requests
+    _unfolded_requests = 0
+    with _histograms_lock:
+        hists = list(_histograms.values())
+    for hist in hists:
+        hist.fold()
+
+
+def begin_request() -> bool:
+    """
+    Start accumulating stage totals for the current request.
+
+    The request's stages are timed from here on, sampled or not; only a
+    sampled request also records them in the process histograms.
+
+    Returns:
+        False if the request is already accumulating (the caller that
+        started it ends it; read the totals with request_stages())
+    """
+    if _request_stages.get() is not None:
+        return False
+    _request_stages.set({})
+    _request_mode()[0] |= COLLECT
+    return True
+
+
+def request_stages() -> Dict[str, List[int]]:
+    """Stage totals accumulated so far for the current request."""
+    return dict(_request_stages.get() or {})
+
+
+def end_request() -> Dict[str, List[int]]:
+    """Stop accumulating and return {stage: [total_ns, calls]} for the request."""
+    stages = _request_stages.get()
+    if stages is None:
+        return {}
+    _request_stages.set(None)
+    _request_mode()[0] &= ~COLLECT
+    return stages
+
+
+def server_timing_header(stages: Dict[str, List[int]]) -> str:
+    """Render request stage totals as a Server-Timing header value."""
+    parts = []
+    for name, (total_ns, calls) in stages.items():
+        entry = f"{name};dur={total_ns / 1e6:.3f}"
+        if calls > 1:
+            entry += f';desc="{calls} calls"'
+        parts.append(entry)
+    return ', '.join(parts)
+
+
+def timed_request(stage_name: str = 'webhook') -> Callable:
+    """
+    Decorator for the webhook entry point.
+
+    Samples the request (every EVERY_N-th one records its stages in the
+    process histograms), records the whole call as a stage and, when
+    SERVER_TIMING is on, collects the request's stage totals and adds a
+    Server-Timing header to the (body, status, headers) reply (a bare dict
+    body gets status 200). The sampling decision is kept per request in a
+    context variable, so concurrent requests do not change each other's.
+    """
+    def decorator(fn: Callable) -> Callable:
+        append, mode_of = histogram(stage_name)._pending.append, _mode.get
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            global _unfolded_requests
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            mode = mode_of()
+            if mode is _OUTSIDE_REQUESTS:
+                mode = _request_mode()
+            previous = mode[0]
+            sampled = not next(_request_numbers) % EVERY_N
+            mode[0] = RECORD if sampled else 0
+            if not sampled and not SERVER_TIMING:
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    mode[0] = previous
+            owner = begin_request() if SERVER_TIMING else False
+            start = _clock()
+            try:
+                result = fn(*args, **kwargs)
+            finally:
+                elapsed = _clock() - start
+                stages = None
+                if owner:
+                    _add_to_request(stage_name, elapsed)
+                    stages = end_request()
+                mode[0] = previous
+                if sampled:
+                    append(elapsed)
+                    _unfolded_requests += 1
+                    if _unfolded_requests >= FOLD_EVERY:
+                        fold()
+            if stages is None:
+                return result
+            header = {'Server-Timing': server_timing_header(stages)}
+            if isinstance(result, dict):
+                return result, 200, header
+            if isinstance(result, tuple) and len(result) == 3:
+                return result[0], result[1], {**result[2], **header}
+            return result
+        return wrapper
+    return decorator
+
+
+def snapshot() -> Dict[str, Dict[str, Any]]:
+    """Summary statistics for every stage recorded so far."""
+    with _histograms_lock:
+        stages = list(_histograms.items())
+    return {name: hist.snapshot() for name, hist in sorted(stages) if hist.total or hist.count}
+
+
+def stages() -> Dict[str, Histogram]:
+    """The live stage histograms by name."""
+    with _histograms_lock:
+        return dict(_histograms)
+
+
+def reset() -> None:
+    """Zero all recorded timings (decorated stages keep their histograms)."""
+    with _histograms_lock:
+        for hist in _histograms.values():
+            hist.reset()
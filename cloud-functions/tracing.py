@@ -0,0 +1,315 @@
+"""
+Tracing - Lightweight spans for the webhook, handlers and library API calls
+Records OpenTelemetry-shaped spans with W3C trace context, exported to memory or a local JSONL file.
+
+Enable with TRACING_EXPORTER=memory (inspect with exporter().spans()) or
+TRACING_EXPORTER=file (appends one JSON span per line to TRACING_FILE).
+Incoming 'traceparent' headers are continued, and the current context is
+sent to the library API in a 'traceparent' header so its spans line up.
+
+Usage (summarize a trace file):
+    python tracing.py traces.jsonl --session <session-id>
+"""
+
+import os
+import json
+import time
+import random
+import logging
+import threading
+import contextvars
+from collections import deque, defaultdict
+from functools import wraps
+from typing import Dict, Any, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = os.environ.get('TRACING_SERVICE_NAME', 'library-webhook')
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar('current_span', default=None)
+_random = random.SystemRandom()
+
+
+def _new_id(bits: int) -> str:
+    return f"{_random.getrandbits(bits):0{bits // 4}x}"
+
+
+class Span:
+    """One timed operation in a trace."""
+
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'kind', 'start_ns', 'end_ns',
+                 'attributes', 'status', 'status_message', '_token')
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], kind: str = 'INTERNAL'):
+        self.trace_id = trace_id
+        self.span_id = _new_id(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes: Dict[str, Any] = {}
+        self.status = 'UNSET'
+        self.status_message = ''
+        self._token = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_error(self, error: BaseException) -> None:
+        self.status = 'ERROR'
+        self.status_message = f"{type(error).__name__}: {error}"
+
+    @property
+    def traceparent(self) -> str:
+        """W3C trace context header value for this span."""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self) -> Dict[str, Any]:
+        """OTLP-style JSON representation (attributes flattened to a dict)."""
+        return {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'parentSpanId': self.parent_id or '',
+            'name': self.name,
+            'kind': f"SPAN_KIND_{self.kind}",
+            'startTimeUnixNano': self.start_ns,
+            'endTimeUnixNano': self.end_ns,
+            'attributes': self.attributes,
+            'status': {'code': f"STATUS_CODE_{self.status}", 'message': self.status_message},
+            'resource': {'service.name': SERVICE_NAME}
+        }
+
+
+class MemoryExporter:
+    """Keeps the most recent finished spans in memory."""
+
+    def __init__(self, max_spans: int = 10000):
+        self._spans = deque(maxlen=max_spans)
+
+    def export(self, span: Span) -> None:
+        self._spans.append(span.to_dict())
+
+    def spans(self, trace_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Finished spans, optionally for one trace."""
+        spans = list(self._spans)
+        return [s for s in spans if s['traceId'] == trace_id] if trace_id else spans
+
+    def clear(self) -> None:
+        self._spans.clear()
+
+
+class FileExporter:
+    """Appends finished spans to a JSONL file, flushing when a request (root) span ends."""
+
+    def __init__(self, path: str, max_bytes: int = 100 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._pending: List[str] = []
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), separators=(',', ':'), default=str)
+        with self._lock:
+            self._pending.append(line)
+            if span.kind == 'SERVER' or span.parent_id is None or len(self._pending) >= 256:
+                self._flush()
+
+    def _flush(self) -> None:
+        lines, self._pending = self._pending, []
+        try:
+            if os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+                return
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write('\n'.join(lines) + '\n')
+        except OSError as e:
+            logger.error(f"Could not write spans to {self.path}: {str(e)}")
+
+
+def _build_exporter():
+    kind = os.environ.get('TRACING_EXPORTER', 'none').lower()
+    if kind == 'memory':
+        return MemoryExporter(int(os.environ.get('TRACING_MAX_SPANS', '10000')))
+    if kind == 'file':
+        return FileExporter(
+            os.environ.get('TRACING_FILE', 'traces.jsonl'),
+            int(os.environ.get('TRACING_MAX_BYTES', str(100 * 1024 * 1024)))
+        )
+    return None
+
+
+_exporter = _build_exporter()
+ENABLED = _exporter is not None
+
+
+def configure(exporter_instance) -> None:
+    """Install an exporter (None turns tracing off)."""
+    global _exporter, ENABLED
+    _exporter = exporter_instance
+    ENABLED = exporter_instance is not None
+
+
+def exporter():
+    """The active exporter, if any."""
+    return _exporter
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Dict[str, str]]:
+    """Trace and parent span IDs from a W3C traceparent header, if valid."""
+    if not header:
+        return None
+    parts = header.strip().split('-')
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    if parts[1] == '0' * 32 or parts[2] == '0' * 16:
+        return None
+    return {'trace_id': parts[1].lower(), 'parent_id': parts[2].lower()}
+
+
+def start_span(name: str, kind: str = 'INTERNAL', traceparent: Optional[str] = None) -> Span:
+    """Start a span as a child of the current one (or of an incoming traceparent) and make it current."""
+    parent = _current_span.get()
+    if parent is not None:
+        span = Span(name, parent.trace_id, parent.span_id, kind)
+    else:
+        remote = parse_traceparent(traceparent)
+        if remote:
+            span = Span(name, remote['trace_id'], remote['parent_id'], kind)
+        else:
+            span = Span(name, _new_id(128), None, kind)
+    span._token = _current_span.set(span)
+    return span
+
+
+def end_span(span: Span) -> None:
+    """Finish a span, restore its parent as current and export it."""
+    span.end_ns = time.time_ns()
+    if span._token is not None:
+        _current_span.reset(span._token)
+        span._token = None
+    if _exporter is not None:
+        try:
+            _exporter.export(span)
+        except Exception as e:
+            logger.error(f"Span export failed: {str(e)}")
+
+
+def set_attributes(attributes: Dict[str, Any]) -> None:
+    """Set attributes on the current span (no-op when tracing is off)."""
+    span = _current_span.get() if ENABLED else None
+    if span is not None:
+        span.attributes.update(attributes)
+
+
+def inject_headers(headers: Dict[str, str]) -> Dict[str, str]:
+    """Add the current trace context to outgoing request headers."""
+    if ENABLED:
+        span = _current_span.get()
+        if span is not None:
+            headers['traceparent'] = span.traceparent
+    return headers
+
+
+def traced(name: Optional[str] = None, kind: str = 'INTERNAL') -> Callable:
+    """
+    Decorator running a function inside a span.
+
+    Args:
+        name: Span name (defaults to the function's qualified name)
+        kind: OpenTelemetry span kind
+    """
+    def decorator(fn: Callable) -> Callable:
+        span_name = name or fn.__qualname__
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            span = start_span(span_name, kind)
+            try:
+                return fn(*args, **kwargs)
+            except BaseException as e:
+                span.set_error(e)
+                raise
+            finally:
+                end_span(span)
+        return wrapper
+    return decorator
+
+
+def traced_request(name: str = 'handle_webhook') -> Callable:
+    """Decorator for the webhook entry point: a SERVER root span continuing any incoming traceparent."""
+    def decorator(fn: Callable) -> Callable:
+        @wraps(fn)
+        def wrapper(request, *args, **kwargs):
+            if not ENABLED:
+                return fn(request, *args, **kwargs)
+            headers = getattr(request, 'headers', None) or {}
+            span = start_span(name, 'SERVER', headers.get('traceparent'))
+            try:
+                return fn(request, *args, **kwargs)
+            except BaseException as e:
+                span.set_error(e)
+                raise
+            finally:
+                end_span(span)
+        return wrapper
+    return decorator
+
+
+def _print_tree(spans: List[Dict[str, Any]]) -> None:
+    children = defaultdict(list)
+    ids = {s['spanId'] for s in spans}
+    for s in spans:
+        parent = s['parentSpanId'] if s['parentSpanId'] in ids else ''
+        children[parent].append(s)
+
+    def walk(parent_id: str, depth: int) -> None:
+        for s in sorted(children.get(parent_id, []), key=lambda s: s['startTimeUnixNano']):
+            ms = (s['endTimeUnixNano'] - s['startTimeUnixNano']) / 1e6
+            details = ' '.join(f"{k}={v}" for k, v in s['attributes'].items())
+            error = ' ERROR' if s['status']['code'].endswith('ERROR') else ''
+            print(f"{'  ' * depth}{s['name']:<{48 - 2 * depth}} {ms:9.3f} ms{error}  {details}")
+            walk(s['spanId'], depth + 1)
+
+    walk('', 0)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Print span trees from a trace file.')
+    parser.add_argument('path', help='JSONL file written by TRACING_EXPORTER=file')
+    parser.add_argument('--session', help='Only traces for this Dialogflow session ID')
+    parser.add_argument('--slowest', type=int, default=0, help='Only the N slowest traces')
+    args = parser.parse_args()
+
+    traces = defaultdict(list)
+    with open(args.path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                span = json.loads(line)
+                traces[span['traceId']].append(span)
+
+    selected = []
+    for trace_id, spans in traces.items():
+        roots = [s for s in spans if s['kind'] == 'SPAN_KIND_SERVER'] or spans
+        root = min(roots, key=lambda s: s['startTimeUnixNano'])
+        if args.session and root['attributes'].get('dialogflow.session_id') != args.session:
+            continue
+        selected.append((root['endTimeUnixNano'] - root['startTimeUnixNano'], trace_id, spans))
+
+    if args.slowest:
+        selected = sorted(selected, key=lambda t: -t[0])[:args.slowest]
+    for _, trace_id, spans in selected:
+        print(f"trace {trace_id}")
+        _print_tree(spans)
+        print()
+
+
+if __name__ == '__main__':
+    main()
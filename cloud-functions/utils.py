@@ -1,9 +1,60 @@
 """
 Utility functions for DialogFlow CX webhook responses.
 Handles rich response formatting and validation.
+
+Fragments that never change (chip sets, canned replies, the error reply) are
+built once as read-only FrozenDicts and shared between requests; callers
+merge per-request data into new dicts instead of copying the templates.
 """
 
-from typing import Dict, Any, List, Optional
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Sequence
+
+
+class FrozenDict(dict):
+    """
+    Read-only dict for response fragments shared between requests.
+    
+    Serializes like a dict; any mutation raises TypeError (copy() returns a
+    plain, writable dict).
+    """
+    
+    __slots__ = ()
+    
+    def _read_only(self, *args, **kwargs):
+        raise TypeError('shared response fragments are read-only; copy() before modifying')
+    
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+    
+    def copy(self) -> Dict[str, Any]:
+        return dict(self)
+    
+    __copy__ = copy
+    
+    def __deepcopy__(self, memo) -> Dict[str, Any]:
+        return thaw(self)
+    
+    def __reduce__(self):
+        return (type(self), (dict(self),))
+
+
+def freeze(value: Any) -> Any:
+    """Read-only copy of a JSON value (dicts become FrozenDicts, lists tuples)."""
+    if isinstance(value, dict):
+        return FrozenDict({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def thaw(value: Any) -> Any:
+    """Writable deep copy of a (possibly frozen) JSON value."""
+    if isinstance(value, dict):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [thaw(item) for item in value]
+    return value
 
 
 def create_rich_response(response_type: str, **kwargs) -> Dict[str, Any]:
@@ -116,34 +167,83 @@ def create_list_response(
     }
 
 
-def create_quick_reply_response(suggestions: List[str]) -> Dict[str, Any]:
+def create_quick_reply_response(suggestions: Sequence[str]) -> Dict[str, Any]:
     """
     Create quick reply suggestions (Chips) for DialogFlow CX.
+    
+    Chip sets are built once per distinct set of suggestions and shared
+    (read-only); most handlers use a handful of fixed sets.
     """
-    chips = []
-    for suggestion in suggestions[:8]:
-        chips.append({
-            'text': suggestion,
-            'image': {
-                'src': {'rawUrl': 'https://example.com/icon.png'} # Optional icon
-            } if False else None # Skip icon for now
-        })
-        # Clean up None values
-        if chips[-1]['image'] is None:
-            del chips[-1]['image']
-            
-    return {
+    return _quick_replies(tuple(suggestions[:8]))
+
+
+@lru_cache(maxsize=256)
+def _quick_replies(suggestions: tuple) -> FrozenDict:
+    return freeze({
         'payload': {
             'richContent': [
                 [
                     {
                         'type': 'chips',
-                        'options': chips
+                        'options': [{'text': suggestion} for suggestion in suggestions]
                     }
                 ]
             ]
         }
-    }
+    })
+
+
+def create_messages(response: Dict[str, Any]) -> Sequence[Dict[str, Any]]:
+    """
+    Build the fulfillment messages for a handler response.
+    
+    Args:
+        response: Handler response (message, rich_response, suggestions)
+        
+    Returns:
+        Messages in DialogFlow CX format
+    """
+    messages = []
+    
+    # Add text message
+    if 'message' in response:
+        messages.append({
+            'text': {
+                'text': [response['message']]
+            }
+        })
+    
+    # Add rich response if available
+    if 'rich_response' in response:
+        messages.append(response['rich_response'])
+    
+    # Add quick replies if available
+    if 'suggestions' in response:
+        messages.append(create_quick_reply_response(response['suggestions']))
+    
+    return messages
+
+
+class StaticReply(FrozenDict):
+    """
+    Handler response with no per-request content, built once at import.
+    
+    Its fulfillment messages are built (and frozen) up front, so
+    build_response only has to merge the session parameters.
+    """
+    
+    __slots__ = ('messages',)
+    
+    def __init__(self, **response):
+        super().__init__(freeze(response))
+        self.messages = freeze(create_messages(self))
+    
+    def __reduce__(self):
+        return (_static_reply, (dict(self),))
+
+
+def _static_reply(response: Dict[str, Any]) -> StaticReply:
+    return StaticReply(**response)
 
 
 def format_error_response(error_message: str, user_friendly: bool = True) -> Dict[str, Any]:
@@ -155,19 +255,17 @@ def format_error_response(error_message: str, user_friendly: bool = True) -> Dic
         user_friendly: Whether to use user-friendly message
         
     Returns:
-        Error response dictionary
+        Error response dictionary (the shared read-only reply when user_friendly)
     """
     if user_friendly:
-        message = "I'm sorry, I encountered an issue. Please try again or contact support if the problem persists."
-    else:
-        message = f"Error: {error_message}"
+        return _FRIENDLY_ERROR
     
     return {
         'fulfillmentResponse': {
             'messages': [
                 {
                     'text': {
-                        'text': [message]
+                        'text': [f"Error: {error_message}"]
                     }
                 }
             ]
@@ -175,6 +273,19 @@ def format_error_response(error_message: str, user_friendly: bool = True) -> Dic
     }
 
 
+_FRIENDLY_ERROR = freeze({
+    'fulfillmentResponse': {
+        'messages': [
+            {
+                'text': {
+                    'text': ["I'm sorry, I encountered an issue. Please try again or contact support if the problem persists."]
+                }
+            }
+        ]
+    }
+})
+
+
 def validate_parameters(parameters: Dict[str, Any], required: List[str]) -> tuple:
     """
     Validate that required parameters are present.
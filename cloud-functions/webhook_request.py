@@ -0,0 +1,79 @@
+"""
+Webhook Request - Typed view of a Dialogflow CX webhook request
+Decodes the request JSON once into a slotted WebhookRequest with the routing fields pre-extracted.
+
+Nested objects that are missing or of the wrong type are treated as empty,
+so handlers read plain attributes instead of repeating .get() and
+isinstance() checks. Session parameters are exposed through a read-only
+view of the decoded dict (no copy); build a new dict to change them.
+"""
+
+from types import MappingProxyType
+from typing import Dict, Any, Mapping, Optional
+
+
+def _object(value: Any) -> Dict[str, Any]:
+    return value if isinstance(value, dict) else {}
+
+
+def _text(value: Any) -> str:
+    return value if isinstance(value, str) else ''
+
+
+def _display_name(value: Any) -> str:
+    return _text(value.get('displayName')) if isinstance(value, dict) else ''
+
+
+class WebhookRequest:
+    """One decoded webhook call: routing fields, session and read-only parameters."""
+
+    __slots__ = ('tag', 'flow', 'page', 'intent', 'session', 'session_id', 'user_id', 'parameters', 'language')
+
+    def __init__(
+        self,
+        tag: str = '',
+        flow: str = '',
+        page: str = '',
+        intent: str = '',
+        session: str = '',
+        parameters: Optional[Dict[str, Any]] = None,
+        language: str = ''
+    ):
+        self.tag = tag
+        self.flow = flow
+        self.page = page
+        self.intent = intent
+        self.session = session
+        self.session_id = session.rsplit('/', 1)[-1]
+        self.parameters: Mapping[str, Any] = MappingProxyType(parameters if parameters is not None else {})
+        self.user_id = self.parameters.get('user_id') or None
+        self.language = language
+
+    @classmethod
+    def from_json(cls, body: Any) -> Optional['WebhookRequest']:
+        """
+        Decode a webhook request body.
+
+        Args:
+            body: Parsed request JSON
+
+        Returns:
+            WebhookRequest, or None if the body is missing or not a JSON object
+        """
+        if not body or not isinstance(body, dict):
+            return None
+        session_info = _object(body.get('sessionInfo'))
+        page_info = _object(body.get('pageInfo'))
+        return cls(
+            tag=_text(_object(body.get('fulfillmentInfo')).get('tag')),
+            flow=_display_name(page_info.get('currentFlow')),
+            page=_display_name(page_info.get('currentPage')),
+            intent=_display_name(body.get('intentInfo')),
+            session=str(session_info.get('session') or ''),
+            parameters=_object(session_info.get('parameters')),
+            language=_text(body.get('languageCode'))
+        )
+
+    def __repr__(self) -> str:
+        return (f"WebhookRequest(tag={self.tag!r}, flow={self.flow!r}, page={self.page!r}, "
+                f"intent={self.intent!r}, session_id={self.session_id!r})")